@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批处理模块
+
+从文件或标准输入读取SQL语句或自然语言问题，在同一个会话池上并行执行，
+结果按输入顺序以JSON Lines或CSV格式写入标准输出或文件，最后输出耗时汇总（写到标准错误）。
+由 mysql_client_menu.py --batch 调用
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, IO
+
+from fast_json import RawJSON, encode_response, loads, raw_result
+from query_history import get_query_history
+from result_export import iter_export
+from sql_utils import is_select, split_statements
+from tenants import Tenant
+
+BATCH_FORMATS = ("jsonl", "csv")
+
+
+def read_batch_input(source: str, nl: bool = False) -> List[str]:
+    """
+    读取批处理输入
+
+    Args:
+        source: 文件路径，- 表示标准输入
+        nl: 是否为自然语言问题（每行一个，忽略空行和 # 开头的行），否则按分号拆分为SQL语句
+
+    Returns:
+        SQL语句或问题列表
+    """
+    if source == "-":
+        text = sys.stdin.read()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            text = f.read()
+    if nl:
+        return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith("#")]
+    return [statement for statement in split_statements(text) if statement.strip()]
+
+
+def _row_count(result_text: str) -> Optional[int]:
+    """结果的行数（查询）或影响的行数（写操作）"""
+    results = raw_result(result_text)
+    if not isinstance(results, RawJSON):
+        return None
+    rows = results.row_count()
+    if rows is None and results.text.startswith("{"):
+        rows = loads(results.text).get("affectedRows")
+    return rows
+
+
+class BatchOutput:
+    """按输入顺序写出每条语句的结果"""
+
+    def __init__(self, output_format: str = "jsonl", stream: Optional[IO[bytes]] = None,
+                 directory: Optional[str] = None):
+        """
+        初始化
+
+        Args:
+            output_format: jsonl（每条语句一行，包含结果）或 csv（每条语句的结果行，带表头）
+            stream: 输出流（二进制），directory 为空时使用
+            directory: 每条语句的结果写入该目录下的单独文件（如 0001.jsonl、0001.csv）
+        """
+        if output_format not in BATCH_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        self.output_format = output_format
+        self.stream = stream
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._written = 0
+
+    def write(self, record: Dict[str, Any], result_text: Optional[str]):
+        """写出一条语句的执行记录和结果"""
+        if self.output_format == "jsonl":
+            self._write_jsonl(record, result_text)
+        else:
+            self._write_csv(record, result_text)
+        self._written += 1
+
+    def _write_jsonl(self, record: Dict[str, Any], result_text: Optional[str]):
+        line = dict(record)
+        if result_text:
+            results = raw_result(result_text)
+            # 结果文本中有换行时（格式化过的JSON）重新编码，保证每条记录占一行
+            if isinstance(results, RawJSON) and "\n" in results.text:
+                results = loads(results.text)
+            line["results"] = results
+        data = (encode_response(line) + "\n").encode("utf-8")
+        if self.directory:
+            with open(self._path(record, "jsonl"), "wb") as f:
+                f.write(data)
+        else:
+            self.stream.write(data)
+
+    def _write_csv(self, record: Dict[str, Any], result_text: Optional[str]):
+        results = loads(result_text) if record["status"] == "ok" and result_text else None
+        if not isinstance(results, list) or not results:
+            # 写操作、空结果和出错的语句只出现在汇总中
+            return
+        if self.directory:
+            with open(self._path(record, "csv"), "wb") as f:
+                for data in iter_export(results, "csv"):
+                    f.write(data)
+            return
+        # 写入同一个流时每条语句的结果各带表头，之间空一行
+        if self._written:
+            self.stream.write(b"\n")
+        for data in iter_export(results, "csv"):
+            self.stream.write(data)
+
+    def _path(self, record: Dict[str, Any], extension: str) -> str:
+        return os.path.join(self.directory, f"{record['index']:04d}.{extension}")
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+
+class BatchRunner:
+    """在一个租户的会话池上并行执行批处理输入"""
+
+    def __init__(self, config: Dict[str, Any], parallel: int = 4, nl: bool = False, execute: bool = True):
+        """
+        初始化
+
+        Args:
+            config: 数据库配置（与菜单和API服务器相同）
+            parallel: 同时执行的语句数，也是会话池的大小
+            nl: 输入是否为自然语言问题（先转换为SQL）
+            execute: 自然语言问题转换后是否执行
+        """
+        self.parallel = max(1, parallel)
+        self.nl = nl
+        self.execute = execute
+        self.config = dict(config, pool_size=self.parallel)
+        self.api_key = config.get("deepseek_api_key", "") or os.environ.get("DEEPSEEK_API_KEY")
+        if nl and not self.api_key:
+            raise ValueError("自然语言批处理需要DeepSeek API密钥")
+        self.tenant = Tenant("default", self.config)
+        self.history = get_query_history(config)
+        self.table_info: List[Dict[str, Any]] = []
+        self.startup_seconds = 0.0
+
+    def run(self, items: List[str], output: BatchOutput) -> Dict[str, Any]:
+        """
+        执行全部输入，结果按输入顺序写入 output
+
+        Returns:
+            耗时汇总
+        """
+        # 会话启动（MCP服务器进程或数据库连接）和表结构获取不计入执行耗时
+        startup_started = time.perf_counter()
+        self.tenant.pool.warm(min(self.parallel, len(items)))
+        if self.nl:
+            self.table_info = self.tenant.get_schema()
+        self.startup_seconds = time.perf_counter() - startup_started
+
+        started = time.perf_counter()
+
+        records = []
+        with ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="batch") as executor:
+            for segment in self._segments(items):
+                # map 按输入顺序返回结果，后面的语句已经在并行执行
+                for record, result_text in executor.map(self._run_item, *zip(*segment)):
+                    output.write(record, result_text)
+                    records.append(record)
+        output.close()
+        if self.history is not None:
+            self.history.flush()
+        return self.summary(records, time.perf_counter() - started)
+
+    def _segments(self, items: List[str]) -> List[List[Tuple[int, str]]]:
+        """
+        把输入分为依次执行的段：连续的SELECT并行执行，其他语句单独执行，
+        之前的语句全部完成后才开始，之后的语句等它完成（保证脚本中的写入和读取顺序）
+
+        自然语言问题在转换之前无法区分读写，全部并行执行
+        """
+        segments: List[List[Tuple[int, str]]] = []
+        reading = False
+        for index, text in enumerate(items, 1):
+            read_only = self.nl or is_select(text)
+            if read_only and reading:
+                segments[-1].append((index, text))
+            else:
+                segments.append([(index, text)])
+            reading = read_only
+        return segments
+
+    def _run_item(self, index: int, text: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """执行一条SQL或问题，返回 (执行记录, 结果文本)"""
+        started = time.perf_counter()
+        record: Dict[str, Any] = {"index": index, "input": text, "sql": text, "status": "ok", "rows": None,
+                                  "error": None}
+        entry: Dict[str, Any] = {"source": "batch", "tenant": self.tenant.name, "question": text if self.nl else None}
+        result_text = None
+        try:
+            sql = text
+            if self.nl:
+                llm_started = time.perf_counter()
+                translation = self.tenant.translate(text, self.table_info, self.api_key)
+                sql = translation["sql"]
+                record["llm_ms"] = round((time.perf_counter() - llm_started) * 1000, 1)
+                entry.update(llm_ms=record["llm_ms"], llm_cache=translation["cache"],
+                             tables=translation["tables_used"])
+                if translation["validation_errors"]:
+                    record.update(sql=sql, status="invalid", error="; ".join(translation["validation_errors"]))
+                    return record, None
+            record["sql"] = sql
+            if not sql or (self.nl and not self.execute):
+                return record, None
+            if self.nl:
+                # 与API相同，执行生成的SQL之前做等价改写
+                sql = self.tenant.rewrite_sql(sql, self.table_info)["sql"]
+                record["sql"] = sql
+
+            exec_started = time.perf_counter()
+            info: Dict[str, Any] = {}
+            result_text = self.tenant.execute_sql(sql, tables=entry.get("tables"), info=info)
+            record["exec_ms"] = round((time.perf_counter() - exec_started) * 1000, 1)
+            entry.update(exec_ms=record["exec_ms"], result_cache=info.get("result_cache"))
+            if not result_text:
+                record.update(status="error", error="执行SQL未返回结果")
+            elif not isinstance(raw_result(result_text), RawJSON):
+                # 工具返回的错误信息
+                record.update(status="error", error=result_text)
+                result_text = None
+            else:
+                record["rows"] = _row_count(result_text)
+                if self.nl and is_select(sql):
+                    self.tenant.record_example(text, sql)
+        except TimeoutError as e:
+            record.update(status="timeout", error=str(e) or "执行超时")
+        except Exception as e:
+            record.update(status="error", error=str(e))
+        finally:
+            record["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if self.history is not None:
+                entry.update(sql=record["sql"], status=record["status"], error=record["error"], rows=record["rows"],
+                             total_ms=record["ms"])
+                self.history.record(entry)
+        return record, result_text
+
+    def summary(self, records: List[Dict[str, Any]], seconds: float) -> Dict[str, Any]:
+        """批处理的耗时汇总"""
+        latencies = sorted(record["ms"] for record in records)
+        statuses: Dict[str, int] = {}
+        for record in records:
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "statements": len(records),
+            "statuses": statuses,
+            "failed": [record["index"] for record in records if record["status"] != "ok"],
+            "rows": sum(record["rows"] or 0 for record in records),
+            "parallel": self.parallel,
+            "startup_seconds": round(self.startup_seconds, 3),
+            "seconds": round(seconds, 3),
+            "per_second": round(len(records) / seconds, 1) if seconds > 0 else None,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": latencies[-1] if latencies else None
+            },
+            "llm_ms": round(sum(record.get("llm_ms", 0) for record in records), 1),
+            "exec_ms": round(sum(record.get("exec_ms", 0) for record in records), 1)
+        }
+
+    def close(self):
+        self.tenant.close()
+
+
+def run_batch(config: Dict[str, Any], source: str, nl: bool = False, execute: bool = True, parallel: int = 4,
+              output_format: str = "jsonl", output: Optional[str] = None, output_dir: Optional[str] = None,
+              stream: Optional[IO[bytes]] = None) -> Dict[str, Any]:
+    """
+    运行批处理
+
+    Args:
+        config: 数据库配置
+        source: 输入文件路径，- 表示标准输入
+        nl: 输入是否为自然语言问题
+        execute: 自然语言问题转换后是否执行
+        parallel: 并行度
+        output_format: jsonl 或 csv
+        output: 输出文件，为空时写入 stream
+        output_dir: 每条语句的结果写入该目录下的单独文件
+        stream: output 和 output_dir 都为空时的输出流（二进制），默认为标准输出
+
+    Returns:
+        耗时汇总
+    """
+    items = read_batch_input(source, nl=nl)
+    runner = BatchRunner(config, parallel=parallel, nl=nl, execute=execute)
+    if output_dir:
+        stream = None
+    elif output:
+        stream = open(output, "wb")
+    elif stream is None:
+        stream = sys.stdout.buffer
+    try:
+        summary = runner.run(items, BatchOutput(output_format, stream=stream, directory=output_dir))
+    finally:
+        runner.close()
+        if output and stream is not None:
+            stream.close()
+    return summary
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果直通的基准测试
+
+生成与 mysql2 输出格式相同的查询结果JSON，比较三种生成 /api/nl2sql 响应的方式每MB结果消耗的CPU时间和内存峰值：
+  reparse      json.loads 解析后用 Flask 的 jsonify 重新编码（原来的方式）
+  orjson       orjson 解析后重新编码（需要安装 orjson）
+  passthrough  直接嵌入结果文本，只编码外层字段
+
+每种方式都经过API的查询历史记录（写入临时目录中的 history.db），分别统计请求线程的CPU时间
+和包括查询历史写入线程在内的进程CPU时间
+
+用法: python bench_passthrough.py --rows 200000 --repeat 5
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict, Any, List, Tuple
+
+from flask import Flask, jsonify
+
+import fast_json
+import nl_to_sql_api
+from fast_json import encode_response, raw_result
+from query_history import get_query_history
+
+_TENANT = SimpleNamespace(name="bench")
+
+
+def make_result_text(rows: int, seed: int = 1) -> str:
+    """生成查询结果文本（整数、字符串、DECIMAL字符串、日期时间和NULL混合的行）"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    data = []
+    for index in range(rows):
+        data.append({
+            "id": index + 1,
+            "customer_id": rng.randint(1, 50000),
+            "name": f"客户{rng.randint(1, 99999)}",
+            "email": f"user{index}@example.com",
+            "amount": f"{rng.uniform(1, 10000):.2f}",
+            "status": rng.choice(["paid", "shipped", "cancelled", "refunded"]),
+            "created_at": (start + datetime.timedelta(seconds=rng.randint(0, 3e7))).isoformat() + ".000Z",
+            "note": None if rng.random() < 0.7 else "加急配送"
+        })
+    # mysql2 的结果经 JSON.stringify 输出，没有多余的空白
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def envelope() -> Dict[str, Any]:
+    return {
+        "success": True,
+        "sql": "SELECT * FROM orders WHERE created_at >= '2024-01-01'",
+        "explanation": "查询2024年以来的订单",
+        "tables_used": ["orders"],
+        "confidence": 0.9
+    }
+
+
+def finish(response: Dict[str, Any]):
+    """与 /api/nl2sql 相同，响应生成后记录查询历史"""
+    entry = {"source": "bench", "question": "2024年以来的订单", "sql": response["sql"]}
+    nl_to_sql_api._finish_history(_TENANT, entry, response, 200, time.perf_counter())
+
+
+def reparse(app: Flask) -> Callable[[str], bytes]:
+    def encode(result_text: str) -> bytes:
+        response = envelope()
+        response["results"] = json.loads(result_text)
+        with app.app_context():
+            data = jsonify(response).get_data()
+        finish(response)
+        return data
+    return encode
+
+
+def orjson_reparse(result_text: str) -> bytes:
+    response = envelope()
+    response["results"] = fast_json.loads(result_text)
+    data = encode_response(response).encode("utf-8")
+    finish(response)
+    return data
+
+
+def passthrough(result_text: str) -> bytes:
+    response = envelope()
+    response["results"] = raw_result(result_text)
+    data = encode_response(response).encode("utf-8")
+    finish(response)
+    return data
+
+
+def measure(encode: Callable[[str], bytes], result_text: str, repeat: int) -> Tuple[float, float, float]:
+    """
+    Returns:
+        (请求线程每次的CPU时间（毫秒，取最小值）, 包括历史写入的进程CPU时间（毫秒，取最小值）, 内存峰值（MB）)
+    """
+    history = get_query_history(nl_to_sql_api.config)
+    encode(result_text)
+    history.flush()
+    best_thread = best_process = None
+    for _ in range(repeat):
+        thread_started = time.thread_time()
+        process_started = time.process_time()
+        encode(result_text)
+        thread_elapsed = time.thread_time() - thread_started
+        history.flush()
+        process_elapsed = time.process_time() - process_started
+        best_thread = thread_elapsed if best_thread is None else min(best_thread, thread_elapsed)
+        best_process = process_elapsed if best_process is None else min(best_process, process_elapsed)
+
+    tracemalloc.start()
+    encode(result_text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    history.flush()
+    return best_thread * 1000, best_process * 1000, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询结果直通的基准测试")
+    parser.add_argument("--rows", type=int, default=200000, help="结果行数")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式的重复次数（取最快的一次）")
+    args = parser.parse_args()
+
+    nl_to_sql_api.config = {"history_db": os.path.join(tempfile.mkdtemp(prefix="bench_history_"), "history.db")}
+    result_text = make_result_text(args.rows)
+    megabytes = len(result_text.encode("utf-8")) / 1e6
+    print(f"结果: {args.rows} 行, {megabytes:.1f} MB\n")
+
+    methods: List[Tuple[str, Callable[[str], bytes]]] = [("reparse", reparse(Flask(__name__)))]
+    if fast_json.ORJSON_AVAILABLE:
+        methods.append(("orjson", orjson_reparse))
+    methods.append(("passthrough", passthrough))
+
+    # 三种方式输出的JSON内容必须相同
+    expected = json.loads(methods[0][1](result_text))
+    for name, encode in methods[1:]:
+        if json.loads(encode(result_text)) != expected:
+            raise SystemExit(f"{name} 的输出与 reparse 不一致")
+
+    print(f"{'方式':<12} {'请求线程 ms':>12} {'ms/MB':>8} {'含历史写入 ms/MB':>17} {'内存峰值 MB':>12} {'节省 ms/MB':>11}")
+    baseline = None
+    for name, encode in methods:
+        thread_ms, process_ms, peak = measure(encode, result_text, args.repeat)
+        per_mb = thread_ms / megabytes
+        baseline = per_mb if baseline is None else baseline
+        print(f"{name:<12} {thread_ms:>12.1f} {per_mb:>8.2f} {process_ms / megabytes:>17.2f} {peak:>12.1f} "
+              f"{baseline - per_mb:>11.2f}")
+    if not fast_json.ORJSON_AVAILABLE:
+        print("\n未安装 orjson，跳过 orjson 方式（pip install orjson）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量写入模块
+
+将大量写语句合并为多行INSERT，并按批次在同一个会话上以事务方式执行，
+统计写入速度和每个批次的失败情况
+"""
+
+import json
+import time
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from deadline import Deadline
+from session_pool import extract_text
+from sql_utils import PUNCT, find_keyword, significant, split_statements, tokenize, top_level
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def parse_insert(sql: str) -> Optional[Tuple[str, List[str], str]]:
+    """
+    拆分 INSERT ... VALUES 语句
+
+    Args:
+        sql: 单条SQL语句
+
+    Returns:
+        (VALUES 之前的部分, 每组值的文本, VALUES 之后的部分如 ON DUPLICATE KEY UPDATE)，
+        不是 INSERT ... VALUES 语句时返回 None
+    """
+    tokens = significant(tokenize(sql))
+    if not tokens or not tokens[0].is_keyword("INSERT", "REPLACE"):
+        return None
+    values_index = find_keyword(tokens, "VALUES")
+    if values_index == -1:
+        values_index = find_keyword(tokens, "VALUE")
+    if values_index == -1:
+        return None
+
+    prefix = sql[:tokens[values_index].pos].strip()
+    tuples = []
+    tail = ""
+    depths = top_level(tokens)
+    index = values_index + 1
+    while index < len(tokens):
+        token, depth = depths[index]
+        if token.type == PUNCT and token.value == "(" and depth == 0:
+            # 找到对应的右括号
+            end = index + 1
+            while not (depths[end][0].type == PUNCT and depths[end][0].value == ")" and depths[end][1] == 0):
+                end += 1
+                if end >= len(tokens):
+                    return None
+            close = tokens[end]
+            tuples.append(sql[token.pos:close.pos + 1])
+            index = end + 1
+            if index < len(tokens) and tokens[index].type == PUNCT and tokens[index].value == ",":
+                index += 1
+                continue
+            if index < len(tokens):
+                tail = sql[tokens[index].pos:].strip()
+            break
+        return None
+    if not tuples:
+        return None
+    return prefix, tuples, tail
+
+
+def coalesce_inserts(statements: Sequence[str], max_rows: int = 500,
+                     max_bytes: int = 1000000) -> List[Tuple[str, int]]:
+    """
+    将相邻的、目标表和列相同的INSERT合并为多行INSERT
+
+    Args:
+        statements: SQL语句列表（每项可以包含多条以分号分隔的语句）
+        max_rows: 每条合并后的INSERT最多包含的行数
+        max_bytes: 每条合并后的INSERT的最大长度（避免超过 max_allowed_packet）
+
+    Returns:
+        (合并后的语句, 合并前的语句数) 列表，保持原有执行顺序
+    """
+    result: List[Tuple[str, int]] = []
+    group_key = None
+    group_prefix = ""
+    group_tail = ""
+    group_tuples: List[str] = []
+    group_size = 0
+    group_count = 0
+
+    def flush():
+        nonlocal group_key, group_tuples, group_size, group_count
+        if group_tuples:
+            tail = f" {group_tail}" if group_tail else ""
+            result.append((f"{group_prefix} VALUES {', '.join(group_tuples)}{tail}", group_count))
+        group_key = None
+        group_tuples = []
+        group_size = 0
+        group_count = 0
+
+    for item in statements:
+        for sql in split_statements(item):
+            parsed = parse_insert(sql)
+            if parsed is None:
+                flush()
+                result.append((sql, 1))
+                continue
+
+            prefix, tuples, tail = parsed
+            key = (" ".join(prefix.split()).upper(), tail)
+            size = sum(len(t) + 2 for t in tuples)
+            if (key != group_key or len(group_tuples) + len(tuples) > max_rows or
+                    group_size + size > max_bytes):
+                flush()
+                group_key = key
+                group_prefix = prefix
+                group_tail = tail
+            group_tuples.extend(tuples)
+            group_size += size
+            group_count += 1
+
+    flush()
+    return result
+
+
+def rows_to_inserts(table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]],
+                    max_rows: int = 500) -> List[Tuple[str, List[Any], int]]:
+    """
+    将行数据转换为参数化的多行INSERT
+
+    Returns:
+        (SQL, 参数, 行数) 列表
+    """
+    column_list = ", ".join(_quote(c) for c in columns)
+    placeholder = "(" + ", ".join("?" for _ in columns) + ")"
+    result = []
+    for start in range(0, len(rows), max_rows):
+        chunk = rows[start:start + max_rows]
+        params: List[Any] = []
+        for offset, row in enumerate(chunk):
+            if len(row) != len(columns):
+                raise ValueError(f"第 {start + offset + 1} 行的列数与 columns 不一致")
+            params.extend(row)
+        sql = f"INSERT INTO {_quote(table)} ({column_list}) VALUES {', '.join(placeholder for _ in chunk)}"
+        result.append((sql, params, len(chunk)))
+    return result
+
+
+def _affected_rows(result_text: Optional[str]) -> int:
+    """从 execute 工具的结果中读取受影响行数"""
+    try:
+        data = json.loads(result_text or "")
+    except json.JSONDecodeError:
+        return 0
+    if isinstance(data, dict):
+        return int(data.get("affectedRows", 0) or 0)
+    return 0
+
+
+class BulkWriter:
+    """在单个池化会话上按事务批次执行写语句"""
+
+    def __init__(self, pool, batch_size: int = 100, max_rows_per_insert: int = 500,
+                 max_statement_bytes: int = 1000000, stop_on_error: bool = False,
+                 timeout: Optional[float] = None):
+        """
+        初始化批量写入器
+
+        Args:
+            pool: MCP会话池
+            batch_size: 每个事务包含的语句数（合并之后）
+            max_rows_per_insert: 每条多行INSERT最多包含的行数
+            max_statement_bytes: 每条多行INSERT的最大长度
+            stop_on_error: 某个批次失败后是否停止执行后续批次
+            timeout: 一次写入（全部批次）的超时时间（秒），为空表示不限制
+        """
+        self.pool = pool
+        self.batch_size = max(1, batch_size)
+        self.max_rows_per_insert = max(1, max_rows_per_insert)
+        self.max_statement_bytes = max_statement_bytes
+        self.stop_on_error = stop_on_error
+        self.timeout = timeout or None
+
+    def write_statements(self, statements: Sequence[str], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        执行一组写语句
+
+        Args:
+            statements: SQL语句列表
+            deadline: 请求的截止时间
+
+        Returns:
+            执行报告
+
+        Raises:
+            TimeoutError: 超时（正在执行的批次被回滚，之前的批次已经提交）
+            RequestCancelled: deadline 被取消
+        """
+        merged = coalesce_inserts(statements, self.max_rows_per_insert, self.max_statement_bytes)
+        items = [(sql, [], count) for sql, count in merged]
+        report = self._run(items, deadline)
+        report["statements_in"] = sum(count for _, count in merged)
+        return report
+
+    def write_rows(self, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]],
+                   deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        批量插入行数据
+
+        Args:
+            table: 表名
+            columns: 列名
+            rows: 行数据，每行的值与 columns 一一对应
+            deadline: 请求的截止时间
+
+        Returns:
+            执行报告
+
+        Raises:
+            TimeoutError: 超时（正在执行的批次被回滚，之前的批次已经提交）
+            RequestCancelled: deadline 被取消
+        """
+        items = rows_to_inserts(table, columns, rows, self.max_rows_per_insert)
+        report = self._run(items, deadline)
+        report["rows_in"] = len(rows)
+        return report
+
+    def _run(self, items: List[Tuple[str, List[Any], int]], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+        async def run_batches(session):
+            rows = 0
+            failures = []
+            committed = 0
+            for batch_index, batch in enumerate(batches):
+                batch_rows = 0
+                await session.call_tool("execute", arguments={"sql": "START TRANSACTION", "params": []})
+                try:
+                    for sql, params, _ in batch:
+                        result = await session.call_tool("execute", arguments={"sql": sql, "params": params})
+                        if getattr(result, "isError", False):
+                            raise RuntimeError(extract_text(result))
+                        batch_rows += _affected_rows(extract_text(result))
+                    await session.call_tool("execute", arguments={"sql": "COMMIT", "params": []})
+                except Exception as e:
+                    await session.call_tool("execute", arguments={"sql": "ROLLBACK", "params": []})
+                    failures.append({
+                        "batch": batch_index,
+                        "statements": sum(count for _, _, count in batch),
+                        "error": str(e)
+                    })
+                    if self.stop_on_error:
+                        break
+                    continue
+                rows += batch_rows
+                committed += 1
+            return rows, committed, failures
+
+        started = time.time()
+        # 超时或取消时会话被关闭，服务端回滚未提交的事务
+        rows, committed, failures = self.pool.run(run_batches, timeout=self.timeout, deadline=deadline)
+        seconds = time.time() - started
+        return {
+            "success": not failures,
+            "statements_out": len(items),
+            "batches": len(batches),
+            "committed_batches": committed,
+            "failed_batches": failures,
+            "rows_affected": rows,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None
+        }
+
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存模块
+
+提供带过期时间和容量上限的缓存，用于表结构缓存、自然语言转SQL结果缓存和查询结果缓存。
+默认使用进程内缓存，配置 shared_store 后使用多进程共享的SQLite缓存
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from shared_store import get_shared_store
+
+
+def make_key(*parts: Any) -> str:
+    """根据任意可JSON序列化的内容生成缓存键"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """线程安全的LRU缓存，支持过期时间"""
+
+    def __init__(self, ttl: Optional[float] = 300, max_entries: int = 1024):
+        """
+        初始化缓存
+
+        Args:
+            ttl: 默认过期时间（秒），None 表示不过期，0 表示禁用缓存
+            max_entries: 最大条目数
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取缓存值，不存在或已过期时返回 default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存值"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl == 0:
+            return
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """删除缓存值"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class SQLiteCache:
+    """基于共享存储的缓存，接口与 MemoryCache 相同，值必须可JSON序列化"""
+
+    def __init__(self, store, namespace: str, ttl: Optional[float] = 300, max_entries: int = 1024):
+        """
+        初始化缓存
+
+        Args:
+            store: SharedStore 实例
+            namespace: 命名空间（不同租户、不同用途的缓存互不影响）
+            ttl: 默认过期时间（秒），None 表示不过期，0 表示禁用缓存
+            max_entries: 最大条目数
+        """
+        self.store = store
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取缓存值，不存在或已过期时返回 default"""
+        if self.ttl == 0:
+            return default
+        try:
+            value = self.store.cache_get(self.namespace, key)
+        except Exception as e:
+            print(f"读取共享缓存时出错: {str(e)}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存值"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl == 0:
+            return
+        try:
+            self.store.cache_set(self.namespace, key, json.dumps(value, ensure_ascii=False),
+                                 ttl, self.max_entries)
+        except Exception as e:
+            print(f"写入共享缓存时出错: {str(e)}")
+
+    def delete(self, key: str):
+        """删除缓存值"""
+        self.store.cache_delete(self.namespace, key)
+
+    def clear(self):
+        """清空缓存"""
+        self.store.cache_delete(self.namespace)
+
+    def stats(self) -> dict:
+        """缓存统计信息（命中率为当前进程的统计）"""
+        return {
+            "entries": self.store.cache_count(self.namespace),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def shared_store_path(config: Dict[str, Any]) -> Optional[str]:
+    """共享存储路径，环境变量 NL2SQL_SHARED_STORE 优先于配置项 shared_store"""
+    return os.environ.get("NL2SQL_SHARED_STORE") or config.get("shared_store") or None
+
+
+def create_cache(config: Dict[str, Any], namespace: str, ttl: Optional[float] = 300,
+                 max_entries: int = 1024):
+    """
+    根据配置创建缓存
+
+    Args:
+        config: 配置，设置了共享存储时使用 SQLiteCache，否则使用 MemoryCache
+        namespace: 共享缓存的命名空间
+        ttl: 默认过期时间（秒）
+        max_entries: 最大条目数
+    """
+    path = shared_store_path(config)
+    if path:
+        return SQLiteCache(get_shared_store(path), namespace, ttl=ttl, max_entries=max_entries)
+    return MemoryCache(ttl=ttl, max_entries=max_entries)
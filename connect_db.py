@@ -10,6 +10,12 @@ import sys
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+# 进程内MySQL后端（需要 aiomysql）
+try:
+    from native_mysql import AIOMYSQL_AVAILABLE as NATIVE_AVAILABLE, native_call
+except ImportError:
+    NATIVE_AVAILABLE = False
+
 
 async def run_connect(host, user, password, database, port):
     """连接到数据库"""
@@ -62,6 +68,25 @@ async def run_connect(host, user, password, database, port):
         traceback.print_exc()
 
 
+def run_native_connect(host, user, password, database, port):
+    """使用进程内MySQL后端连接数据库（不启动MCP服务器）"""
+    config = {
+        "host": host,
+        "user": user,
+        "password": password,
+        "database": database,
+        "port": port
+    }
+    try:
+        print("连接到数据库...")
+        result = native_call(config, "query", {"sql": "SELECT VERSION() AS version", "params": []})
+        print("连接结果:")
+        print(f"Successfully connected to database (MySQL {json.loads(result)[0]['version']})")
+    except Exception as e:
+        print(f"执行过程中出错: {str(e)}")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     if len(sys.argv) >= 6:
         host = sys.argv[1]
@@ -69,7 +94,13 @@ if __name__ == "__main__":
         password = sys.argv[3]
         database = sys.argv[4]
         port = int(sys.argv[5])
-        asyncio.run(run_connect(host, user, password, database, port))
+        backend = sys.argv[6] if len(sys.argv) >= 7 else "mcp"
+        if backend == "native" and NATIVE_AVAILABLE:
+            run_native_connect(host, user, password, database, port)
+        else:
+            if backend == "native":
+                print("未安装 aiomysql，使用MCP服务器连接")
+            asyncio.run(run_connect(host, user, password, database, port))
     else:
-        print("用法: python connect_db.py <host> <user> <password> <database> <port>")
+        print("用法: python connect_db.py <host> <user> <password> <database> <port> [mcp|native]")
         sys.exit(1)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求截止时间模块
+
+每个请求一个 Deadline，覆盖LLM调用、MCP工具调用和SQL执行：阻塞调用的等待时间不超过剩余时间，
+客户端断开时取消 Deadline，已注册的回调（如取消MCP调用并终止正在执行的语句）立即执行
+"""
+
+import select
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class RequestCancelled(Exception):
+    """请求已被取消（客户端断开或超过截止时间）"""
+
+
+class DeadlineExceeded(RequestCancelled, TimeoutError):
+    """超过请求的截止时间"""
+
+
+class Deadline:
+    """请求的截止时间和取消状态（线程安全）"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        初始化截止时间
+
+        Args:
+            timeout: 从现在起的时长（秒），为空或0表示不限时间（仍然可以取消）
+        """
+        self.timeout_seconds = timeout or None
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，不限时间时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self):
+        """
+        检查请求是否还可以继续
+
+        Raises:
+            RequestCancelled: 请求已被取消
+            DeadlineExceeded: 已超过截止时间
+        """
+        if self.reason is not None:
+            raise RequestCancelled(self.reason)
+        if self.expired:
+            raise DeadlineExceeded(f"请求超过截止时间（{self.timeout_seconds:g}秒）")
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """
+        阻塞调用可以等待的时间：剩余时间与 default 中较小的一个
+
+        Raises:
+            RequestCancelled: 请求已被取消
+            DeadlineExceeded: 已超过截止时间
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(remaining, default)
+
+    def cancel(self, reason: str = "客户端已断开"):
+        """取消请求并执行已注册的回调"""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"执行取消回调时出错: {str(e)}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册取消时执行的回调，请求已取消时立即执行
+
+        Returns:
+            注销回调的函数
+        """
+        with self._lock:
+            if self.reason is None:
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+        callback()
+        return lambda: None
+
+
+class DisconnectWatcher:
+    """后台线程定期检查客户端连接，发现对端关闭时取消对应请求的 Deadline"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watched: Dict[int, tuple] = {}
+        self._thread = None
+
+    def watch(self, sock: Optional[socket.socket], deadline: Deadline) -> Callable[[], None]:
+        """
+        开始监视客户端连接（请求体已经读取完毕之后调用）
+
+        Args:
+            sock: 客户端套接字，为空或平台不支持时不监视
+            deadline: 客户端断开时取消的 Deadline
+
+        Returns:
+            停止监视的函数
+        """
+        if sock is None or not hasattr(select, "poll"):
+            return lambda: None
+        try:
+            fd = sock.fileno()
+        except OSError:
+            return lambda: None
+        with self._lock:
+            self._watched[fd] = (sock, deadline)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="disconnect-watcher", daemon=True)
+                self._thread.start()
+        return lambda: self._unwatch(fd, deadline)
+
+    def _unwatch(self, fd: int, deadline: Deadline):
+        with self._lock:
+            if fd in self._watched and self._watched[fd][1] is deadline:
+                del self._watched[fd]
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = dict(self._watched)
+            if not watched:
+                continue
+
+            poller = select.poll()
+            for fd in watched:
+                poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+            try:
+                events = poller.poll(0)
+            except OSError:
+                continue
+
+            for fd, event in events:
+                sock, deadline = watched[fd]
+                if event & (select.POLLHUP | select.POLLERR):
+                    closed = True
+                else:
+                    # 可读但读不到数据表示对端已关闭；读到数据（下一个请求）说明连接仍然有效
+                    try:
+                        closed = sock.recv(1, socket.MSG_PEEK) == b""
+                    except (BlockingIOError, InterruptedError):
+                        closed = False
+                    except OSError:
+                        closed = True
+                if closed:
+                    self._unwatch(fd, deadline)
+                    deadline.cancel("客户端已断开")
+
+
+disconnect_watcher = DisconnectWatcher()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+示例库模块
+
+保存经过验证的（问题, SQL）示例对（来自成功执行的查询和人工维护），
+用进程内的字符n-gram倒排索引检索与新问题最相似的示例，
+在token预算内作为few-shot示例加入提示词
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS examples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant TEXT NOT NULL,
+    question TEXT NOT NULL,
+    sql TEXT NOT NULL,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (tenant, question)
+);
+"""
+
+# 去掉空白和标点后再切分n-gram
+_NOISE_RE = re.compile(r"[\s,.;:!?，。；：！？、（）()\"'“”‘’]+")
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+
+def _grams(text: str) -> List[str]:
+    """文本的字符二元组（去重）"""
+    text = _NOISE_RE.sub(" ", text.lower()).strip()
+    if len(text) < 2:
+        return [text] if text else []
+    return list(dict.fromkeys(text[i:i + 2] for i in range(len(text) - 1)))
+
+
+def estimate_tokens(text: str) -> int:
+    """估算token数：中文约每字一个token，其他字符约每4个一个token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class NgramIndex:
+    """字符二元组倒排索引，按二元组的余弦相似度排序"""
+
+    def __init__(self, max_df_ratio: float = 0.05, max_grams: int = 12, max_postings: int = 10000):
+        """
+        初始化索引
+
+        Args:
+            max_df_ratio: 出现在超过该比例文档中的二元组在检索时跳过（类似停用词），
+                          查询中的二元组都很常见时不跳过
+            max_grams: 检索时最多使用的二元组数（按出现的文档数从少到多选取）
+            max_postings: 检索时最多扫描的倒排记录数
+        """
+        self.max_df_ratio = max_df_ratio
+        self.max_grams = max_grams
+        self.max_postings = max_postings
+        self._postings: Dict[str, array] = {}
+        # 文档ID -> 文本，用于候选文档的精确打分
+        self._texts: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def add(self, doc_id: int, text: str):
+        self._texts[doc_id] = text
+        for gram in _grams(text):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array("i")
+            postings.append(doc_id)
+
+    def remove(self, doc_id: int):
+        # 倒排表中的记录在检索时跳过，不立即删除
+        self._texts.pop(doc_id, None)
+
+    def search(self, text: str, k: int = 3) -> List[Tuple[int, float]]:
+        """
+        检索最相似的文档
+
+        Returns:
+            [(文档ID, 相似度)]，按相似度从高到低排列
+        """
+        total = len(self._texts)
+        grams = _grams(text)
+        if not total or not grams:
+            return []
+
+        # 只用最有区分度的几个二元组计数，常见的二元组（类似停用词）跳过
+        known = sorted((self._postings[gram] for gram in grams if gram in self._postings), key=len)
+        max_df = max(50, int(total * self.max_df_ratio))
+        selective = [postings for postings in known if len(postings) <= max_df]
+        known = (selective or known)[:self.max_grams]
+
+        counts: Counter = Counter()
+        scanned = 0
+        for postings in known:
+            # 限制扫描的倒排记录总数，保证最坏情况下的检索延迟；
+            # 所有二元组都很常见时只扫描最新加入的记录
+            if scanned and scanned + len(postings) > self.max_postings:
+                break
+            if len(postings) > self.max_postings:
+                postings = postings[-self.max_postings:]
+            scanned += len(postings)
+            counts.update(postings)
+
+        # 先按共同二元组数取候选，再按完整的二元组余弦相似度排序
+        query = set(grams)
+        candidates = []
+        for doc_id, _ in counts.most_common(k * 4):
+            doc_text = self._texts.get(doc_id)
+            if doc_text is None:
+                continue
+            doc_grams = _grams(doc_text)
+            shared = sum(1 for gram in doc_grams if gram in query)
+            candidates.append((shared / math.sqrt(len(query) * max(1, len(doc_grams))), doc_id))
+        candidates.sort(reverse=True)
+        return [(doc_id, score) for score, doc_id in candidates[:k]]
+
+
+class ExampleStore:
+    """示例库（SQLite持久化），每个租户一个内存索引"""
+
+    def __init__(self, path: str, refresh_interval: float = 30):
+        """
+        初始化示例库
+
+        Args:
+            path: SQLite数据库文件路径
+            refresh_interval: 从数据库加载其他进程新增示例的间隔（秒）
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        # 租户 -> (索引, {ID: (问题, SQL)}, {问题: ID}, 已加载的最大ID, 上次加载时间)
+        self._tenants: Dict[str, Dict[str, Any]] = {}
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _tenant(self, tenant: str) -> Dict[str, Any]:
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = {
+                "index": NgramIndex(), "examples": {}, "questions": {}, "last_id": 0, "loaded_at": 0.0
+            }
+        if time.time() - state["loaded_at"] >= self.refresh_interval:
+            self._load(tenant, state)
+        return state
+
+    def _load(self, tenant: str, state: Dict[str, Any]):
+        """加载数据库中新增的示例"""
+        rows = self.connection().execute(
+            "SELECT id, question, sql FROM examples WHERE tenant = ? AND id > ? ORDER BY id",
+            (tenant, state["last_id"])
+        ).fetchall()
+        for example_id, question, sql in rows:
+            self._index(state, example_id, question, sql)
+        state["loaded_at"] = time.time()
+
+    @staticmethod
+    def _index(state: Dict[str, Any], example_id: int, question: str, sql: str):
+        if example_id in state["examples"]:
+            return
+        state["index"].add(example_id, question)
+        state["examples"][example_id] = (question, sql)
+        state["questions"][question] = example_id
+        state["last_id"] = max(state["last_id"], example_id)
+
+    def add(self, tenant: str, question: str, sql: str, source: str = "manual") -> Optional[int]:
+        """
+        添加示例，问题已存在时人工添加的示例覆盖原有SQL，自动添加的示例忽略
+
+        Args:
+            tenant: 租户名称
+            question: 自然语言问题
+            sql: 对应的SQL
+            source: 来源（manual 或 execution）
+
+        Returns:
+            示例ID，忽略时返回 None
+        """
+        question = question.strip()
+        with self._lock:
+            state = self._tenant(tenant)
+            existing = state["questions"].get(question)
+            if existing is not None and source != "manual":
+                return None
+
+        conn = self.connection()
+        if existing is not None:
+            conn.execute("UPDATE examples SET sql = ?, source = ? WHERE id = ?", (sql, source, existing))
+            with self._lock:
+                state["examples"][existing] = (question, sql)
+            return existing
+
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO examples (tenant, question, sql, source, created_at) VALUES (?, ?, ?, ?, ?)",
+            (tenant, question, sql, source, time.time())
+        )
+        if not cursor.rowcount:
+            return None
+        with self._lock:
+            self._index(state, cursor.lastrowid, question, sql)
+        return cursor.lastrowid
+
+    def remove(self, tenant: str, example_id: int) -> bool:
+        """删除示例"""
+        cursor = self.connection().execute("DELETE FROM examples WHERE tenant = ? AND id = ?",
+                                           (tenant, example_id))
+        with self._lock:
+            state = self._tenant(tenant)
+            example = state["examples"].pop(example_id, None)
+            if example is not None:
+                state["index"].remove(example_id)
+                state["questions"].pop(example[0], None)
+        return bool(cursor.rowcount)
+
+    def search(self, tenant: str, question: str, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        检索与问题最相似的示例
+
+        Returns:
+            [{"id", "question", "sql", "score"}]
+        """
+        with self._lock:
+            state = self._tenant(tenant)
+            hits = state["index"].search(question, k)
+            return [{"id": example_id, "question": state["examples"][example_id][0],
+                     "sql": state["examples"][example_id][1], "score": round(score, 4)}
+                    for example_id, score in hits]
+
+    def few_shot(self, tenant: str, question: str, k: int = 3, token_budget: int = 600,
+                 min_score: float = 0.2) -> List[Dict[str, Any]]:
+        """
+        选择放入提示词的示例
+
+        Args:
+            tenant: 租户名称
+            question: 自然语言问题
+            k: 最多返回的示例数
+            token_budget: 示例的token总预算
+            min_score: 最低相似度
+
+        Returns:
+            按相似度从高到低排列的示例
+        """
+        selected = []
+        used = 0
+        for example in self.search(tenant, question, k):
+            if example["score"] < min_score or example["question"] == question.strip():
+                continue
+            cost = estimate_tokens(example["question"]) + estimate_tokens(example["sql"]) + 8
+            if used + cost > token_budget:
+                break
+            selected.append(example)
+            used += cost
+        return selected
+
+    def list(self, tenant: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """按添加时间倒序列出示例"""
+        rows = self.connection().execute(
+            "SELECT id, question, sql, source, created_at FROM examples WHERE tenant = ? "
+            "ORDER BY id DESC LIMIT ? OFFSET ?",
+            (tenant, limit, offset)
+        ).fetchall()
+        return [{"id": r[0], "question": r[1], "sql": r[2], "source": r[3], "created_at": r[4]} for r in rows]
+
+    def stats(self, tenant: str) -> Dict[str, Any]:
+        """示例数量"""
+        with self._lock:
+            return {"examples": len(self._tenant(tenant)["index"])}
+
+
+_stores: Dict[str, ExampleStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_example_store(path: str) -> ExampleStore:
+    """获取指定路径的示例库（同一进程内共享）"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ExampleStore(path)
+        return store
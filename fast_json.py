@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON编码模块
+
+查询结果是MCP工具（或进程内后端）返回的JSON文本。不需要处理行数据时，响应直接嵌入这段文本，
+只对外层的响应字段编码，省去解析成Python对象再重新编码的开销；必须编码时使用 orjson（已安装时）
+"""
+
+import json
+from typing import Dict, Any, Optional
+
+# orjson 是可选依赖，未安装时使用标准库 json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class RawJSON:
+    """已经编码好的JSON文本，编码响应时原样嵌入"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def row_count(self) -> Optional[int]:
+        """
+        行数组的行数（顶层数组的元素个数）
+
+        用 loads 解析后计数：字符串中的分隔符、嵌套的对象（JSON列）和格式化输出中的空白都不影响结果。
+        解析由C实现完成，比在Python中逐字符扫描快；查询历史在后台写入线程中调用，不占用请求线程
+
+        Returns:
+            行数，不是数组（如写操作的执行结果）或文本不是合法的JSON时返回 None
+        """
+        try:
+            value = loads(self.text)
+        except ValueError:
+            return None
+        return len(value) if isinstance(value, list) else None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, RawJSON):
+        return loads(value.text)
+    return str(value)
+
+
+def dumps(value: Any) -> str:
+    """编码为JSON文本（不转义非ASCII字符，无法编码的值转换为字符串）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, default=_default)
+
+
+def loads(text: str) -> Any:
+    """
+    解析JSON文本
+
+    Raises:
+        json.JSONDecodeError: 文本不是合法的JSON（orjson 的错误也是它的子类）
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def raw_result(result_text: str) -> Any:
+    """
+    不解析工具返回的结果文本：JSON数组或对象包装为 RawJSON，其他文本（错误信息等）原样返回字符串
+
+    mysql2 和进程内后端输出的都是合法的JSON，只按首尾字符判断
+    """
+    text = result_text.strip()
+    if (text.startswith("[") and text.endswith("]")) or (text.startswith("{") and text.endswith("}")):
+        return RawJSON(text)
+    return result_text
+
+
+def encode_response(response: Dict[str, Any]) -> str:
+    """
+    编码响应，RawJSON 类型的顶层字段直接嵌入原文本
+
+    Args:
+        response: 响应数据
+
+    Returns:
+        JSON文本
+    """
+    raw = {key: value.text for key, value in response.items() if isinstance(value, RawJSON)}
+    if not raw:
+        return dumps(response)
+    head = dumps({key: value for key, value in response.items() if key not in raw})
+    parts = [head[:-1]]
+    separator = "," if len(head) > 2 else ""
+    for key, text in raw.items():
+        parts.append(separator + dumps(key) + ":" + text)
+        separator = ","
+    parts.append("}")
+    return "".join(parts)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引建议模块
+
+从查询历史中取出成功执行的生成SQL（按SQL指纹归并），分析每类查询在各表上的等值条件、连接条件、
+范围条件、GROUP BY 和 ORDER BY 列，得到候选索引（等值列在前，其次是分组/排序列或第一个范围列），
+与已有索引（表统计信息）和 EXPLAIN 的执行计划对照，按 估算减少的扫描行数 × 执行次数 排序。
+只给出建议（CREATE INDEX 语句），不修改数据库
+
+用法:
+    python index_advisor.py [--config config.json] [--tenant default] [--hours 24] [--limit 20] [--no-explain]
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from fast_json import loads
+from query_history import get_query_history
+from sql_utils import IDENT, PUNCT, QUOTED, find_keyword, identifier_name, significant, statement_type, tokenize
+from sql_validator import KEYWORDS, table_aliases
+from table_stats import estimate_scan, filter_columns, format_count
+from tenants import TenantRegistry
+
+# 不知道基数时，等值条件和范围条件各保留的行数比例（只影响候选索引的排序）
+_EQUALITY_SELECTIVITY = 0.01
+_RANGE_SELECTIVITY = 0.3
+
+# 出现在 GROUP BY/ORDER BY 所在的括号深度时，表示子句结束
+_LIST_ENDINGS = ("HAVING", "ORDER", "LIMIT", "WINDOW", "UNION", "FOR", "LOCK", "INTO", "WITH", "PROCEDURE")
+
+# EXPLAIN 中表示需要额外排序的 Extra
+_SORT_EXTRAS = ("Using filesort", "Using temporary")
+
+
+def clause_columns(tokens, keyword: str) -> Optional[List[Tuple[Optional[str], str]]]:
+    """
+    顶层 GROUP BY 或 ORDER BY 中的列
+
+    Args:
+        tokens: 去掉空白和注释的词法单元
+        keyword: "GROUP BY" 或 "ORDER BY"
+
+    Returns:
+        [(限定符（小写）, 列名（小写）)]，没有这个子句时返回 None，有表达式（不能使用索引）时返回空列表
+    """
+    position = find_keyword(tokens, keyword)
+    if position < 0:
+        return None
+    items: List[list] = [[]]
+    depth = 0
+    for token in tokens[position + 2:]:
+        if token.type == PUNCT and token.value == "(":
+            depth += 1
+        elif token.type == PUNCT and token.value == ")":
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0 and token.type == PUNCT and token.value == ",":
+            items.append([])
+            continue
+        elif depth == 0 and (token.is_keyword(*_LIST_ENDINGS) or (token.type == PUNCT and token.value == ";")):
+            break
+        items[-1].append(token)
+
+    columns = []
+    for item in items:
+        if item and item[-1].is_keyword("ASC", "DESC"):
+            item = item[:-1]
+        if len(item) == 1:
+            qualifier, name = None, item[0]
+        elif len(item) == 3 and item[1].type == PUNCT and item[1].value == ".":
+            qualifier, name = identifier_name(item[0]).lower(), item[2]
+        else:
+            return []
+        if name.type not in (IDENT, QUOTED) or (name.type == IDENT and name.upper in KEYWORDS):
+            return []
+        columns.append((qualifier, identifier_name(name).lower()))
+    return columns
+
+
+def _column_index(table_info: Optional[List[Dict[str, Any]]]) -> Dict[str, set]:
+    """表名（小写） -> 列名集合（小写）"""
+    return {table["name"].lower(): {column["name"].lower() for column in table.get("columns", [])}
+            for table in table_info or []}
+
+
+def query_usage(sql: str, table_info: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    单条语句在各表上使用的列
+
+    不带限定符的列按表结构归属到唯一包含该列的表（只引用一个表时直接归属），无法确定时忽略
+
+    Args:
+        sql: SELECT、UPDATE 或 DELETE 语句
+        table_info: 表结构信息
+
+    Returns:
+        表名（小写） -> {"equality", "join", "range", "group", "order": 列名列表（小写，按出现顺序）}，
+        group/order 只有在子句中的列全部属于该表时才非空
+    """
+    if statement_type(sql) not in ("SELECT", "UPDATE", "DELETE"):
+        return {}
+    tokens = significant(tokenize(sql))
+    aliases = table_aliases(sql)
+    tables = list(dict.fromkeys(aliases.values()))
+    schema = _column_index(table_info)
+
+    def resolve(qualifier: Optional[str], column: str) -> Optional[str]:
+        if qualifier is not None:
+            return aliases.get(qualifier)
+        if len(tables) == 1:
+            return tables[0]
+        owners = [table for table in tables if column in schema.get(table, ())]
+        return owners[0] if len(owners) == 1 else None
+
+    usage = {table: {"equality": [], "join": [], "range": [], "group": [], "order": []} for table in tables}
+    for qualifier, column, sargable, kind in filter_columns(tokens):
+        table = resolve(qualifier, column)
+        if table is None or not sargable or kind == "other" or column in usage[table][kind]:
+            continue
+        usage[table][kind].append(column)
+
+    for keyword, kind in (("GROUP BY", "group"), ("ORDER BY", "order")):
+        columns = clause_columns(tokens, keyword)
+        if not columns:
+            continue
+        owners = {resolve(qualifier, column) for qualifier, column in columns}
+        if len(owners) == 1 and None not in owners:
+            usage[owners.pop()][kind] = list(dict.fromkeys(column for _, column in columns))
+    return {table: columns for table, columns in usage.items() if any(columns.values())}
+
+
+def propose_index(columns: Dict[str, List[str]], max_columns: int = 4) -> Tuple[List[str], List[str]]:
+    """
+    按列的用法组合候选索引：等值和连接列在前，没有范围条件时接着分组或排序列，否则接第一个范围列
+
+    Returns:
+        (索引列, 各列的用途说明)
+    """
+    index: List[str] = []
+    reasons: List[str] = []
+
+    def add(names: List[str], reason: str):
+        for name in names:
+            if name not in index and len(index) < max_columns:
+                index.append(name)
+                reasons.append(f"{reason}: {name}")
+
+    add(columns["equality"], "等值")
+    add(columns["join"], "连接")
+    if columns["range"]:
+        add(columns["range"][:1], "范围")
+    elif columns["group"]:
+        add(columns["group"], "分组")
+    elif columns["order"]:
+        add(columns["order"], "排序")
+    return index, reasons
+
+
+def covered_by(index_columns: List[str], existing: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """已有索引中以候选索引的列为最左前缀的索引"""
+    for item in existing:
+        if item["columns"][:len(index_columns)] == index_columns:
+            return item
+    return None
+
+
+def index_name(table: str, columns: List[str]) -> str:
+    """候选索引的名称（MySQL限制64个字符）"""
+    return f"idx_{table}_{'_'.join(columns)}"[:64]
+
+
+def estimate_after(rows: int, columns: Dict[str, List[str]], index_columns: List[str],
+                   cardinality: Dict[str, int]) -> int:
+    """使用候选索引后估算扫描的行数（只计入等值、连接列和一个范围列的过滤效果）"""
+    remaining = float(rows)
+    for column in index_columns:
+        if column in columns["equality"] or column in columns["join"]:
+            remaining *= 1 / cardinality[column] if cardinality.get(column) else _EQUALITY_SELECTIVITY
+        elif column in columns["range"]:
+            remaining *= _RANGE_SELECTIVITY
+            break
+        else:
+            break
+    return max(1, int(remaining))
+
+
+def explain_rows(result_text: Optional[str], aliases: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """
+    解析 EXPLAIN 的结果
+
+    Returns:
+        表名（小写） -> {"type", "key", "rows", "sort"}（同一个表出现多次时取扫描行数最多的一行）
+    """
+    try:
+        rows = loads(result_text or "")
+    except ValueError:
+        raise RuntimeError(result_text or "EXPLAIN 未返回结果")
+    if not isinstance(rows, list):
+        raise RuntimeError(result_text)
+    plan: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        table = aliases.get(str(row.get("table") or "").lower())
+        if table is None:
+            continue
+        extra = row.get("Extra") or ""
+        item = {
+            "type": row.get("type"),
+            "key": row.get("key"),
+            "rows": int(row.get("rows") or 0),
+            "sort": any(text in extra for text in _SORT_EXTRAS)
+        }
+        if table not in plan or item["rows"] > plan[table]["rows"]:
+            plan[table] = item
+    return plan
+
+
+class IndexAdvisor:
+    """根据租户的查询历史生成索引建议"""
+
+    def __init__(self, tenant, history, explain: bool = True, explain_timeout: float = 10,
+                 min_rows: int = 10000, max_columns: int = 4):
+        """
+        初始化
+
+        Args:
+            tenant: 租户（表结构、表统计信息和执行 EXPLAIN 的会话池）
+            history: 查询历史
+            explain: 是否对每类查询执行 EXPLAIN（只读，不执行查询本身）
+            explain_timeout: 每次 EXPLAIN 的超时时间（秒）
+            min_rows: 只为估算行数不少于这么多的表给出建议
+            max_columns: 候选索引最多包含的列数
+        """
+        self.tenant = tenant
+        self.history = history
+        self.explain = explain
+        self.explain_timeout = explain_timeout
+        self.min_rows = min_rows
+        self.max_columns = max_columns
+
+    def _explain(self, sql: str, aliases: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        pool = self.tenant.read_pool(list(dict.fromkeys(aliases.values())))
+        result_text = pool.call_tool("query", {"sql": f"EXPLAIN {sql}", "params": []}, timeout=self.explain_timeout)
+        return explain_rows(result_text, aliases)
+
+    def advise(self, hours: Optional[float] = 24, limit: int = 20, max_queries: int = 200) -> Dict[str, Any]:
+        """
+        生成索引建议
+
+        Args:
+            hours: 统计最近多少小时的查询历史，为空时统计全部
+            limit: 返回的建议数
+            max_queries: 最多分析的查询类数（按执行次数取前面的）
+
+        Returns:
+            {"queries": 分析的查询类数, "executions": 执行次数, "explained", "explain_errors",
+             "candidates": [{"table", "columns", "ddl", "score", "executions", "rows", "rows_before",
+                             "rows_after", "avoids_sort", "reasons", "queries"}, ...]}
+        """
+        workload = self.history.workload(max_queries, hours, self.tenant.name)
+        table_info = self.tenant.get_schema()
+        stats = self.tenant.table_stats.snapshot() if self.tenant.table_stats is not None else None
+        stats = stats or {}
+
+        candidates: Dict[Tuple[str, tuple], Dict[str, Any]] = {}
+        explained = 0
+        explain_errors = 0
+        for query in workload:
+            usage = query_usage(query["sql"], table_info)
+            if not usage:
+                continue
+            plan: Dict[str, Dict[str, Any]] = {}
+            if self.explain and statement_type(query["sql"]) == "SELECT":
+                try:
+                    plan = self._explain(query["sql"], table_aliases(query["sql"]))
+                    explained += 1
+                except Exception as e:
+                    print(f"EXPLAIN 出错: {str(e)}")
+                    explain_errors += 1
+
+            for table, columns in usage.items():
+                table_stats = stats.get(table)
+                step = plan.get(table)
+                rows = table_stats["rows"] if table_stats is not None else (step["rows"] if step else 0)
+                if rows < self.min_rows:
+                    continue
+                index_columns, reasons = propose_index(columns, self.max_columns)
+                if not index_columns:
+                    continue
+                existing = table_stats["indexes"] if table_stats is not None else []
+                if covered_by(index_columns, existing) is not None:
+                    continue
+
+                # 当前扫描的行数：优先使用执行计划，其次按已有索引估算
+                if step is not None:
+                    before = step["rows"]
+                elif table_stats is not None:
+                    before, _ = estimate_scan(table_stats, columns["equality"] + columns["join"] + columns["range"])
+                else:
+                    before = rows
+                after = estimate_after(rows, columns, index_columns,
+                                       table_stats["cardinality"] if table_stats is not None else {})
+                # 执行计划需要额外排序，而候选索引的顺序可以满足分组或排序时，省去排序的行数也计入收益
+                avoids_sort = bool(step and step["sort"] and
+                                   any(reason.startswith(("分组", "排序")) for reason in reasons))
+                saved = max(0, before - after) + (after if avoids_sort else 0)
+                if saved <= 0:
+                    continue
+
+                key = (table, tuple(index_columns))
+                candidate = candidates.get(key)
+                if candidate is None:
+                    candidate = candidates[key] = {
+                        "table": table_stats["name"] if table_stats is not None else table,
+                        "columns": index_columns,
+                        "score": 0,
+                        "executions": 0,
+                        "rows": rows,
+                        "rows_before": before,
+                        "rows_after": after,
+                        "avoids_sort": False,
+                        "reasons": reasons,
+                        "queries": []
+                    }
+                candidate["score"] += saved * query["count"]
+                candidate["executions"] += query["count"]
+                candidate["rows_before"] = max(candidate["rows_before"], before)
+                candidate["avoids_sort"] = candidate["avoids_sort"] or avoids_sort
+                candidate["queries"].append({
+                    "fingerprint": query["fingerprint"],
+                    "count": query["count"],
+                    "avg_exec_ms": query["avg_exec_ms"],
+                    "plan": step
+                })
+
+        ranked = self._merge_prefixes(list(candidates.values()))
+        for candidate in ranked:
+            candidate["ddl"] = (f"CREATE INDEX {index_name(candidate['table'], candidate['columns'])} "
+                                f"ON {candidate['table']} ({', '.join(candidate['columns'])})")
+            candidate["queries"].sort(key=lambda item: item["count"], reverse=True)
+            del candidate["queries"][5:]
+        return {
+            "queries": len(workload),
+            "executions": sum(query["count"] for query in workload),
+            "explained": explained,
+            "explain_errors": explain_errors,
+            "candidates": ranked[:limit]
+        }
+
+    @staticmethod
+    def _merge_prefixes(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """同一个表上是另一个候选索引最左前缀的候选索引，并入那个更长的索引（一个索引同时满足两类查询）"""
+        candidates.sort(key=lambda item: len(item["columns"]), reverse=True)
+        kept: List[Dict[str, Any]] = []
+        for candidate in candidates:
+            target = next((item for item in kept if item["table"] == candidate["table"] and
+                           item["columns"][:len(candidate["columns"])] == candidate["columns"]), None)
+            if target is None:
+                kept.append(candidate)
+                continue
+            target["score"] += candidate["score"]
+            target["executions"] += candidate["executions"]
+            target["avoids_sort"] = target["avoids_sort"] or candidate["avoids_sort"]
+            target["queries"].extend(candidate["queries"])
+        kept.sort(key=lambda item: item["score"], reverse=True)
+        return kept
+
+
+def format_advice(report: Dict[str, Any]) -> str:
+    """索引建议的文本报告"""
+    lines = [f"分析了 {report['queries']} 类查询（{report['executions']} 次执行），"
+             f"EXPLAIN {report['explained']} 次，失败 {report['explain_errors']} 次"]
+    if not report["candidates"]:
+        lines.append("没有建议的索引")
+    for number, candidate in enumerate(report["candidates"], 1):
+        lines.append("")
+        lines.append(f"{number}. {candidate['ddl']};")
+        lines.append(f"   收益 {format_count(candidate['score'])}（{candidate['executions']} 次执行，"
+                     f"表约{format_count(candidate['rows'])}行，扫描约{format_count(candidate['rows_before'])}行 → "
+                     f"约{format_count(candidate['rows_after'])}行{'，省去排序' if candidate['avoids_sort'] else ''}）")
+        lines.append(f"   列的用途: {', '.join(candidate['reasons'])}")
+        for query in candidate["queries"][:3]:
+            lines.append(f"   - {query['count']} 次: {query['fingerprint'][:120]}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="根据生成SQL的执行历史给出索引建议（不修改数据库）")
+    parser.add_argument("--config", default="config.json", help="配置文件")
+    parser.add_argument("--tenant", default=None, help="租户名称，默认为 default")
+    parser.add_argument("--hours", type=float, default=24, help="统计最近多少小时，0表示全部")
+    parser.add_argument("--limit", type=int, default=20, help="返回的建议数")
+    parser.add_argument("--no-explain", action="store_true", help="不执行 EXPLAIN，只按表统计信息估算")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"错误: {str(e)}")
+    history = get_query_history(config)
+    if history is None or not os.path.exists(history.path):
+        raise SystemExit("错误: 未启用查询历史或查询历史文件不存在")
+
+    registry = TenantRegistry(config, config.get("profiles_dir", "profiles"))
+    try:
+        tenant = registry.get(args.tenant)
+    except KeyError:
+        raise SystemExit(f"错误: 未知的租户: {args.tenant}")
+    try:
+        advisor = IndexAdvisor(tenant, history, explain=not args.no_explain,
+                               min_rows=int(config.get("advisor_min_rows", 10000)))
+        report = advisor.advise(hours=args.hours or None, limit=args.limit)
+    finally:
+        registry.close()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_advice(report))
+
+
+if __name__ == "__main__":
+    main()
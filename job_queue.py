@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步任务队列模块
+
+耗时较长的自然语言查询以任务方式提交：提交后立即返回任务ID，
+由有界工作线程池按优先级执行，同一优先级内按客户端轮转保证公平，
+客户端通过轮询或SSE获取任务状态，结果在保留时间内可以查询
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Callable, List
+
+from deadline import Deadline
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """队列已满或客户端排队任务数已达上限"""
+
+
+class Job:
+    """单个任务"""
+
+    def __init__(self, payload: Dict[str, Any], client_id: str, priority: int = 0):
+        """
+        初始化任务
+
+        Args:
+            payload: 任务参数（与 /api/nl2sql 的请求数据相同）
+            client_id: 提交任务的客户端标识
+            priority: 优先级，数值越大越先执行
+        """
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.client_id = client_id
+        self.priority = priority
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.status_code = None
+        self.error = None
+        # 开始执行时创建，取消执行中的任务时取消它，终止正在执行的语句
+        self.deadline: Optional[Deadline] = None
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        """任务状态快照"""
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.error:
+            data["error"] = self.error
+        if include_result and self.status in FINISHED_STATES:
+            data["result"] = self.result
+            data["status_code"] = self.status_code
+        return data
+
+
+class JobQueue:
+    """有界优先级任务队列，同一优先级内按客户端轮转"""
+
+    def __init__(self, handler: Callable[[Job], tuple], workers: int = 4, max_pending: int = 100,
+                 max_pending_per_client: int = 20, result_ttl: float = 600, store=None,
+                 timeout: Optional[float] = None):
+        """
+        初始化任务队列
+
+        Args:
+            handler: 执行任务的函数，返回 (结果, HTTP状态码)
+            workers: 工作线程数
+            max_pending: 排队任务总数上限
+            max_pending_per_client: 单个客户端排队任务数上限
+            result_ttl: 已完成任务的保留时间（秒）
+            store: 可选的共享缓存，多进程部署时任何进程都能查询任务状态
+            timeout: 任务从开始执行起的最长时间（秒），为空表示不限制
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_pending_per_client = max_pending_per_client
+        self.result_ttl = result_ttl
+        self.store = store
+        self.timeout = timeout or None
+
+        self._jobs: Dict[str, Job] = {}
+        # 优先级 -> (客户端 -> 任务队列)
+        self._pending: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._pending_count = 0
+        self._client_pending: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._running = 0
+
+    def _ensure_workers(self):
+        # 工作线程延迟启动（预派生模式下在fork之后启动）
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload: Dict[str, Any], client_id: str, priority: int = 0) -> Job:
+        """
+        提交任务
+
+        Raises:
+            QueueFullError: 队列已满或该客户端排队任务过多
+        """
+        job = Job(payload, client_id, priority)
+        with self._cond:
+            self._ensure_workers()
+            self._expire()
+            if self._pending_count >= self.max_pending:
+                raise QueueFullError(f"任务队列已满 ({self.max_pending})")
+            if self._client_pending.get(client_id, 0) >= self.max_pending_per_client:
+                raise QueueFullError(f"客户端排队任务数已达上限 ({self.max_pending_per_client})")
+
+            clients = self._pending.setdefault(priority, OrderedDict())
+            clients.setdefault(client_id, deque()).append(job)
+            self._pending_count += 1
+            self._client_pending[client_id] = self._client_pending.get(client_id, 0) + 1
+            self._jobs[job.id] = job
+            self._publish(job)
+            self._cond.notify_all()
+        return job
+
+    def _next_job(self) -> Optional[Job]:
+        """取出下一个任务：最高优先级中排在最前的客户端，取完后该客户端移到末尾"""
+        for priority in sorted(self._pending, reverse=True):
+            clients = self._pending[priority]
+            while clients:
+                client_id, jobs = next(iter(clients.items()))
+                job = jobs.popleft()
+                if jobs:
+                    clients.move_to_end(client_id)
+                else:
+                    del clients[client_id]
+                self._pending_count -= 1
+                self._client_pending[client_id] -= 1
+                if not self._client_pending[client_id]:
+                    del self._client_pending[client_id]
+                if job.status == CANCELLED:
+                    continue
+                return job
+            del self._pending[priority]
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                job.status = RUNNING
+                job.started_at = time.time()
+                job.deadline = Deadline(self.timeout)
+                self._running += 1
+                self._publish(job)
+                self._cond.notify_all()
+
+            try:
+                result, status_code = self.handler(job)
+                status = SUCCEEDED if status_code < 400 else FAILED
+                error = None if status == SUCCEEDED else (result or {}).get("error")
+            except Exception as e:
+                result, status_code, status, error = None, 500, FAILED, str(e)
+            if job.deadline.cancelled:
+                status, error = CANCELLED, job.deadline.reason
+
+            with self._cond:
+                job.result = result
+                job.status_code = status_code
+                job.error = error
+                job.status = status
+                job.finished_at = time.time()
+                self._running -= 1
+                self._publish(job)
+                self._cond.notify_all()
+
+    def _publish(self, job: Job):
+        """将任务状态写入共享缓存"""
+        if self.store is not None:
+            self.store.set(job.id, job.to_dict(), ttl=self.result_ttl)
+
+    def _expire(self):
+        """删除超过保留时间的已完成任务"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态快照，任务不存在或已过期时返回 None"""
+        with self._cond:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict()
+        if self.store is not None:
+            return self.store.get(job_id)
+        return None
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        取消任务：排队中的任务不再执行；执行中的任务取消其 deadline，终止正在执行的语句，
+        处理函数返回后状态为 cancelled
+
+        Returns:
+            是否已取消，任务不存在（或在其他进程中）或已结束时返回 False
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            if job.status == RUNNING:
+                deadline = job.deadline
+            else:
+                deadline = None
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                self._publish(job)
+                self._cond.notify_all()
+        if deadline is not None:
+            deadline.cancel("任务已取消")
+        return True
+
+    def wait_for_change(self, job_id: str, last_status: Optional[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等待任务状态变化（用于SSE推送）
+
+        Args:
+            job_id: 任务ID
+            last_status: 上次推送的状态
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            最新的任务状态快照
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                while job.status == last_status:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                return job.to_dict()
+
+        # 其他进程中的任务，通过共享缓存轮询
+        snapshot = self.get(job_id)
+        while snapshot is not None and snapshot["status"] == last_status and time.time() < deadline:
+            time.sleep(0.5)
+            snapshot = self.get(job_id)
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        """队列状态"""
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "pending": self._pending_count,
+                "running": self._running,
+                "max_pending": self.max_pending,
+                "clients": len(self._client_pending),
+                "jobs": len(self._jobs)
+            }
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+键集分页模块
+
+将没有 LIMIT 的单表SELECT改写为按主键分页的查询（WHERE pk > ? ORDER BY pk LIMIT n），
+逐页获取结果并在消费当前页时预取下一页，降低首行延迟和峰值内存
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+from sql_utils import (IDENT, PUNCT, QUOTED, find_keyword, identifier_name, significant,
+                       split_statements, tokenize, top_level)
+
+# 分页查询中附加的主键列别名，返回给调用方之前删除
+KEYSET_COLUMN = "__keyset_key"
+
+# 出现在顶层时无法分页的子句（OVER 是窗口函数：分页后只在每页内计算，结果会改变）
+_UNSUPPORTED_CLAUSES = ("GROUP BY", "HAVING", "ORDER BY", "LIMIT", "UNION", "INTO", "FOR UPDATE",
+                        "LOCK IN", "WINDOW", "OVER", "PROCEDURE")
+
+# 聚合函数（出现在选择列表顶层时结果只有一行或需要分组）
+_AGGREGATES = ("COUNT", "SUM", "AVG", "MIN", "MAX", "GROUP_CONCAT", "STD", "STDDEV", "VARIANCE",
+               "BIT_AND", "BIT_OR", "BIT_XOR", "JSON_ARRAYAGG", "JSON_OBJECTAGG")
+
+
+def primary_key(table_info: List[Dict[str, Any]], table: str) -> Optional[str]:
+    """
+    获取单列主键
+
+    Args:
+        table_info: get_table_info_from_db 返回的表结构
+        table: 表名
+
+    Returns:
+        主键列名，表不存在或为联合主键时返回 None
+    """
+    for table_data in table_info or []:
+        if table_data["name"].lower() != table.lower():
+            continue
+        keys = [column["name"] for column in table_data["columns"] if column.get("key") == "PRI"]
+        return keys[0] if len(keys) == 1 else None
+    return None
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+class KeysetPlan:
+    """一条SELECT的键集分页方案"""
+
+    def __init__(self, select_list: str, from_clause: str, where: Optional[str], table: str,
+                 key_column: str, key_ref: str):
+        self.select_list = select_list
+        self.from_clause = from_clause
+        self.where = where
+        self.table = table
+        self.key_column = key_column
+        self.key_ref = key_ref
+
+    def page_sql(self, page_size: int, after: bool = False) -> str:
+        """
+        生成分页查询
+
+        Args:
+            page_size: 每页行数
+            after: 是否带 key > ? 条件（第一页之后的页）
+        """
+        conditions = []
+        if self.where:
+            conditions.append(f"({self.where})")
+        if after:
+            conditions.append(f"{self.key_ref} > ?")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return (f"SELECT {self.select_list}, {self.key_ref} AS {KEYSET_COLUMN} FROM {self.from_clause}"
+                f"{where} ORDER BY {self.key_ref} LIMIT {int(page_size)}")
+
+    def describe(self, page_size: int) -> Dict[str, Any]:
+        """分页方案说明（放在响应中）"""
+        return {
+            "mode": "keyset",
+            "table": self.table,
+            "key": self.key_column,
+            "page_size": page_size
+        }
+
+
+def plan_keyset(sql: str, table_info: List[Dict[str, Any]]) -> Optional[KeysetPlan]:
+    """
+    为SELECT生成键集分页方案
+
+    只处理单表、无 GROUP BY/ORDER BY/LIMIT/DISTINCT/聚合/窗口函数的查询，且表必须有单列主键
+
+    Args:
+        sql: SELECT语句
+        table_info: 表结构信息（需要包含列的 key 字段）
+
+    Returns:
+        分页方案，无法分页时返回 None
+    """
+    statements = split_statements(sql)
+    if len(statements) != 1:
+        return None
+    sql = statements[0]
+    tokens = significant(tokenize(sql))
+    if len(tokens) < 4 or not tokens[0].is_keyword("SELECT"):
+        return None
+    if tokens[1].is_keyword("DISTINCT", "DISTINCTROW", "SQL_CALC_FOUND_ROWS"):
+        return None
+    for clause in _UNSUPPORTED_CLAUSES:
+        if find_keyword(tokens, clause) != -1:
+            return None
+
+    from_index = find_keyword(tokens, "FROM")
+    if from_index == -1:
+        return None
+
+    # 选择列表顶层不能有聚合函数
+    depths = top_level(tokens)
+    for index in range(1, from_index):
+        token, depth = depths[index]
+        if (depth == 0 and token.is_keyword(*_AGGREGATES) and
+                tokens[index + 1].type == PUNCT and tokens[index + 1].value == "("):
+            return None
+
+    where_index = find_keyword(tokens, "WHERE")
+    from_end = where_index if where_index != -1 else len(tokens)
+    from_tokens = tokens[from_index + 1:from_end]
+
+    # FROM 子句只能是 表名 [[AS] 别名]
+    if not from_tokens or from_tokens[0].type not in (IDENT, QUOTED):
+        return None
+    table = identifier_name(from_tokens[0])
+    rest = from_tokens[1:]
+    if rest and rest[0].is_keyword("AS"):
+        rest = rest[1:]
+    if len(rest) > 1 or (rest and rest[0].type not in (IDENT, QUOTED)):
+        return None
+    alias = identifier_name(rest[0]) if rest else table
+
+    key_column = primary_key(table_info, table)
+    if key_column is None:
+        return None
+
+    end = tokens[-1].pos + len(tokens[-1].value)
+    select_list = sql[tokens[1].pos:tokens[from_index].pos].strip()
+    from_clause = sql[from_tokens[0].pos:(tokens[where_index].pos if where_index != -1 else end)].strip()
+    where = sql[tokens[where_index + 1].pos:end].strip() if where_index != -1 else None
+    if where_index != -1 and not where:
+        return None
+
+    return KeysetPlan(select_list, from_clause, where, table, key_column,
+                      f"{_quote(alias)}.{_quote(key_column)}")
+
+
+def iter_keyset_rows(fetch_page: Callable[[str, list], List[Dict[str, Any]]], plan: KeysetPlan,
+                     page_size: int = 1000, prefetch: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    按页获取并逐行返回结果
+
+    Args:
+        fetch_page: 执行查询的函数 fetch_page(sql, params) -> 行列表
+        plan: 分页方案
+        page_size: 每页行数
+        prefetch: 是否在消费当前页时后台预取下一页
+
+    Yields:
+        每一行数据（不含分页用的主键列）
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keyset-prefetch") if prefetch else None
+    try:
+        rows = fetch_page(plan.page_sql(page_size), [])
+        while rows:
+            last_key = rows[-1][KEYSET_COLUMN]
+            has_more = len(rows) >= page_size
+            next_page = None
+            if has_more:
+                next_args = (plan.page_sql(page_size, after=True), [last_key])
+                if executor is not None:
+                    next_page = executor.submit(fetch_page, *next_args)
+
+            for row in rows:
+                row.pop(KEYSET_COLUMN, None)
+                yield row
+
+            if not has_more:
+                return
+            rows = next_page.result() if next_page is not None else fetch_page(*next_args)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM调用限流模块
+
+进程内所有DeepSeek调用共用一个限流器：令牌桶限制请求速率，
+AIMD（加性增、乘性减）调整并发上限——收到429或延迟超过目标时减小，成功时缓慢增大，
+超出上限的请求在有界队列中等待，超过等待时间后放弃
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+
+class LLMBusyError(Exception):
+    """LLM调用排队已满或等待超时"""
+
+
+class TokenBucket:
+    """令牌桶（调用方负责加锁）"""
+
+    def __init__(self, rate: float, burst: float):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数，0 表示不限速
+            burst: 桶容量（允许的突发请求数）
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_take(self) -> float:
+        """
+        尝试取一个令牌
+
+        Returns:
+            0 表示已取得令牌，否则为需要等待的秒数
+        """
+        if not self.rate:
+            return 0.0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdaptiveLimiter:
+    """令牌桶 + AIMD并发限制"""
+
+    def __init__(self, rate: float = 5, burst: float = 10, initial_limit: int = 4, min_limit: int = 1,
+                 max_limit: int = 16, latency_target: float = 10, max_queue: int = 100,
+                 queue_timeout: float = 30, backoff: float = 0.5):
+        """
+        初始化限流器
+
+        Args:
+            rate: 每秒最多发起的请求数，0 表示不限速
+            burst: 允许的突发请求数
+            initial_limit: 初始并发上限
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+            latency_target: 目标延迟（秒），超过时减小并发上限
+            max_queue: 最多排队的请求数
+            queue_timeout: 默认的最长排队时间（秒）
+            backoff: 收到429时并发上限的缩小比例
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._queued = 0
+        self._latency = None
+        self._counts = {"admitted": 0, "rejected": 0, "timeouts": 0, "throttled": 0,
+                        "slow": 0, "succeeded": 0, "failed": 0}
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """
+        占用一个调用名额，退出时若调用方没有报告结果则按失败处理
+
+        Args:
+            timeout: 最长排队时间（秒），默认使用 queue_timeout
+
+        Yields:
+            调用结束后用于报告结果的 Permit
+
+        Raises:
+            LLMBusyError: 排队已满或等待超时
+        """
+        self.acquire(timeout)
+        permit = Permit(self)
+        try:
+            yield permit
+        finally:
+            if not permit.done:
+                permit.failed()
+
+    def acquire(self, timeout: Optional[float] = None):
+        """等待并发名额和令牌"""
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            if self._queued >= self.max_queue:
+                self._counts["rejected"] += 1
+                raise LLMBusyError(f"LLM请求排队已满 ({self.max_queue})")
+            self._queued += 1
+            try:
+                while True:
+                    wait = None
+                    if self._inflight < int(self.limit):
+                        wait = self.bucket.try_take()
+                        if wait == 0:
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counts["timeouts"] += 1
+                        raise LLMBusyError("等待LLM调用名额超时")
+                    self._cond.wait(min(remaining, wait) if wait else remaining)
+                self._inflight += 1
+                self._counts["admitted"] += 1
+            finally:
+                self._queued -= 1
+
+    def _release(self, outcome: str, latency: Optional[float]):
+        with self._cond:
+            self._inflight -= 1
+            if outcome == "throttled":
+                # 乘性减
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._counts["throttled"] += 1
+            elif outcome == "succeeded":
+                self._counts["succeeded"] += 1
+                self._latency = latency if self._latency is None else self._latency * 0.8 + latency * 0.2
+                if self.latency_target and latency > self.latency_target:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                    self._counts["slow"] += 1
+                elif self._inflight + 1 >= int(self.limit):
+                    # 加性增：名额用满时每个窗口约增加1
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self._counts["failed"] += 1
+            self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        """当前并发上限、正在进行和排队中的请求数以及累计计数"""
+        with self._cond:
+            self.bucket._refill()
+            return dict(self._counts,
+                        limit=round(self.limit, 2),
+                        inflight=self._inflight,
+                        queued=self._queued,
+                        max_queue=self.max_queue,
+                        rate=self.bucket.rate,
+                        tokens=round(self.bucket.tokens, 2),
+                        latency_ewma=round(self._latency, 3) if self._latency is not None else None)
+
+
+class Permit:
+    """一次已获准的调用，调用结束后报告结果"""
+
+    def __init__(self, limiter: AdaptiveLimiter):
+        self.limiter = limiter
+        self.started_at = time.monotonic()
+        self.done = False
+
+    def _finish(self, outcome: str):
+        if not self.done:
+            self.done = True
+            self.limiter._release(outcome, time.monotonic() - self.started_at)
+
+    def succeeded(self):
+        self._finish("succeeded")
+
+    def throttled(self):
+        """服务端返回429"""
+        self._finish("throttled")
+
+    def failed(self):
+        self._finish("failed")
+
+
+_limiter: Optional[AdaptiveLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter(config: Optional[Dict[str, Any]] = None) -> AdaptiveLimiter:
+    """获取进程内共用的LLM限流器（第一次调用时按配置创建）"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            config = config or {}
+            _limiter = AdaptiveLimiter(
+                rate=float(config.get("llm_rate", 5)),
+                burst=float(config.get("llm_burst", 10)),
+                initial_limit=int(config.get("llm_concurrency", 4)),
+                min_limit=int(config.get("llm_min_concurrency", 1)),
+                max_limit=int(config.get("llm_max_concurrency", 16)),
+                latency_target=float(config.get("llm_latency_target", 10)),
+                max_queue=int(config.get("llm_queue_size", 100)),
+                queue_timeout=float(config.get("llm_queue_timeout", 30))
+            )
+        return _limiter
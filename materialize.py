@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热门问题预计算模块
+
+根据查询历史找出最常见的、结果较小的成功查询，预先执行并把结果保存在进程内，
+相同问题的请求直接返回预计算的结果，不调用模型也不访问数据库。
+后台线程定期刷新结果；写入相关表后（表版本号变化）结果立即失效，并尽快重新计算
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+from fast_json import loads
+from query_history import get_query_history
+from sql_utils import is_select
+from sql_validator import referenced_tables
+
+_TRAILING_PUNCTUATION = "?？。.!！;； "
+
+
+def normalize_question(text: str) -> str:
+    """问题的匹配键：全角转半角、小写、合并空白、去掉结尾的标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"\s+", " ", text).strip().rstrip(_TRAILING_PUNCTUATION)
+
+
+class MaterializedAnswer:
+    """一个热门问题的预计算结果"""
+
+    __slots__ = ("question", "sql", "tables", "explanation", "confidence", "results", "versions",
+                 "refreshed_at", "refresh_ms", "hits")
+
+    def __init__(self, question: str, sql: str, tables: List[str], results: List[Dict[str, Any]],
+                 versions: list, refresh_ms: float, explanation: str = "", confidence: Optional[float] = None):
+        self.question = question
+        self.sql = sql
+        self.tables = tables
+        self.explanation = explanation
+        self.confidence = confidence
+        self.results = results
+        # 执行前各相关表的版本号，与当前版本号不一致时结果已过期
+        self.versions = versions
+        self.refreshed_at = time.time()
+        self.refresh_ms = refresh_ms
+        self.hits = 0
+
+    def response(self) -> Dict[str, Any]:
+        """与 /api/nl2sql 执行SQL时格式相同的响应"""
+        return {
+            "success": True,
+            "sql": self.sql,
+            "explanation": self.explanation,
+            "tables_used": self.tables,
+            "confidence": self.confidence,
+            "results": self.results,
+            "materialized": {
+                "refreshed_at": self.refreshed_at,
+                "age": round(time.time() - self.refreshed_at, 1)
+            }
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "question": self.question,
+            "sql": self.sql,
+            "tables": self.tables,
+            "rows": len(self.results),
+            "refreshed_at": self.refreshed_at,
+            "refresh_ms": round(self.refresh_ms, 1),
+            "hits": self.hits
+        }
+
+
+class Materializer:
+    """租户的热门问题预计算结果"""
+
+    def __init__(self, tenant, interval: float = 60, ttl: float = 600, max_entries: int = 50,
+                 min_count: int = 3, hours: float = 24, max_rows: int = 1000):
+        """
+        初始化
+
+        Args:
+            tenant: 所属租户（执行SQL、获取表版本号和查询历史）
+            interval: 后台线程查找热门问题并刷新结果的间隔（秒）
+            ttl: 结果的最长使用时间（秒），0 表示只按表版本号失效
+            max_entries: 最多预计算的问题数
+            min_count: 统计期间内至少出现多少次才预计算
+            hours: 统计最近多少小时的查询历史
+            max_rows: 只预计算结果不超过这么多行的查询
+        """
+        self.tenant = tenant
+        self.interval = interval
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_count = min_count
+        self.hours = hours
+        self.max_rows = max_rows
+
+        self._answers: Dict[str, MaterializedAnswer] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._thread_pid = None
+        self._discovered_at = 0.0
+        self.hits = 0
+        self.stale = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    # ---- 查找 ----
+
+    def lookup(self, question: str) -> Optional[MaterializedAnswer]:
+        """
+        查找问题的预计算结果
+
+        Returns:
+            仍然有效的结果，没有或已过期时返回 None（过期的结果由后台线程重新计算）
+        """
+        self._ensure_refresher()
+        answer = self._answers.get(normalize_question(question))
+        if answer is None:
+            return None
+        if not self._fresh(answer):
+            self.stale += 1
+            self._wake.set()
+            return None
+        answer.hits += 1
+        self.hits += 1
+        return answer
+
+    def _fresh(self, answer: MaterializedAnswer) -> bool:
+        if self.ttl and time.time() - answer.refreshed_at > self.ttl:
+            return False
+        # 表版本号可能由其他工作进程更新（共享存储），每次查找时都比较
+        return answer.versions == self.tenant.table_state(answer.tables)
+
+    def invalidate(self, tables: Optional[List[str]] = None):
+        """写入表之后调用：引用了这些表的结果已经失效，唤醒后台线程重新计算"""
+        tables = {t.lower() for t in tables or []}
+        with self._lock:
+            answers = list(self._answers.values())
+        if not tables or any(tables & set(answer.tables) for answer in answers):
+            self._wake.set()
+
+    # ---- 刷新 ----
+
+    def refresh(self, discover: bool = True) -> Dict[str, int]:
+        """
+        刷新预计算结果
+
+        Args:
+            discover: 是否根据查询历史重新选择热门问题（否则只重新计算已过期的结果）
+
+        Returns:
+            {"refreshed": 重新计算的问题数, "failed": 失败数, "entries": 当前问题数}
+        """
+        with self._lock:
+            current = dict(self._answers)
+
+        candidates = {key: (answer.question, answer.sql, answer.tables) for key, answer in current.items()}
+        if discover:
+            candidates = self._discover(current)
+            self._discovered_at = time.time()
+
+        refreshed = failed = 0
+        answers: Dict[str, MaterializedAnswer] = {}
+        for key, (question, sql, tables) in candidates.items():
+            if self._closed:
+                break
+            answer = current.get(key)
+            if answer is not None and answer.sql == sql and self._fresh(answer):
+                answers[key] = answer
+                continue
+            try:
+                fresh = self._materialize(question, sql, tables)
+            except Exception as e:
+                print(f"预计算 \"{question}\" 时出错: {str(e)}")
+                self.failures += 1
+                failed += 1
+                continue
+            if fresh is not None:
+                if answer is not None:
+                    fresh.hits = answer.hits
+                answers[key] = fresh
+                refreshed += 1
+
+        with self._lock:
+            self._answers = answers
+        self.refreshes += refreshed
+        return {"refreshed": refreshed, "failed": failed, "entries": len(answers)}
+
+    def _discover(self, current: Dict[str, MaterializedAnswer]) -> Dict[str, tuple]:
+        """从查询历史中选出热门问题，同一问题的多种写法归并在一起"""
+        history = get_query_history(self.tenant.config)
+        if history is None:
+            return {key: (answer.question, answer.sql, answer.tables) for key, answer in current.items()}
+        history.flush()
+
+        counts: Dict[str, int] = {}
+        candidates: Dict[str, tuple] = {}
+        for item in history.hot_questions(limit=self.max_entries * 4, hours=self.hours, tenant=self.tenant.name,
+                                          min_count=1, max_rows=self.max_rows):
+            sql = item["sql"]
+            if not is_select(sql):
+                continue
+            key = normalize_question(item["question"])
+            counts[key] = counts.get(key, 0) + item["count"]
+            if key not in candidates:
+                tables = [t.lower() for t in item["tables"]]
+                for table in referenced_tables(sql):
+                    if table not in tables:
+                        tables.append(table)
+                candidates[key] = (item["question"].strip(), sql, tables)
+
+        hot = sorted((key for key in candidates if counts[key] >= self.min_count),
+                     key=lambda k: counts[k], reverse=True)[:self.max_entries]
+        return {key: candidates[key] for key in hot}
+
+    def _materialize(self, question: str, sql: str, tables: List[str]) -> Optional[MaterializedAnswer]:
+        """执行SQL并保存结果，结果不是行数据或超过 max_rows 时返回 None"""
+        # 先取版本号再执行：执行期间发生的写入会使结果立即过期
+        versions = self.tenant.table_state(tables)
+        started = time.perf_counter()
+        result_text = self.tenant.execute_sql(sql, tables=tables)
+        refresh_ms = (time.perf_counter() - started) * 1000
+        try:
+            results = loads(result_text or "")
+        except json.JSONDecodeError:
+            raise RuntimeError(result_text or "执行SQL未返回结果")
+        if not isinstance(results, list) or len(results) > self.max_rows:
+            return None
+
+        explanation, confidence = "", None
+        translation = self._cached_translation(question)
+        if translation is not None and translation.get("sql") == sql:
+            explanation, confidence = translation.get("explanation", ""), translation.get("confidence")
+        return MaterializedAnswer(question, sql, tables, results, versions, refresh_ms,
+                                  explanation=explanation, confidence=confidence)
+
+    def _cached_translation(self, question: str) -> Optional[Dict[str, Any]]:
+        """LLM缓存中的转换结果（用于返回SQL解释），请求可能带或不带表结构"""
+        for table_info in ([], self.tenant.cached_schema() or []):
+            cached = self.tenant.llm_cache.get(self.tenant.llm_cache_key(question, table_info))
+            if isinstance(cached, dict):
+                return cached
+        return None
+
+    # ---- 后台线程 ----
+
+    def _ensure_refresher(self):
+        """启动后台刷新线程（fork之后的子进程中重新启动）"""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._closed or (self._thread is not None and self._thread_pid == os.getpid()):
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"materialize-{self.tenant.name}",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            woken = self._wake.wait(max(0.0, self._discovered_at + self.interval - time.time()))
+            self._wake.clear()
+            if self._closed:
+                return
+            if woken:
+                # 合并短时间内连续的写入
+                time.sleep(1)
+            try:
+                self.refresh(discover=time.time() - self._discovered_at >= self.interval)
+            except Exception as e:
+                print(f"刷新预计算结果时出错: {str(e)}")
+
+    def close(self):
+        """停止后台线程"""
+        self._closed = True
+        self._wake.set()
+
+    def answers(self) -> List[Dict[str, Any]]:
+        """当前的预计算问题"""
+        with self._lock:
+            answers = list(self._answers.values())
+        return [answer.describe() for answer in sorted(answers, key=lambda a: a.hits, reverse=True)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._answers),
+            "hits": self.hits,
+            "stale": self.stale,
+            "refreshes": self.refreshes,
+            "failures": self.failures
+        }
+
+
+def create_materializer(tenant) -> Optional[Materializer]:
+    """按租户配置创建预计算结果，未开启 materialize 时返回 None"""
+    config = tenant.config
+    if not config.get("materialize", False):
+        return None
+    return Materializer(
+        tenant,
+        interval=float(config.get("materialize_interval", 60)),
+        ttl=float(config.get("materialize_ttl", 600)),
+        max_entries=int(config.get("materialize_max_entries", 50)),
+        min_count=int(config.get("materialize_min_count", 3)),
+        hours=float(config.get("materialize_hours", 24)),
+        max_rows=int(config.get("materialize_max_rows", 1000))
+    )
@@ -4,6 +4,8 @@
 从配置文件读取连接信息，提供菜单选择不同的功能
 """
 
+import argparse
+import contextlib
 import json
 import os
 import subprocess
@@ -25,6 +27,117 @@ try:
 except ImportError:
     PERSISTENT_CLIENT_AVAILABLE = False
 
+# 导入批量写入模块
+try:
+    from bulk_writer import BulkWriter
+    from session_pool import create_session_pool
+    BULK_WRITER_AVAILABLE = True
+except ImportError:
+    BULK_WRITER_AVAILABLE = False
+
+# 导入进程内MySQL后端
+try:
+    from native_mysql import AIOMYSQL_AVAILABLE as NATIVE_AVAILABLE, native_call
+except ImportError:
+    NATIVE_AVAILABLE = False
+
+# 导入批处理模块
+try:
+    from batch_runner import BATCH_FORMATS, run_batch
+    BATCH_AVAILABLE = True
+except ImportError:
+    BATCH_AVAILABLE = False
+
+# 导入结果查看器
+try:
+    from result_viewer import ResultViewer
+    from tenants import Tenant
+    VIEWER_AVAILABLE = True
+except ImportError:
+    VIEWER_AVAILABLE = False
+
+# 导入查询历史模块
+try:
+    from query_history import get_query_history
+    HISTORY_AVAILABLE = True
+except ImportError:
+    HISTORY_AVAILABLE = False
+
+
+def record_history(config, entry):
+    """记录菜单中的一次执行（查询历史模块不可用或未配置 history_db 时忽略）"""
+    if not HISTORY_AVAILABLE:
+        return
+    try:
+        history = get_query_history(config)
+        if history is not None:
+            history.record(dict(entry, source="menu", tenant="default"))
+    except Exception as e:
+        print(f"记录查询历史时出错: {str(e)}")
+
+
+def result_rows(results):
+    """结果的行数（查询）或影响的行数（更新）"""
+    if isinstance(results, list):
+        return len(results)
+    if isinstance(results, dict):
+        return results.get("affectedRows")
+    return None
+
+
+def use_native(config):
+    """是否使用进程内MySQL后端（配置 db_backend 为 native 且已安装 aiomysql）"""
+    return NATIVE_AVAILABLE and config.get("db_backend") == "native"
+
+
+def native_tool(config, name, arguments=None):
+    """使用进程内MySQL后端执行工具调用，返回解析后的结果，出错时返回 None"""
+    try:
+        return json.loads(native_call(config, name, arguments))
+    except Exception as e:
+        print(f"执行过程中出错: {str(e)}")
+        return None
+
+
+_menu_tenant = None
+
+
+def get_menu_tenant(config):
+    """分页查看结果使用的租户（会话池在多次查询之间复用，配置修改后重新创建）"""
+    global _menu_tenant
+    if _menu_tenant is not None and _menu_tenant.config == config:
+        return _menu_tenant
+    if _menu_tenant is not None:
+        _menu_tenant.close()
+    _menu_tenant = Tenant("default", dict(config))
+    return _menu_tenant
+
+
+def view_query(config, sql, history):
+    """
+    分页显示SELECT的结果：只在翻页时读取更多的行，内存中最多保留 viewer_max_rows 行
+
+    history 中写入行数（结果已全部读取时）、状态和显示第一页的耗时（翻页等待的时间不计入）
+    """
+    started = time.time()
+    tenant = get_menu_tenant(config)
+    viewer = ResultViewer(
+        lambda: tenant.iter_rows(sql, paginate=True),
+        page_size=config.get("viewer_page_size"),
+        max_rows=config.get("viewer_max_rows", 5000),
+        max_column_width=config.get("viewer_column_width", 40)
+    )
+    print(f"\n执行查询: {sql}")
+    shown = viewer.show(0)
+    history["exec_ms"] = (time.time() - started) * 1000
+    history["rows"] = viewer.fetched if viewer.complete and viewer.error is None else None
+    if viewer.error is not None:
+        history.update(status="error", error=viewer.error)
+    if shown:
+        viewer.run(show_first=False)
+    else:
+        viewer.close()
+
 
 def load_config(config_file="config.json"):
     """从配置文件加载数据库连接信息"""
@@ -164,7 +277,8 @@ def connect_to_database(config):
                 config['user'],
                 config['password'],
                 config['database'],
-                str(config['port'])
+                str(config['port']),
+                config.get('db_backend', 'mcp')
             ]
             subprocess.run(cmd, check=True)
             print("连接成功")
@@ -183,6 +297,29 @@ def execute_query(config):
         print("错误: 只能执行SELECT查询")
         return
 
+    started = time.time()
+    history = {"sql": sql, "status": "ok"}
+    if VIEWER_AVAILABLE:
+        # 分页显示结果，不一次打印全部的行
+        view_query(config, sql, history)
+        record_history(config, dict(history, total_ms=history["exec_ms"]))
+        return
+
+    if use_native(config):
+        # 使用进程内MySQL后端，不启动MCP服务器
+        print(f"\n执行查询: {sql}")
+        results = native_tool(config, "query", {"sql": sql, "params": []})
+        if results is not None:
+            print("\n查询结果:")
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+            history["rows"] = result_rows(results)
+        else:
+            print("\n查询失败")
+            history["status"] = "error"
+        elapsed = (time.time() - started) * 1000
+        record_history(config, dict(history, exec_ms=elapsed, total_ms=elapsed))
+        return
+
     if PERSISTENT_CLIENT_AVAILABLE:
         # 使用持久化客户端
         print(f"\n执行查询: {sql}")
@@ -190,8 +327,10 @@ def execute_query(config):
         if results:
             print("\n查询结果:")
             print(json.dumps(results, indent=2, ensure_ascii=False))
+            history["rows"] = result_rows(results)
         else:
             print("\n查询失败")
+            history["status"] = "error"
     else:
         # 创建临时脚本
         with open("temp_query.py", "w", encoding="utf-8") as f:
@@ -278,6 +417,10 @@ if __name__ == "__main__":
         subprocess.run(["python", "temp_query.py"], check=True)
     except subprocess.CalledProcessError as e:
         print(f"执行查询失败: {e}")
+        history["status"] = "error"
+
+    elapsed = (time.time() - started) * 1000
+    record_history(config, dict(history, exec_ms=elapsed, total_ms=elapsed))
 
     # 删除临时脚本
     try:
@@ -286,17 +429,73 @@ if __name__ == "__main__":
         pass
 
 
+def bulk_execute(config, path):
+    """从文件读取SQL语句并批量执行"""
+    if not BULK_WRITER_AVAILABLE:
+        print("错误: 批量写入需要安装 mcp 模块")
+        return
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            statements = [f.read()]
+    except OSError as e:
+        print(f"错误: 无法读取文件 {path}: {e}")
+        return
+
+    pool = create_session_pool(config, size=1, name="bulk")
+    try:
+        writer = BulkWriter(
+            pool,
+            batch_size=config.get("bulk_batch_size", 100),
+            max_rows_per_insert=config.get("bulk_max_rows", 500),
+            max_statement_bytes=config.get("bulk_max_bytes", 1000000),
+            timeout=config.get("bulk_timeout", 600)
+        )
+        print(f"\n批量执行: {path}")
+        report = writer.write_statements(statements)
+        print("\n执行结果:")
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        elapsed = report["seconds"] * 1000
+        record_history(config, {"sql": f"-- @{path}", "status": "ok" if report["success"] else "error",
+                                "rows": report["rows_affected"], "exec_ms": elapsed, "total_ms": elapsed})
+    except Exception as e:
+        print(f"\n批量执行失败: {e}")
+    finally:
+        pool.close()
+
+
 def execute_update(config):
     """执行更新"""
-    sql = input("\n请输入SQL语句 (INSERT, UPDATE, DELETE): ")
+    sql = input("\n请输入SQL语句 (INSERT, UPDATE, DELETE，或 @文件路径 批量执行文件中的语句): ")
     if not sql:
         print("错误: SQL语句不能为空")
         return
 
+    if sql.startswith("@"):
+        bulk_execute(config, sql[1:].strip())
+        return
+
     if sql.strip().upper().startswith("SELECT"):
         print("错误: 请使用查询功能执行SELECT语句")
         return
 
+    started = time.time()
+    history = {"sql": sql, "status": "ok"}
+    if use_native(config):
+        # 使用进程内MySQL后端，不启动MCP服务器
+        print(f"\n执行更新: {sql}")
+        results = native_tool(config, "execute", {"sql": sql, "params": []})
+        if results is not None:
+            print("\n执行结果:")
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+            history["rows"] = result_rows(results)
+        else:
+            print("\n执行失败")
+            history["status"] = "error"
+        elapsed = (time.time() - started) * 1000
+        record_history(config, dict(history, exec_ms=elapsed, total_ms=elapsed))
+        return
+
     if PERSISTENT_CLIENT_AVAILABLE:
         # 使用持久化客户端
         print(f"\n执行更新: {sql}")
@@ -304,8 +503,10 @@ def execute_update(config):
         if results:
             print("\n执行结果:")
             print(json.dumps(results, indent=2, ensure_ascii=False))
+            history["rows"] = result_rows(results)
         else:
             print("\n执行失败")
+            history["status"] = "error"
     else:
         # 创建临时脚本
         with open("temp_execute.py", "w", encoding="utf-8") as f:
@@ -392,6 +593,10 @@ if __name__ == "__main__":
         subprocess.run(["python", "temp_execute.py"], check=True)
     except subprocess.CalledProcessError as e:
         print(f"执行更新失败: {e}")
+        history["status"] = "error"
+
+    elapsed = (time.time() - started) * 1000
+    record_history(config, dict(history, exec_ms=elapsed, total_ms=elapsed))
 
     # 删除临时脚本
     try:
@@ -402,6 +607,20 @@ if __name__ == "__main__":
 
 def list_tables(config):
     """列出所有表"""
+    if use_native(config):
+        # 使用进程内MySQL后端，不启动MCP服务器
+        print("\n列出所有表...")
+        tables = native_tool(config, "list_tables")
+        if tables is None:
+            print("\n获取表列表失败")
+            return
+        print("\n表列表:")
+        table_names = [value for table_info in tables for key, value in table_info.items()
+                       if key.startswith("Tables_in_")]
+        for i, table in enumerate(table_names, 1):
+            print(f"{i}. {table}")
+        return
+
     if PERSISTENT_CLIENT_AVAILABLE:
         # 使用持久化客户端
         print("\n列出所有表...")
@@ -526,6 +745,17 @@ def describe_table(config):
         print("错误: 表名不能为空")
         return
 
+    if use_native(config):
+        # 使用进程内MySQL后端，不启动MCP服务器
+        print(f"\n获取表 {table} 的结构...")
+        structure = native_tool(config, "describe_table", {"table": table})
+        if structure is not None:
+            print(f"\n表 {table} 结构:")
+            print(json.dumps(structure, indent=2, ensure_ascii=False))
+        else:
+            print(f"\n获取表 {table} 结构失败")
+        return
+
     if PERSISTENT_CLIENT_AVAILABLE:
         # 使用持久化客户端
         print(f"\n获取表 {table} 的结构...")
@@ -662,20 +892,40 @@ def natural_language_query(config):
         print("错误: 查询不能为空")
         return
 
+    started = time.time()
     print("\n获取数据库表结构信息...")
     table_info = get_table_info_from_db(config)
+    schema_ms = (time.time() - started) * 1000
 
     print("\n将自然语言转换为SQL...")
+    llm_started = time.time()
     converter = DeepSeekNLtoSQL(api_key)
     sql, explanation = converter.convert_to_sql(natural_language, table_info)
+    history = {"question": natural_language, "sql": sql, "status": "ok" if sql else "error",
+               "schema_ms": schema_ms, "llm_ms": (time.time() - llm_started) * 1000, "llm_cache": "miss"}
 
     print(f"\n生成的SQL: {sql}")
     print(f"\n解释: {explanation}")
 
-    # 询问是否执行生成的SQL
+    # 询问是否执行生成的SQL（等待输入的时间不计入总耗时）
+    total_ms = (time.time() - started) * 1000
     if input("\n是否执行SQL? (y/n): ").lower() == 'y':
+        exec_started = time.time()
         # 检查SQL类型
-        if sql.strip().upper().startswith("SELECT"):
+        if VIEWER_AVAILABLE and sql.strip().upper().startswith("SELECT"):
+            # 分页显示结果（exec_ms 为显示第一页的耗时）
+            view_query(config, sql, history)
+        elif use_native(config):
+            # 使用进程内MySQL后端，不启动MCP服务器
+            tool = "query" if sql.strip().upper().startswith("SELECT") else "execute"
+            results = native_tool(config, tool, {"sql": sql, "params": []})
+            if results is not None:
+                print("\n执行结果:")
+                print(json.dumps(results, indent=2, ensure_ascii=False))
+                history["rows"] = result_rows(results)
+            else:
+                history["status"] = "error"
+        elif sql.strip().upper().startswith("SELECT"):
             # 创建临时脚本
             with open("temp_nl_query.py", "w", encoding="utf-8") as f:
                 f.write(f"""#!/usr/bin/env python3
@@ -761,6 +1011,7 @@ if __name__ == "__main__":
                 subprocess.run(["python", "temp_nl_query.py"], check=True)
             except subprocess.CalledProcessError as e:
                 print(f"执行查询失败: {e}")
+                history["status"] = "error"
 
             # 删除临时脚本
             try:
@@ -853,6 +1104,7 @@ if __name__ == "__main__":
                 subprocess.run(["python", "temp_nl_execute.py"], check=True)
             except subprocess.CalledProcessError as e:
                 print(f"执行更新失败: {e}")
+                history["status"] = "error"
 
             # 删除临时脚本
             try:
@@ -860,6 +1112,11 @@ if __name__ == "__main__":
             except:
                 pass
 
+        history.setdefault("exec_ms", (time.time() - exec_started) * 1000)
+        total_ms += history["exec_ms"]
+
+    record_history(config, dict(history, total_ms=total_ms))
+
 
 def modify_config(config, config_file):
     """修改数据库连接配置"""
@@ -906,10 +1163,41 @@ def modify_config(config, config_file):
     return new_config
 
 
+def run_batch_mode(args):
+    """批处理模式：不显示菜单，结果写到标准输出或文件，提示信息和耗时汇总写到标准错误"""
+    if not BATCH_AVAILABLE:
+        print("错误: 批处理模式需要安装 mcp 模块", file=sys.stderr)
+        return 2
+
+    stdout = sys.stdout.buffer
+    with contextlib.redirect_stdout(sys.stderr):
+        config = load_config(args.config_file)
+        try:
+            summary = run_batch(config, args.batch, nl=args.nl, execute=not args.no_execute,
+                                parallel=args.parallel, output_format=args.format, output=args.output,
+                                output_dir=args.output_dir, stream=stdout)
+        except (OSError, ValueError) as e:
+            print(f"错误: {str(e)}")
+            return 2
+        print("\n耗时汇总:")
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 1 if summary["failed"] else 0
+
+
 if __name__ == "__main__":
     # 检查命令行参数
-    config_file = "config.json"
-    if len(sys.argv) > 1:
-        config_file = sys.argv[1]
-
-    run_mysql_client(config_file)
+    parser = argparse.ArgumentParser(description="MCP MySQL客户端菜单")
+    parser.add_argument("config_file", nargs="?", default="config.json", help="配置文件")
+    parser.add_argument("--batch", metavar="FILE", help="批处理模式：从文件（- 表示标准输入）读取SQL语句或问题并执行，不显示菜单")
+    parser.add_argument("--nl", action="store_true", help="批处理输入为自然语言问题（每行一个）")
+    parser.add_argument("--no-execute", action="store_true", help="自然语言问题只转换为SQL，不执行")
+    parser.add_argument("--parallel", type=int, default=4, help="同时执行的语句数")
+    parser.add_argument("--format", choices=BATCH_FORMATS if BATCH_AVAILABLE else ("jsonl", "csv"),
+                        default="jsonl", help="结果格式")
+    parser.add_argument("--output", help="结果文件，默认写到标准输出")
+    parser.add_argument("--output-dir", help="每条语句的结果写入该目录下的单独文件")
+    args = parser.parse_args()
+
+    if args.batch:
+        sys.exit(run_batch_mode(args))
+    run_mysql_client(args.config_file)
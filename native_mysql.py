@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内MySQL后端模块
+
+使用纯Python的异步MySQL客户端（aiomysql）直接连接数据库，提供与MCP服务器相同的
+connect_db、query、execute、list_tables、describe_table 工具语义（结果为相同格式的JSON文本），
+省去 node MCP 服务器进程和 stdio JSON-RPC 的往返。在配置中设置 "db_backend": "native" 启用
+"""
+
+import datetime
+import decimal
+import json
+import re
+from typing import Dict, Any, Optional, List
+
+from session_pool import MCPSessionPool
+from sql_utils import PARAM, tokenize
+
+# aiomysql 是可选依赖，未安装时使用MCP后端
+try:
+    import aiomysql
+    AIOMYSQL_AVAILABLE = True
+except ImportError:
+    AIOMYSQL_AVAILABLE = False
+
+# MySQL客户端错误码范围（连接断开等），这类错误之后连接不能再使用
+_CLIENT_ERRORS = range(2000, 3000)
+
+_CHANGED_RE = re.compile(r"Changed:\s*(\d+)")
+
+
+class NativeToolError(Exception):
+    """数据库返回的错误（SQL错误等，连接仍然可用），对应MCP工具返回的错误"""
+
+
+class TextContent:
+    """工具结果中的一段文本（与MCP的 TextContent 结构相同）"""
+
+    __slots__ = ("type", "text")
+
+    def __init__(self, text: str):
+        self.type = "text"
+        self.text = text
+
+
+class ToolResult:
+    """工具调用结果（与MCP的 CallToolResult 结构相同）"""
+
+    __slots__ = ("content", "isError")
+
+    def __init__(self, text: str):
+        self.content = [TextContent(text)]
+        self.isError = False
+
+
+def _json_default(value: Any) -> Any:
+    """按 mysql2 的方式转换JSON不支持的类型：DECIMAL为字符串，日期时间为ISO格式"""
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def to_json(value: Any) -> str:
+    """把查询结果序列化为JSON文本"""
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+def convert_placeholders(sql: str) -> str:
+    """
+    把 ? 占位符转换为 aiomysql 使用的 %s（字符串和注释中的 ? 不变），其余的 % 转义为 %%
+
+    只在有参数时调用：没有参数时 aiomysql 不对SQL做格式化
+    """
+    parts = []
+    for token in tokenize(sql):
+        if token.type == PARAM:
+            parts.append("%s")
+        else:
+            parts.append(token.value.replace("%", "%%"))
+    return "".join(parts)
+
+
+def _quote_identifier(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _is_client_error(error: BaseException) -> bool:
+    """连接级错误（连接已断开或协议错误）"""
+    if not AIOMYSQL_AVAILABLE:
+        return True
+    if isinstance(error, aiomysql.InterfaceError):
+        return True
+    if isinstance(error, aiomysql.MySQLError):
+        code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+        return code is None or code in _CLIENT_ERRORS
+    return True
+
+
+def _error_message(error: BaseException) -> str:
+    if len(error.args) >= 2:
+        return str(error.args[1])
+    return str(error)
+
+
+class NativeSession:
+    """一个直接连接MySQL的会话，call_tool 的参数和结果与MCP服务器的工具相同"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> ToolResult:
+        """
+        执行工具
+
+        Args:
+            name: connect_db、query、execute、list_tables 或 describe_table
+            arguments: 工具参数
+
+        Returns:
+            结果文本与MCP服务器相同的 ToolResult
+
+        Raises:
+            NativeToolError: SQL执行出错（连接仍然可用）
+            aiomysql.MySQLError: 连接出错
+        """
+        arguments = arguments or {}
+        if name == "connect_db":
+            # 会话创建时已经按配置连接
+            return ToolResult("Successfully connected to database")
+        if name == "query":
+            return ToolResult(to_json(await self._run(arguments["sql"], arguments.get("params"), "Query execution failed")))
+        if name == "execute":
+            return ToolResult(to_json(await self._run(arguments["sql"], arguments.get("params"), "Execute failed")))
+        if name == "list_tables":
+            return ToolResult(to_json(await self._run("SHOW TABLES", None, "List tables failed")))
+        if name == "describe_table":
+            sql = f"DESCRIBE {_quote_identifier(arguments['table'])}"
+            return ToolResult(to_json(await self._run(sql, None, "Describe table failed")))
+        raise NativeToolError(f"Unknown tool: {name}")
+
+    async def _run(self, sql: str, params: Optional[List[Any]], error_prefix: str) -> Any:
+        """执行SQL，返回行数据（有结果集时）或执行结果"""
+        if params:
+            sql = convert_placeholders(sql)
+        try:
+            async with self.conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(sql, params or None)
+                if cursor.description:
+                    return list(await cursor.fetchall())
+                return self._result_header(cursor)
+        except Exception as e:
+            if _is_client_error(e):
+                raise
+            raise NativeToolError(f"{error_prefix}: {_error_message(e)}") from e
+
+    @staticmethod
+    def _result_header(cursor) -> Dict[str, Any]:
+        """与 mysql2 的 ResultSetHeader 相同的字段"""
+        result = getattr(cursor, "_result", None)
+        info = (getattr(result, "message", None) or b"")
+        if isinstance(info, bytes):
+            info = info.decode("utf-8", errors="replace")
+        changed = _CHANGED_RE.search(info)
+        return {
+            "fieldCount": 0,
+            "affectedRows": max(cursor.rowcount, 0),
+            "insertId": cursor.lastrowid or 0,
+            "info": info,
+            "serverStatus": getattr(result, "server_status", 0) or 0,
+            "warningStatus": getattr(result, "warning_count", 0) or 0,
+            "changedRows": int(changed.group(1)) if changed else 0
+        }
+
+
+class _NativePooledSession:
+    """池中的单个数据库连接"""
+
+    def __init__(self, session: NativeSession, connection_id: Optional[int] = None):
+        self.session = session
+        self.connection_id = connection_id
+
+    def alive(self) -> bool:
+        return not self.session.conn.closed
+
+    async def close(self):
+        self.session.conn.close()
+
+
+class NativeSessionPool(MCPSessionPool):
+    """直接连接MySQL的会话池，接口与MCP会话池相同（超时、取消和 KILL QUERY 的处理也相同）"""
+
+    def __init__(self, config: Dict[str, Any], size: int = 2, name: str = "default"):
+        if not AIOMYSQL_AVAILABLE:
+            raise RuntimeError("进程内MySQL后端需要安装 aiomysql")
+        super().__init__(config, size=size, name=name)
+        self.connect_timeout = config.get("connect_timeout", 10)
+
+    async def _open_session(self) -> _NativePooledSession:
+        conn = await aiomysql.connect(
+            host=self.config["host"],
+            port=int(self.config["port"]),
+            user=self.config["user"],
+            password=self.config["password"],
+            db=self.config["database"],
+            charset="utf8mb4",
+            autocommit=True,
+            connect_timeout=self.connect_timeout
+        )
+        session = NativeSession(conn)
+        connection_id = await self._connection_id(session) if self.kill_on_cancel else None
+        return _NativePooledSession(session, connection_id)
+
+    def _is_tool_error(self, error: BaseException) -> bool:
+        return isinstance(error, NativeToolError)
+
+    def stats(self) -> Dict[str, Any]:
+        """会话池状态"""
+        return dict(super().stats(), backend="native")
+
+
+def native_call(config: Dict[str, Any], name: str, arguments: Optional[Dict[str, Any]] = None,
+                timeout: Optional[float] = None) -> Optional[str]:
+    """
+    使用临时连接执行一次工具调用（命令行工具使用）
+
+    Returns:
+        结果文本
+    """
+    pool = NativeSessionPool(dict(config, kill_on_cancel=False), size=1, name="native")
+    try:
+        return pool.call_tool(name, arguments, timeout=timeout)
+    finally:
+        pool.close()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自然语言转SQL评测
+
+对同一组问题用不同的策略（提示词裁剪、表结构格式、模型、JSON模式、few-shot、校验等配置）生成SQL，
+在测试数据库上执行，与标准答案的执行结果比较（不比较SQL文本），输出每种策略的准确率、token数、
+模型延迟和SQL执行时间。模型响应可以实时请求、录制后回放或使用桩（不需要API密钥）。
+
+问题集（JSON Lines，每行一个问题）:
+    {"id": "q1", "question": "每个客户的订单总额", "expected_sql": "SELECT ...", "ordered": false}
+    expected_sql 也可以换成 expected（行数组，每行为值数组或对象）；ordered 为 true 时比较行的顺序
+
+策略（JSON数组，config 为覆盖的租户配置，如 prompt_max_tables、prompt_schema_format、llm_model、
+llm_json_mode、few_shot、validate_sql）:
+    [{"name": "baseline", "config": {}}, {"name": "compact", "config": {"prompt_schema_format": "compact"}}]
+
+用法:
+    python nl2sql_eval.py --corpus corpus.jsonl --strategies strategies.json --fixture fixture.sql \\
+        --llm record --recordings recordings.jsonl --report report.json
+    python nl2sql_eval.py --corpus corpus.jsonl --strategies strategies.json --llm replay --recordings recordings.jsonl
+"""
+
+import argparse
+import datetime
+import decimal
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+
+from cache import make_key
+from example_store import estimate_tokens
+from fast_json import loads
+from sql_utils import is_select, split_statements
+from sql_validator import read_only_errors
+from tenants import Tenant
+
+LLM_MODES = ("live", "record", "replay", "stub")
+
+_NUMBER_RE = re.compile(r"^-?\d+(\.\d+)?([eE][-+]?\d+)?$")
+
+# 评测时关闭缓存和自动学习，每个问题都调用模型并执行SQL
+_EVAL_DEFAULTS = {
+    "llm_cache_ttl": 0,
+    "result_cache_ttl": 0,
+    "few_shot": False,
+    "few_shot_learn": False,
+    "materialize": False,
+    "replicas": []
+}
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """读取问题集，每项需要 question 以及 expected_sql 或 expected"""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            if "question" not in item or ("expected_sql" not in item and "expected" not in item):
+                raise ValueError(f"{path} 第 {number} 行缺少 question 或 expected_sql/expected")
+            item.setdefault("id", str(len(items) + 1))
+            items.append(item)
+    return items
+
+
+def load_strategies(path: Optional[str]) -> List[Dict[str, Any]]:
+    """读取策略列表，未指定时只有一个使用当前配置的 baseline"""
+    if not path:
+        return [{"name": "baseline", "config": {}}]
+    with open(path, "r", encoding="utf-8") as f:
+        strategies = json.load(f)
+    for index, strategy in enumerate(strategies):
+        strategy.setdefault("name", f"strategy{index + 1}")
+        strategy.setdefault("config", {})
+    return strategies
+
+
+# ---- 结果比较 ----
+
+def normalize_value(value: Any) -> Any:
+    """
+    比较用的值：数字（包括 DECIMAL 字符串）统一为保留6位小数的浮点数，布尔值为整数，
+    日期时间统一为 "YYYY-MM-DD HH:MM:SS"（mysql2 输出为 2024-01-01T08:00:00.000Z）
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return round(float(value), 6)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, sort_keys=True)
+    text = value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else str(value).strip()
+    if _NUMBER_RE.match(text):
+        return round(float(text), 6)
+    if len(text) >= 19 and text[4] == "-" and text[10] == "T":
+        return text[:10] + " " + text[11:19]
+    return text
+
+
+def result_signature(rows: List[Any], ordered: bool = False) -> List[Tuple]:
+    """
+    结果的比较形式：每行的值规范化后排序（不要求列的顺序和列名相同），
+    ordered 为 false 时行也排序（按多重集合比较）
+    """
+    signature = []
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        signature.append(tuple(sorted((normalize_value(value) for value in values), key=repr)))
+    return signature if ordered else sorted(signature, key=repr)
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))], 1)
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 1) if values else None
+
+
+# ---- 模型响应 ----
+
+class LLMTransport:
+    """
+    评测时代替HTTP请求调用模型
+
+    live 直接请求API；record 请求API并把响应追加到录制文件；replay 只使用录制的响应（按请求内容匹配）；
+    stub 返回桩SQL（stubs 中的SQL，没有时使用问题的 expected_sql），token数按文本长度估算
+    """
+
+    def __init__(self, mode: str, api_key: Optional[str] = None, recordings: Optional[str] = None,
+                 stubs: Optional[Dict[str, str]] = None, timeout: float = 60):
+        if mode not in LLM_MODES:
+            raise ValueError(f"不支持的模型响应方式: {mode}")
+        if mode in ("live", "record") and not api_key:
+            raise ValueError("实时请求模型需要DeepSeek API密钥")
+        if mode in ("record", "replay") and not recordings:
+            raise ValueError(f"{mode} 方式需要指定录制文件")
+        self.mode = mode
+        self.api_key = api_key
+        self.recordings_path = recordings
+        self.stubs = stubs or {}
+        self.timeout = timeout
+        self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        self._recorded: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if mode == "replay" or (mode == "record" and os.path.exists(recordings)):
+            self._load_recordings()
+
+        # 当前问题（桩和录制文件使用）和本题累计的模型延迟
+        self.item: Dict[str, Any] = {}
+        self.latency_ms = 0.0
+
+    def _load_recordings(self):
+        if not os.path.exists(self.recordings_path):
+            raise ValueError(f"录制文件不存在: {self.recordings_path}")
+        with open(self.recordings_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._recorded[record["key"]] = record
+
+    def start(self, item: Dict[str, Any]):
+        """开始评测一个问题"""
+        self.item = item
+        self.latency_ms = 0.0
+
+    def __call__(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        key = make_key(payload)
+        if self.mode == "stub":
+            return self._stub(payload)
+        if self.mode == "replay":
+            record = self._recorded.get(key)
+            if record is None:
+                raise RuntimeError("没有录制的响应（问题、策略或提示词已改变，需要重新录制）")
+            self.latency_ms += record["latency_ms"]
+            return record["response"]
+
+        started = time.perf_counter()
+        response = requests.post(self.api_url, json=payload, timeout=self.timeout,
+                                 headers={"Content-Type": "application/json",
+                                          "Authorization": f"Bearer {self.api_key}"})
+        response.raise_for_status()
+        result = response.json()
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.latency_ms += latency_ms
+        if self.mode == "record":
+            record = {"key": key, "id": self.item.get("id"), "question": self.item.get("question"),
+                      "model": payload.get("model"), "latency_ms": round(latency_ms, 1), "response": result}
+            with self._lock:
+                self._recorded[key] = record
+                with open(self.recordings_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return result
+
+    def _stub(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        question = self.item.get("question", "")
+        sql = self.stubs.get(self.item.get("id")) or self.stubs.get(question) or self.item.get("expected_sql", "")
+        content = json.dumps({"sql": sql, "explanation": "桩响应", "tables_used": [], "confidence": None},
+                             ensure_ascii=False)
+        prompt = "".join(message["content"] for message in payload.get("messages", []))
+        return {
+            "choices": [{"message": {"content": content}}],
+            "usage": {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(content)}
+        }
+
+
+# ---- 评测 ----
+
+def _query_errors(sql: str) -> List[str]:
+    """不能在测试数据库上执行的原因（写语句、SELECT ... INTO、锁定行）"""
+    errors = [] if is_select(sql) else ["不是查询语句"]
+    return errors + read_only_errors(sql)
+
+
+class Evaluator:
+    """在测试数据库上评测各策略"""
+
+    def __init__(self, config: Dict[str, Any], transport: LLMTransport, statement_timeout: float = 30):
+        """
+        初始化
+
+        Args:
+            config: 测试数据库和模型的配置（与API服务器相同）
+            transport: 模型响应方式
+            statement_timeout: 每条SQL的执行超时时间（秒）
+        """
+        self.config = dict(config, **_EVAL_DEFAULTS)
+        self.config["statement_timeout"] = statement_timeout
+        self.transport = transport
+        self.api_key = config.get("deepseek_api_key", "") or os.environ.get("DEEPSEEK_API_KEY") or "offline"
+        # 执行标准答案和生成的SQL都使用同一个会话池，各策略的执行时间可以比较
+        self.fixture = Tenant("eval", dict(self.config, pool_size=1))
+        self._expected: Dict[str, Any] = {}
+
+    def load_fixture(self, path: str) -> Dict[str, Any]:
+        """执行测试数据库的初始化脚本（建表和插入数据），遇到错误时停止"""
+        with open(path, "r", encoding="utf-8") as f:
+            statements = split_statements(f.read())
+        report = self.fixture.bulk_write(statements=statements, stop_on_error=True)
+        if not report.get("success"):
+            raise RuntimeError(f"初始化测试数据库失败: {json.dumps(report['failed_batches'], ensure_ascii=False)}")
+        return report
+
+    def _run_sql(self, sql: str) -> Tuple[List[Any], float]:
+        """
+        执行查询，返回 (行数据, 执行时间毫秒)
+
+        Raises:
+            RuntimeError: 不是只读查询（不执行，避免修改测试数据库）或执行失败
+        """
+        errors = _query_errors(sql)
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        started = time.perf_counter()
+        result_text = self.fixture.execute_sql(sql)
+        exec_ms = (time.perf_counter() - started) * 1000
+        try:
+            rows = loads(result_text or "")
+        except json.JSONDecodeError:
+            raise RuntimeError(result_text or "执行SQL未返回结果")
+        if not isinstance(rows, list):
+            raise RuntimeError(result_text)
+        return rows, exec_ms
+
+    def expected(self, item: Dict[str, Any]) -> List[Tuple]:
+        """标准答案的执行结果（同一个问题只执行一次）"""
+        if item["id"] not in self._expected:
+            if "expected" in item:
+                rows = item["expected"]
+            else:
+                rows, _ = self._run_sql(item["expected_sql"])
+            self._expected[item["id"]] = result_signature(rows, item.get("ordered", False))
+        return self._expected[item["id"]]
+
+    def evaluate(self, strategy: Dict[str, Any], items: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        用一种策略评测全部问题（依次执行，延迟不受并发影响）
+
+        Returns:
+            (汇总, 每个问题的结果)
+        """
+        tenant = Tenant(f"eval:{strategy['name']}", dict(self.config, **strategy["config"]))
+        tenant.llm_transport = self.transport
+        table_info = self.fixture.get_schema()
+        details = []
+        try:
+            for item in items:
+                details.append(self._evaluate_item(tenant, strategy["name"], item, table_info))
+        finally:
+            tenant.close()
+        return self.summarize(strategy, details), details
+
+    def _evaluate_item(self, tenant: Tenant, name: str, item: Dict[str, Any],
+                       table_info: List[Dict[str, Any]]) -> Dict[str, Any]:
+        detail: Dict[str, Any] = {"strategy": name, "id": item["id"], "question": item["question"], "sql": None,
+                                  "status": None, "error": None, "llm_ms": None, "exec_ms": None,
+                                  "prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0}
+        try:
+            expected = self.expected(item)
+        except Exception as e:
+            detail.update(status="expected_error", error=f"标准答案执行失败: {str(e)}")
+            return detail
+
+        info: Dict[str, Any] = {}
+        self.transport.start(item)
+        try:
+            translation = tenant.translate(item["question"], table_info, self.api_key, info=info)
+        except Exception as e:
+            detail.update(status="llm_error", error=str(e))
+            return detail
+        finally:
+            detail.update(llm_ms=round(self.transport.latency_ms, 1), prompt_tokens=info.get("prompt_tokens", 0),
+                          completion_tokens=info.get("completion_tokens", 0), llm_calls=info.get("llm_calls", 0))
+
+        detail["sql"] = translation["sql"]
+        if not translation["sql"]:
+            detail.update(status="no_sql", error=translation["explanation"])
+            return detail
+        if translation["validation_errors"]:
+            detail.update(status="invalid", error="; ".join(translation["validation_errors"]))
+            return detail
+        # 写语句会修改测试数据库，影响之后所有问题和策略的结果，不执行
+        errors = _query_errors(translation["sql"])
+        if errors:
+            detail.update(status="invalid", error="; ".join(errors) + "，未执行")
+            return detail
+        try:
+            rows, exec_ms = self._run_sql(translation["sql"])
+        except Exception as e:
+            detail.update(status="exec_error", error=str(e))
+            return detail
+        detail["exec_ms"] = round(exec_ms, 1)
+        detail["status"] = "correct" if result_signature(rows, item.get("ordered", False)) == expected else "wrong"
+        return detail
+
+    @staticmethod
+    def summarize(strategy: Dict[str, Any], details: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """一种策略的汇总指标"""
+        scored = [detail for detail in details if detail["status"] != "expected_error"]
+        statuses: Dict[str, int] = {}
+        for detail in details:
+            statuses[detail["status"]] = statuses.get(detail["status"], 0) + 1
+        correct = statuses.get("correct", 0)
+        llm_ms = [detail["llm_ms"] for detail in scored if detail["llm_calls"]]
+        exec_ms = [detail["exec_ms"] for detail in scored if detail["exec_ms"] is not None]
+        prompt_tokens = [detail["prompt_tokens"] for detail in scored if detail["llm_calls"]]
+        completion_tokens = [detail["completion_tokens"] for detail in scored if detail["llm_calls"]]
+        return {
+            "strategy": strategy["name"],
+            "config": strategy["config"],
+            "questions": len(scored),
+            "correct": correct,
+            "accuracy": round(correct / len(scored), 4) if scored else None,
+            "statuses": statuses,
+            "llm_calls": sum(detail["llm_calls"] for detail in scored),
+            "prompt_tokens": {"total": sum(prompt_tokens), "mean": _mean(prompt_tokens)},
+            "completion_tokens": {"total": sum(completion_tokens), "mean": _mean(completion_tokens)},
+            "llm_ms": {"mean": _mean(llm_ms), "p50": _percentile(llm_ms, 0.5), "p95": _percentile(llm_ms, 0.95)},
+            "exec_ms": {"mean": _mean(exec_ms), "p50": _percentile(exec_ms, 0.5), "p95": _percentile(exec_ms, 0.95)}
+        }
+
+    def close(self):
+        self.fixture.close()
+
+
+def format_report(summaries: List[Dict[str, Any]]) -> str:
+    """各策略的对比表"""
+    header = (f"{'策略':<16} {'准确率':>8} {'正确/总数':>10} {'提示token':>10} {'输出token':>10} "
+              f"{'模型ms均值':>10} {'模型ms p95':>10} {'执行ms均值':>10} {'执行ms p95':>10}")
+    lines = [header, "-" * len(header)]
+
+    def cell(value: Any, width: int) -> str:
+        return f"{'-' if value is None else value:>{width}}"
+
+    for summary in summaries:
+        accuracy = None if summary["accuracy"] is None else f"{summary['accuracy'] * 100:.1f}%"
+        lines.append(f"{summary['strategy']:<16} {cell(accuracy, 8)} "
+                     f"{cell(str(summary['correct']) + '/' + str(summary['questions']), 10)} "
+                     f"{cell(summary['prompt_tokens']['mean'], 10)} {cell(summary['completion_tokens']['mean'], 10)} "
+                     f"{cell(summary['llm_ms']['mean'], 10)} {cell(summary['llm_ms']['p95'], 10)} "
+                     f"{cell(summary['exec_ms']['mean'], 10)} {cell(summary['exec_ms']['p95'], 10)}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自然语言转SQL评测：比较各策略的准确率和延迟")
+    parser.add_argument("--config", default="config.json", help="测试数据库和模型的配置文件")
+    parser.add_argument("--corpus", required=True, help="问题集（JSON Lines）")
+    parser.add_argument("--strategies", help="策略列表（JSON），默认只评测当前配置")
+    parser.add_argument("--fixture", help="评测前执行的测试数据库初始化脚本（SQL）")
+    parser.add_argument("--llm", choices=LLM_MODES, default="replay", help="模型响应方式")
+    parser.add_argument("--recordings", help="录制文件（JSON Lines），record 时追加，replay 时读取")
+    parser.add_argument("--stubs", help="桩SQL（JSON对象，键为问题id或问题），stub 方式使用")
+    parser.add_argument("--statement-timeout", type=float, default=30, help="每条SQL的执行超时时间（秒）")
+    parser.add_argument("--report", help="汇总报告（JSON）输出路径")
+    parser.add_argument("--details", help="每个问题的结果（JSON Lines）输出路径")
+    args = parser.parse_args()
+
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        items = load_corpus(args.corpus)
+        strategies = load_strategies(args.strategies)
+        stubs = None
+        if args.stubs:
+            with open(args.stubs, "r", encoding="utf-8") as f:
+                stubs = json.load(f)
+        api_key = config.get("deepseek_api_key", "") or os.environ.get("DEEPSEEK_API_KEY")
+        transport = LLMTransport(args.llm, api_key=api_key, recordings=args.recordings, stubs=stubs,
+                                 timeout=config.get("llm_timeout", 60))
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"错误: {str(e)}")
+
+    evaluator = Evaluator(config, transport, statement_timeout=args.statement_timeout)
+    summaries = []
+    all_details = []
+    try:
+        if args.fixture:
+            report = evaluator.load_fixture(args.fixture)
+            print(f"已初始化测试数据库: {report['statements_in']} 条语句，{report['rows_affected']} 行")
+        for strategy in strategies:
+            print(f"评测策略 {strategy['name']}（{len(items)} 个问题）...")
+            summary, details = evaluator.evaluate(strategy, items)
+            summaries.append(summary)
+            all_details.extend(details)
+    finally:
+        evaluator.close()
+
+    print()
+    print(format_report(summaries))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"llm": args.llm, "questions": len(items), "strategies": summaries}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"\n汇总报告已写入 {args.report}")
+    if args.details:
+        with open(args.details, "w", encoding="utf-8") as f:
+            for detail in all_details:
+                f.write(json.dumps(detail, ensure_ascii=False) + "\n")
+        print(f"每个问题的结果已写入 {args.details}")
+
+
+if __name__ == "__main__":
+    main()
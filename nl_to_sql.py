@@ -9,192 +9,331 @@ import json
 import requests
 from typing import Dict, Any, Optional, List, Tuple
 
+from deadline import Deadline, RequestCancelled
+from llm_limiter import LLMBusyError
+from structured_output import JSON_FORMAT_HINT, parse_response
+
+
+SCHEMA_FORMATS = ("full", "compact")
+
+
+def format_schema(table_info: List[Dict[str, Any]], schema_format: str = "full") -> str:
+    """
+    把表结构格式化为提示词中的文本
+
+    Args:
+        table_info: 表结构信息
+        schema_format: full（每列一行，带列说明）或 compact（每表一行 表名(列 类型, ...)，不带列说明）
+
+    Returns:
+        表结构文本
+    """
+    if schema_format not in SCHEMA_FORMATS:
+        raise ValueError(f"不支持的表结构格式: {schema_format}")
+    text = ""
+    for table in table_info:
+        if schema_format == "compact":
+            columns = ", ".join(f"{column['name']} {column['type']}" for column in table['columns'])
+            text += f"{table['name']}({columns})\n"
+            continue
+        text += f"\n表名: {table['name']}\n"
+        text += "列:\n"
+        for column in table['columns']:
+            text += f"- {column['name']}: {column['type']}"
+            if column.get('description'):
+                text += f" ({column['description']})"
+            text += "\n"
+    return text
+
 
 class DeepSeekNLtoSQL:
     """DeepSeek AI自然语言转SQL类"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, json_mode: bool = True, limiter=None,
+                 max_retries: int = 1, timeout: Optional[float] = 60, model: str = "deepseek-chat",
+                 schema_format: str = "full", transport=None):
         """
         初始化DeepSeek AI客户端
 
         Args:
             api_key: DeepSeek API密钥，如果为None则从环境变量获取
+            json_mode: 是否要求模型以JSON格式返回结果
+            limiter: 可选的 AdaptiveLimiter，多个请求共用时协调调用速率和并发
+            max_retries: 使用限流器时收到429后的重试次数
+            timeout: HTTP请求的超时时间（秒）
+            model: 模型名称
+            schema_format: 提示词中表结构的格式，full（每列一行，带列说明）或 compact（每表一行，不带列说明）
+            transport: 可选，代替HTTP请求的函数 transport(payload) -> 响应JSON（评测时回放录制的响应）
         """
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("DeepSeek API密钥未提供，请设置DEEPSEEK_API_KEY环境变量或在初始化时提供")
 
+        self.json_mode = json_mode
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.model = model
+        self.schema_format = schema_format
+        self.transport = transport
         self.api_url = "https://api.deepseek.com/v1/chat/completions"
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
 
-    def convert_to_sql(self, natural_language: str, table_info: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, str]:
+    def _request(self, payload: Dict[str, Any], deadline: Optional[Deadline]):
+        """发送HTTP请求，等待时间不超过请求的剩余时间"""
+        timeout = deadline.timeout(self.timeout) if deadline is not None else self.timeout
+        try:
+            return requests.post(self.api_url, headers=self.headers, json=payload, timeout=timeout)
+        except requests.Timeout:
+            if deadline is not None:
+                deadline.check()
+            raise
+
+    def _post(self, payload: Dict[str, Any], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        发送请求，配置了限流器时先等待调用名额，收到429时缩小并发上限后重试
+
+        Raises:
+            LLMBusyError: 等待调用名额超时
+            RequestCancelled: 请求已被取消或超过截止时间
+        """
+        if self.transport is not None:
+            return self.transport(payload)
+        if self.limiter is None:
+            response = self._request(payload, deadline)
+            response.raise_for_status()
+            return response.json()
+
+        for attempt in range(self.max_retries + 1):
+            queue_timeout = deadline.timeout(self.limiter.queue_timeout) if deadline is not None else None
+            with self.limiter.slot(queue_timeout) as permit:
+                response = self._request(payload, deadline)
+                if response.status_code == 429:
+                    permit.throttled()
+                    if attempt < self.max_retries:
+                        print("DeepSeek API返回429，降低并发后重试")
+                        continue
+                response.raise_for_status()
+                result = response.json()
+                permit.succeeded()
+                return result
+
+    def convert_to_sql(self, natural_language: str, table_info: Optional[List[Dict[str, Any]]] = None,
+                       feedback: Optional[Tuple[str, List[str]]] = None) -> Tuple[str, str]:
         """
         将自然语言转换为SQL查询
 
         Args:
             natural_language: 自然语言查询
             table_info: 表结构信息，用于提供上下文
+            feedback: 上一次生成的SQL及其校验错误，用于让模型修正
 
         Returns:
             Tuple[str, str]: (SQL查询, 解释)
         """
+        result = self.generate(natural_language, table_info, feedback)
+        return result["sql"], result["explanation"]
+
+    def generate(self, natural_language: str, table_info: Optional[List[Dict[str, Any]]] = None,
+                 feedback: Optional[Tuple[str, List[str]]] = None,
+                 examples: Optional[List[Dict[str, Any]]] = None,
+                 deadline: Optional[Deadline] = None, info: Optional[Dict[str, Any]] = None,
+                 hints: Optional[str] = None) -> Dict[str, Any]:
+        """
+        将自然语言转换为SQL查询，返回结构化结果
+
+        JSON模式下要求模型返回JSON对象并严格解析，解析失败时使用宽松解析器
+
+        Args:
+            natural_language: 自然语言查询
+            table_info: 表结构信息，用于提供上下文
+            feedback: 上一次生成的SQL及其校验错误，用于让模型修正
+            examples: 相似问题的示例（question、sql），作为few-shot示例放入提示词
+            deadline: 请求的截止时间
+            info: 可选，累加调用信息（llm_calls、prompt_tokens、completion_tokens）
+            hints: 性能提示（大表的估算行数和索引），放在表结构之后
+
+        Returns:
+            {"sql": SQL查询, "explanation": 解释, "tables_used": 用到的表, "confidence": 置信度}
+
+        Raises:
+            LLMBusyError: 等待调用名额超时
+            RequestCancelled: 请求已被取消或超过截止时间
+        """
         # 构建提示
         system_prompt = "你是一个专业的SQL专家，擅长将自然语言转换为SQL查询。请根据用户的自然语言描述，生成对应的SQL查询语句。"
 
         if table_info:
             system_prompt += "\n\n数据库表结构信息如下:\n"
-            for table in table_info:
-                system_prompt += f"\n表名: {table['name']}\n"
-                system_prompt += "列:\n"
-                for column in table['columns']:
-                    system_prompt += f"- {column['name']}: {column['type']}"
-                    if column.get('description'):
-                        system_prompt += f" ({column['description']})"
-                    system_prompt += "\n"
-
-        user_prompt = f"请将以下自然语言转换为SQL查询:\n\n{natural_language}\n\n请只返回SQL查询语句和简短解释，不要包含其他内容。格式如下:\n\nSQL: [SQL查询语句]\n解释: [简短解释]"
+            system_prompt += format_schema(table_info, self.schema_format)
+
+        if hints:
+            system_prompt += "\n\n性能提示（估算行数和索引，~N个值为索引第一列的基数）:\n" + hints
+            system_prompt += "\n查询大表时请按索引列过滤或连接，不要在索引列上使用函数，查询明细时加上 LIMIT。\n"
+
+        if examples:
+            system_prompt += "\n\n参考示例（已验证的问题和SQL）:\n"
+            for example in examples:
+                system_prompt += f"\n问题: {example['question']}\nSQL: {example['sql']}\n"
+
+        if self.json_mode:
+            user_prompt = f"请将以下自然语言转换为SQL查询:\n\n{natural_language}\n\n{JSON_FORMAT_HINT}"
+            format_hint = "JSON格式不变"
+        else:
+            user_prompt = f"请将以下自然语言转换为SQL查询:\n\n{natural_language}\n\n请只返回SQL查询语句和简短解释，不要包含其他内容。格式如下:\n\nSQL: [SQL查询语句]\n解释: [简短解释]"
+            format_hint = "格式不变"
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        if feedback:
+            previous_sql, errors = feedback
+            previous = json.dumps({"sql": previous_sql}, ensure_ascii=False) if self.json_mode else f"SQL: {previous_sql}"
+            messages.append({"role": "assistant", "content": previous})
+            messages.append({"role": "user", "content": "上面的SQL没有通过校验:\n" + "\n".join(f"- {e}" for e in errors) +
+                             f"\n\n请修正后只返回一条SQL查询语句和简短解释，{format_hint}。"})
 
         # 构建请求
         payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            "model": self.model,
+            "messages": messages,
             "temperature": 0.1,  # 低温度以获得更确定性的结果
             "max_tokens": 1000
         }
+        if self.json_mode:
+            payload["response_format"] = {"type": "json_object"}
 
         # 发送请求
         try:
-            response = requests.post(self.api_url, headers=self.headers, json=payload)
-            response.raise_for_status()
-            result = response.json()
+            result = self._post(payload, deadline)
+            if info is not None:
+                usage = result.get("usage") or {}
+                info["llm_calls"] = info.get("llm_calls", 0) + 1
+                info["prompt_tokens"] = info.get("prompt_tokens", 0) + (usage.get("prompt_tokens") or 0)
+                info["completion_tokens"] = info.get("completion_tokens", 0) + (usage.get("completion_tokens") or 0)
 
             # 解析响应
             content = result["choices"][0]["message"]["content"]
-
-            # 提取SQL和解释
-            sql = ""
-            explanation = ""
-
-            if "SQL:" in content and "解释:" in content:
-                parts = content.split("解释:")
-                sql_part = parts[0].strip()
-                sql = sql_part.replace("SQL:", "").strip()
-                explanation = parts[1].strip()
-            else:
-                # 尝试其他格式
-                lines = content.split("\n")
-                for line in lines:
-                    if line.startswith("SQL:"):
-                        sql = line.replace("SQL:", "").strip()
-                    elif line.startswith("解释:"):
-                        explanation = line.replace("解释:", "").strip()
+            parsed = parse_response(content)
+            if parsed is None:
+                print(f"无法从模型输出中提取SQL: {content[:200]}")
+                return {"sql": "", "explanation": "错误: 无法解析模型输出", "tables_used": [], "confidence": None}
 
             # 清理SQL中的Markdown代码块标记
-            sql = sql.replace("```sql", "").replace("```", "").strip()
-
-            return sql, explanation
+            parsed["sql"] = parsed["sql"].replace("```sql", "").replace("```", "").strip()
+            return parsed
 
+        except (LLMBusyError, RequestCancelled):
+            raise
         except Exception as e:
             print(f"调用DeepSeek API时出错: {str(e)}")
-            return "", f"错误: {str(e)}"
+            return {"sql": "", "explanation": f"错误: {str(e)}", "tables_used": [], "confidence": None}
 
 
-def get_table_info_from_db(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+def get_table_info_from_db(config: Dict[str, Any], pool=None,
+                           deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
     """
     从数据库获取表结构信息
 
     Args:
         config: 数据库配置
+        pool: 可选的MCP会话池，提供时复用池中的会话而不是启动新的MCP服务器
+        deadline: 使用会话池时请求的截止时间
 
     Returns:
         表结构信息列表
+
+    Raises:
+        RequestCancelled: 请求已被取消或超过截止时间
     """
 
     import asyncio
-    from mcp import ClientSession, StdioServerParameters
-    from mcp.client.stdio import stdio_client
 
-    async def get_tables_info():
+    async def collect_tables_info(session) -> List[Dict[str, Any]]:
         tables_info = []
 
-        # 设置环境变量
-        env = {
-            "MYSQL_HOST": config["host"],
-            "MYSQL_USER": config["user"],
-            "MYSQL_PASSWORD": config["password"],
-            "MYSQL_DATABASE": config["database"],
-            "MYSQL_PORT": str(config["port"]),
-        }
+        # 列出所有表
+        tables_result = await session.call_tool("list_tables", arguments={})
+        tables_text = ""
+        if hasattr(tables_result, 'content') and tables_result.content:
+            for item in tables_result.content:
+                if hasattr(item, 'text'):
+                    tables_text = item.text
+
+        tables_data = json.loads(tables_text)
+        table_names = []
+        for table_info in tables_data:
+            for key in table_info:
+                if key.startswith("Tables_in_"):
+                    table_names.append(table_info[key])
+
+        # 获取每个表的结构
+        for table_name in table_names:
+            describe_args = {"table": table_name}
+            describe_result = await session.call_tool("describe_table", arguments=describe_args)
+            describe_text = ""
+            if hasattr(describe_result, 'content') and describe_result.content:
+                for item in describe_result.content:
+                    if hasattr(item, 'text'):
+                        describe_text = item.text
+
+            columns_data = json.loads(describe_text)
+            columns = []
+            for column_info in columns_data:
+                column = {
+                    "name": column_info["Field"],
+                    "type": column_info["Type"],
+                    "description": f"{'主键' if column_info['Key'] == 'PRI' else ''} {'可为空' if column_info['Null'] == 'YES' else '不可为空'}",
+                    "key": column_info["Key"]
+                }
+                columns.append(column)
+
+            table_info = {
+                "name": table_name,
+                "columns": columns
+            }
+            tables_info.append(table_info)
+
+        return tables_info
+
+    if pool is None and config.get("db_backend", "mcp") == "native":
+        # 进程内MySQL后端：使用临时连接，不启动MCP服务器
+        from session_pool import create_session_pool
+        pool = create_session_pool(config, size=1, name="schema")
+        try:
+            return get_table_info_from_db(config, pool=pool, deadline=deadline)
+        finally:
+            pool.close()
+
+    if pool is not None:
+        try:
+            return pool.run(collect_tables_info, deadline=deadline)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            print(f"获取表结构信息时出错: {str(e)}")
+            return []
+
+    from mcp import ClientSession
+    from mcp.client.stdio import stdio_client
+    from session_pool import build_server_params, connect_arguments
 
-        # 创建服务器参数
-        server_params = StdioServerParameters(
-            command="node",
-            args=["build/index.js"],
-            env=env,
-        )
+    async def get_tables_info():
+        tables_info = []
 
         try:
-            async with stdio_client(server_params) as (read, write):
+            async with stdio_client(build_server_params(config)) as (read, write):
                 async with ClientSession(read, write) as session:
                     await session.initialize()
 
                     # 连接到数据库
-                    connect_args = {
-                        "host": config["host"],
-                        "user": config["user"],
-                        "password": config["password"],
-                        "database": config["database"],
-                        "port": config["port"]
-                    }
-
-                    await session.call_tool("connect_db", arguments=connect_args)
-
-                    # 列出所有表
-                    tables_result = await session.call_tool("list_tables", arguments={})
-                    tables_text = ""
-                    if hasattr(tables_result, 'content') and tables_result.content:
-                        for item in tables_result.content:
-                            if hasattr(item, 'text'):
-                                tables_text = item.text
-
-                    tables_data = json.loads(tables_text)
-                    table_names = []
-                    for table_info in tables_data:
-                        for key in table_info:
-                            if key.startswith("Tables_in_"):
-                                table_names.append(table_info[key])
-
-                    # 获取每个表的结构
-                    for table_name in table_names:
-                        describe_args = {"table": table_name}
-                        describe_result = await session.call_tool("describe_table", arguments=describe_args)
-                        describe_text = ""
-                        if hasattr(describe_result, 'content') and describe_result.content:
-                            for item in describe_result.content:
-                                if hasattr(item, 'text'):
-                                    describe_text = item.text
-
-                        columns_data = json.loads(describe_text)
-                        columns = []
-                        for column_info in columns_data:
-                            column = {
-                                "name": column_info["Field"],
-                                "type": column_info["Type"],
-                                "description": f"{'主键' if column_info['Key'] == 'PRI' else ''} {'可为空' if column_info['Null'] == 'YES' else '不可为空'}"
-                            }
-                            columns.append(column)
-
-                        table_info = {
-                            "name": table_name,
-                            "columns": columns
-                        }
-                        tables_info.append(table_info)
+                    await session.call_tool("connect_db", arguments=connect_arguments(config))
+
+                    tables_info = await collect_tables_info(session)
 
         except Exception as e:
             print(f"获取表结构信息时出错: {str(e)}")
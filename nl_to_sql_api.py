@@ -6,13 +6,31 @@
 提供HTTP API接口，允许其他程序调用自然语言转SQL功能
 """
 
+import hmac
+import itertools
 import json
 import os
 import sys
-from typing import Dict, Any, List, Optional
-from flask import Flask, request, jsonify, send_from_directory
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-from nl_to_sql import DeepSeekNLtoSQL, get_table_info_from_db
+from cache import create_cache, shared_store_path
+from deadline import Deadline, RequestCancelled, disconnect_watcher
+from fast_json import RawJSON, dumps, encode_response, loads, raw_result
+from index_advisor import IndexAdvisor
+from job_queue import JobQueue, QueueFullError, FINISHED_STATES
+from llm_limiter import LLMBusyError, get_llm_limiter
+from profiler import get_request_profiler, get_sampling_profiler, parse_modes
+from query_history import get_query_history
+from result_export import (CONTENT_TYPES, EXPORT_FORMATS, PARQUET_AVAILABLE, ExportStats,
+                           export_to_file, iter_export)
+from shared_store import get_shared_store
+from sql_utils import is_select
+from sql_validator import read_only_errors, validate_sql
+from structured_output import parse_stats
+from tenants import Tenant, TenantRegistry, TenantBusyError, DEFAULT_TENANT
 
 app = Flask(__name__, static_folder='static')
 CORS(app)  # 启用CORS支持
@@ -20,11 +38,27 @@ CORS(app)  # 启用CORS支持
 # 全局配置
 CONFIG_FILE = "config.json"
 config = None
+registry = None
+job_queue = None
+# 保护注册表的首次创建，避免并发的首批请求各自创建租户（无法共享缓存和合并的调用）
+_registry_lock = threading.Lock()
+
+# 共享存储模式下的配置版本，以及检查配置更新的间隔（秒）
+config_version = 0
+CONFIG_SYNC_INTERVAL = 1.0
+_last_config_sync = 0.0
+
+# 启动预热状态，供 /readyz 使用
+readiness = {
+    "mcp_sessions": False,
+    "schema_cache": False,
+    "error": None
+}
 
 
 def load_config(config_file=CONFIG_FILE):
     """加载配置"""
-    global config
+    global config, config_version
     try:
         with open(config_file, 'r', encoding='utf-8') as f:
             config = json.load(f)
@@ -39,162 +73,816 @@ def load_config(config_file=CONFIG_FILE):
             "port": 3306,
             "deepseek_api_key": ""
         }
+
+    # 共享存储模式下以共享配置为准，第一个启动的进程负责写入初始配置
+    path = shared_store_path(config)
+    if path:
+        store = get_shared_store(path)
+        shared_config, config_version = store.get_config()
+        if shared_config is None:
+            config_version = store.set_config(config)
+        else:
+            config = shared_config
+        print(f"使用共享存储 {path} (配置版本 {config_version})")
     return config
 
 
-@app.route('/api/nl2sql', methods=['POST'])
-def nl_to_sql():
+def warmup(max_backoff: float = 30):
     """
-    自然语言转SQL API
-
-    请求格式:
-    {
-        "query": "自然语言查询",
-        "get_schema": true/false,  # 是否获取数据库表结构
-        "execute": true/false      # 是否执行生成的SQL
-    }
+    预热默认租户：创建MCP会话并加载表结构缓存
 
-    响应格式:
-    {
-        "success": true/false,
-        "sql": "生成的SQL",
-        "explanation": "SQL解释",
-        "schema": [...],           # 如果get_schema为true
-        "results": [...]           # 如果execute为true
-    }
+    失败时按指数退避重试，直到成功
     """
-    global config
+    backoff = 1.0
+    while True:
+        try:
+            tenant = get_registry().get()
+            tenant.pool.warm(tenant.config.get("pool_min_size", 1))
+            readiness["mcp_sessions"] = True
+            tenant.get_schema()
+            readiness["schema_cache"] = True
+            readiness["error"] = None
+            print("预热完成，服务已就绪")
+            return
+        except Exception as e:
+            readiness["error"] = str(e)
+            print(f"预热失败，{backoff:.0f}秒后重试: {str(e)}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+
+def start_warmup():
+    """在后台线程中预热，不阻塞服务器启动"""
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+@app.before_request
+def sync_shared_config():
+    """共享存储模式下定期检查其他工作进程是否更新了配置"""
+    global config, config_version, _last_config_sync
 
-    # 确保配置已加载
     if config is None:
         config = load_config()
 
-    # 获取请求数据
-    data = request.json
-    if not data or 'query' not in data:
+    path = shared_store_path(config)
+    if not path or time.time() - _last_config_sync < CONFIG_SYNC_INTERVAL:
+        return
+    _last_config_sync = time.time()
+
+    store = get_shared_store(path)
+    if store.config_version() == config_version:
+        return
+    shared_config, config_version = store.get_config()
+    config.clear()
+    config.update(shared_config)
+    if registry is not None:
+        registry.update_defaults(config)
+    print(f"已同步共享配置 (版本 {config_version})")
+
+
+def get_registry() -> TenantRegistry:
+    """获取租户注册表（首次调用时创建）"""
+    global config, registry
+
+    with _registry_lock:
+        # 确保配置已加载
+        if config is None:
+            config = load_config()
+
+        if registry is None:
+            registry = TenantRegistry(config, config.get("profiles_dir", "profiles"))
+        return registry
+
+
+def admin_error() -> Optional[Tuple[Response, int]]:
+    """
+    管理接口的访问控制
+
+    配置了 admin_token（或环境变量 NL2SQL_ADMIN_TOKEN）时要求 X-Admin-Token 请求头与之相同；
+    没有配置时只允许本机直接访问（经过反向代理转发、带有 X-Forwarded-For 的请求不算本机）
+
+    Returns:
+        拒绝访问时的 (响应, HTTP状态码)，允许访问时返回 None
+    """
+    token = (config or {}).get("admin_token") or os.environ.get("NL2SQL_ADMIN_TOKEN")
+    if token:
+        supplied = request.headers.get("X-Admin-Token", "")
+        if hmac.compare_digest(supplied.encode("utf-8"), str(token).encode("utf-8")):
+            return None
         return jsonify({
             "success": False,
-            "error": "缺少必要参数: query"
-        }), 400
+            "error": "管理接口需要有效的 X-Admin-Token"
+        }), 401
+    if request.remote_addr in ("127.0.0.1", "::1") and "X-Forwarded-For" not in request.headers:
+        return None
+    return jsonify({
+        "success": False,
+        "error": "未配置 admin_token，管理接口只允许本机访问"
+    }), 403
+
+
+def resolve_tenant(data: Optional[Dict[str, Any]] = None) -> Tenant:
+    """
+    根据请求确定目标租户
+
+    优先使用 X-Tenant 请求头，其次是请求体或查询参数中的 tenant
+
+    Raises:
+        KeyError: 租户不存在
+    """
+    name = request.headers.get("X-Tenant") or (data or {}).get("tenant") or request.args.get("tenant")
+    return get_registry().get(name)
+
+
+def request_deadline(tenant: Tenant, data: Dict[str, Any]) -> Deadline:
+    """
+    请求的截止时间：请求中的 timeout 不能超过租户配置的 request_timeout
+
+    Raises:
+        ValueError: timeout 不是数字
+    """
+    timeout = tenant.config.get("request_timeout", 120) or None
+    if data.get("timeout"):
+        requested = float(data["timeout"])
+        timeout = min(requested, timeout) if timeout else requested
+    return Deadline(timeout)
+
+
+def record_history(tenant: Tenant, entry: Dict[str, Any]):
+    """写入查询历史（未配置 history_db 时忽略，出错不影响请求）"""
+    try:
+        history = get_query_history(config or {})
+        if history is not None:
+            history.record(dict(entry, tenant=tenant.name))
+    except Exception as e:
+        print(f"记录查询历史时出错: {str(e)}")
+
+
+def _finish_history(tenant: Tenant, entry: Dict[str, Any], response: Dict[str, Any], status: int,
+                    started: float):
+    """根据响应补全历史记录的状态和行数后写入"""
+    if "status" not in entry:
+        if status == 504:
+            entry["status"] = "timeout"
+        elif status == 499:
+            entry["status"] = "cancelled"
+        elif status != 200:
+            entry["status"] = "error"
+        elif response.get("validation_errors"):
+            entry["status"] = "invalid"
+        elif response.get("execute_error"):
+            entry["status"] = "error"
+        else:
+            entry["status"] = "ok"
+    entry.setdefault("error", response.get("error") or response.get("execute_error"))
+    results = response.get("results")
+    if isinstance(results, RawJSON):
+        if results.text.startswith("{"):
+            # 写操作的执行结果很短，解析后取影响的行数
+            results = loads(results.text)
+        else:
+            # 查询结果的行数由查询历史的写入线程计算，请求线程不解析结果文本
+            entry["rows"] = results
+    if isinstance(results, list):
+        entry["rows"] = len(results)
+    elif isinstance(results, dict):
+        entry["rows"] = results.get("affectedRows")
+    entry["total_ms"] = (time.perf_counter() - started) * 1000
+    record_history(tenant, entry)
+
+
+def _history_rows(rows: Iterator[Dict[str, Any]], tenant: Tenant, entry: Dict[str, Any],
+                  started: float) -> Iterator[Dict[str, Any]]:
+    """流式输出的行迭代器，输出结束（或中断）后记录行数和耗时"""
+    count = 0
+    exec_started = time.perf_counter()
+    entry["status"] = "cancelled"
+    try:
+        for row in rows:
+            count += 1
+            yield row
+        entry["status"] = "ok"
+    except TimeoutError as e:
+        entry.update(status="timeout", error=str(e))
+        raise
+    except Exception as e:
+        entry.update(status="error", error=str(e))
+        raise
+    finally:
+        entry["rows"] = count
+        entry["exec_ms"] = (time.perf_counter() - exec_started) * 1000
+        entry["total_ms"] = (time.perf_counter() - started) * 1000
+        record_history(tenant, entry)
+
+
+def process_nl2sql(tenant: Tenant, data: Dict[str, Any], stream: bool = False,
+                   deadline: Optional[Deadline] = None, source: str = "api",
+                   passthrough: bool = False,
+                   statement_timeout: Optional[float] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    处理一次自然语言转SQL请求，并写入查询历史
+
+    Args:
+        tenant: 目标租户
+        data: 请求数据
+        stream: 分页执行时 results 是否返回行迭代器（由调用方流式输出）
+        deadline: 请求的截止时间，覆盖获取表结构、模型调用和SQL执行，为空时按配置创建
+        source: 查询历史中记录的来源（api/job）
+        passthrough: results 是否直接使用工具返回的JSON文本（RawJSON，由调用方用 encode_response 编码），
+                     不解析为Python对象
+        statement_timeout: 执行生成的SQL的时间限制（秒，0表示只受 deadline 限制），为空时使用租户的 statement_timeout
+
+    Returns:
+        (响应数据, HTTP状态码)
+    """
+    started = time.perf_counter()
+    entry = {"source": source, "question": data.get("query")}
+    response, status = _process_nl2sql(tenant, data, stream, deadline, entry, passthrough, statement_timeout)
+    if isinstance(response.get("results"), Iterator):
+        # 流式输出结束后再记录行数和执行耗时
+        response["results"] = _history_rows(response["results"], tenant, entry, started)
+    else:
+        _finish_history(tenant, entry, response, status, started)
+    return response, status
+
+
+def _process_nl2sql(tenant: Tenant, data: Dict[str, Any], stream: bool, deadline: Optional[Deadline],
+                    entry: Dict[str, Any], passthrough: bool = False,
+                    statement_timeout: Optional[float] = None) -> Tuple[Dict[str, Any], int]:
+    """处理请求，各阶段耗时和缓存命中情况写入 entry"""
+    if deadline is None:
+        try:
+            deadline = request_deadline(tenant, data)
+        except (TypeError, ValueError):
+            return {
+                "success": False,
+                "error": "timeout 必须是数字"
+            }, 400
 
     natural_language = data['query']
     get_schema = data.get('get_schema', False)
     execute_sql = data.get('execute', False)
+    paginate = data.get('paginate', False)
+    read_primary = data.get('read_primary', False)
 
     # 设置API密钥
-    api_key = config.get('deepseek_api_key', '') or os.environ.get("DEEPSEEK_API_KEY")
+    api_key = tenant.config.get('deepseek_api_key', '') or os.environ.get("DEEPSEEK_API_KEY")
     if not api_key:
-        return jsonify({
+        return {
             "success": False,
             "error": "未设置DeepSeek API密钥"
-        }), 400
+        }, 400
 
-    # 获取表结构信息
-    table_info = []
-    if get_schema:
-        try:
-            table_info = get_table_info_from_db(config)
-        except Exception as e:
-            print(f"获取表结构信息时出错: {str(e)}")
-
-    # 转换为SQL
     try:
-        converter = DeepSeekNLtoSQL(api_key)
-        sql, explanation = converter.convert_to_sql(natural_language, table_info)
+        # 获取表结构信息
+        table_info = []
+        if get_schema:
+            stage_started = time.perf_counter()
+            try:
+                table_info = tenant.get_schema(deadline=deadline)
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                print(f"获取表结构信息时出错: {str(e)}")
+            entry["schema_ms"] = (time.perf_counter() - stage_started) * 1000
+
+        # 热门问题直接返回预计算的结果，不调用模型也不访问数据库
+        if execute_sql and not paginate and data.get("materialized", True) and tenant.materialized is not None:
+            answer = tenant.materialized.lookup(natural_language)
+            if answer is not None:
+                entry.update(llm_cache="materialized", result_cache="materialized", sql=answer.sql,
+                             tables=answer.tables)
+                response = answer.response()
+                if get_schema:
+                    response["schema"] = table_info
+                return response, 200
+
+        # 转换为SQL
+        stage_started = time.perf_counter()
+        translation = tenant.translate(natural_language, table_info, api_key, deadline=deadline)
+        sql = translation["sql"]
+        entry.update(llm_ms=(time.perf_counter() - stage_started) * 1000, llm_cache=translation["cache"],
+                     sql=sql, tables=translation["tables_used"])
 
         response = {
             "success": True,
             "sql": sql,
-            "explanation": explanation
+            "explanation": translation["explanation"],
+            "tables_used": translation["tables_used"],
+            "confidence": translation["confidence"]
         }
 
+        # 未通过本地校验的SQL不执行
+        if translation["validation_errors"]:
+            response["validation_errors"] = translation["validation_errors"]
+            if execute_sql:
+                response["execute_error"] = "SQL未通过校验，未执行"
+            execute_sql = False
+
         # 添加表结构信息
         if get_schema:
             response["schema"] = table_info
 
+        # 执行前做等价改写（日期函数条件改为范围条件、相关子查询去相关等），执行计划没有改善时保留原SQL
+        if execute_sql and sql and data.get("rewrite", True):
+            rewrite = tenant.rewrite_sql(sql, table_info, deadline=deadline)
+            if rewrite["rewrites"] or rewrite["notes"]:
+                response["rewrite"] = {key: rewrite[key] for key in
+                                       ("original_sql", "rewrites", "notes", "plan", "applied")}
+            if rewrite["applied"]:
+                sql = rewrite["sql"]
+                response["sql"] = sql
+                entry["sql"] = sql
+
+        # 执行前按表统计信息检查是否会扫描大表，guardrail 为 block 时不执行（allow_full_scan 可以跳过）
+        if execute_sql and sql:
+            warnings = tenant.check_scan(sql, deadline=deadline)
+            if warnings:
+                response["guardrail"] = warnings
+                if tenant.config.get("guardrail", "warn") == "block" and not data.get("allow_full_scan", False):
+                    response["execute_error"] = "SQL可能扫描大表，未执行: " + "; ".join(warnings)
+                    entry["status"] = "blocked"
+                    execute_sql = False
+
+        # 按主键分页执行SELECT
+        if execute_sql and sql and paginate and is_select(sql):
+            plan = tenant.keyset_plan(sql)
+            if plan is not None:
+                page_size = int(data.get("page_size", tenant.config.get("page_size", 1000)))
+                response["pagination"] = plan.describe(page_size)
+                route: Dict[str, Any] = {}
+                rows = tenant.iter_keyset(plan, page_size, timeout=statement_timeout, deadline=deadline,
+                                          primary=read_primary, info=route)
+                if "routing" in route:
+                    response["routing"] = route["routing"]
+                if stream:
+                    response["results"] = rows
+                else:
+                    stage_started = time.perf_counter()
+                    response["results"] = list(rows)
+                    entry["exec_ms"] = (time.perf_counter() - stage_started) * 1000
+                return response, 200
+            response["pagination"] = {"mode": "none"}
+
         # 执行SQL
         if execute_sql and sql:
+            stage_started = time.perf_counter()
+            info: Dict[str, Any] = {}
             try:
-                # 直接使用MCP客户端执行SQL
-                import asyncio
-                from mcp import ClientSession, StdioServerParameters
-                from mcp.client.stdio import stdio_client
-
-                # 定义异步函数执行SQL
-                async def execute_sql_with_mcp():
-                    # 设置环境变量
-                    env = {
-                        "MYSQL_HOST": config["host"],
-                        "MYSQL_USER": config["user"],
-                        "MYSQL_PASSWORD": config["password"],
-                        "MYSQL_DATABASE": config["database"],
-                        "MYSQL_PORT": str(config["port"]),
-                    }
-
-                    # 创建服务器参数
-                    server_params = StdioServerParameters(
-                        command="node",
-                        args=["build/index.js"],
-                        env=env,
-                    )
-
-                    # 连接到MCP服务器
-                    async with stdio_client(server_params) as (read, write):
-                        async with ClientSession(read, write) as session:
-                            # 初始化会话
-                            await session.initialize()
-
-                            # 连接到数据库
-                            connect_args = {
-                                "host": config["host"],
-                                "user": config["user"],
-                                "password": config["password"],
-                                "database": config["database"],
-                                "port": config["port"]
-                            }
-
-                            await session.call_tool("connect_db", arguments=connect_args)
-
-                            # 根据SQLl类型选择工具
-                            if sql.strip().upper().startswith("SELECT"):
-                                tool_name = "query"
-                            else:
-                                tool_name = "execute"
-
-                            # 执行SQL
-                            sql_args = {
-                                "sql": sql,
-                                "params": []
-                            }
-
-                            result = await session.call_tool(tool_name, arguments=sql_args)
-
-                            # 提取结果
-                            if hasattr(result, 'content') and result.content:
-                                for item in result.content:
-                                    if hasattr(item, 'text'):
-                                        return item.text
-
-                            return None
-
-                # 执行异步函数
-                result_text = asyncio.run(execute_sql_with_mcp())
+                result_text = tenant.execute_sql(sql, timeout=statement_timeout, tables=translation["tables_used"],
+                                                 deadline=deadline, info=info, primary=read_primary)
 
                 # 处理结果
                 if result_text:
-                    try:
-                        results = json.loads(result_text)
-                        response["results"] = results
-                    except json.JSONDecodeError:
-                        response["results"] = result_text
+                    if passthrough:
+                        # 结果不需要处理，响应中直接嵌入工具返回的JSON文本
+                        results = raw_result(result_text)
+                        parsed = isinstance(results, RawJSON)
+                    else:
+                        try:
+                            results = loads(result_text)
+                            parsed = True
+                        except json.JSONDecodeError:
+                            results = result_text
+                            parsed = False
+                    response["results"] = results
+                    # 执行成功的查询作为以后的few-shot示例
+                    if parsed and is_select(sql):
+                        tenant.record_example(natural_language, sql)
                 else:
                     response["execute_error"] = "执行SQL未返回结果"
 
             except Exception as e:
+                # 客户端已断开时不再继续；执行超时时仍然返回生成的SQL
+                if deadline.cancelled:
+                    raise
                 response["execute_error"] = str(e)
+                if isinstance(e, TimeoutError):
+                    entry["status"] = "timeout"
+            finally:
+                entry["exec_ms"] = (time.perf_counter() - stage_started) * 1000
+                entry["result_cache"] = info.get("result_cache")
+                if "routing" in info:
+                    response["routing"] = info["routing"]
 
-        return jsonify(response)
+        return response, 200
 
+    except LLMBusyError as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }, 429
+    except TimeoutError as e:
+        return {
+            "success": False,
+            "error": str(e) or "请求超时"
+        }, 504
+    except RequestCancelled as e:
+        # 客户端已断开，响应不会被读取
+        return {
+            "success": False,
+            "error": str(e)
+        }, 499
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }, 500
+
+
+@app.route('/api/nl2sql', methods=['POST'])
+def nl_to_sql():
+    """
+    自然语言转SQL API
+
+    请求格式:
+    {
+        "query": "自然语言查询",
+        "tenant": "租户名称",      # 可选，也可以通过 X-Tenant 请求头指定
+        "get_schema": true/false,  # 是否获取数据库表结构
+        "execute": true/false,     # 是否执行生成的SQL
+        "paginate": true/false,    # 是否按主键分页执行SELECT并流式返回结果
+        "page_size": 1000,         # 分页执行时每页行数
+        "timeout": 30,             # 可选，请求的截止时间（秒），不超过配置的 request_timeout
+        "read_primary": true/false,# 配置了只读副本时，是否要求SELECT在主库上执行，默认为false
+        "materialized": true/false # 是否允许返回热门问题的预计算结果，默认为true
+    }
+
+    请求头 X-Profile: cpu/memory/all 对这个请求采集 cProfile/tracemalloc（需要开启 request_profiling
+    并通过管理接口的访问控制），摘要在响应的 profile 中返回
+
+    响应格式:
+    {
+        "success": true/false,
+        "sql": "生成的SQL",
+        "explanation": "SQL解释",
+        "tables_used": [...],      # SQL用到的表
+        "confidence": 0.9,         # 模型给出的置信度（JSON模式）
+        "schema": [...],           # 如果get_schema为true
+        "pagination": {...},       # 如果paginate为true
+        "results": [...],          # 如果execute为true
+        "routing": {...},          # 配置了只读副本时执行SELECT的库: endpoint、reason、lag
+        "materialized": {...},     # 结果来自预计算时: refreshed_at、age（秒）
+        "profile": {...}           # 请求头 X-Profile 要求采集时
+    }
+    """
+    # 获取请求数据
+    data = request.json
+    if not data or 'query' not in data:
+        return jsonify({
+            "success": False,
+            "error": "缺少必要参数: query"
+        }), 400
+
+    try:
+        tenant = resolve_tenant(data)
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+
+    try:
+        deadline = request_deadline(tenant, data)
+    except (TypeError, ValueError):
+        return jsonify({
+            "success": False,
+            "error": "timeout 必须是数字"
+        }), 400
+
+    # 按请求头采集这个请求；未开启或无权采集时照常处理，在响应中说明原因
+    profile_modes = set()
+    profile_error = None
+    if request.headers.get("X-Profile"):
+        try:
+            profile_modes = parse_modes(request.headers["X-Profile"])
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        if not get_request_profiler(config).enabled:
+            profile_error = "未开启请求采集（request_profiling）"
+        elif admin_error() is not None:
+            profile_error = "采集请求需要管理接口的访问权限"
+        if profile_error:
+            profile_modes = set()
+
+    slot = tenant.slot(timeout=deadline.timeout(tenant.config.get("tenant_queue_timeout", 30)))
+    try:
+        slot.__enter__()
+    except TenantBusyError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
+
+    # 客户端断开时取消请求：停止等待模型调用，终止正在执行的SQL
+    unwatch = disconnect_watcher.watch(request.environ.get("werkzeug.socket"), deadline)
+
+    def finish():
+        unwatch()
+        slot.__exit__(None, None, None)
+
+    try:
+        with get_request_profiler(config).capture(profile_modes) as profile:
+            response, status = process_nl2sql(tenant, data, stream=True, deadline=deadline, passthrough=True)
+    except BaseException:
+        finish()
+        raise
+    if profile is not None or profile_error:
+        response["profile"] = profile if profile is not None else {"error": profile_error}
+
+    # 分页执行时边查询边输出，输出结束后再释放并发名额
+    if isinstance(response.get("results"), Iterator):
+        return Response(stream_json_rows(response, on_close=finish, deadline=deadline),
+                        mimetype="application/json")
+
+    finish()
+    return Response(encode_response(response), status=status, mimetype="application/json")
+
+
+def stream_json_rows(response: Dict[str, Any], on_close=None,
+                     deadline: Optional[Deadline] = None) -> Iterator[str]:
+    """
+    流式输出响应JSON，response["results"] 为行迭代器
+
+    查询中途出错时结果数组提前结束，并在响应末尾附加 execute_error；
+    输出中途被关闭（客户端断开）时取消 deadline，终止正在执行的分页查询
+    """
+    rows = response.pop("results")
+    completed = False
+    try:
+        head = dumps(response)
+        yield head[:-1] + ', "results": ['
+        error = None
+        try:
+            for index, row in enumerate(rows):
+                yield ("," if index else "") + dumps(row)
+        except Exception as e:
+            error = str(e)
+        if error:
+            yield "], " + json.dumps("execute_error") + ": " + json.dumps(error, ensure_ascii=False) + "}"
+        else:
+            yield "]}"
+        completed = True
+    finally:
+        if not completed and deadline is not None:
+            deadline.cancel()
+        if on_close is not None:
+            on_close()
+
+
+def get_job_queue() -> JobQueue:
+    """获取任务队列（首次调用时创建）"""
+    global job_queue
+    if job_queue is None:
+        get_registry()
+        result_ttl = config.get("job_result_ttl", 600)
+        job_queue = JobQueue(
+            run_job,
+            workers=config.get("job_workers", 4),
+            max_pending=config.get("job_queue_size", 100),
+            max_pending_per_client=config.get("job_client_limit", 20),
+            result_ttl=result_ttl,
+            # 多进程部署时任务状态写入共享存储，任何工作进程都能查询
+            store=create_cache(config, "jobs", ttl=result_ttl,
+                               max_entries=config.get("job_queue_size", 100) * 10)
+            if shared_store_path(config) else None,
+            # 任务用于长时间运行的报表，不受 request_timeout 限制
+            timeout=config.get("job_timeout", 3600)
+        )
+    return job_queue
+
+
+def run_job(job) -> Tuple[Dict[str, Any], int]:
+    """在任务队列的工作线程中执行自然语言查询"""
+    try:
+        tenant = get_registry().get(job.payload.get("tenant"))
+    except KeyError as e:
+        return {
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }, 404
+
+    # 任务已经排过队，等待租户并发名额的时间只受任务的截止时间限制；
+    # 每条语句的执行时间使用 job_statement_timeout 而不是 statement_timeout
+    try:
+        with tenant.slot(timeout=job.deadline.timeout()):
+            return process_nl2sql(tenant, job.payload, deadline=job.deadline, source="job",
+                                  statement_timeout=tenant.config.get("job_statement_timeout", 0))
+    except TenantBusyError as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }, 429
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    以异步任务方式提交自然语言查询
+
+    请求格式与 /api/nl2sql 相同，另外支持:
+    {
+        "priority": 0               # 优先级，数值越大越先执行
+    }
+
+    客户端通过 X-Client-Id 请求头标识（默认使用客户端IP），同一优先级内各客户端轮流执行
+
+    响应格式（202）:
+    {
+        "success": true,
+        "job_id": "任务ID",
+        "status": "queued",
+        "status_url": "/api/jobs/<job_id>",
+        "events_url": "/api/jobs/<job_id>/events"
+    }
+    """
+    data = request.json
+    if not data or 'query' not in data:
+        return jsonify({
+            "success": False,
+            "error": "缺少必要参数: query"
+        }), 400
+
+    # 提交时检查租户，避免排队后才发现租户不存在
+    try:
+        tenant = resolve_tenant(data)
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+
+    payload = dict(data, tenant=tenant.name)
+    client_id = request.headers.get("X-Client-Id") or request.remote_addr or "anonymous"
+    try:
+        priority = int(data.get("priority", 0))
+        job = get_job_queue().submit(payload, client_id, priority)
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "priority 必须是整数"
+        }), 400
+    except QueueFullError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
+
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events"
+    }), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+def manage_job(job_id):
+    """
+    查询或取消任务
+
+    GET: 返回任务状态，完成后包含 result（与 /api/nl2sql 的响应相同）
+    DELETE: 取消排队中或执行中的任务（执行中的任务终止正在执行的语句）
+    """
+    queue = get_job_queue()
+    if request.method == 'DELETE':
+        if queue.cancel(job_id):
+            return jsonify({
+                "success": True,
+                "message": "任务已取消"
+            })
+        return jsonify({
+            "success": False,
+            "error": "任务不存在、已结束或不在当前工作进程中执行"
+        }), 409
+
+    snapshot = queue.get(job_id)
+    if snapshot is None:
+        return jsonify({
+            "success": False,
+            "error": "任务不存在或已过期"
+        }), 404
+    return jsonify(dict(snapshot, success=True))
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """以SSE推送任务状态变化，任务结束后关闭连接"""
+    queue = get_job_queue()
+    snapshot = queue.get(job_id)
+    if snapshot is None:
+        return jsonify({
+            "success": False,
+            "error": "任务不存在或已过期"
+        }), 404
+
+    def generate(snapshot):
+        last_status = None
+        while snapshot is not None:
+            if snapshot["status"] != last_status:
+                last_status = snapshot["status"]
+                yield f"event: status\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+                if last_status in FINISHED_STATES:
+                    return
+            else:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+            snapshot = queue.wait_for_change(job_id, last_status, timeout=15)
+
+    return Response(generate(snapshot), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/api/bulk', methods=['POST'])
+def bulk_write():
+    """
+    批量写入
+
+    相邻的同表INSERT会合并为多行INSERT，然后按批次在同一个会话上以事务方式执行
+
+    请求格式（statements 与 table/columns/rows 二选一）:
+    {
+        "statements": ["INSERT ...", "UPDATE ...", ...],
+        "table": "表名",
+        "columns": ["列1", "列2"],
+        "rows": [[值1, 值2], ...],
+        "tenant": "租户名称",       # 可选
+        "batch_size": 100,          # 每个事务包含的语句数（合并之后）
+        "max_rows_per_insert": 500, # 每条多行INSERT最多包含的行数
+        "stop_on_error": false,     # 某个批次失败后是否停止
+        "timeout": 60               # 可选，超时时间（秒），不超过 bulk_timeout
+    }
+
+    响应格式:
+    {
+        "success": true/false,      # 所有批次都成功时为 true
+        "statements_out": 0,        # 合并后实际执行的语句数
+        "batches": 0,
+        "committed_batches": 0,
+        "failed_batches": [{"batch": 0, "statements": 0, "error": "..."}],
+        "rows_affected": 0,
+        "seconds": 0,
+        "rows_per_sec": 0
+    }
+    """
+    data = request.json or {}
+    statements = data.get("statements")
+    has_rows = data.get("table") and data.get("columns") and data.get("rows") is not None
+    if not statements and not has_rows:
+        return jsonify({
+            "success": False,
+            "error": "缺少必要参数: statements 或 table/columns/rows"
+        }), 400
+    if statements and any(is_select(sql) for sql in statements):
+        return jsonify({
+            "success": False,
+            "error": "批量写入不能包含SELECT语句"
+        }), 400
+
+    try:
+        tenant = resolve_tenant(data)
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+
+    try:
+        deadline = Deadline(float(data["timeout"])) if data.get("timeout") else None
+        with tenant.slot(timeout=tenant.config.get("tenant_queue_timeout", 30)):
+            report = tenant.bulk_write(
+                statements=statements,
+                table=data.get("table"),
+                columns=data.get("columns"),
+                rows=data.get("rows"),
+                deadline=deadline,
+                batch_size=data.get("batch_size"),
+                max_rows_per_insert=data.get("max_rows_per_insert"),
+                stop_on_error=data.get("stop_on_error", False)
+            )
+        return jsonify(report)
+    except TenantBusyError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
+    except TimeoutError as e:
+        # 正在执行的批次已回滚，之前的批次已经提交
+        return jsonify({
+            "success": False,
+            "error": f"批量写入超时，未完成的批次已回滚: {str(e)}"
+        }), 504
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -202,29 +890,258 @@ def nl_to_sql():
         }), 500
 
 
+@app.route('/api/export', methods=['POST'])
+def export_results():
+    """
+    将查询结果分块导出为CSV或Parquet
+
+    请求格式:
+    {
+        "query": "自然语言查询",     # 与 sql 二选一
+        "sql": "SELECT ...",        # 直接指定SELECT语句
+        "tenant": "租户名称",        # 可选
+        "format": "csv/parquet",    # 默认 csv
+        "destination": "download/file",  # 默认 download，file 时写入服务器的 export_dir 目录
+        "file_name": "文件名",       # destination 为 file 时可选
+        "chunk_rows": 10000,        # 每块行数，Parquet 中每块为一个行组
+        "paginate": true,           # 默认按主键分页查询，避免一次取回整个结果
+        "page_size": 1000           # 分页查询每页行数
+    }
+
+    响应:
+        download: 流式返回文件内容
+        file: {"success": true, "path": "...", "rows": 0, "bytes": 0, "seconds": 0, "rows_per_sec": 0}
+    """
+    data = request.json
+    if not data or not (data.get('query') or data.get('sql')):
+        return jsonify({
+            "success": False,
+            "error": "缺少必要参数: query 或 sql"
+        }), 400
+
+    export_format = data.get("format", "csv")
+    destination = data.get("destination", "download")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            "success": False,
+            "error": f"不支持的导出格式: {export_format}"
+        }), 400
+    if export_format == "parquet" and not PARQUET_AVAILABLE:
+        return jsonify({
+            "success": False,
+            "error": "导出Parquet需要安装 pyarrow"
+        }), 400
+
+    try:
+        tenant = resolve_tenant(data)
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+
+    slot = tenant.slot(timeout=tenant.config.get("tenant_queue_timeout", 30))
+    try:
+        slot.__enter__()
+    except TenantBusyError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
+
+    try:
+        sql = data.get("sql")
+        if sql:
+            # 直接指定的SQL与生成的SQL一样经过本地校验
+            validation = validate_sql(sql, tenant.get_schema())
+            if validation.errors:
+                raise ValueError(f"SQL未通过校验: {'; '.join(validation.errors)}")
+            sql = validation.sql
+        else:
+            api_key = tenant.config.get('deepseek_api_key', '') or os.environ.get("DEEPSEEK_API_KEY")
+            if not api_key:
+                raise ValueError("未设置DeepSeek API密钥")
+            translation = tenant.translate(data["query"], tenant.get_schema(), api_key)
+            if translation["validation_errors"]:
+                raise ValueError(f"生成的SQL未通过校验: {'; '.join(translation['validation_errors'])}")
+            sql = translation["sql"]
+        if not is_select(sql):
+            raise ValueError("只能导出SELECT查询的结果")
+        errors = read_only_errors(sql)
+        if errors:
+            raise ValueError("; ".join(errors))
+
+        chunk_rows = int(data.get("chunk_rows", tenant.config.get("export_chunk_rows", 10000)))
+        # 导出不限总时长（每条语句仍受 statement_timeout 限制），下载中断时取消正在执行的查询
+        deadline = Deadline()
+        rows = tenant.iter_rows(sql, paginate=data.get("paginate", True),
+                                page_size=data.get("page_size"), deadline=deadline)
+        # 先取第一行，执行出错时还能返回错误状态码
+        first = list(itertools.islice(rows, 1))
+        rows = itertools.chain(first, rows)
+
+        if destination == "file":
+            export_dir = tenant.config.get("export_dir", "exports")
+            os.makedirs(export_dir, exist_ok=True)
+            file_name = os.path.basename(data.get("file_name") or
+                                         f"export_{time.strftime('%Y%m%d_%H%M%S')}.{export_format}")
+            path = os.path.join(export_dir, file_name)
+            stats = export_to_file(rows, path, export_format, chunk_rows)
+            print(f"导出 {path}: {stats['rows']} 行, {stats['rows_per_sec']} 行/秒")
+            slot.__exit__(None, None, None)
+            return jsonify(dict(stats, success=True, sql=sql, path=path))
+    except Exception as e:
+        slot.__exit__(None, None, None)
+        status = 400 if isinstance(e, ValueError) else 500
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), status
+
+    def generate():
+        stats = ExportStats()
+        completed = False
+        try:
+            yield from iter_export(rows, export_format, chunk_rows, stats)
+            completed = True
+        finally:
+            if not completed:
+                deadline.cancel()
+            slot.__exit__(None, None, None)
+            summary = stats.to_dict()
+            print(f"导出下载: {summary['rows']} 行, {summary['rows_per_sec']} 行/秒")
+
+    file_name = f"export.{export_format}"
+    return Response(generate(), mimetype=CONTENT_TYPES[export_format],
+                    headers={"Content-Disposition": f"attachment; filename={file_name}"})
+
+
+@app.route('/api/examples', methods=['GET', 'POST'])
+def manage_examples():
+    """
+    管理few-shot示例
+
+    GET: 列出示例，带 q 参数时检索与 q 最相似的示例
+        /api/examples?tenant=default&q=上个月销售额&k=3
+        /api/examples?tenant=default&limit=100&offset=0
+    POST: 添加人工维护的示例（SQL需要通过本地校验）
+    {
+        "question": "自然语言问题",
+        "sql": "对应的SQL",
+        "tenant": "租户名称"
+    }
+    """
+    data = request.json if request.method == 'POST' else request.args
+    try:
+        tenant = resolve_tenant(data or {})
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+    if tenant.examples is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用示例库（few_shot 为 false）"
+        }), 400
+
+    if request.method == 'GET':
+        question = request.args.get("q")
+        if question:
+            examples = tenant.examples.search(tenant.name, question, int(request.args.get("k", 3)))
+        else:
+            examples = tenant.examples.list(tenant.name, int(request.args.get("limit", 100)),
+                                            int(request.args.get("offset", 0)))
+        return jsonify({
+            "success": True,
+            "examples": examples
+        })
+
+    question = (data or {}).get("question")
+    sql = (data or {}).get("sql")
+    if not question or not sql:
+        return jsonify({
+            "success": False,
+            "error": "缺少必要参数: question 和 sql"
+        }), 400
+
+    table_info = tenant.cached_schema()
+    if table_info is None:
+        try:
+            table_info = tenant.get_schema()
+        except Exception as e:
+            print(f"获取表结构信息时出错: {str(e)}")
+    validation = validate_sql(sql, table_info)
+    if not validation.valid:
+        return jsonify({
+            "success": False,
+            "error": "SQL未通过校验",
+            "validation_errors": validation.errors
+        }), 400
+
+    example_id = tenant.examples.add(tenant.name, question, validation.sql, source="manual")
+    return jsonify({
+        "success": True,
+        "id": example_id
+    })
+
+
+@app.route('/api/examples/<int:example_id>', methods=['DELETE'])
+def delete_example(example_id):
+    """删除示例"""
+    try:
+        tenant = resolve_tenant(request.args)
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+    if tenant.examples is None or not tenant.examples.remove(tenant.name, example_id):
+        return jsonify({
+            "success": False,
+            "error": "示例不存在"
+        }), 404
+    return jsonify({
+        "success": True
+    })
+
+
 @app.route('/api/schema', methods=['GET'])
 def get_schema():
     """
     获取数据库表结构
 
+    查询参数:
+        tenant: 租户名称（可选，也可以通过 X-Tenant 请求头指定）
+        refresh: 为 true 时忽略缓存
+
     响应格式:
     {
         "success": true/false,
         "schema": [...]
     }
     """
-    global config
-
-    # 确保配置已加载
-    if config is None:
-        config = load_config()
+    try:
+        tenant = resolve_tenant()
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
 
     try:
-        table_info = get_table_info_from_db(config)
+        refresh = request.args.get("refresh", "").lower() == "true"
+        with tenant.slot(timeout=tenant.config.get("tenant_queue_timeout", 30)):
+            table_info = tenant.get_schema(refresh=refresh)
         return jsonify({
             "success": True,
             "schema": table_info
         })
+    except TenantBusyError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
     except Exception as e:
         return jsonify({
             "success": False,
@@ -232,6 +1149,384 @@ def get_schema():
         }), 500
 
 
+@app.route('/api/tenants', methods=['GET'])
+def list_tenants():
+    """
+    列出所有租户及其资源使用情况
+
+    响应格式:
+    {
+        "success": true,
+        "tenants": ["default", ...],
+        "stats": {...},
+        "llm_parse": {"json": 0, "fallback": 0, "failed": 0}   # 模型输出的解析方式统计
+    }
+    """
+    tenants = get_registry()
+    return jsonify({
+        "success": True,
+        "tenants": tenants.names(),
+        "stats": tenants.stats(),
+        "llm_parse": parse_stats.to_dict()
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    运行指标
+
+    响应格式:
+    {
+        "llm_limiter": {
+            "limit": 4.0,          # 当前并发上限（AIMD调整）
+            "inflight": 0,         # 正在进行的LLM调用数
+            "queued": 0,           # 排队中的LLM调用数
+            "throttled": 0,        # 收到429的次数
+            ...
+        },
+        "llm_parse": {...},        # 模型输出的解析方式统计
+        "jobs": {...},             # 异步任务队列状态（已创建时）
+        "history": {...}           # 查询历史的写入统计（未配置时为 null）
+    }
+    """
+    history = get_query_history(config or {})
+    return jsonify({
+        "llm_limiter": get_llm_limiter(config).metrics(),
+        "llm_parse": parse_stats.to_dict(),
+        "jobs": job_queue.stats() if job_queue is not None else None,
+        "history": history.stats() if history is not None else None
+    })
+
+
+@app.route('/api/history', methods=['GET'])
+def history_report():
+    """
+    查询历史报告
+
+    查询参数:
+        report: slow（最慢的查询，默认）、tables（按表统计的延迟分位数）、cache（缓存效果）、recent（最近的记录）、
+                hot（最常见的成功执行的问题）
+        limit: 返回的条数，默认20
+        hours: 统计最近多少小时，默认24，0表示全部
+        by: slow 报告按 exec（SQL执行耗时，默认）或 total（请求总耗时）排序
+        tenant: 只统计指定租户（也可以通过 X-Tenant 请求头指定），默认统计全部
+
+    响应格式:
+    {
+        "success": true,
+        "report": "slow",
+        "data": [...]              # cache 报告为对象
+    }
+    """
+    get_registry()
+    history = get_query_history(config)
+    if history is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用查询历史（history_db 为空）"
+        }), 404
+
+    report = request.args.get("report", "slow")
+    tenant = request.headers.get("X-Tenant") or request.args.get("tenant")
+    try:
+        limit = int(request.args.get("limit", 20))
+        hours = float(request.args.get("hours", 24)) or None
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "limit 和 hours 必须是数字"
+        }), 400
+
+    if report == "slow":
+        data = history.slow_queries(limit, hours, tenant, request.args.get("by", "exec"))
+    elif report == "tables":
+        data = history.table_latency(hours, tenant)
+    elif report == "cache":
+        data = history.cache_report(hours, tenant)
+    elif report == "recent":
+        data = history.recent(limit, tenant)
+    elif report == "hot":
+        data = history.hot_questions(limit, hours, tenant, min_count=1)
+    else:
+        return jsonify({
+            "success": False,
+            "error": f"未知的报告类型: {report}"
+        }), 400
+
+    return jsonify({
+        "success": True,
+        "report": report,
+        "data": data
+    })
+
+
+@app.route('/api/index_advisor', methods=['GET'])
+def index_advice():
+    """
+    根据生成SQL的执行历史给出索引建议（只给出 CREATE INDEX 语句，不修改数据库）
+
+    查询参数:
+        tenant: 租户名称（可选，也可以通过 X-Tenant 请求头指定）
+        hours: 统计最近多少小时，默认24，0表示全部
+        limit: 返回的建议数，默认20
+        explain: 为 false 时不执行 EXPLAIN，只按表统计信息估算
+
+    响应格式:
+    {
+        "success": true,
+        "queries": 50,             # 分析的查询类数（按SQL指纹归并）
+        "executions": 1200,        # 这些查询的执行次数
+        "explained": 45,
+        "explain_errors": 0,
+        "candidates": [{"table", "columns", "ddl", "score", "executions", "rows", "rows_before", "rows_after",
+                        "avoids_sort", "reasons", "queries"}, ...]
+    }
+    """
+    try:
+        tenant = resolve_tenant()
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+    history = get_query_history(config)
+    if history is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用查询历史（history_db 为空）"
+        }), 404
+    try:
+        limit = int(request.args.get("limit", 20))
+        hours = float(request.args.get("hours", 24)) or None
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "limit 和 hours 必须是数字"
+        }), 400
+
+    advisor = IndexAdvisor(tenant, history, explain=request.args.get("explain", "true").lower() != "false",
+                           min_rows=int(tenant.config.get("advisor_min_rows", 10000)))
+    try:
+        with tenant.slot(timeout=tenant.config.get("tenant_queue_timeout", 30)):
+            report = advisor.advise(hours=hours, limit=limit)
+    except TenantBusyError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    return jsonify(dict(report, success=True))
+
+
+@app.route('/api/materialized', methods=['GET', 'POST'])
+def manage_materialized():
+    """
+    热门问题的预计算结果
+
+    GET: 列出当前预计算的问题及命中次数
+    POST: 立即根据查询历史重新选择热门问题并刷新结果
+    {
+        "tenant": "租户名称"
+    }
+
+    响应格式:
+    {
+        "success": true,
+        "answers": [{"question", "sql", "tables", "rows", "refreshed_at", "refresh_ms", "hits"}, ...],
+        "stats": {...},
+        "refresh": {"refreshed": 3, "failed": 0, "entries": 5}   # POST
+    }
+    """
+    data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        tenant = resolve_tenant(data)
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": f"未知的租户: {e.args[0]}"
+        }), 404
+    if tenant.materialized is None:
+        return jsonify({
+            "success": False,
+            "error": "未启用预计算（materialize 为 false）"
+        }), 400
+
+    response = {"success": True}
+    if request.method == 'POST':
+        try:
+            response["refresh"] = tenant.materialized.refresh()
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 500
+    response.update(answers=tenant.materialized.answers(), stats=tenant.materialized.stats())
+    return jsonify(response)
+
+
+@app.route('/api/debug/profiling', methods=['GET', 'POST'])
+def manage_request_profiling():
+    """
+    单个请求的采集（管理接口）
+
+    GET: 采集器状态和保存的采集结果
+    POST: 开启或关闭按请求头 X-Profile 采集（只影响处理这个请求的进程）
+    {
+        "enabled": true/false
+    }
+
+    响应格式:
+    {
+        "success": true,
+        "stats": {"enabled", "directory", "captures", "skipped"},
+        "profiles": [{"id", "modes", "wall_ms", "artifact"}, ...]
+    }
+    """
+    denied = admin_error()
+    if denied is not None:
+        return denied
+    profiler = get_request_profiler(config)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data.get("enabled"), bool):
+            return jsonify({
+                "success": False,
+                "error": "enabled 必须是 true 或 false"
+            }), 400
+        profiler.enabled = data["enabled"]
+        print(f"请求采集已{'开启' if profiler.enabled else '关闭'}")
+    return jsonify({
+        "success": True,
+        "stats": profiler.stats(),
+        "profiles": profiler.list()
+    })
+
+
+@app.route('/api/debug/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    读取一次采集的结果（管理接口）
+
+    查询参数:
+        format: json（默认，摘要）或 prof（cProfile 文件，可以用 snakeviz、pstats 查看）
+    """
+    denied = admin_error()
+    if denied is not None:
+        return denied
+    profiler = get_request_profiler(config)
+    if request.args.get("format", "json") == "prof":
+        path = profiler.path(profile_id, "prof")
+        if path is None or not os.path.exists(path):
+            return jsonify({
+                "success": False,
+                "error": "采集结果不存在"
+            }), 404
+        return send_from_directory(os.path.abspath(profiler.directory), os.path.basename(path),
+                                   mimetype="application/octet-stream", as_attachment=True)
+    report = profiler.load(profile_id)
+    if report is None:
+        return jsonify({
+            "success": False,
+            "error": "采集结果不存在"
+        }), 404
+    return jsonify({"success": True, "profile": report})
+
+
+@app.route('/api/debug/sampler', methods=['GET', 'POST'])
+def manage_sampler():
+    """
+    采样分析器（管理接口，只影响处理这个请求的进程）
+
+    GET: 状态和按函数汇总的采样次数；查询参数 format=folded 时返回折叠栈文本（火焰图工具的输入）
+    POST: 开始、停止或清空采样
+    {
+        "action": "start/stop/reset",
+        "interval": 0.01,          # 采样间隔（秒）
+        "duration": 300,           # 最长采样时间（秒），到时自动停止，0 表示一直采样到 stop
+        "include_idle": false      # 是否计入空闲等待的线程
+    }
+
+    响应格式:
+    {
+        "success": true,
+        "stats": {"running", "interval", "samples", "idle", "stacks", "sampling_ms", ...},
+        "top": [{"function", "self", "total"}, ...]
+    }
+    """
+    denied = admin_error()
+    if denied is not None:
+        return denied
+    sampler = get_sampling_profiler()
+    if request.method == 'GET':
+        if request.args.get("format") == "folded":
+            return Response(sampler.folded(), mimetype="text/plain")
+        try:
+            limit = int(request.args.get("limit", 20))
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "limit 必须是整数"
+            }), 400
+        return jsonify({"success": True, "stats": sampler.stats(), "top": sampler.top(limit)})
+
+    data = request.get_json(silent=True) or {}
+    action = data.get("action")
+    if action == "start":
+        try:
+            interval = float(data.get("interval", config.get("sampler_interval", 0.01)))
+            duration = float(data.get("duration", config.get("sampler_max_duration", 300)))
+        except (TypeError, ValueError):
+            return jsonify({
+                "success": False,
+                "error": "interval 和 duration 必须是数字"
+            }), 400
+        if not sampler.start(interval, duration or None, include_idle=bool(data.get("include_idle", False))):
+            return jsonify({
+                "success": False,
+                "error": "采样已在进行中"
+            }), 409
+        print(f"采样分析器已开始，间隔 {sampler.interval} 秒")
+    elif action == "stop":
+        sampler.stop()
+        print("采样分析器已停止")
+    elif action == "reset":
+        sampler.reset()
+    else:
+        return jsonify({
+            "success": False,
+            "error": "action 必须是 start、stop 或 reset"
+        }), 400
+    return jsonify({"success": True, "stats": sampler.stats(), "top": sampler.top()})
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """存活探针：进程能处理请求即返回200"""
+    return jsonify({"status": "ok"})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    就绪探针：MCP会话和表结构缓存预热完成后返回200，否则返回503
+
+    响应格式:
+    {
+        "ready": true/false,
+        "mcp_sessions": true/false,
+        "schema_cache": true/false,
+        "error": "最近一次预热错误"
+    }
+    """
+    ready = readiness["mcp_sessions"] and readiness["schema_cache"]
+    return jsonify(dict(readiness, ready=ready)), 200 if ready else 503
+
+
 @app.route('/api/config', methods=['GET', 'POST'])
 def manage_config():
     """
@@ -240,7 +1535,7 @@ def manage_config():
     GET: 获取当前配置
     POST: 更新配置
     """
-    global config
+    global config, config_version
 
     # 确保配置已加载
     if config is None:
@@ -253,6 +1548,8 @@ def manage_config():
             safe_config['password'] = '******'
         if 'deepseek_api_key' in safe_config:
             safe_config['deepseek_api_key'] = '******'
+        if 'admin_token' in safe_config:
+            safe_config['admin_token'] = '******'
 
         return jsonify({
             "success": True,
@@ -268,19 +1565,35 @@ def manage_config():
                 "error": "缺少配置数据"
             }), 400
 
+        # 修改管理员令牌本身需要管理接口的访问权限
+        if 'admin_token' in data:
+            denied = admin_error()
+            if denied is not None:
+                return denied
+
         # 更新配置
         for key, value in data.items():
             if key in config:
                 config[key] = value
 
-        # 保存配置
+        # 保存配置（共享存储模式下写入共享存储，所有工作进程都会同步）
         try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
+            path = shared_store_path(config)
+            if path:
+                config_version = get_shared_store(path).set_config(config)
+            else:
+                with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+                    json.dump(config, f, indent=4, ensure_ascii=False)
+
+            # 默认租户和继承了修改项的其他租户按新配置重建会话池，连接配置变化后缓存内容不再可靠
+            tenants = get_registry()
+            tenants.get(DEFAULT_TENANT).clear_caches()
+            reset = tenants.update_defaults(config, clear_caches=True)
 
             return jsonify({
                 "success": True,
-                "message": "配置已更新"
+                "message": "配置已更新",
+                "reset_tenants": reset
             })
         except Exception as e:
             return jsonify({
@@ -306,5 +1619,8 @@ if __name__ == '__main__':
     # 设置端口
     port = int(os.environ.get('PORT', 5000))
 
-    # 启动服务器
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # 后台预热MCP会话和表结构缓存
+    start_warmup()
+
+    # 启动服务器（关闭自动重载，避免重复启动和预热）
+    app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产模式API服务器（预派生多进程）
+
+主进程创建监听套接字后派生多个工作进程，工作进程共享同一个套接字接受连接，
+异常退出的工作进程会被自动重启。配置和缓存通过共享存储在工作进程之间共享
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+DEFAULT_SHARED_STORE = "shared_store.db"
+
+
+def create_listen_socket(host: str, port: int, backlog: int = 128) -> socket.socket:
+    """创建并绑定监听套接字"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, host: str, port: int, threads: bool = True):
+    """工作进程：在共享套接字上处理请求"""
+    from werkzeug.serving import make_server
+    import nl_to_sql_api
+
+    nl_to_sql_api.config = nl_to_sql_api.load_config()
+    # 预热在fork之后进行，每个工作进程拥有自己的MCP会话
+    nl_to_sql_api.start_warmup()
+
+    server = make_server(host, port, nl_to_sql_api.app, threaded=threads, fd=sock.fileno())
+    print(f"工作进程 {os.getpid()} 已启动")
+    server.serve_forever()
+
+
+class PreforkServer:
+    """预派生多进程服务器"""
+
+    def __init__(self, host: str, port: int, workers: int):
+        """
+        初始化服务器
+
+        Args:
+            host: 监听地址
+            port: 监听端口
+            workers: 工作进程数
+        """
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.sock = None
+        self.children: Dict[int, int] = {}
+        self.stopping = False
+
+    def spawn(self, slot: int):
+        """派生一个工作进程"""
+        pid = os.fork()
+        if pid == 0:
+            # 子进程
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(self.sock, self.host, self.port)
+            except Exception as e:
+                print(f"工作进程 {os.getpid()} 出错: {str(e)}")
+            finally:
+                os._exit(1)
+        self.children[pid] = slot
+
+    def stop(self, signum=None, frame=None):
+        """停止所有工作进程"""
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve(self):
+        """启动工作进程并监控，工作进程退出时自动重启"""
+        self.sock = create_listen_socket(self.host, self.port)
+        print(f"主进程 {os.getpid()} 监听 {self.host}:{self.port}，工作进程数 {self.workers}")
+
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            print(f"工作进程 {pid} 已退出 (状态 {status})，重新启动")
+            # 避免工作进程启动即崩溃时不停重启
+            time.sleep(1)
+            self.spawn(slot)
+
+        self.sock.close()
+        print("服务器已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以预派生多进程模式启动自然语言转SQL API服务器")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)), help="监听端口")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="工作进程数")
+    parser.add_argument("--shared-store", default=None,
+                        help=f"共享存储文件路径 (默认使用配置中的 shared_store，未配置时为 {DEFAULT_SHARED_STORE})")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("错误: 预派生多进程模式需要支持 fork 的操作系统")
+        sys.exit(1)
+
+    # 多个工作进程必须使用共享存储，否则配置和缓存在进程之间不一致
+    if args.shared_store:
+        os.environ["NL2SQL_SHARED_STORE"] = args.shared_store
+    elif not os.environ.get("NL2SQL_SHARED_STORE"):
+        from nl_to_sql_api import load_config
+        if not load_config().get("shared_store"):
+            os.environ["NL2SQL_SHARED_STORE"] = DEFAULT_SHARED_STORE
+
+    PreforkServer(args.host, args.port, args.workers).serve()
+
+
+if __name__ == "__main__":
+    main()
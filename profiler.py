@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能分析模块
+
+- RequestProfiler: 按需对单个请求采集 cProfile（CPU）和 tracemalloc（内存分配），
+  结果摘要随响应返回，完整的 .prof 文件保存在目录中（可以用 snakeviz、pstats 查看）
+- SamplingProfiler: 运行时开启的采样分析器，后台线程定时读取所有线程的调用栈并按栈聚合，
+  输出火焰图工具（flamegraph.pl、speedscope）使用的折叠栈格式
+
+两者都只在当前进程内有效，多进程部署时每个工作进程分别采集
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Set
+
+PROFILE_MODES = ("cpu", "memory")
+
+_PROFILE_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+# 线程空闲等待时的栈顶函数，采样时默认不计入
+_IDLE_FRAMES = frozenset((
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socketserver.py", "serve_forever"),
+))
+
+
+def parse_modes(value: Optional[str]) -> Set[str]:
+    """
+    解析 X-Profile 请求头（cpu、memory、all 或逗号分隔的组合）
+
+    Raises:
+        ValueError: 包含未知的采集类型
+    """
+    modes = {item.strip().lower() for item in (value or "").split(",") if item.strip()}
+    if "all" in modes:
+        modes = (modes - {"all"}) | set(PROFILE_MODES)
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise ValueError(f"未知的采集类型: {', '.join(sorted(unknown))}")
+    return modes
+
+
+class RequestProfiler:
+    """单个请求的 cProfile/tracemalloc 采集"""
+
+    def __init__(self, directory: str, keep: int = 20, top: int = 30):
+        """
+        初始化
+
+        Args:
+            directory: 保存采集结果的目录
+            keep: 最多保留的采集结果数，更早的被删除
+            top: 摘要中列出的函数和内存分配位置数
+        """
+        self.directory = directory
+        self.keep = keep
+        self.top = top
+        self.enabled = False
+        # cProfile（Python 3.12 起基于 sys.monitoring）和 tracemalloc 都是进程级的，同一时间只采集一个请求
+        self._busy = threading.Lock()
+        self.captures = 0
+        self.skipped = 0
+
+    @contextmanager
+    def capture(self, modes: Set[str]) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        在 with 块内采集，退出时把摘要写入 yield 的字典
+
+        Args:
+            modes: 采集类型（cpu、memory），为空时不采集并 yield None
+
+        Yields:
+            {"id", "modes", "wall_ms", "cpu": {...}, "memory": {...}}，
+            其他请求正在采集时为 {"error": ...}
+        """
+        if not modes:
+            yield None
+            return
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            yield {"error": "其他请求正在采集，本次未采集"}
+            return
+
+        report: Dict[str, Any] = {
+            "id": time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8],
+            "modes": sorted(modes)
+        }
+        profile = cProfile.Profile() if "cpu" in modes else None
+        was_tracing = tracemalloc.is_tracing()
+        before = None
+        try:
+            if "memory" in modes:
+                if not was_tracing:
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+                before = tracemalloc.take_snapshot()
+            started = time.perf_counter()
+            if profile is not None:
+                try:
+                    profile.enable()
+                except ValueError as e:
+                    # 已有其他分析工具（调试器、覆盖率统计）在运行
+                    report["cpu"] = {"error": str(e)}
+                    profile = None
+            try:
+                yield report
+            finally:
+                if profile is not None:
+                    profile.disable()
+                report["wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                if before is not None:
+                    report["memory"] = self._memory_report(before)
+                if profile is not None:
+                    report["cpu"] = self._cpu_report(profile, report["id"])
+                self._save(report)
+                self.captures += 1
+        finally:
+            if "memory" in modes and not was_tracing:
+                tracemalloc.stop()
+            self._busy.release()
+
+    def _cpu_report(self, profile: cProfile.Profile, profile_id: str) -> Dict[str, Any]:
+        stats = pstats.Stats(profile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        functions = [{
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3)
+        } for (filename, line, name), (_, calls, total, cumulative, _) in rows]
+        report = {"total_calls": stats.total_calls, "functions": functions}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+            report["artifact"] = f"{profile_id}.prof"
+        except OSError as e:
+            print(f"保存CPU采集结果时出错: {str(e)}")
+        return report
+
+    def _memory_report(self, before: tracemalloc.Snapshot) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        # 去掉 tracemalloc 和采集过程自身的分配
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        allocations = [{
+            "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size_diff / 1024, 1),
+            "count": stat.count_diff
+        } for stat in differences[:self.top] if stat.size_diff]
+        return {"peak_kb": round(peak / 1024, 1), "current_kb": round(current / 1024, 1),
+                "allocations": allocations}
+
+    def _save(self, report: Dict[str, Any]):
+        """保存摘要，只保留最近 keep 次采集的文件"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{report['id']}.json"), "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False)
+            ids = self._ids()
+            for old in ids[:-self.keep] if self.keep > 0 else []:
+                for suffix in (".json", ".prof"):
+                    path = os.path.join(self.directory, old + suffix)
+                    if os.path.exists(path):
+                        os.remove(path)
+        except OSError as e:
+            print(f"保存采集结果时出错: {str(e)}")
+
+    def _ids(self) -> List[str]:
+        """保存的采集结果ID，按保存时间排序"""
+        if not os.path.isdir(self.directory):
+            return []
+        ids = []
+        for name in os.listdir(self.directory):
+            profile_id, _, suffix = name.partition(".")
+            if suffix == "json" and _PROFILE_ID_RE.match(profile_id):
+                ids.append((os.path.getmtime(os.path.join(self.directory, name)), profile_id))
+        return [profile_id for _, profile_id in sorted(ids)]
+
+    def list(self) -> List[Dict[str, Any]]:
+        """保存的采集结果（最近的在前）：[{"id", "modes", "wall_ms", "artifact"}]"""
+        result = []
+        for profile_id in reversed(self._ids()):
+            report = self.load(profile_id)
+            if report is not None:
+                result.append({"id": profile_id, "modes": report.get("modes"), "wall_ms": report.get("wall_ms"),
+                               "artifact": (report.get("cpu") or {}).get("artifact")})
+        return result
+
+    def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """读取采集摘要，不存在时返回 None"""
+        path = self.path(profile_id, "json")
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, profile_id: str, suffix: str) -> Optional[str]:
+        """采集结果文件的路径，ID格式不正确时返回 None"""
+        if not _PROFILE_ID_RE.match(profile_id):
+            return None
+        return os.path.join(self.directory, f"{profile_id}.{suffix}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "captures": self.captures,
+            "skipped": self.skipped
+        }
+
+
+class SamplingProfiler:
+    """定时采样所有线程调用栈的分析器"""
+
+    def __init__(self, max_stacks: int = 10000):
+        """
+        初始化
+
+        Args:
+            max_stacks: 最多记录的不同调用栈数，超过后新的栈只按线程计入 [other]
+        """
+        self.max_stacks = max_stacks
+        self.interval = 0.01
+        self.include_idle = False
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.idle = 0
+        self.sampling_seconds = 0.0
+        self.started_at: Optional[float] = None
+        self.stops_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, duration: Optional[float] = 300,
+              include_idle: bool = False) -> bool:
+        """
+        开始采样（继续累加之前的结果，需要时先调用 reset）
+
+        Args:
+            interval: 采样间隔（秒）
+            duration: 最长采样时间（秒），到时自动停止，为空时一直采样到 stop
+            include_idle: 是否计入空闲等待的线程
+
+        Returns:
+            是否启动（已经在采样时返回 False）
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = max(float(interval), 0.001)
+            self.include_idle = include_idle
+            self.started_at = time.time()
+            self.stops_at = self.started_at + duration if duration else None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> bool:
+        """停止采样，返回之前是否在采样"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return False
+        self._stop.set()
+        thread.join(timeout=5)
+        return True
+
+    def reset(self):
+        """清空采样结果"""
+        with self._lock:
+            self._counts.clear()
+            self.samples = 0
+            self.idle = 0
+            self.sampling_seconds = 0.0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if self.stops_at is not None and time.time() >= self.stops_at:
+                break
+            started = time.perf_counter()
+            self._sample(own)
+            self.sampling_seconds += time.perf_counter() - started
+
+    def _sample(self, own: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        idle = 0
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                idle += 1
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks.append(";".join(reversed(frames)))
+        with self._lock:
+            self.samples += 1
+            self.idle += idle
+            for stack in stacks:
+                if stack not in self._counts and len(self._counts) >= self.max_stacks:
+                    stack = stack.split(";", 1)[0] + ";[other]"
+                self._counts[stack] += 1
+
+    def folded(self) -> str:
+        """折叠栈格式（每行 线程;外层函数;...;内层函数 次数），可以直接交给 flamegraph.pl 或 speedscope"""
+        with self._lock:
+            items = sorted(self._counts.items())
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        按函数汇总的采样次数
+
+        Returns:
+            [{"function", "self": 位于栈顶的次数, "total": 出现在栈中的次数}]，按 self 降序
+        """
+        own: Counter = Counter()
+        total: Counter = Counter()
+        with self._lock:
+            items = list(self._counts.items())
+        for stack, count in items:
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [{"function": function, "self": count, "total": total[function]}
+                for function, count in own.most_common(limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stacks = len(self._counts)
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "include_idle": self.include_idle,
+            "started_at": self.started_at,
+            "stops_at": self.stops_at,
+            "samples": self.samples,
+            "idle": self.idle,
+            "stacks": stacks,
+            "sampling_ms": round(self.sampling_seconds * 1000, 1)
+        }
+
+
+_request_profiler: Optional[RequestProfiler] = None
+_sampler: Optional[SamplingProfiler] = None
+_profilers_lock = threading.Lock()
+
+
+def get_request_profiler(config: Optional[Dict[str, Any]] = None) -> RequestProfiler:
+    """获取进程内共用的请求采集器（第一次调用时按配置创建）"""
+    global _request_profiler
+    with _profilers_lock:
+        if _request_profiler is None:
+            config = config or {}
+            _request_profiler = RequestProfiler(
+                config.get("profile_dir", "debug_profiles"),
+                keep=int(config.get("profile_keep", 20)),
+                top=int(config.get("profile_top", 30))
+            )
+            _request_profiler.enabled = bool(config.get("request_profiling", False))
+        return _request_profiler
+
+
+def get_sampling_profiler() -> SamplingProfiler:
+    """获取进程内共用的采样分析器"""
+    global _sampler
+    with _profilers_lock:
+        if _sampler is None:
+            _sampler = SamplingProfiler()
+        return _sampler
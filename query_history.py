@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询历史模块
+
+记录每次自然语言查询和菜单执行的问题、SQL、各阶段耗时、行数和缓存命中情况。
+请求线程只把记录放入内存队列，由后台线程批量写入SQLite（只追加），
+并提供慢查询、按表统计的延迟分位数和缓存效果报告（命令行或 /api/history）
+
+用法:
+    python query_history.py slow [--limit 20] [--hours 24] [--by exec|total]
+    python query_history.py tables [--hours 24]
+    python query_history.py cache [--hours 24]
+    python query_history.py recent [--limit 20]
+    python query_history.py hot [--limit 20] [--hours 24]
+"""
+
+import argparse
+import atexit
+import json
+import math
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+from sql_utils import NUMBER, STRING, tokenize
+from sql_validator import normalize_sql
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    tenant TEXT,
+    source TEXT NOT NULL,
+    question TEXT,
+    sql TEXT,
+    fingerprint TEXT,
+    tables TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    rows INTEGER,
+    schema_ms REAL,
+    llm_ms REAL,
+    exec_ms REAL,
+    total_ms REAL,
+    llm_cache TEXT,
+    result_cache TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_ts ON history (ts);
+"""
+
+# 记录中的字段（与表的列对应，id 除外）
+FIELDS = ("ts", "tenant", "source", "question", "sql", "fingerprint", "tables", "status", "error", "rows",
+          "schema_ms", "llm_ms", "exec_ms", "total_ms", "llm_cache", "result_cache")
+
+# rows 字段在记录中的位置
+_ROWS = FIELDS.index("rows")
+
+_INSERT = f"INSERT INTO history ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})"
+
+
+def fingerprint(sql: str) -> str:
+    """SQL指纹：规范化后的SQL，字符串和数字常量替换为 ?，用于归并同类查询"""
+    text = "".join("?" if token.type in (STRING, NUMBER) else token.value for token in tokenize(sql))
+    return normalize_sql(text)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩法计算分位数，values 必须已排序"""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+class QueryHistory:
+    """查询历史（SQLite，只追加），后台线程批量写入"""
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_queue: int = 10000, retention_days: float = 30):
+        """
+        初始化查询历史
+
+        Args:
+            path: SQLite数据库文件路径
+            batch_size: 每个事务最多写入的记录数
+            flush_interval: 后台线程等待新记录的最长时间（秒）
+            max_queue: 内存队列容量，写入跟不上时丢弃新记录而不是阻塞请求
+            retention_days: 记录保留天数，0表示不清理
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._writer = None
+        self._writer_pid = None
+        self._pruned_at = 0.0
+        self.written = 0
+        self.dropped = 0
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # ---- 写入 ----
+
+    def record(self, entry: Dict[str, Any]):
+        """
+        记录一次执行（不阻塞，队列已满时丢弃）
+
+        Args:
+            entry: FIELDS 中的字段，缺少的字段为空；sql 存在时自动计算指纹，tables 可以是列表，
+                rows 可以是有 row_count() 方法的对象（如直接嵌入响应的结果文本 RawJSON），在写入线程中计数
+        """
+        self._ensure_writer()
+        entry = dict(entry)
+        entry.setdefault("ts", time.time())
+        if entry.get("sql") and not entry.get("fingerprint"):
+            entry["fingerprint"] = fingerprint(entry["sql"])
+        if isinstance(entry.get("tables"), (list, tuple)):
+            entry["tables"] = ",".join(entry["tables"])
+        for field in ("schema_ms", "llm_ms", "exec_ms", "total_ms"):
+            if entry.get(field) is not None:
+                entry[field] = round(entry[field], 1)
+        try:
+            self._queue.put_nowait(tuple(entry.get(field) for field in FIELDS))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        # fork 之后后台线程不存在，在子进程中重新启动
+        if self._writer is not None and self._writer_pid == os.getpid():
+            return
+        with self._init_lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._writer = threading.Thread(target=self._write_loop, name="query-history", daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._prune()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    @staticmethod
+    def _count_rows(record: tuple) -> tuple:
+        """在写入线程中计算结果文本的行数，不占用请求线程"""
+        rows = record[_ROWS]
+        if not hasattr(rows, "row_count"):
+            return record
+        try:
+            count = rows.row_count()
+        except Exception:
+            count = None
+        return record[:_ROWS] + (count,) + record[_ROWS + 1:]
+
+    def _write(self, batch: List[tuple]):
+        try:
+            batch = [self._count_rows(record) for record in batch]
+            conn = self.connection()
+            conn.execute("BEGIN")
+            conn.executemany(_INSERT, batch)
+            conn.execute("COMMIT")
+            self.written += len(batch)
+        except Exception as e:
+            print(f"写入查询历史时出错: {str(e)}")
+            try:
+                self.connection().execute("ROLLBACK")
+            except Exception:
+                pass
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _prune(self):
+        """每小时清理一次过期记录"""
+        if not self.retention_days or time.time() - self._pruned_at < 3600:
+            return
+        self._pruned_at = time.time()
+        try:
+            self.connection().execute("DELETE FROM history WHERE ts < ?",
+                                      (time.time() - self.retention_days * 86400,))
+        except Exception as e:
+            print(f"清理查询历史时出错: {str(e)}")
+
+    def flush(self, timeout: float = 5):
+        """等待队列中的记录写入完成（进程退出前调用）"""
+        if self._writer is None or self._writer_pid != os.getpid():
+            return
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    # ---- 报告 ----
+
+    def _select(self, columns: str, hours: Optional[float], tenant: Optional[str],
+                condition: str = "", group_by: str = "") -> List[tuple]:
+        where, params = [], []
+        if hours:
+            where.append("ts >= ?")
+            params.append(time.time() - hours * 3600)
+        if tenant:
+            where.append("tenant = ?")
+            params.append(tenant)
+        if condition:
+            where.append(condition)
+        sql = f"SELECT {columns} FROM history"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if group_by:
+            sql += " GROUP BY " + group_by
+        return self.connection().execute(sql, params).fetchall()
+
+    def recent(self, limit: int = 20, tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近的记录"""
+        sql = f"SELECT id, {', '.join(FIELDS)} FROM history"
+        params: List[Any] = []
+        if tenant:
+            sql += " WHERE tenant = ?"
+            params.append(tenant)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self.connection().execute(sql, params).fetchall()
+        return [dict(zip(("id",) + FIELDS, row)) for row in rows]
+
+    def slow_queries(self, limit: int = 20, hours: Optional[float] = 24, tenant: Optional[str] = None,
+                     by: str = "exec") -> List[Dict[str, Any]]:
+        """
+        最慢的N类查询（按SQL指纹归并，按p95耗时排序）
+
+        Args:
+            limit: 返回的查询数
+            hours: 统计最近多少小时，为空时统计全部
+            tenant: 只统计指定租户
+            by: exec 按SQL执行耗时，total 按请求总耗时
+        """
+        column = "total_ms" if by == "total" else "exec_ms"
+        groups: Dict[str, Dict[str, Any]] = {}
+        for fp, sql, question, latency in self._select(
+                f"fingerprint, sql, question, {column}", hours, tenant,
+                f"{column} IS NOT NULL AND fingerprint IS NOT NULL"):
+            group = groups.get(fp)
+            if group is None:
+                group = groups[fp] = {"fingerprint": fp, "sql": sql, "question": question, "latencies": []}
+            group["latencies"].append(latency)
+
+        report = []
+        for group in groups.values():
+            latencies = sorted(group.pop("latencies"))
+            group.update(count=len(latencies),
+                         avg_ms=_ms(sum(latencies) / len(latencies)),
+                         p50_ms=_ms(percentile(latencies, 50)),
+                         p95_ms=_ms(percentile(latencies, 95)),
+                         max_ms=_ms(latencies[-1]))
+            report.append(group)
+        report.sort(key=lambda g: g["p95_ms"], reverse=True)
+        return report[:limit]
+
+    def table_latency(self, hours: Optional[float] = 24, tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按表统计SQL执行耗时的分位数（一条查询引用多个表时计入每个表）"""
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        for tables, latency in self._select("tables, exec_ms", hours, tenant,
+                                            "exec_ms IS NOT NULL AND tables IS NOT NULL AND tables != ''"):
+            for table in tables.split(","):
+                latencies[table].append(latency)
+
+        report = []
+        for table, values in latencies.items():
+            values.sort()
+            report.append({
+                "table": table,
+                "count": len(values),
+                "avg_ms": _ms(sum(values) / len(values)),
+                "p50_ms": _ms(percentile(values, 50)),
+                "p95_ms": _ms(percentile(values, 95)),
+                "p99_ms": _ms(percentile(values, 99)),
+                "max_ms": _ms(values[-1])
+            })
+        report.sort(key=lambda t: t["p95_ms"], reverse=True)
+        return report
+
+    def cache_report(self, hours: Optional[float] = 24, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """LLM缓存和查询结果缓存的命中率，以及命中与未命中时的平均耗时"""
+        report = {}
+        for name, status_column, latency_column in (("llm_cache", "llm_cache", "llm_ms"),
+                                                    ("result_cache", "result_cache", "exec_ms")):
+            rows = self._select(f"{status_column}, COUNT(*), AVG({latency_column})", hours, tenant,
+                                f"{status_column} IS NOT NULL", group_by=status_column)
+            stats = {status: {"count": count, "avg_ms": _ms(avg)} for status, count, avg in rows}
+            hits = stats.get("hit", {}).get("count", 0)
+            misses = stats.get("miss", {}).get("count", 0)
+            hit_ms = stats.get("hit", {}).get("avg_ms")
+            miss_ms = stats.get("miss", {}).get("avg_ms")
+            report[name] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+                "avg_hit_ms": hit_ms,
+                "avg_miss_ms": miss_ms,
+                # 按未命中时的平均耗时估算命中节省的时间
+                "saved_seconds": round(hits * (miss_ms - (hit_ms or 0)) / 1000, 1)
+                if hits and miss_ms is not None else None
+            }
+
+        totals = self._select("COUNT(*), AVG(total_ms)", hours, tenant)[0]
+        statuses = self._select("status, COUNT(*)", hours, tenant, group_by="status")
+        report["requests"] = {"count": totals[0], "avg_total_ms": _ms(totals[1]), "status": dict(statuses)}
+        return report
+
+    def hot_questions(self, limit: int = 20, hours: Optional[float] = 24, tenant: Optional[str] = None,
+                      min_count: int = 3, max_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        最常见的成功执行的问题（按问题文本归并，按次数排序），每个问题取最近一次执行的SQL
+
+        Args:
+            limit: 返回的问题数
+            hours: 统计最近多少小时，为空时统计全部
+            tenant: 只统计指定租户
+            min_count: 最少出现次数
+            max_rows: 最近一次执行的结果行数上限
+        """
+        # SQLite中与 MAX() 一起查询的其他列取自 ts 最大的那一行
+        rows = self._select("question, sql, tables, rows, MAX(ts), COUNT(*)", hours, tenant,
+                            "status = 'ok' AND question IS NOT NULL AND sql IS NOT NULL AND rows IS NOT NULL",
+                            group_by="question")
+        report = []
+        for question, sql, tables, row_count, ts, count in rows:
+            if count < min_count or (max_rows is not None and row_count > max_rows):
+                continue
+            report.append({
+                "question": question,
+                "sql": sql,
+                "tables": tables.split(",") if tables else [],
+                "rows": row_count,
+                "count": count,
+                "last_ts": ts
+            })
+        report.sort(key=lambda q: q["count"], reverse=True)
+        return report[:limit]
+
+    def workload(self, limit: Optional[int] = None, hours: Optional[float] = 24, tenant: Optional[str] = None,
+                 generated: bool = True) -> List[Dict[str, Any]]:
+        """
+        成功执行的SQL（按SQL指纹归并，按次数排序），每类取最近一次执行的SQL作为样本
+
+        Args:
+            limit: 返回的查询数，为空时返回全部
+            hours: 统计最近多少小时，为空时统计全部
+            tenant: 只统计指定租户
+            generated: 是否只统计由自然语言生成的SQL（有问题文本的记录）
+        """
+        condition = "status = 'ok' AND fingerprint IS NOT NULL AND sql IS NOT NULL"
+        if generated:
+            condition += " AND question IS NOT NULL"
+        # SQLite中与 MAX() 一起查询的其他列取自 ts 最大的那一行
+        rows = self._select("fingerprint, sql, COUNT(*), SUM(exec_ms), COUNT(exec_ms), MAX(ts)", hours, tenant,
+                            condition, group_by="fingerprint")
+        report = []
+        for fp, sql, count, exec_total, exec_count, ts in rows:
+            report.append({
+                "fingerprint": fp,
+                "sql": sql,
+                "count": count,
+                "avg_exec_ms": _ms(exec_total / exec_count) if exec_count else None,
+                "total_exec_ms": _ms(exec_total),
+                "last_ts": ts
+            })
+        report.sort(key=lambda q: q["count"], reverse=True)
+        return report[:limit] if limit else report
+
+    def stats(self) -> Dict[str, Any]:
+        """写入统计"""
+        return {
+            "path": self.path,
+            "written": self.written,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped
+        }
+
+
+_histories: Dict[str, QueryHistory] = {}
+_histories_lock = threading.Lock()
+
+
+def get_query_history(config: Dict[str, Any]) -> Optional[QueryHistory]:
+    """
+    获取配置指定的查询历史（同一进程内共享）
+
+    Returns:
+        QueryHistory，配置 history_db 为空时返回 None（不记录历史）
+    """
+    path = config.get("history_db", "history.db")
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    with _histories_lock:
+        history = _histories.get(path)
+        if history is None:
+            history = _histories[path] = QueryHistory(
+                path, retention_days=config.get("history_retention_days", 30))
+            atexit.register(history.flush)
+        return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询历史报告")
+    parser.add_argument("report", choices=("slow", "tables", "cache", "recent", "hot"), help="报告类型")
+    parser.add_argument("--db", default=None, help="查询历史文件（默认使用 config.json 中的 history_db）")
+    parser.add_argument("--limit", type=int, default=20, help="返回的条数")
+    parser.add_argument("--hours", type=float, default=24, help="统计最近多少小时，0表示全部")
+    parser.add_argument("--tenant", default=None, help="只统计指定租户")
+    parser.add_argument("--by", choices=("exec", "total"), default="exec", help="慢查询按SQL执行耗时或请求总耗时排序")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args()
+
+    path = args.db
+    if path is None:
+        try:
+            with open("config.json", "r", encoding="utf-8") as f:
+                path = json.load(f).get("history_db", "history.db")
+        except (OSError, ValueError):
+            path = "history.db"
+    if not path or not os.path.exists(path):
+        print(f"错误: 查询历史文件不存在: {path}")
+        sys.exit(1)
+
+    history = QueryHistory(path)
+    hours = args.hours or None
+    if args.report == "slow":
+        report = history.slow_queries(args.limit, hours, args.tenant, args.by)
+    elif args.report == "tables":
+        report = history.table_latency(hours, args.tenant)
+    elif args.report == "cache":
+        report = history.cache_report(hours, args.tenant)
+    elif args.report == "hot":
+        report = history.hot_questions(args.limit, hours, args.tenant, min_count=1)
+    else:
+        report = history.recent(args.limit, args.tenant)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    if args.report == "slow":
+        print(f"{'p95(ms)':>10} {'avg(ms)':>10} {'max(ms)':>10} {'次数':>6}  SQL")
+        for item in report:
+            print(f"{item['p95_ms']:>10} {item['avg_ms']:>10} {item['max_ms']:>10} {item['count']:>6}  "
+                  f"{item['fingerprint'][:120]}")
+    elif args.report == "tables":
+        print(f"{'表':<30} {'次数':>6} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10} {'max(ms)':>10}")
+        for item in report:
+            print(f"{item['table']:<30} {item['count']:>6} {item['p50_ms']:>10} {item['p95_ms']:>10} "
+                  f"{item['p99_ms']:>10} {item['max_ms']:>10}")
+    elif args.report == "cache":
+        requests_info = report["requests"]
+        print(f"请求数: {requests_info['count']}，平均耗时: {requests_info['avg_total_ms']} ms，"
+              f"状态: {requests_info['status']}")
+        for name in ("llm_cache", "result_cache"):
+            item = report[name]
+            ratio = f"{item['hit_ratio'] * 100:.1f}%" if item["hit_ratio"] is not None else "-"
+            print(f"{name}: 命中 {item['hits']}，未命中 {item['misses']}，命中率 {ratio}，"
+                  f"命中/未命中平均耗时 {item['avg_hit_ms']}/{item['avg_miss_ms']} ms，"
+                  f"估计节省 {item['saved_seconds']} 秒")
+    elif args.report == "hot":
+        print(f"{'次数':>6} {'行数':>6}  问题")
+        for item in report:
+            print(f"{item['count']:>6} {item['rows']:>6}  {item['question'][:100]}")
+    else:
+        for item in report:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item["ts"]))
+            print(f"{when} [{item['source']}] {item['status']} {item['total_ms']} ms "
+                  f"rows={item['rows']} {(item['sql'] or item['question'] or '')[:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读写分离模块
+
+租户配置 replicas 列出只读副本（地址、端口和权重），每个副本使用独立的会话池。
+SELECT按权重分配到健康且延迟较小的副本，写操作和需要读到最新写入的查询使用主库：
+最近写入过的表，在副本的复制延迟追上写入时间之前，对这些表的查询都发往主库
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+from cache import create_cache
+from session_pool import MCPSessionPool, create_session_pool
+
+PRIMARY = "primary"
+
+
+def primary_route(reason: str) -> Dict[str, Any]:
+    """在主库上执行的路由信息"""
+    return {"endpoint": PRIMARY, "reason": reason, "lag": None}
+
+
+class Replica:
+    """一个只读副本及其健康状态"""
+
+    def __init__(self, name: str, config: Dict[str, Any], weight: float, pool: MCPSessionPool):
+        self.name = name
+        self.config = config
+        self.weight = weight
+        self.pool = pool
+        # 首次健康检查完成前不分配查询
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.reads = 0
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "host": self.config["host"],
+            "port": self.config["port"],
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "lag": self.lag,
+            "error": self.error,
+            "checked_at": self.checked_at,
+            "reads": self.reads,
+            "pool": self.pool.stats()
+        }
+
+
+class ReplicaRouter:
+    """为SELECT选择主库或副本"""
+
+    def __init__(self, name: str, config: Dict[str, Any], primary: MCPSessionPool, write_times=None):
+        """
+        初始化
+
+        Args:
+            name: 租户名称（用于会话池名称和日志）
+            config: 租户配置，replicas 为副本列表，每项包含 host、port，可选 name、user、password、
+                    database、weight（默认1）和 pool_size
+            primary: 主库的会话池
+            write_times: 各表最近写入时间的缓存（可以是多进程共享的缓存），为空时只记录在进程内
+        """
+        self.name = name
+        self.primary = primary
+        self.max_lag = float(config.get("replica_max_lag", 5))
+        self.check_interval = float(config.get("replica_check_interval", 5))
+        self.check_timeout = float(config.get("replica_check_timeout", 5))
+        # 判断副本是否已经包含某次写入时额外留出的时间（秒）
+        self.lag_margin = float(config.get("replica_lag_margin", 1))
+        self.write_times = write_times
+        self._local_writes: Dict[str, float] = {}
+        self.primary_reads = 0
+
+        self.replicas: List[Replica] = []
+        for index, item in enumerate(config.get("replicas") or []):
+            replica_name = item.get("name") or f"replica{index + 1}"
+            replica_config = dict(config)
+            replica_config.update({key: value for key, value in item.items() if key not in ("name", "weight")})
+            pool = create_session_pool(replica_config, size=item.get("pool_size", config.get("pool_size", 2)),
+                                       name=f"{name}:{replica_name}")
+            self.replicas.append(Replica(replica_name, replica_config, float(item.get("weight", 1)), pool))
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    # ---- 路由 ----
+
+    def note_write(self, tables: Optional[List[str]] = None):
+        """记录写操作的时间，之后对这些表的查询在副本追上之前使用主库"""
+        now = time.time()
+        for table in [t.lower() for t in tables or []] or ["*"]:
+            self._local_writes[table] = now
+            if self.write_times is not None:
+                self.write_times.set(table, now)
+
+    def _last_write(self, tables: List[str]) -> Optional[float]:
+        latest = None
+        for table in set(t.lower() for t in tables) | {"*"}:
+            written = self._local_writes.get(table)
+            if self.write_times is not None:
+                shared = self.write_times.get(table)
+                if shared is not None and (written is None or shared > written):
+                    written = shared
+            if written is not None and (latest is None or written > latest):
+                latest = written
+        return latest
+
+    def choose(self, tables: List[str], primary: bool = False) -> Tuple[MCPSessionPool, Dict[str, Any]]:
+        """
+        为查询选择会话池
+
+        Args:
+            tables: 查询引用的表
+            primary: 是否要求使用主库
+
+        Returns:
+            (会话池, 路由信息 {"endpoint", "reason", "lag"})
+        """
+        self._ensure_checker()
+        if primary:
+            return self._use_primary("requested")
+        if not tables:
+            # 无法确定引用了哪些表，不能判断副本是否包含最近的写入
+            return self._use_primary("unknown_tables")
+
+        last_write = self._last_write(tables)
+        since_write = time.time() - last_write if last_write is not None else None
+        candidates = []
+        stale = False
+        for replica in self.replicas:
+            if not replica.healthy or replica.lag is None or replica.lag > self.max_lag:
+                continue
+            if since_write is not None and replica.lag + self.lag_margin >= since_write:
+                stale = True
+                continue
+            candidates.append(replica)
+
+        if not candidates:
+            return self._use_primary("read_your_writes" if stale else "no_healthy_replica")
+
+        # 按权重随机选择，延迟越大权重越小
+        weights = [replica.weight / (1 + replica.lag) for replica in candidates]
+        replica = random.choices(candidates, weights=weights)[0]
+        replica.reads += 1
+        return replica.pool, {"endpoint": replica.name, "reason": "replica", "lag": replica.lag}
+
+    def _use_primary(self, reason: str) -> Tuple[MCPSessionPool, Dict[str, Any]]:
+        self.primary_reads += 1
+        return self.primary, primary_route(reason)
+
+    # ---- 健康检查 ----
+
+    def check(self):
+        """检查所有副本的连接和复制延迟"""
+        for replica in self.replicas:
+            if self._closed:
+                return
+            try:
+                replica.lag = self._replication_lag(replica)
+                replica.healthy = replica.lag is not None
+                replica.error = None if replica.healthy else "复制已停止"
+            except Exception as e:
+                if replica.healthy:
+                    print(f"[{self.name}] 副本 {replica.name} 不可用: {str(e)}")
+                replica.healthy = False
+                replica.lag = None
+                replica.error = str(e)
+            replica.checked_at = time.time()
+
+    def _replication_lag(self, replica: Replica) -> Optional[float]:
+        """副本的复制延迟（秒），复制已停止时返回 None，不是副本（如只读克隆）时返回0"""
+        timeout = self.check_timeout
+        rows = None
+        for sql, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                            ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                result_text = replica.pool.call_tool("query", {"sql": sql, "params": []}, timeout=timeout)
+                rows = json.loads(result_text or "")
+            except TimeoutError as e:
+                raise RuntimeError(f"健康检查超时: {str(e)}")
+            except Exception:
+                # MySQL 8.0.22 之前没有 SHOW REPLICA STATUS（工具返回错误）
+                continue
+            if isinstance(rows, list):
+                break
+            rows = None
+        if rows is None:
+            raise RuntimeError("无法获取复制状态")
+        if not rows:
+            return 0.0
+        lag = rows[0].get(column)
+        return float(lag) if lag is not None else None
+
+    def _ensure_checker(self):
+        """启动后台健康检查线程（fork之后的子进程中重新启动）"""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._closed or (self._thread is not None and self._thread_pid == os.getpid()):
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"replica-check-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[{self.name}] 检查副本时出错: {str(e)}")
+            self._wake.wait(self.check_interval)
+
+    def close(self):
+        """停止健康检查并关闭副本的会话池"""
+        self._closed = True
+        self._wake.set()
+        for replica in self.replicas:
+            replica.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """各副本的状态和路由计数"""
+        return {
+            "primary_reads": self.primary_reads,
+            "max_lag": self.max_lag,
+            "replicas": [replica.describe() for replica in self.replicas]
+        }
+
+
+def create_router(name: str, config: Dict[str, Any], primary: MCPSessionPool) -> Optional[ReplicaRouter]:
+    """配置了 replicas 时创建路由器，否则返回 None（所有查询使用主库）"""
+    if not config.get("replicas"):
+        return None
+    # 写入时间与表版本号一样放在（可能多进程共享的）缓存中，其他工作进程的写入也能让查询使用主库
+    write_times = create_cache(config, f"{name}:writes", ttl=3600, max_entries=4096)
+    return ReplicaRouter(name, config, primary, write_times=write_times)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果导出模块
+
+逐行解析MCP query 工具返回的JSON结果，分块写入CSV或Parquet（每块一个行组），
+不在内存中构建完整的结果对象，并统计导出速度
+"""
+
+import csv
+import io
+import json
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+# Parquet 导出需要 pyarrow（可选依赖）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+EXPORT_FORMATS = ("csv", "parquet")
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_rows(text: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐个解析JSON数组中的元素
+
+    Args:
+        text: query 工具返回的JSON数组文本
+
+    Yields:
+        每一行数据
+
+    Raises:
+        ValueError: 文本不是JSON数组
+    """
+    decoder = json.JSONDecoder()
+    length = len(text)
+    index = 0
+    while index < length and text[index] in _WHITESPACE:
+        index += 1
+    if index >= length or text[index] != "[":
+        raise ValueError("查询结果不是JSON数组")
+    index += 1
+
+    while True:
+        while index < length and text[index] in _WHITESPACE + ",":
+            index += 1
+        if index >= length:
+            raise ValueError("查询结果JSON不完整")
+        if text[index] == "]":
+            return
+        row, index = decoder.raw_decode(text, index)
+        yield row
+
+
+def iter_chunks(rows: Iterable[Dict[str, Any]], chunk_rows: int) -> Iterator[List[Dict[str, Any]]]:
+    """将行迭代器按 chunk_rows 分块"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _ChunkSink:
+    """收集写入的字节，供流式下载按块取出"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+class ExportStats:
+    """导出统计"""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        seconds = (self.finished_at or time.time()) - self.started_at
+        return {
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "chunks": self.chunks,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(self.rows / seconds, 1) if seconds > 0 else None
+        }
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _iter_csv(chunks: Iterable[List[Dict[str, Any]]], stats: ExportStats) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            columns = list(chunk[0].keys())
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        writer.writerows([_csv_value(row.get(column)) for column in columns] for row in chunk)
+        stats.rows += len(chunk)
+        stats.chunks += 1
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        stats.bytes += len(data)
+        yield data
+
+
+def _iter_parquet(chunks: Iterable[List[Dict[str, Any]]], stats: ExportStats) -> Iterator[bytes]:
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("导出Parquet需要安装 pyarrow")
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pylist(chunk)
+                schema = table.schema
+                writer = pq.ParquetWriter(sink, schema)
+            else:
+                table = pa.Table.from_pylist(chunk, schema=schema)
+            # 每块写成一个行组
+            writer.write_table(table)
+            stats.rows += len(chunk)
+            stats.chunks += 1
+            data = sink.drain()
+            stats.bytes += len(data)
+            yield data
+    finally:
+        if writer is not None:
+            writer.close()
+    data = sink.drain()
+    stats.bytes += len(data)
+    yield data
+
+
+def iter_export(rows: Iterable[Dict[str, Any]], export_format: str = "csv",
+                chunk_rows: int = 10000, stats: Optional[ExportStats] = None) -> Iterator[bytes]:
+    """
+    将行数据分块编码为CSV或Parquet
+
+    Args:
+        rows: 行迭代器
+        export_format: csv 或 parquet
+        chunk_rows: 每块行数（Parquet 中每块为一个行组）
+        stats: 导出统计，导出结束后填入完成时间
+
+    Yields:
+        编码后的数据块
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+    stats = stats or ExportStats()
+    chunks = iter_chunks(rows, max(1, chunk_rows))
+    encoder = _iter_csv if export_format == "csv" else _iter_parquet
+    try:
+        yield from encoder(chunks, stats)
+    finally:
+        stats.finish()
+
+
+def export_to_file(rows: Iterable[Dict[str, Any]], path: str, export_format: str = "csv",
+                   chunk_rows: int = 10000) -> Dict[str, Any]:
+    """
+    将行数据分块写入文件
+
+    Args:
+        rows: 行迭代器
+        path: 输出文件路径
+        export_format: csv 或 parquet
+        chunk_rows: 每块行数
+
+    Returns:
+        导出统计（行数、字节数、耗时、每秒行数）
+    """
+    stats = ExportStats()
+    with open(path, "wb") as f:
+        for data in iter_export(rows, export_format, chunk_rows, stats):
+            f.write(data)
+    return stats.to_dict()
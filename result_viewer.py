@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+终端结果查看器
+
+按页把查询结果显示为对齐的表格：只在翻到下一页时才从行迭代器读取更多的行
+（按主键分页的查询逐页访问数据库），内存中最多保留 max_rows 行，更早的行被丢弃。
+完整结果可以重新查询并逐块写入文件，不在内存中保存
+"""
+
+import json
+import os
+import shutil
+import unicodedata
+from collections import deque
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+from result_export import EXPORT_FORMATS, export_to_file
+
+_ELLIPSIS = "…"
+
+
+def char_width(char: str) -> int:
+    """字符在终端中的显示宽度（中日韩文字和全角字符为2）"""
+    if unicodedata.combining(char):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+
+def display_width(text: str) -> int:
+    """文本在终端中的显示宽度"""
+    if text.isascii():
+        return len(text)
+    return sum(char_width(char) for char in text)
+
+
+def fit(text: str, width: int) -> str:
+    """截断（结尾加省略号）或补空格，使文本的显示宽度正好为 width"""
+    current = display_width(text)
+    if current > width:
+        parts = []
+        used = 0
+        for char in text:
+            w = char_width(char)
+            if used + w > width - 1:
+                break
+            parts.append(char)
+            used += w
+        text = "".join(parts) + _ELLIPSIS
+        current = used + 1
+    return text + " " * (width - current)
+
+
+def format_cell(value: Any) -> str:
+    """单元格的显示文本：NULL、JSON值压缩为一行，换行和制表符替换为空格"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    elif isinstance(value, bool):
+        value = "1" if value else "0"
+    text = str(value)
+    if "\n" in text or "\r" in text or "\t" in text:
+        text = text.replace("\r\n", " ").replace("\n", " ").replace("\r", " ").replace("\t", " ")
+    return text
+
+
+def format_table(rows: List[Dict[str, Any]], start: int = 1, max_column_width: int = 40) -> List[str]:
+    """
+    把一页行数据格式化为对齐的表格
+
+    Args:
+        rows: 行数据（列取第一行的键）
+        start: 第一行的行号
+        max_column_width: 列的最大显示宽度，更长的值被截断
+
+    Returns:
+        表格的各行文本
+    """
+    if not rows:
+        return []
+    columns = list(rows[0].keys())
+    cells = [[format_cell(row.get(column)) for column in columns] for row in rows]
+    number_width = len(str(start + len(rows) - 1))
+    widths = []
+    for index, column in enumerate(columns):
+        width = max([display_width(column)] + [display_width(line[index]) for line in cells])
+        widths.append(min(max(width, 1), max_column_width))
+
+    lines = [" " * number_width + " | " + " | ".join(fit(column, width) for column, width in zip(columns, widths)),
+             "-" * number_width + "-+-" + "-+-".join("-" * width for width in widths)]
+    for offset, line in enumerate(cells):
+        lines.append(str(start + offset).rjust(number_width) + " | "
+                     + " | ".join(fit(cell, width) for cell, width in zip(line, widths)))
+    return lines
+
+
+class ResultViewer:
+    """分页查看查询结果"""
+
+    def __init__(self, open_rows: Callable[[], Iterator[Dict[str, Any]]], page_size: Optional[int] = None,
+                 max_rows: int = 5000, max_column_width: int = 40, input_func=input, print_func=print):
+        """
+        初始化
+
+        Args:
+            open_rows: 执行查询并返回行迭代器（保存完整结果时重新调用）
+            page_size: 每页行数，为空时按终端高度计算
+            max_rows: 内存中最多保留的行数（向前翻页超出这个范围时不可用）
+            max_column_width: 列的最大显示宽度
+            input_func: 读取命令的函数
+            print_func: 输出的函数
+        """
+        if page_size is None:
+            page_size = max(5, shutil.get_terminal_size().lines - 6)
+        self.open_rows = open_rows
+        self.page_size = max(1, page_size)
+        self.max_rows = max(self.page_size, max_rows)
+        self.max_column_width = max_column_width
+        self.input = input_func
+        self.print = print_func
+
+        self._rows = None
+        self._buffer: deque = deque()
+        # 缓冲区中第一行的序号（从0开始）
+        self._first = 0
+        self.fetched = 0
+        self.complete = False
+        self.error: Optional[str] = None
+
+    def _open(self):
+        if self._rows is None:
+            self._rows = self.open_rows()
+
+    def _fill(self, count: int):
+        """从迭代器读取行，直到读取的总行数达到 count 或结果结束"""
+        self._open()
+        while self.fetched < count and not self.complete:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                self.complete = True
+                break
+            self._buffer.append(row)
+            self.fetched += 1
+            if len(self._buffer) > self.max_rows:
+                self._buffer.popleft()
+                self._first += 1
+
+    def page(self, number: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        第 number 页（从0开始）的行
+
+        Returns:
+            行数据，超出结果范围时返回 None
+
+        Raises:
+            IndexError: 该页的行已经不在内存中
+        """
+        start = number * self.page_size
+        self._fill(start + self.page_size)
+        if start < self._first:
+            raise IndexError(f"第 {number + 1} 页已不在内存中（最多保留 {self.max_rows} 行）")
+        if number > 0 and start >= self.fetched:
+            return None
+        begin = start - self._first
+        return [self._buffer[index] for index in range(begin, min(begin + self.page_size, len(self._buffer)))]
+
+    def close(self):
+        """停止读取结果（分页查询不再访问数据库）"""
+        if self._rows is not None and hasattr(self._rows, "close"):
+            self._rows.close()
+        self._rows = None
+
+    def _status(self, number: int, rows: List[Dict[str, Any]]) -> str:
+        start = number * self.page_size
+        status = f"第 {number + 1} 页，第 {start + 1}-{start + len(rows)} 行"
+        if self.complete:
+            pages = (self.fetched + self.page_size - 1) // self.page_size
+            return f"{status}（共 {self.fetched} 行，{pages} 页）"
+        return f"{status}（已读取 {self.fetched} 行，还有更多）"
+
+    def show(self, number: int) -> bool:
+        """显示一页，页不存在时返回 False"""
+        try:
+            rows = self.page(number)
+        except IndexError as e:
+            self.print(str(e))
+            return False
+        except Exception as e:
+            # 出错之后不再读取，已显示的页仍然可以查看
+            self.error = str(e)
+            self.complete = True
+            self.print(f"查询失败: {self.error}")
+            return False
+        if rows is None:
+            self.print("没有更多的行")
+            return False
+        if not rows:
+            self.print("查询结果为空")
+            return True
+        self.print("")
+        for line in format_table(rows, number * self.page_size + 1, self.max_column_width):
+            self.print(line)
+        self.print(self._status(number, rows))
+        return True
+
+    def save(self, path: str, export_format: Optional[str] = None) -> Dict[str, Any]:
+        """
+        把完整结果写入文件（逐块写入；内存中已有完整结果时直接写入，否则重新查询）
+
+        Args:
+            path: 文件路径
+            export_format: csv 或 parquet，为空时按扩展名判断（默认csv）
+
+        Returns:
+            导出统计
+        """
+        if export_format is None:
+            extension = os.path.splitext(path)[1].lstrip(".").lower()
+            export_format = extension if extension in EXPORT_FORMATS else "csv"
+        if self.complete and self.error is None and self._first == 0:
+            return export_to_file(iter(self._buffer), path, export_format)
+        rows = self.open_rows()
+        try:
+            return export_to_file(rows, path, export_format)
+        finally:
+            if hasattr(rows, "close"):
+                rows.close()
+
+    def run(self, show_first: bool = True):
+        """
+        交互式查看：回车/n 下一页，p 上一页，g 页码 跳转，s 文件名 保存完整结果，q 退出
+
+        Args:
+            show_first: 是否先显示第一页（调用方已经用 show(0) 显示过时为 False）
+        """
+        number = 0
+        try:
+            if show_first and not self.show(number):
+                return
+            while True:
+                if self.complete and (number + 1) * self.page_size >= self.fetched:
+                    prompt = "\n[p]上一页 [g 页码]跳转 [s 文件名]保存完整结果 [q]退出: "
+                else:
+                    prompt = "\n[回车]下一页 [p]上一页 [g 页码]跳转 [s 文件名]保存完整结果 [q]退出: "
+                command = self.input(prompt).strip()
+                if command.lower() in ("q", "quit", "exit"):
+                    return
+                if command.lower() in ("", "n"):
+                    if self.show(number + 1):
+                        number += 1
+                elif command.lower() == "p":
+                    if number == 0:
+                        self.print("已经是第一页")
+                    elif self.show(number - 1):
+                        number -= 1
+                elif command.lower().startswith("g"):
+                    try:
+                        target = int(command[1:].strip()) - 1
+                    except ValueError:
+                        self.print("用法: g 页码")
+                        continue
+                    if target >= 0 and self.show(target):
+                        number = target
+                elif command.lower().startswith("s"):
+                    path = command[1:].strip() or self.input("保存到文件（.csv 或 .parquet）: ").strip()
+                    if not path:
+                        continue
+                    try:
+                        stats = self.save(path)
+                        self.print(f"已保存 {stats['rows']} 行到 {path}（{stats['bytes']} 字节，{stats['seconds']} 秒）")
+                    except Exception as e:
+                        self.print(f"保存失败: {str(e)}")
+                else:
+                    self.print("未知命令")
+        except KeyboardInterrupt:
+            self.print("")
+        finally:
+            self.close()
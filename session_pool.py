@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MCP会话池模块
+
+在后台事件循环线程中维护一组已连接数据库的MCP会话，
+避免每个请求都重新启动 node MCP 服务器进程并重新连接数据库
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+from typing import Dict, Any, Optional, List, Callable, Awaitable
+
+from deadline import Deadline
+
+# 在模块导入时（服务启动阶段）加载mcp，避免第一个请求承担导入开销
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+try:
+    from mcp.shared.exceptions import McpError
+except ImportError:
+    from mcp.shared.exceptions import MCPError as McpError
+
+# 后台事件循环（所有会话池共享）
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取后台事件循环，首次调用时启动后台线程
+
+    Returns:
+        在后台线程中运行的事件循环
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="mcp-event-loop", daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def build_server_params(config: Dict[str, Any]):
+    """
+    根据数据库配置创建MCP服务器参数
+
+    Args:
+        config: 数据库配置
+
+    Returns:
+        StdioServerParameters
+    """
+    # 设置环境变量
+    env = {
+        "MYSQL_HOST": config["host"],
+        "MYSQL_USER": config["user"],
+        "MYSQL_PASSWORD": config["password"],
+        "MYSQL_DATABASE": config["database"],
+        "MYSQL_PORT": str(config["port"]),
+    }
+
+    return StdioServerParameters(
+        command="node",
+        args=["build/index.js"],
+        env=env,
+    )
+
+
+def connect_arguments(config: Dict[str, Any]) -> Dict[str, Any]:
+    """构建 connect_db 工具的参数"""
+    return {
+        "host": config["host"],
+        "user": config["user"],
+        "password": config["password"],
+        "database": config["database"],
+        "port": config["port"]
+    }
+
+
+def extract_text(result) -> Optional[str]:
+    """提取工具调用结果中的第一段文本"""
+    if hasattr(result, 'content') and result.content:
+        for item in result.content:
+            if hasattr(item, 'text'):
+                return item.text
+    return None
+
+
+def _is_tool_error(error: BaseException) -> bool:
+    """判断异常是否为MCP工具返回的错误（会话本身仍然可用）"""
+    return isinstance(error, McpError)
+
+
+class _PooledSession:
+    """池中的单个MCP会话"""
+
+    def __init__(self, session, task: asyncio.Task, closing: asyncio.Event, connection_id: Optional[int] = None):
+        self.session = session
+        self.task = task
+        self.closing = closing
+        # MCP服务器的数据库连接ID，取消调用时用 KILL QUERY 终止正在执行的语句
+        self.connection_id = connection_id
+
+    def alive(self) -> bool:
+        """MCP服务器进程是否仍在运行"""
+        return not self.task.done()
+
+    async def close(self):
+        """关闭会话并等待MCP服务器进程退出"""
+        self.closing.set()
+        try:
+            await self.task
+        except BaseException:
+            pass
+
+
+class MCPSessionPool:
+    """MCP会话池，会话按需创建，最多保持 size 个"""
+
+    def __init__(self, config: Dict[str, Any], size: int = 2, name: str = "default"):
+        """
+        初始化会话池
+
+        Args:
+            config: 数据库配置
+            size: 最大会话数
+            name: 会话池名称（用于日志）
+        """
+        self.config = config
+        self.size = max(1, int(size))
+        self.name = name
+        self.kill_on_cancel = config.get("kill_on_cancel", True)
+        self.kill_timeout = config.get("kill_timeout", 5)
+        self.killed = 0
+        self._idle: List[_PooledSession] = []
+        self._created = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = None
+
+    def _condition(self) -> asyncio.Condition:
+        # 必须在后台事件循环中创建
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def _session_worker(self, ready: asyncio.Future, closing: asyncio.Event):
+        """
+        持有一个MCP会话直到被关闭
+
+        stdio_client 的上下文必须在同一个任务中进入和退出，因此每个会话由独立任务持有
+        """
+        try:
+            async with stdio_client(build_server_params(self.config)) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    await session.call_tool("connect_db", arguments=connect_arguments(self.config))
+                    connection_id = await self._connection_id(session) if self.kill_on_cancel else None
+                    ready.set_result((session, connection_id))
+                    await closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            elif not closing.is_set():
+                print(f"[{self.name}] MCP会话异常退出: {str(e)}")
+
+    async def _connection_id(self, session) -> Optional[int]:
+        """查询会话使用的数据库连接ID，失败时返回 None（取消调用时不终止语句）"""
+        try:
+            result = await session.call_tool("query", arguments={"sql": "SELECT CONNECTION_ID() AS id", "params": []})
+            return int(json.loads(extract_text(result))[0]["id"])
+        except Exception as e:
+            print(f"[{self.name}] 无法获取数据库连接ID: {str(e)}")
+            return None
+
+    def _is_tool_error(self, error: BaseException) -> bool:
+        """异常是否为工具返回的错误（会话本身仍然可用）"""
+        return _is_tool_error(error)
+
+    async def _open_session(self) -> _PooledSession:
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        closing = asyncio.Event()
+        task = loop.create_task(self._session_worker(ready, closing))
+        session, connection_id = await ready
+        return _PooledSession(session, task, closing, connection_id)
+
+    async def acquire(self) -> _PooledSession:
+        """从池中获取一个会话，没有空闲会话时创建新会话或等待"""
+        cond = self._condition()
+        async with cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"会话池 {self.name} 已关闭")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._in_use += 1
+                    return pooled
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                await cond.wait()
+
+        try:
+            pooled = await self._open_session()
+        except BaseException:
+            async with cond:
+                self._created -= 1
+                cond.notify()
+            raise
+
+        async with cond:
+            self._in_use += 1
+        return pooled
+
+    async def release(self, pooled: _PooledSession, broken: bool = False):
+        """归还会话，broken 为 True 时关闭会话而不放回池中"""
+        cond = self._condition()
+        async with cond:
+            self._in_use -= 1
+            if broken or self._closed or not pooled.alive():
+                self._created -= 1
+                discard = True
+            else:
+                self._idle.append(pooled)
+                discard = False
+            cond.notify()
+        if discard:
+            await pooled.close()
+
+    async def run_async(self, fn: Callable[[Any], Awaitable[Any]]) -> Any:
+        """在池中的会话上执行异步函数 fn(session)"""
+        pooled = await self.acquire()
+        broken = False
+        try:
+            return await fn(pooled.session)
+        except BaseException as e:
+            broken = not self._is_tool_error(e)
+            if isinstance(e, asyncio.CancelledError) and pooled.connection_id is not None:
+                # 关闭MCP会话不会停止服务端已经开始执行的语句，从另一个连接终止它
+                asyncio.get_running_loop().create_task(self._kill_query(pooled.connection_id))
+            raise
+        finally:
+            await self.release(pooled, broken=broken)
+
+    async def _kill_query(self, connection_id: int):
+        """在池中的另一个会话上执行 KILL QUERY"""
+        try:
+            pooled = await asyncio.wait_for(self.acquire(), self.kill_timeout)
+        except Exception as e:
+            print(f"[{self.name}] 无法终止连接 {connection_id} 上的语句: {str(e)}")
+            return
+        broken = False
+        try:
+            await asyncio.wait_for(pooled.session.call_tool(
+                "execute", arguments={"sql": f"KILL QUERY {int(connection_id)}", "params": []}), self.kill_timeout)
+            self.killed += 1
+            print(f"[{self.name}] 已终止连接 {connection_id} 上的语句")
+        except BaseException as e:
+            broken = not self._is_tool_error(e)
+            print(f"[{self.name}] 终止连接 {connection_id} 上的语句时出错: {str(e)}")
+        finally:
+            await self.release(pooled, broken=broken)
+
+    def run(self, fn: Callable[[Any], Awaitable[Any]], timeout: Optional[float] = None,
+            deadline: Optional[Deadline] = None) -> Any:
+        """
+        在后台事件循环中执行 fn(session) 并同步等待结果
+
+        超时或 deadline 被取消时取消 fn，使用中的会话被关闭，正在执行的语句被终止
+
+        Args:
+            fn: 接收 ClientSession 的异步函数
+            timeout: 超时时间（秒）
+            deadline: 请求的截止时间
+
+        Returns:
+            fn 的返回值
+
+        Raises:
+            TimeoutError: 超时（超过 deadline 时为 DeadlineExceeded）
+            RequestCancelled: deadline 被取消
+        """
+        if deadline is not None:
+            timeout = deadline.timeout(timeout)
+        future = asyncio.run_coroutine_threadsafe(self.run_async(fn), get_event_loop())
+        unregister = deadline.on_cancel(future.cancel) if deadline is not None else None
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            if deadline is not None:
+                deadline.check()
+            raise TimeoutError(f"MCP调用超时（{timeout:g}秒）")
+        except concurrent.futures.CancelledError:
+            if deadline is not None:
+                deadline.check()
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                  timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        调用MCP工具并返回结果文本
+
+        Args:
+            name: 工具名称
+            arguments: 工具参数
+            timeout: 超时时间（秒）
+            deadline: 请求的截止时间
+
+        Returns:
+            结果文本
+        """
+        async def _call(session):
+            result = await session.call_tool(name, arguments=arguments or {})
+            return extract_text(result)
+
+        return self.run(_call, timeout=timeout, deadline=deadline)
+
+    async def _warm(self, count: int) -> int:
+        acquired = []
+        try:
+            for _ in range(min(count, self.size)):
+                acquired.append(await self.acquire())
+        finally:
+            for pooled in acquired:
+                await self.release(pooled)
+        return len(acquired)
+
+    def warm(self, count: int = 1, timeout: Optional[float] = None) -> int:
+        """
+        预先创建会话，使后续请求不需要等待MCP服务器启动
+
+        Args:
+            count: 预先创建的会话数（不超过池大小）
+            timeout: 超时时间（秒）
+
+        Returns:
+            已就绪的会话数
+        """
+        future = asyncio.run_coroutine_threadsafe(self._warm(count), get_event_loop())
+        return future.result(timeout)
+
+    async def _close_all(self):
+        cond = self._condition()
+        async with cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            cond.notify_all()
+        for pooled in idle:
+            await pooled.close()
+
+    def close(self, timeout: float = 10):
+        """关闭池中所有空闲会话，使用中的会话在归还时关闭"""
+        future = asyncio.run_coroutine_threadsafe(self._close_all(), get_event_loop())
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"[{self.name}] 关闭会话池时出错: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """会话池状态"""
+        return {
+            "size": self.size,
+            "created": self._created,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "killed_queries": self.killed,
+            "backend": "mcp"
+        }
+
+
+def create_session_pool(config: Dict[str, Any], size: int = 2, name: str = "default") -> MCPSessionPool:
+    """
+    按配置 db_backend 创建会话池
+
+    Args:
+        config: 数据库配置，db_backend 为 mcp（默认，通过 node MCP 服务器）或 native（进程内直接连接MySQL）
+        size: 最大会话数
+        name: 会话池名称（用于日志）
+
+    Returns:
+        会话池，未安装 aiomysql 时退回MCP会话池
+    """
+    if config.get("db_backend", "mcp") == "native":
+        from native_mysql import AIOMYSQL_AVAILABLE, NativeSessionPool
+        if AIOMYSQL_AVAILABLE:
+            return NativeSessionPool(config, size=size, name=name)
+        print(f"[{name}] 未安装 aiomysql，使用MCP会话池")
+    return MCPSessionPool(config, size=size, name=name)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享存储模块
+
+基于SQLite（WAL模式）的本地共享存储，多个工作进程通过同一个数据库文件共享
+配置、表结构缓存、自然语言转SQL缓存和查询结果缓存，任何工作进程都可以处理任何请求
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (namespace, accessed_at);
+CREATE TABLE IF NOT EXISTS config (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+"""
+
+
+# 读取缓存时最多每隔这么久（秒）更新一次访问时间：每次读取都写入会让所有工作进程在SQLite的写锁上排队，
+# 淘汰顺序只需要近似的最近访问时间
+_TOUCH_INTERVAL = 60
+
+
+class SharedStore:
+    """SQLite共享存储，每个线程（以及fork后的每个进程）使用独立连接"""
+
+    def __init__(self, path: str):
+        """
+        初始化共享存储
+
+        Args:
+            path: SQLite数据库文件路径
+        """
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        # fork 之后不能复用父进程的连接
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # ---- 缓存 ----
+
+    def cache_get(self, namespace: str, key: str) -> Optional[str]:
+        """读取缓存值（JSON文本），不存在或已过期时返回 None"""
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at < now:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+            return None
+        if now - accessed_at >= _TOUCH_INTERVAL:
+            conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key)
+            )
+        return value
+
+    def cache_set(self, namespace: str, key: str, value: str, ttl: Optional[float], max_entries: int):
+        """写入缓存值，超过 max_entries 时淘汰最久未访问的条目（访问时间的精度为 _TOUCH_INTERVAL）"""
+        conn = self.connection()
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value, expires_at, now)
+        )
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (namespace, namespace, max_entries)
+        )
+
+    def cache_delete(self, namespace: str, key: Optional[str] = None):
+        """删除缓存值，key 为空时清空整个命名空间"""
+        conn = self.connection()
+        if key is None:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        else:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def cache_count(self, namespace: str) -> int:
+        """命名空间中的条目数"""
+        row = self.connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0]
+
+    # ---- 配置 ----
+
+    def get_config(self, name: str = "default") -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        读取共享配置
+
+        Returns:
+            (配置, 版本号)，配置不存在时返回 (None, 0)
+        """
+        row = self.connection().execute(
+            "SELECT value, version FROM config WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def config_version(self, name: str = "default") -> int:
+        """共享配置的版本号，每次更新加一"""
+        row = self.connection().execute(
+            "SELECT version FROM config WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_config(self, config: Dict[str, Any], name: str = "default") -> int:
+        """
+        写入共享配置
+
+        Returns:
+            新版本号
+        """
+        conn = self.connection()
+        value = json.dumps(config, ensure_ascii=False)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self.config_version(name) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO config (name, value, version) VALUES (?, ?, ?)",
+                (name, value, version)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+
+_stores: Dict[str, SharedStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_shared_store(path: str) -> SharedStore:
+    """获取指定路径的共享存储（同一路径在进程内只创建一次）"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = SharedStore(path)
+            _stores[path] = store
+        return store
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求合并模块
+
+同一进程内键相同的并发调用只执行一次：第一个调用者执行计算，
+其他调用者等待并共享它的结果（或异常）
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+
+class _Call:
+    """一次进行中的计算"""
+
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self, retry_on: Tuple[Type[BaseException], ...] = ()):
+        """
+        初始化
+
+        Args:
+            retry_on: 执行者因这些异常失败时（如执行者的请求被取消），等待者不共享异常而是重新执行
+        """
+        self.retry_on = retry_on
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        执行 fn，同一时刻键相同的调用共享同一次执行的结果
+
+        Args:
+            key: 合并键
+            fn: 计算函数
+            timeout: 等待其他调用者执行结果的最长时间（秒）
+
+        Returns:
+            fn 的返回值
+
+        Raises:
+            TimeoutError: 等待超时
+            fn 抛出的异常（所有等待者都会收到）
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.shared += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    self.executed += 1
+                    leader = True
+
+            if leader:
+                break
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            if not call.event.wait(remaining):
+                raise TimeoutError("等待合并的调用超时")
+            if call.error is None:
+                return call.result
+            if not isinstance(call.error, self.retry_on):
+                raise call.error
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        """执行次数、共享结果的次数和进行中的计算数"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls)
+            }
@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL改写模块
+
+执行模型生成的SELECT之前做等价改写，只改写能确定结果不变的简单形式：
+- 包在日期函数中的过滤条件（DATE(col) = '...'、YEAR(col) = ...、DATE_FORMAT(col, '%Y-%m') = '...'）
+  改为列上的范围条件，使条件可以使用索引
+- WHERE 中作为顶层 AND 条件的相关 EXISTS/IN 子查询（单表，以等值条件关联外层）改为不相关的 IN 子查询，
+  MySQL可以按半连接执行，不需要对外层的每一行执行一次子查询
+- 派生表中的 SELECT * 只保留外层查询用到的列
+
+ORDER BY RAND() 和最外层的 SELECT * 没有等价的改写，只给出说明
+"""
+
+import datetime
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fast_json import loads
+from sql_utils import (IDENT, NUMBER, OP, PUNCT, QUOTED, STRING, identifier_name, is_select, significant,
+                       split_statements, tokenize)
+from sql_validator import KEYWORDS, table_aliases
+
+_DATE_TYPES = ("date", "datetime", "timestamp")
+
+# 可以改写为范围条件的日期函数
+_PERIOD_FUNCTIONS = ("DATE", "YEAR", "DATE_FORMAT")
+_DATE_FORMATS = ("%Y-%m-%d", "%Y-%m", "%Y")
+
+# 比较运算符 -> 对应的范围条件（start/end 为常量对应的时间段的起止，不含 end）
+_PERIOD_CONDITIONS = {
+    "=": ((">=", "start"), ("<", "end")),
+    ">=": ((">=", "start"),),
+    ">": ((">=", "end"),),
+    "<": (("<", "start"),),
+    "<=": (("<", "end"),),
+}
+
+# 改写的条件之前可以出现的关键字（条件不是更大的表达式的一部分）
+_PREDICATE_STARTS = ("WHERE", "AND", "OR", "XOR", "ON", "WHEN", "NOT")
+
+# 子句结束的关键字
+_CLAUSE_ENDS = ("GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", "UNION", "FOR", "LOCK", "INTO")
+
+# 条件之后可以出现的关键字
+_PREDICATE_ENDS = _CLAUSE_ENDS + ("AND", "OR", "XOR", "THEN", "WHERE", "JOIN", "INNER", "LEFT", "RIGHT",
+                                  "CROSS", "STRAIGHT_JOIN", "NATURAL")
+
+# 子查询中出现这些关键字时不改写
+_SUBQUERY_UNSUPPORTED = ("GROUP", "HAVING", "LIMIT", "UNION", "JOIN", "WINDOW", "OVER", "DISTINCT",
+                         "STRAIGHT_JOIN", "NATURAL", "USING", "SELECT")
+
+# 派生表中出现这些关键字时不裁剪列（去重和分组的结果与选择的列有关）
+_DERIVED_UNSUPPORTED = ("GROUP", "HAVING", "UNION", "JOIN", "WINDOW", "OVER", "DISTINCT", "DISTINCTROW",
+                        "STRAIGHT_JOIN", "NATURAL", "USING")
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+_YEAR_RE = re.compile(r"^\d{4}$")
+
+
+def _is_punct(token: Optional[Any], *values: str) -> bool:
+    return token is not None and token.type == PUNCT and token.value in values
+
+
+def _is_name(token: Optional[Any]) -> bool:
+    """是否为标识符（不是关键字）"""
+    return token is not None and token.type in (IDENT, QUOTED) and \
+        not (token.type == IDENT and token.upper in KEYWORDS)
+
+
+def _closing(tokens, open_index: int) -> int:
+    """与 tokens[open_index] 处左括号匹配的右括号下标，没有时返回 -1"""
+    depth = 0
+    for index in range(open_index, len(tokens)):
+        if _is_punct(tokens[index], "("):
+            depth += 1
+        elif _is_punct(tokens[index], ")"):
+            depth -= 1
+            if depth == 0:
+                return index
+    return -1
+
+
+def _text(sql: str, tokens, start: int, end: int) -> str:
+    """tokens[start:end + 1] 对应的原始文本"""
+    return sql[tokens[start].pos:tokens[end].pos + len(tokens[end].value)]
+
+
+def _quote(name: str) -> str:
+    if _IDENTIFIER_RE.match(name) and name.upper() not in KEYWORDS:
+        return name
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _column_ref(tokens, position: int) -> Optional[Tuple[Optional[str], str, int]]:
+    """
+    position 处开始的列引用（列名或 限定符.列名）
+
+    Returns:
+        (限定符（小写，没有时为 None）, 列名（小写）, 最后一个词法单元的下标)，不是列引用时返回 None
+    """
+    if position >= len(tokens) or not _is_name(tokens[position]):
+        return None
+    following = tokens[position + 1] if position + 1 < len(tokens) else None
+    if _is_punct(following, "("):
+        return None
+    if _is_punct(following, "."):
+        if position + 2 >= len(tokens) or tokens[position + 2].type not in (IDENT, QUOTED):
+            return None
+        after = tokens[position + 3] if position + 3 < len(tokens) else None
+        # 数据库名.表名.列名 不改写
+        if _is_punct(after, ".", "("):
+            return None
+        return identifier_name(tokens[position]).lower(), identifier_name(tokens[position + 2]).lower(), \
+            position + 2
+    return None, identifier_name(tokens[position]).lower(), position
+
+
+def _schema_columns(table_info: List[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """表名（小写） -> {列名（小写）: 列信息}（保持列的顺序）"""
+    return {table["name"].lower(): {column["name"].lower(): column for column in table.get("columns", [])}
+            for table in table_info}
+
+
+def _is_date_column(qualifier: Optional[str], column: str, columns: Dict[str, Dict[str, Dict[str, Any]]],
+                    aliases: Dict[str, str]) -> bool:
+    """列是否为日期时间类型（没有限定符时，语句引用的表中所有同名的列都必须是日期时间类型）"""
+    if qualifier is not None:
+        tables = [aliases[qualifier]] if qualifier in aliases else []
+    else:
+        tables = list(dict.fromkeys(aliases.values()))
+    types = [str(columns[table][column].get("type") or "").lower() for table in tables
+             if column in columns.get(table, {})]
+    return bool(types) and all(column_type.split("(")[0].strip() in _DATE_TYPES for column_type in types)
+
+
+def _literal(token: Optional[Any]) -> Optional[str]:
+    if token is None:
+        return None
+    if token.type == STRING and token.value[:1] == "'" and "\\" not in token.value and \
+            "''" not in token.value[1:-1]:
+        return token.value[1:-1]
+    if token.type == NUMBER:
+        return token.value
+    return None
+
+
+def _period(function: str, date_format: Optional[str],
+            token: Optional[Any]) -> Optional[Tuple[datetime.date, datetime.date]]:
+    """日期函数的结果等于常量时，列所在的时间段 [start, end)"""
+    value = _literal(token)
+    if value is None:
+        return None
+    try:
+        if (function == "DATE" or date_format == "%Y-%m-%d") and token.type == STRING and _DAY_RE.match(value):
+            start = datetime.date.fromisoformat(value)
+            return start, start + datetime.timedelta(days=1)
+        if date_format == "%Y-%m" and token.type == STRING and _MONTH_RE.match(value):
+            start = datetime.date(int(value[:4]), int(value[5:]), 1)
+            end = datetime.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            return start, end
+        if (function == "YEAR" or date_format == "%Y") and _YEAR_RE.match(value) and \
+                (function == "YEAR" or token.type == STRING):
+            year = int(value)
+            return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    except ValueError:
+        return None
+    return None
+
+
+def _predicate_ends(tokens, position: int) -> bool:
+    """position 处是否为条件的结尾（后面不是运算符等更大的表达式的一部分）"""
+    if position >= len(tokens):
+        return True
+    token = tokens[position]
+    return _is_punct(token, ")", ";") or token.is_keyword(*_PREDICATE_ENDS) or \
+        (token.type == OP and token.value in ("&&", "||"))
+
+
+def _date_range(sql: str, tokens, columns: Dict[str, Dict[str, Dict[str, Any]]],
+                aliases: Dict[str, str]) -> Optional[Tuple[int, int, str]]:
+    """DATE(col) = '2024-01-01' -> (col >= '2024-01-01' AND col < '2024-01-02')"""
+    for index, token in enumerate(tokens):
+        if not token.is_keyword(*_PERIOD_FUNCTIONS) or not _is_punct(
+                tokens[index + 1] if index + 1 < len(tokens) else None, "("):
+            continue
+        previous = tokens[index - 1] if index > 0 else None
+        if previous is None or not (previous.is_keyword(*_PREDICATE_STARTS) or _is_punct(previous, "(")):
+            continue
+        close = _closing(tokens, index + 1)
+        reference = _column_ref(tokens, index + 2)
+        if close < 0 or reference is None:
+            continue
+        qualifier, column, last = reference
+        arguments = tokens[last + 1:close]
+        date_format = None
+        if token.upper == "DATE_FORMAT":
+            if len(arguments) != 2 or not _is_punct(arguments[0], ",") or arguments[1].type != STRING:
+                continue
+            date_format = _literal(arguments[1])
+            if date_format not in _DATE_FORMATS:
+                continue
+        elif arguments:
+            continue
+        if not _is_date_column(qualifier, column, columns, aliases):
+            continue
+
+        operator = tokens[close + 1] if close + 1 < len(tokens) else None
+        if operator is None:
+            continue
+        if operator.type == OP and operator.value in _PERIOD_CONDITIONS:
+            end = close + 2
+            period = _period(token.upper, date_format, tokens[end] if end < len(tokens) else None)
+            if period is None:
+                continue
+            bounds = {"start": period[0], "end": period[1]}
+            conditions = [(op, bounds[bound]) for op, bound in _PERIOD_CONDITIONS[operator.value]]
+        elif operator.is_keyword("BETWEEN"):
+            end = close + 4
+            if end >= len(tokens) or not tokens[close + 3].is_keyword("AND"):
+                continue
+            low = _period(token.upper, date_format, tokens[close + 2])
+            high = _period(token.upper, date_format, tokens[end])
+            if low is None or high is None:
+                continue
+            conditions = [(">=", low[0]), ("<", high[1])]
+        else:
+            continue
+        if not _predicate_ends(tokens, end + 1):
+            continue
+
+        column_text = _text(sql, tokens, index + 2, last)
+        replacement = " AND ".join(f"{column_text} {op} '{value.isoformat()}'" for op, value in conditions)
+        if len(conditions) > 1:
+            replacement = f"({replacement})"
+        return index, end, replacement
+    return None
+
+
+def _where_conjunct(tokens, start: int, end: int) -> bool:
+    """
+    tokens[start:end + 1] 是否为 WHERE 子句的顶层 AND 条件之一
+
+    这样的条件结果为 NULL 和 FALSE 时效果相同（都过滤掉这一行），EXISTS 与 IN 在 NULL 上的差别不影响结果
+    """
+    previous = tokens[start - 1] if start > 0 else None
+    if previous is None or not (previous.is_keyword("WHERE", "AND") or (previous.type == OP and previous.value == "&&")):
+        return False
+    if end + 1 < len(tokens):
+        following = tokens[end + 1]
+        if not (_is_punct(following, ")", ";") or following.is_keyword("AND", *_CLAUSE_ENDS) or
+                (following.type == OP and following.value == "&&")):
+            return False
+
+    def connective(token) -> bool:
+        return token.is_keyword("OR", "XOR") or (token.type == OP and token.value == "||")
+
+    # 向前到同一层的 WHERE，向后到子句结束，同一层不能有 OR/XOR
+    depth = 0
+    position = start - 1
+    while True:
+        if position < 0:
+            return False
+        token = tokens[position]
+        if _is_punct(token, ")"):
+            depth += 1
+        elif _is_punct(token, "("):
+            if depth == 0:
+                return False
+            depth -= 1
+        elif depth == 0:
+            if token.is_keyword("WHERE"):
+                break
+            if connective(token) or token.is_keyword("ON", "HAVING", "SELECT"):
+                return False
+        position -= 1
+    depth = 0
+    for token in tokens[end + 1:]:
+        if _is_punct(token, "("):
+            depth += 1
+        elif _is_punct(token, ")"):
+            if depth == 0:
+                break
+            depth -= 1
+        elif depth == 0:
+            if token.is_keyword(*_CLAUSE_ENDS) or _is_punct(token, ";"):
+                break
+            if connective(token):
+                return False
+    return True
+
+
+def _simple_subquery(tokens, start: int, end: int,
+                     columns: Dict[str, Dict[str, Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    解析 tokens[start:end] 中形如 SELECT ... FROM 表 [别名] [WHERE 条件] 的单表子查询
+
+    Returns:
+        {"select": (起, 止), "from": (起, 止), "name": 子查询中引用这个表的名称（小写）,
+         "columns": 表的列名集合, "conjuncts": [(起, 止)]}，不是这样的子查询或表结构未知时返回 None
+    """
+    if start >= end or not tokens[start].is_keyword("SELECT"):
+        return None
+    if any(token.is_keyword(*_SUBQUERY_UNSUPPORTED) for token in tokens[start + 1:end]):
+        return None
+    from_index = next((i for i in range(start + 1, end) if tokens[i].is_keyword("FROM")), -1)
+    if from_index <= start + 1 or from_index + 1 >= end or not _is_name(tokens[from_index + 1]):
+        return None
+    table = identifier_name(tokens[from_index + 1]).lower()
+    if table not in columns:
+        return None
+    name = table
+    position = from_index + 2
+    if position < end and tokens[position].is_keyword("AS"):
+        position += 1
+    if position < end and _is_name(tokens[position]):
+        name = identifier_name(tokens[position]).lower()
+        position += 1
+    from_end = position - 1
+
+    conjuncts: List[Tuple[int, int]] = []
+    if position < end:
+        if not tokens[position].is_keyword("WHERE") or position + 1 >= end:
+            return None
+        depth = 0
+        between = False
+        conjunct_start = position + 1
+        for index in range(position + 1, end):
+            token = tokens[index]
+            if _is_punct(token, "("):
+                depth += 1
+            elif _is_punct(token, ")"):
+                depth -= 1
+            elif depth == 0:
+                if token.is_keyword("OR", "XOR") or (token.type == OP and token.value == "||"):
+                    return None
+                if token.is_keyword("BETWEEN"):
+                    between = True
+                elif token.is_keyword("AND") or (token.type == OP and token.value == "&&"):
+                    if between:
+                        between = False
+                        continue
+                    if index == conjunct_start:
+                        return None
+                    conjuncts.append((conjunct_start, index - 1))
+                    conjunct_start = index + 1
+        if conjunct_start >= end:
+            return None
+        conjuncts.append((conjunct_start, end - 1))
+    return {"select": (start + 1, from_index - 1), "from": (from_index + 1, from_end), "name": name,
+            "columns": set(columns[table]), "conjuncts": conjuncts}
+
+
+def _scope(reference: Tuple[Optional[str], str, int], subquery: Dict[str, Any]) -> Optional[str]:
+    """列引用属于子查询的表（inner）还是外层查询（outer），无法确定时返回 None"""
+    qualifier, column, _ = reference
+    if qualifier is None:
+        return "inner" if column in subquery["columns"] else None
+    if qualifier == subquery["name"]:
+        return "inner" if column in subquery["columns"] else None
+    return "outer"
+
+
+def _only_inner(tokens, start: int, end: int, subquery: Dict[str, Any]) -> bool:
+    """tokens[start:end + 1] 中的列引用是否都属于子查询的表"""
+    position = start
+    while position <= end:
+        reference = _column_ref(tokens, position)
+        if reference is not None:
+            if _scope(reference, subquery) != "inner":
+                return False
+            position = reference[2] + 1
+            continue
+        token = tokens[position]
+        # 关键字以外的标识符只能是函数名
+        if _is_name(token) and not _is_punct(
+                tokens[position + 1] if position + 1 < len(tokens) else None, "("):
+            return False
+        position += 1
+    return True
+
+
+def _correlation(sql: str, tokens, subquery: Dict[str, Any]) -> Optional[Tuple[List[Tuple[str, str]], List[str]]]:
+    """
+    拆分子查询的条件
+
+    Returns:
+        ([(子查询的列, 外层的列)], [其余只引用子查询的表的条件])，有其他引用外层的条件时返回 None
+    """
+    pairs: List[Tuple[str, str]] = []
+    rest: List[str] = []
+    for start, end in subquery["conjuncts"]:
+        left = _column_ref(tokens, start)
+        if left is not None and left[2] + 1 < end and tokens[left[2] + 1].type == OP and \
+                tokens[left[2] + 1].value == "=":
+            right = _column_ref(tokens, left[2] + 2)
+            if right is not None and right[2] == end:
+                scopes = (_scope(left, subquery), _scope(right, subquery))
+                left_text = _text(sql, tokens, start, left[2])
+                right_text = _text(sql, tokens, left[2] + 2, end)
+                if scopes == ("inner", "outer"):
+                    pairs.append((left_text, right_text))
+                    continue
+                if scopes == ("outer", "inner"):
+                    pairs.append((right_text, left_text))
+                    continue
+        if not _only_inner(tokens, start, end, subquery):
+            return None
+        rest.append(_text(sql, tokens, start, end))
+    return pairs, rest
+
+
+def _semijoin(sql: str, tokens, subquery: Dict[str, Any], outer: List[str], inner: List[str],
+              rest: List[str]) -> str:
+    left = outer[0] if len(outer) == 1 else f"({', '.join(outer)})"
+    where = f" WHERE {' AND '.join(rest)}" if rest else ""
+    from_text = _text(sql, tokens, *subquery["from"])
+    return f"{left} IN (SELECT {', '.join(inner)} FROM {from_text}{where})"
+
+
+def _exists_to_in(sql: str, tokens, columns: Dict[str, Dict[str, Dict[str, Any]]],
+                  aliases: Dict[str, str]) -> Optional[Tuple[int, int, str]]:
+    """EXISTS (SELECT ... FROM t WHERE t.k = o.k AND p) -> o.k IN (SELECT t.k FROM t WHERE p)"""
+    for index, token in enumerate(tokens):
+        if not token.is_keyword("EXISTS") or index + 1 >= len(tokens) or not _is_punct(tokens[index + 1], "("):
+            continue
+        close = _closing(tokens, index + 1)
+        if close < 0 or not _where_conjunct(tokens, index, close):
+            continue
+        subquery = _simple_subquery(tokens, index + 2, close, columns)
+        if subquery is None:
+            continue
+        # 子查询的选择列表中有聚合函数时 EXISTS 总是为真
+        select_start, select_end = subquery["select"]
+        if any(_is_punct(t, "(") for t in tokens[select_start:select_end + 1]):
+            continue
+        split = _correlation(sql, tokens, subquery)
+        if split is None or not split[0]:
+            continue
+        pairs, rest = split
+        replacement = _semijoin(sql, tokens, subquery, [outer for _, outer in pairs],
+                                [inner for inner, _ in pairs], rest)
+        return index, close, replacement
+    return None
+
+
+def _decorrelate_in(sql: str, tokens, columns: Dict[str, Dict[str, Dict[str, Any]]],
+                    aliases: Dict[str, str]) -> Optional[Tuple[int, int, str]]:
+    """x IN (SELECT t.c FROM t WHERE t.k = o.k AND p) -> (x, o.k) IN (SELECT t.c, t.k FROM t WHERE p)"""
+    for index, token in enumerate(tokens):
+        if not token.is_keyword("IN") or index + 2 >= len(tokens) or not _is_punct(tokens[index + 1], "(") or \
+                not tokens[index + 2].is_keyword("SELECT") or index == 0:
+            continue
+        start = index - 3 if index >= 3 and _is_punct(tokens[index - 2], ".") else index - 1
+        reference = _column_ref(tokens, start)
+        if reference is None or reference[2] != index - 1:
+            continue
+        close = _closing(tokens, index + 1)
+        if close < 0 or not _where_conjunct(tokens, start, close):
+            continue
+        subquery = _simple_subquery(tokens, index + 2, close, columns)
+        if subquery is None:
+            continue
+        select_start, select_end = subquery["select"]
+        selected = _column_ref(tokens, select_start)
+        if selected is None or selected[2] != select_end or _scope(selected, subquery) != "inner":
+            continue
+        split = _correlation(sql, tokens, subquery)
+        if split is None or not split[0]:
+            continue
+        pairs, rest = split
+        replacement = _semijoin(sql, tokens, subquery,
+                                [_text(sql, tokens, start, index - 1)] + [outer for _, outer in pairs],
+                                [_text(sql, tokens, select_start, select_end)] + [inner for inner, _ in pairs],
+                                rest)
+        return start, close, replacement
+    return None
+
+
+def _derived_columns(sql: str, tokens, columns: Dict[str, Dict[str, Dict[str, Any]]],
+                     aliases: Dict[str, str]) -> Optional[Tuple[int, int, str]]:
+    """FROM (SELECT * FROM t WHERE ...) d -> FROM (SELECT 外层用到的列 FROM t WHERE ...) d"""
+    for index, token in enumerate(tokens):
+        if not _is_punct(token, "(") or index + 4 >= len(tokens) or not tokens[index + 1].is_keyword("SELECT") or \
+                not (tokens[index + 2].type == OP and tokens[index + 2].value == "*") or \
+                not tokens[index + 3].is_keyword("FROM"):
+            continue
+        previous = tokens[index - 1] if index > 0 else None
+        if previous is None or not (previous.is_keyword("FROM", "JOIN") or _is_punct(previous, ",")):
+            continue
+        close = _closing(tokens, index)
+        if close < 0 or not _is_name(tokens[index + 4]):
+            continue
+        table = identifier_name(tokens[index + 4]).lower()
+        inner = tokens[index + 5:close]
+        if table not in columns or any(t.is_keyword(*_DERIVED_UNSUPPORTED) for t in inner) or \
+                any(_is_punct(t, ",") for t in inner[:3]):
+            continue
+
+        outer = tokens[:index] + tokens[close + 1:]
+        if any(t.is_keyword("NATURAL", "USING") for t in outer):
+            continue
+        # 外层的 * 和 别名.* 需要派生表的所有列（COUNT(*) 之类的函数参数除外）
+        stars = False
+        for position, t in enumerate(outer):
+            if t.type == OP and t.value == "*" and position > 0 and \
+                    (outer[position - 1].is_keyword("SELECT", "DISTINCT", "ALL") or
+                     _is_punct(outer[position - 1], ",", ".")):
+                stars = True
+                break
+        if stars:
+            continue
+        names: Set[str] = {identifier_name(t).lower() for t in outer if t.type in (IDENT, QUOTED)}
+        keep = [column["name"] for name, column in columns[table].items() if name in names]
+        if len(keep) == len(columns[table]):
+            continue
+        replacement = ", ".join(_quote(name) for name in keep) if keep else "1"
+        return index + 2, index + 2, replacement
+    return None
+
+
+# 按顺序尝试的改写规则
+_RULES = (
+    ("date_range", _date_range),
+    ("exists_to_in", _exists_to_in),
+    ("decorrelate_in", _decorrelate_in),
+    ("derived_columns", _derived_columns),
+)
+
+
+def rewrite_notes(sql: str) -> List[str]:
+    """没有等价改写的低效写法"""
+    tokens = significant(tokenize(sql))
+    notes = []
+    if len(tokens) > 1 and tokens[0].is_keyword("SELECT") and tokens[1].type == OP and tokens[1].value == "*":
+        notes.append("SELECT * 返回表的所有列，只需要部分列时应在问题中说明")
+    for index, token in enumerate(tokens[2:], start=2):
+        if token.is_keyword("RAND") and tokens[index - 1].is_keyword("BY") and tokens[index - 2].is_keyword("ORDER"):
+            notes.append("ORDER BY RAND() 需要为每一行生成随机数并对整个结果排序，大表上很慢；"
+                         "可以改为按主键范围随机取样")
+            break
+    return notes
+
+
+def rewrite_sql(sql: str, table_info: Optional[List[Dict[str, Any]]] = None,
+                max_rewrites: int = 20) -> Dict[str, Any]:
+    """
+    对单条SELECT做等价改写
+
+    Args:
+        sql: SQL文本
+        table_info: 表结构信息（列类型用于判断日期列，列名用于判断子查询中的列属于哪个表），
+            没有表结构时只做不依赖表结构的改写
+        max_rewrites: 最多改写的次数
+
+    Returns:
+        {"sql": 改写后的SQL, "rewrites": [{"rule", "before", "after"}], "notes": 没有等价改写的低效写法}
+    """
+    rewrites: List[Dict[str, str]] = []
+    if not is_select(sql) or len(split_statements(sql)) != 1:
+        return {"sql": sql, "rewrites": rewrites, "notes": []}
+    columns = _schema_columns(table_info or [])
+    while len(rewrites) < max_rewrites:
+        tokens = significant(tokenize(sql))
+        aliases = table_aliases(sql)
+        for rule, function in _RULES:
+            match = function(sql, tokens, columns, aliases)
+            if match is not None:
+                break
+        else:
+            break
+        start, end, replacement = match
+        rewrites.append({"rule": rule, "before": _text(sql, tokens, start, end), "after": replacement})
+        sql = sql[:tokens[start].pos] + replacement + sql[tokens[end].pos + len(tokens[end].value):]
+    return {"sql": sql, "rewrites": rewrites, "notes": rewrite_notes(sql)}
+
+
+def plan_rows(result_text: Optional[str]) -> float:
+    """
+    根据 EXPLAIN 的结果估算查询检查的行数
+
+    同一个 SELECT 中的表按连接顺序累乘（前面的表过滤后的行数 × 这个表的扫描行数），
+    依赖子查询（DEPENDENT SUBQUERY）再乘以外层查询的行数
+
+    Raises:
+        RuntimeError: EXPLAIN 的结果无法解析
+    """
+    try:
+        rows = loads(result_text or "")
+    except ValueError:
+        raise RuntimeError(result_text or "EXPLAIN 未返回结果")
+    if not isinstance(rows, list):
+        raise RuntimeError(result_text)
+    total = 0.0
+    produced: Dict[Any, float] = {}
+    outer_id = rows[0].get("id") if rows else None
+    for row in rows:
+        select_id = row.get("id")
+        count = float(row.get("rows") or 0)
+        filtered = float(row.get("filtered") or 100) / 100
+        before = produced.get(select_id, 1.0)
+        examined = before * count
+        if "DEPENDENT" in str(row.get("select_type") or "").upper():
+            examined *= produced.get(outer_id, 1.0)
+        total += examined
+        produced[select_id] = before * max(count * filtered, 1.0)
+    return total
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL词法工具模块
+
+轻量的MySQL词法分析，用于判断语句类型、拆分多条语句和定位顶层子句，
+不依赖数据库，也不做完整的语法分析
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+# 词法单元类型
+WS = "ws"
+COMMENT = "comment"
+STRING = "string"
+IDENT = "ident"          # 普通标识符或关键字
+QUOTED = "quoted"        # 反引号标识符
+NUMBER = "number"
+PARAM = "param"          # ? 占位符
+OP = "op"
+PUNCT = "punct"          # ( ) , ; .
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^'\\]|\\.|'')*(?:'|\Z)|"(?:[^"\\]|\\.|"")*(?:"|\Z))
+  | (?P<quoted>`(?:[^`]|``)*(?:`|\Z))
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+)
+  | (?P<ident>[A-Za-z_\u0080-\uffff][A-Za-z0-9_$\u0080-\uffff]*|@@?[A-Za-z0-9_.$]+)
+  | (?P<param>\?)
+  | (?P<punct>[(),;.])
+  | (?P<op><=>|<=|>=|<>|!=|:=|\|\||&&|<<|>>|[-+*/%=<>!~^&|])
+""", re.VERBOSE | re.DOTALL)
+
+
+class Token:
+    """词法单元"""
+
+    __slots__ = ("type", "value", "pos")
+
+    def __init__(self, token_type: str, value: str, pos: int):
+        self.type = token_type
+        self.value = value
+        self.pos = pos
+
+    @property
+    def upper(self) -> str:
+        return self.value.upper()
+
+    def is_keyword(self, *keywords: str) -> bool:
+        return self.type == IDENT and self.value.upper() in keywords
+
+    def __repr__(self):
+        return f"Token({self.type}, {self.value!r})"
+
+
+def tokenize(sql: str) -> List[Token]:
+    """
+    将SQL拆分为词法单元
+
+    Args:
+        sql: SQL文本
+
+    Returns:
+        词法单元列表（包含空白和注释），无法识别的字符作为 op 返回
+    """
+    tokens = []
+    pos = 0
+    length = len(sql)
+    while pos < length:
+        match = _TOKEN_RE.match(sql, pos)
+        if match is None:
+            tokens.append(Token(OP, sql[pos], pos))
+            pos += 1
+            continue
+        tokens.append(Token(match.lastgroup, match.group(), pos))
+        pos = match.end()
+    return tokens
+
+
+def significant(tokens: List[Token]) -> List[Token]:
+    """去掉空白和注释"""
+    return [t for t in tokens if t.type not in (WS, COMMENT)]
+
+
+def identifier_name(token: Token) -> str:
+    """标识符名称（去掉反引号）"""
+    if token.type == QUOTED:
+        return token.value[1:-1].replace("``", "`")
+    return token.value
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    按顶层分号拆分多条语句
+
+    Returns:
+        去掉首尾空白和结尾分号后的非空语句列表
+    """
+    statements = []
+    start = 0
+    for token in tokenize(sql):
+        if token.type == PUNCT and token.value == ";":
+            statements.append(sql[start:token.pos])
+            start = token.pos + 1
+    statements.append(sql[start:])
+    result = []
+    for statement in statements:
+        if significant(tokenize(statement)):
+            result.append(statement.strip())
+    return result
+
+
+def statement_type(sql: str) -> Optional[str]:
+    """
+    语句类型（第一个关键字的大写形式）
+
+    以 WITH 或括号开头的查询返回 SELECT
+    """
+    tokens = significant(tokenize(sql))
+    for token in tokens:
+        if token.type == PUNCT and token.value == "(":
+            continue
+        if token.type != IDENT:
+            return None
+        keyword = token.upper
+        if keyword == "WITH":
+            return "SELECT"
+        return keyword
+    return None
+
+
+def is_select(sql: str) -> bool:
+    """是否为只读查询（SELECT/WITH ... SELECT）"""
+    return statement_type(sql) == "SELECT"
+
+
+def top_level(tokens: List[Token]) -> List[Tuple[Token, int]]:
+    """
+    计算每个词法单元所在的括号深度
+
+    Returns:
+        (词法单元, 深度) 列表
+    """
+    result = []
+    depth = 0
+    for token in tokens:
+        if token.type == PUNCT and token.value == ")":
+            depth -= 1
+        result.append((token, depth))
+        if token.type == PUNCT and token.value == "(":
+            depth += 1
+    return result
+
+
+def find_keyword(tokens: List[Token], keyword: str, start: int = 0, depth: int = 0) -> int:
+    """
+    在指定括号深度查找关键字
+
+    Args:
+        tokens: 去掉空白和注释的词法单元
+        keyword: 关键字（大写），可以是两个词，如 "GROUP BY"
+        start: 起始位置
+        depth: 括号深度
+
+    Returns:
+        关键字第一个词的下标，找不到时返回 -1
+    """
+    words = keyword.split()
+    current = 0
+    for index, token in enumerate(tokens):
+        if token.type == PUNCT and token.value == ")":
+            current -= 1
+        if index >= start and current == depth and token.is_keyword(words[0]):
+            following = tokens[index + 1:index + len(words)]
+            if len(following) == len(words) - 1 and all(
+                    t.is_keyword(w) for t, w in zip(following, words[1:])):
+                return index
+        if token.type == PUNCT and token.value == "(":
+            current += 1
+    return -1
+
+
+def add_execution_time_hint(sql: str, milliseconds: int) -> str:
+    """
+    在以 SELECT 开头的查询中加入 MAX_EXECUTION_TIME 优化器提示，由MySQL服务端限制执行时间
+
+    以 WITH 或括号开头、已有该提示的查询原样返回（MySQL只识别紧跟在第一个 SELECT 之后的提示）
+    """
+    if milliseconds <= 0 or "MAX_EXECUTION_TIME" in sql.upper():
+        return sql
+    tokens = significant(tokenize(sql))
+    if not tokens or not tokens[0].is_keyword("SELECT"):
+        return sql
+    end = tokens[0].pos + len(tokens[0].value)
+    return f"{sql[:end]} /*+ MAX_EXECUTION_TIME({int(milliseconds)}) */{sql[end:]}"
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL校验模块
+
+在本地检查LLM生成的SQL：清理Markdown标记、拆分多条语句、检查基本语法
+（括号、引号、截断）以及引用的表和列是否存在于表结构中，
+并生成用于缓存键的规范化SQL，不需要连接数据库
+"""
+
+import re
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from sql_utils import (COMMENT, IDENT, NUMBER, OP, PUNCT, QUOTED, STRING,
+                       identifier_name, significant, split_statements, tokenize)
+
+# 允许的语句类型
+STATEMENT_TYPES = ("SELECT", "WITH", "INSERT", "REPLACE", "UPDATE", "DELETE", "SHOW", "DESCRIBE",
+                   "DESC", "EXPLAIN")
+
+# 关键字和不带括号使用的内置函数/常量，不会被当作列名
+KEYWORDS = frozenset("""
+    ACCESSIBLE ADD ALL ALTER ANALYZE AND ANY AS ASC ASENSITIVE BEFORE BETWEEN BIGINT BINARY BLOB BOTH BY
+    CALL CASCADE CASE CHANGE CHAR CHARACTER CHECK COLLATE COLUMN CONDITION CONSTRAINT CONTINUE CONVERT
+    CREATE CROSS CUBE CURRENT_DATE CURRENT_TIME CURRENT_TIMESTAMP CURRENT_USER CURSOR DATABASE DATABASES
+    DATE DATETIME DAY DAY_HOUR DAY_MICROSECOND DAY_MINUTE DAY_SECOND DEC DECIMAL DECLARE DEFAULT DELAYED
+    DELETE DESC DESCRIBE DETERMINISTIC DISTINCT DISTINCTROW DIV DOUBLE DROP DUAL DUPLICATE EACH ELSE ELSEIF
+    END ESCAPE ESCAPED EXCEPT EXISTS EXIT EXPLAIN FALSE FETCH FIRST FLOAT FOLLOWING FOR FORCE FOREIGN FROM
+    FULL FULLTEXT GROUP HAVING HIGH_PRIORITY HOUR HOUR_MICROSECOND HOUR_MINUTE HOUR_SECOND IF IGNORE IN
+    INDEX INNER INSERT INT INTEGER INTERSECT INTERVAL INTO IS JOIN JSON KEY KEYS KILL LAST LATERAL LEADING
+    LEFT LIKE LIMIT LINES LOCALTIME LOCALTIMESTAMP LOCK LONG LOW_PRIORITY MATCH MEMBER MICROSECOND MINUTE
+    MINUTE_MICROSECOND MINUTE_SECOND MOD MODE MONTH NATURAL NEXT NOT NULL NULLS NUMERIC OF OFFSET ON ONLY
+    OPTIMIZE OPTION OR ORDER OUTER OVER PARTITION PRECEDING PRIMARY QUARTER RANGE READ RECURSIVE REFERENCES
+    REGEXP RENAME REPLACE RESTRICT RIGHT RLIKE ROLLUP ROW ROWS SCHEMA SECOND SECOND_MICROSECOND SELECT SEPARATOR
+    SET SHARE SHOW SIGNED SOME SQL_BIG_RESULT SQL_CALC_FOUND_ROWS SQL_NO_CACHE SQL_SMALL_RESULT STRAIGHT_JOIN
+    TABLE TABLES TEMPORARY TEXT THEN TIME TIMESTAMP TO TRAILING TRUE UNBOUNDED UNION UNIQUE UNKNOWN UNSIGNED
+    UPDATE USE USING UTC_DATE UTC_TIME UTC_TIMESTAMP VALUE VALUES VARCHAR WEEK WHEN WHERE WINDOW WITH XOR
+    YEAR YEAR_MONTH ZEROFILL
+""".split())
+
+# 语句不能以这些关键字或符号结尾（通常是输出被截断）
+_INCOMPLETE_ENDINGS = frozenset(("SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "BY", "JOIN", "ON", "SET",
+                                 "VALUES", "HAVING", "LIMIT", "AS", "IN", "LIKE", "BETWEEN", "CASE", "WHEN",
+                                 "THEN", "ELSE", "INTO", "UNION", "DISTINCT", "OFFSET", "USING"))
+
+# 表名出现在这些关键字之后
+_TABLE_KEYWORDS = ("FROM", "JOIN", "UPDATE", "INTO", "TABLE", "DESCRIBE", "DESC")
+
+_FENCE_RE = re.compile(r"```[A-Za-z]*")
+
+
+class ValidationResult:
+    """SQL校验结果"""
+
+    def __init__(self, sql: str, statements: List[str], errors: List[str]):
+        self.sql = sql
+        self.statements = statements
+        self.errors = errors
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "valid": self.valid,
+            "statements": self.statements,
+            "errors": self.errors
+        }
+
+
+def clean_sql(text: str) -> str:
+    """
+    清理LLM输出中的SQL
+
+    去掉Markdown代码块标记、开头的 "SQL:" 和结尾的分号
+    """
+    text = _FENCE_RE.sub("", text or "").strip()
+    if text[:4].upper() == "SQL:":
+        text = text[4:].strip()
+    return text.rstrip("; \t\r\n")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    规范化SQL（用于缓存键）
+
+    去掉注释和多余空白、关键字转为大写、去掉结尾分号，
+    字符串常量和标识符保持原样
+    """
+    parts = []
+    previous = None
+    for token in significant(tokenize(sql)):
+        value = token.upper if token.type == IDENT and token.upper in KEYWORDS else token.value
+        attach = (token.type == PUNCT and token.value in (",", ")", ".", ";")) or \
+            (previous is not None and previous.type == PUNCT and previous.value in ("(", ".")) or \
+            (token.type == PUNCT and token.value == "(" and previous is not None and
+             previous.type == IDENT and previous.upper not in KEYWORDS)
+        parts.append(value if attach or not parts else " " + value)
+        previous = token
+    return "".join(parts).rstrip(";").strip()
+
+
+def _check_syntax(sql: str) -> List[str]:
+    """检查单条语句的基本语法"""
+    errors = []
+    tokens = significant(tokenize(sql))
+    if not tokens:
+        return ["SQL为空"]
+
+    for token in tokens:
+        if token.type == STRING and (len(token.value) < 2 or token.value[-1] != token.value[0]):
+            errors.append("字符串常量没有结束引号")
+        elif token.type == QUOTED and (len(token.value) < 2 or not token.value.endswith("`")):
+            errors.append("标识符没有结束的反引号")
+    for token in tokenize(sql):
+        if token.type == COMMENT and token.value.startswith("/*") and not token.value.endswith("*/"):
+            errors.append("注释没有结束")
+
+    depth = 0
+    for token in tokens:
+        if token.type == PUNCT and token.value == "(":
+            depth += 1
+        elif token.type == PUNCT and token.value == ")":
+            depth -= 1
+            if depth < 0:
+                errors.append("多余的右括号")
+                break
+    if depth > 0:
+        errors.append("括号不匹配，缺少右括号")
+
+    first = next((t for t in tokens if not (t.type == PUNCT and t.value == "(")), tokens[0])
+    if first.type != IDENT or first.upper not in STATEMENT_TYPES:
+        errors.append(f"不支持的语句开头: {first.value}")
+
+    last = tokens[-1]
+    if last.type == OP or (last.type == PUNCT and last.value in (",", ".", "(")) or \
+            (last.type == IDENT and last.upper in _INCOMPLETE_ENDINGS):
+        errors.append(f"语句不完整，以 {last.value} 结尾")
+    return errors
+
+
+def _schema_index(table_info: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
+    """表名（小写） -> 列名集合（小写）"""
+    return {table["name"].lower(): {column["name"].lower() for column in table.get("columns", [])}
+            for table in table_info}
+
+
+def _cte_names(tokens) -> Set[str]:
+    """WITH 定义的公用表表达式名称（小写）"""
+    ctes = set()
+    for index, token in enumerate(tokens[:-1]):
+        if token.type in (IDENT, QUOTED) and tokens[index + 1].is_keyword("AS") and \
+                index + 2 < len(tokens) and tokens[index + 2].type == PUNCT and tokens[index + 2].value == "(":
+            ctes.add(identifier_name(token).lower())
+    return ctes
+
+
+def _query_levels(tokens) -> List[bool]:
+    """
+    每个词法单元是否位于语句本身或子查询的子句层级
+
+    子查询（括号内以 SELECT/WITH 开头）的括号内是查询层级；函数参数、表达式和值列表的括号内不是，
+    其中的 FROM 等关键字（如 EXTRACT(YEAR FROM col)、TRIM(LEADING 'x' FROM col)）不引出表名
+    """
+    levels = []
+    stack = [True]
+    for index, token in enumerate(tokens):
+        if token.type == PUNCT and token.value == ")" and len(stack) > 1:
+            stack.pop()
+        levels.append(stack[-1])
+        if token.type == PUNCT and token.value == "(":
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+            stack.append(following is not None and (following.is_keyword("SELECT", "WITH") or
+                                                    (following.type == PUNCT and following.value == "(")))
+    return levels
+
+
+def _table_references(tokens) -> Tuple[List[Tuple[str, Optional[str]]], bool]:
+    """
+    查找 FROM/JOIN/UPDATE/INTO 等关键字之后的表引用（只在查询层级查找，见 _query_levels）
+
+    Returns:
+        ([(表名, 别名)], 是否包含派生表)
+    """
+    references = []
+    derived = False
+    levels = _query_levels(tokens)
+    for index, token in enumerate(tokens):
+        if not token.is_keyword(*_TABLE_KEYWORDS) or index + 1 >= len(tokens) or not levels[index]:
+            continue
+        # INSERT ... ON DUPLICATE KEY UPDATE 之后是列的赋值
+        if token.is_keyword("UPDATE") and index >= 2 and tokens[index - 1].is_keyword("KEY") and \
+                tokens[index - 2].is_keyword("DUPLICATE"):
+            continue
+        # SELECT ... INTO @变量 / OUTFILE / DUMPFILE 的目标不是表
+        if token.is_keyword("INTO") and (tokens[index + 1].value.startswith("@") or
+                                         tokens[index + 1].is_keyword("OUTFILE", "DUMPFILE")):
+            continue
+        position = index + 1
+        while True:
+            target = tokens[position]
+            if target.type == PUNCT and target.value == "(":
+                derived = True
+                break
+            if target.type not in (IDENT, QUOTED) or (target.type == IDENT and target.upper in KEYWORDS):
+                break
+            name = identifier_name(target)
+            # 跳过 数据库名.表名 中的数据库名
+            if position + 2 < len(tokens) and tokens[position + 1].type == PUNCT and \
+                    tokens[position + 1].value == "." and tokens[position + 2].type in (IDENT, QUOTED):
+                position += 2
+                name = identifier_name(tokens[position])
+            # 别名
+            alias = None
+            alias_position = position + 1
+            if alias_position < len(tokens) and tokens[alias_position].is_keyword("AS"):
+                alias_position += 1
+            if alias_position < len(tokens) and tokens[alias_position].type in (IDENT, QUOTED) and \
+                    not (tokens[alias_position].type == IDENT and tokens[alias_position].upper in KEYWORDS):
+                alias = identifier_name(tokens[alias_position])
+                position = alias_position
+            references.append((name, alias))
+            # FROM a, b 的后续表
+            if position + 2 < len(tokens) and tokens[position + 1].type == PUNCT and \
+                    tokens[position + 1].value == "," and token.is_keyword("FROM"):
+                position += 2
+                continue
+            break
+    return references, derived
+
+
+def referenced_tables(sql: str) -> List[str]:
+    """
+    语句引用的表名（小写，不含公用表表达式），用于按表失效缓存
+
+    Args:
+        sql: SQL文本（可以包含多条语句）
+
+    Returns:
+        按出现顺序去重的表名列表
+    """
+    tables = []
+    for statement in split_statements(sql):
+        tokens = significant(tokenize(statement))
+        ctes = _cte_names(tokens)
+        references, _ = _table_references(tokens)
+        for name, _ in references:
+            table = name.lower()
+            if table not in ctes and table not in tables:
+                tables.append(table)
+    return tables
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """
+    单条语句中的表引用，用于把 别名.列名 对应到表
+
+    Returns:
+        别名（或没有别名时的表名，小写） -> 表名（小写），不含公用表表达式和派生表
+    """
+    tokens = significant(tokenize(sql))
+    ctes = _cte_names(tokens)
+    references, _ = _table_references(tokens)
+    aliases = {}
+    for name, alias in references:
+        table = name.lower()
+        if table in ctes:
+            continue
+        aliases[table] = table
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _check_schema(sql: str, schema: Dict[str, Set[str]]) -> List[str]:
+    """检查语句引用的表和列是否存在"""
+    errors = []
+    tokens = significant(tokenize(sql))
+    all_columns = set().union(*schema.values()) if schema else set()
+    ctes = _cte_names(tokens)
+    references, derived = _table_references(tokens)
+    derived = derived or bool(ctes)
+
+    # 别名 -> 表名（派生表和公用表表达式为 None）
+    aliases: Dict[str, Optional[str]] = {}
+    for name, alias in references:
+        table = name.lower()
+        if table in ctes:
+            aliases[table] = None
+        elif table not in schema:
+            error = f"表不存在: {name}"
+            if error not in errors:
+                errors.append(error)
+            aliases[table] = None
+        else:
+            aliases[table] = table
+        if alias:
+            aliases[alias.lower()] = aliases[table]
+
+    # 派生表的别名（FROM (SELECT ...) AS x）
+    for index, token in enumerate(tokens[:-1]):
+        if token.type == PUNCT and token.value == ")":
+            following = tokens[index + 1]
+            if following.is_keyword("AS") and index + 2 < len(tokens):
+                following = tokens[index + 2]
+            if following.type in (IDENT, QUOTED) and identifier_name(following).lower() not in aliases:
+                aliases[identifier_name(following).lower()] = None
+
+    # 带限定符的列：别名.列名
+    for index in range(len(tokens) - 2):
+        qualifier, dot, column = tokens[index], tokens[index + 1], tokens[index + 2]
+        if not (qualifier.type in (IDENT, QUOTED) and dot.type == PUNCT and dot.value == "." and
+                column.type in (IDENT, QUOTED)):
+            continue
+        if index > 0 and tokens[index - 1].type == PUNCT and tokens[index - 1].value == ".":
+            continue
+        table = aliases.get(identifier_name(qualifier).lower())
+        if table is None:
+            continue
+        name = identifier_name(column)
+        if name != "*" and name.lower() not in schema[table]:
+            errors.append(f"列不存在: {identifier_name(qualifier)}.{name}")
+
+    # 不带限定符的列：只在所有表都来自表结构时检查，排除函数名和别名
+    if derived or not aliases:
+        return errors
+    defined = set(aliases)
+    for index, token in enumerate(tokens[1:], 1):
+        previous = tokens[index - 1]
+        if token.type not in (IDENT, QUOTED):
+            continue
+        if previous.is_keyword("AS") or previous.type in (NUMBER, STRING) or \
+                (previous.type == PUNCT and previous.value == ")") or \
+                (previous.type in (IDENT, QUOTED) and not (previous.type == IDENT and previous.upper in KEYWORDS)):
+            defined.add(identifier_name(token).lower())
+
+    for index, token in enumerate(tokens):
+        if token.type not in (IDENT, QUOTED) or (token.type == IDENT and token.upper in KEYWORDS):
+            continue
+        if token.value.startswith("@"):
+            continue
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        previous = tokens[index - 1] if index > 0 else None
+        if following is not None and following.type == PUNCT and following.value in ("(", "."):
+            continue
+        if previous is not None and previous.type == PUNCT and previous.value == ".":
+            continue
+        # 排序规则和字符集名称：COLLATE utf8mb4_bin、CHARACTER SET utf8mb4、CONVERT(x USING utf8mb4)
+        if previous is not None and (previous.is_keyword("COLLATE", "CHARSET", "USING") or
+                                     (previous.is_keyword("SET") and index >= 2 and
+                                      tokens[index - 2].is_keyword("CHARACTER", "CHAR"))):
+            continue
+        name = identifier_name(token).lower()
+        if name in defined or name in all_columns or name in schema:
+            continue
+        errors.append(f"列不存在: {identifier_name(token)}")
+    return errors
+
+
+def validate_sql(sql: str, table_info: Optional[List[Dict[str, Any]]] = None,
+                 allow_multiple: bool = False) -> ValidationResult:
+    """
+    校验SQL
+
+    Args:
+        sql: LLM生成的SQL（可以包含Markdown代码块标记）
+        table_info: 表结构信息，为空时只检查语法
+        allow_multiple: 是否允许多条语句
+
+    Returns:
+        校验结果，sql 为清理后的SQL
+    """
+    cleaned = clean_sql(sql)
+    statements = split_statements(cleaned)
+    errors: List[str] = []
+    if not statements:
+        return ValidationResult(cleaned, [], ["SQL为空"])
+    if len(statements) > 1 and not allow_multiple:
+        errors.append(f"包含 {len(statements)} 条语句，只允许一条")
+
+    schema = _schema_index(table_info) if table_info else None
+    for statement in statements:
+        statement_errors = _check_syntax(statement)
+        if not statement_errors and schema:
+            statement_errors = _check_schema(statement, schema)
+        for error in statement_errors:
+            if error not in errors:
+                errors.append(error)
+    return ValidationResult(cleaned, statements, errors)
+
+
+def read_only_errors(sql: str) -> List[str]:
+    """
+    检查只读查询中写文件、写变量或锁定行的子句（直接执行客户端SQL的接口在 validate_sql 之后使用）
+
+    Returns:
+        错误信息列表：SELECT ... INTO（OUTFILE/DUMPFILE/变量）、FOR UPDATE/FOR SHARE、LOCK IN SHARE MODE
+    """
+    errors = []
+    tokens = significant(tokenize(sql))
+    for index, token in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token.is_keyword("INTO"):
+            error = "不允许 SELECT ... INTO（写入文件或变量）"
+        elif token.is_keyword("FOR") and following is not None and following.is_keyword("UPDATE", "SHARE"):
+            error = f"不允许 FOR {following.upper}（锁定行）"
+        elif token.is_keyword("LOCK") and following is not None and following.is_keyword("IN"):
+            error = "不允许 LOCK IN SHARE MODE（锁定行）"
+        else:
+            continue
+        if error not in errors:
+            errors.append(error)
+    return errors
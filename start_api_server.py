@@ -4,6 +4,7 @@
 启动自然语言转SQL API服务器
 """
 
+import argparse
 import os
 import sys
 import subprocess
@@ -19,46 +20,80 @@ def check_dependencies():
         subprocess.check_call([sys.executable, "-m", "pip", "install", "flask"])
         print("Flask安装完成")
 
-def start_server():
+def wait_until_ready(port, server_process, timeout=60, max_delay=2.0):
+    """
+    按指数退避轮询 /readyz，直到服务就绪、进程退出或超时
+
+    Returns:
+        服务是否就绪
+    """
+    import requests
+
+    url = f"http://localhost:{port}/readyz"
+    deadline = time.time() + timeout
+    delay = 0.1
+    alive = False
+    status = {}
+
+    while time.time() < deadline:
+        if server_process.poll() is not None:
+            print(f"服务器启动失败，进程已退出: {server_process.returncode}")
+            return False
+        try:
+            response = requests.get(url, timeout=1)
+            alive = True
+            status = response.json()
+            if response.status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            # 服务器尚未开始监听
+            pass
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+    if alive:
+        print(f"服务器已启动但尚未就绪: {status.get('error') or status}")
+    else:
+        print(f"服务器在 {timeout} 秒内没有响应")
+    return False
+
+def start_server(port=5000, workers=1):
     """启动服务器"""
     print("启动API服务器...")
     
     # 设置环境变量
     env = os.environ.copy()
-    env["PORT"] = "5000"
+    env["PORT"] = str(port)
     
-    # 启动服务器
-    server_process = subprocess.Popen(
-        [sys.executable, "nl_to_sql_api.py"],
-        env=env
-    )
+    # 启动服务器（多个工作进程时使用预派生多进程模式）
+    if workers > 1:
+        command = [sys.executable, "prefork_server.py", "--workers", str(workers), "--port", str(port)]
+    else:
+        command = [sys.executable, "nl_to_sql_api.py"]
+    server_process = subprocess.Popen(command, env=env)
     
-    # 等待服务器启动
+    # 等待服务器就绪
     print("等待服务器启动...")
-    time.sleep(2)
-    
-    # 检查服务器是否启动
-    try:
-        import requests
-        response = requests.get("http://localhost:5000/api/config")
-        if response.status_code == 200:
-            print("服务器已启动，可以通过以下地址访问:")
-            print("http://localhost:5000/api/nl2sql")
-            print("http://localhost:5000/api/schema")
-            print("http://localhost:5000/api/config")
-        else:
-            print(f"服务器启动失败: {response.status_code}")
-    except Exception as e:
-        print(f"检查服务器状态时出错: {str(e)}")
+    if wait_until_ready(port, server_process):
+        print("服务器已就绪，可以通过以下地址访问:")
+        print(f"http://localhost:{port}/api/nl2sql")
+        print(f"http://localhost:{port}/api/schema")
+        print(f"http://localhost:{port}/api/config")
     
     return server_process
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动自然语言转SQL API服务器")
+    parser.add_argument("--port", type=int, default=5000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="工作进程数，大于1时以生产模式（预派生多进程 + 共享存储）启动")
+    args = parser.parse_args()
+
     # 检查依赖
     check_dependencies()
     
     # 启动服务器
-    server_process = start_server()
+    server_process = start_server(args.port, args.workers)
     
     try:
         # 保持脚本运行
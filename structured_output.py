@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型输出解析模块
+
+优先按JSON格式严格解析模型输出（sql、explanation、tables_used、confidence），
+失败时使用逐行的宽松解析器从 "SQL:/解释:" 文本、Markdown代码块或内嵌JSON中提取，
+并统计各种解析方式的次数
+"""
+
+import json
+import re
+import threading
+from typing import Dict, Any, List, Optional
+
+# JSON模式下要求模型返回的格式（写入提示词）
+JSON_FORMAT_HINT = """请以JSON格式返回，不要包含其他内容:
+{
+    "sql": "SQL查询语句",
+    "explanation": "简短解释",
+    "tables_used": ["用到的表名"],
+    "confidence": 0到1之间的数字，表示SQL正确的把握
+}"""
+
+_SQL_MARKERS = ("SQL:", "SQL：")
+_EXPLANATION_MARKERS = ("解释:", "解释：", "Explanation:")
+_FENCE_RE = re.compile(r"^\s*```\s*([A-Za-z]*)\s*$")
+
+
+class ParseStats:
+    """解析统计（进程内）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"json": 0, "fallback": 0, "failed": 0}
+
+    def record(self, kind: str):
+        with self._lock:
+            self.counts[kind] += 1
+
+    def to_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+parse_stats = ParseStats()
+
+
+def _result(sql: str, explanation: str = "", tables_used: Optional[List[str]] = None,
+            confidence: Optional[float] = None) -> Dict[str, Any]:
+    return {
+        "sql": sql,
+        "explanation": explanation,
+        "tables_used": tables_used or [],
+        "confidence": confidence
+    }
+
+
+def parse_json_response(content: str) -> Dict[str, Any]:
+    """
+    严格解析JSON格式的模型输出
+
+    Args:
+        content: 模型输出文本
+
+    Returns:
+        {"sql", "explanation", "tables_used", "confidence"}
+
+    Raises:
+        ValueError: 不是JSON对象或字段类型不符合要求
+    """
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        raise ValueError("模型输出不是JSON对象")
+
+    sql = data.get("sql")
+    if not isinstance(sql, str) or not sql.strip():
+        raise ValueError("sql 字段必须是非空字符串")
+    explanation = data.get("explanation", "")
+    if not isinstance(explanation, str):
+        raise ValueError("explanation 字段必须是字符串")
+    tables_used = data.get("tables_used", [])
+    if not isinstance(tables_used, list) or not all(isinstance(t, str) for t in tables_used):
+        raise ValueError("tables_used 字段必须是字符串数组")
+    confidence = data.get("confidence")
+    if confidence is not None:
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+            raise ValueError("confidence 字段必须是0到1之间的数字")
+        confidence = float(confidence)
+    return _result(sql.strip(), explanation.strip(), tables_used, confidence)
+
+
+def _lenient_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    """从JSON对象中提取字段，忽略类型不符合要求的可选字段"""
+    explanation = data.get("explanation")
+    tables_used = data.get("tables_used")
+    if not isinstance(tables_used, list):
+        tables_used = []
+    confidence = data.get("confidence")
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+        confidence = None
+    else:
+        confidence = min(max(float(confidence), 0.0), 1.0)
+    return _result(data["sql"].strip(), explanation.strip() if isinstance(explanation, str) else "",
+                   [t for t in tables_used if isinstance(t, str)], confidence)
+
+
+class TolerantParser:
+    """
+    宽松的逐行解析器
+
+    可以分多次调用 feed 输入文本，支持多行SQL、Markdown代码块和内嵌的JSON对象
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._text: List[str] = []
+        self._section = None
+        self._sql: List[str] = []
+        self._explanation: List[str] = []
+        self._fence: List[str] = []
+        self._in_fence = False
+        self._fence_is_sql = False
+
+    def feed(self, text: str):
+        """输入一段文本"""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line: str):
+        self._text.append(line)
+        match = _FENCE_RE.match(line)
+        if match:
+            if self._in_fence:
+                self._in_fence = False
+                if self._fence_is_sql and not self._sql:
+                    self._sql = list(self._fence)
+            else:
+                self._in_fence = True
+                self._fence_is_sql = match.group(1).lower() in ("", "sql", "mysql")
+                self._fence = []
+            return
+        if self._in_fence:
+            self._fence.append(line)
+            if self._section == "sql":
+                self._sql.append(line)
+            return
+
+        stripped = line.strip()
+        for marker in _SQL_MARKERS:
+            if stripped.startswith(marker):
+                self._section = "sql"
+                rest = stripped[len(marker):].strip()
+                self._sql = [rest] if rest else []
+                return
+        for marker in _EXPLANATION_MARKERS:
+            if stripped.startswith(marker):
+                self._section = "explanation"
+                rest = stripped[len(marker):].strip()
+                self._explanation = [rest] if rest else []
+                return
+        if self._section == "sql":
+            self._sql.append(line)
+        elif self._section == "explanation":
+            self._explanation.append(line)
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        """
+        结束输入并返回解析结果
+
+        Returns:
+            {"sql", "explanation", "tables_used", "confidence"}，提取不到SQL时返回 None
+        """
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = ""
+
+        # 文本中内嵌的JSON对象
+        text = "\n".join(self._text)
+        decoder = json.JSONDecoder()
+        index = text.find("{")
+        while index != -1:
+            try:
+                data, _ = decoder.raw_decode(text, index)
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and isinstance(data.get("sql"), str) and data["sql"].strip():
+                return _lenient_result(data)
+            index = text.find("{", index + 1)
+
+        sql = "\n".join(line for line in self._sql if line.strip() and not _FENCE_RE.match(line)).strip()
+        if not sql and self._fence and self._fence_is_sql:
+            sql = "\n".join(self._fence).strip()
+        if not sql:
+            return None
+        return _result(sql, "\n".join(self._explanation).strip())
+
+
+def parse_tolerant(content: str) -> Optional[Dict[str, Any]]:
+    """使用宽松解析器解析完整的模型输出"""
+    parser = TolerantParser()
+    parser.feed(content)
+    return parser.close()
+
+
+def parse_response(content: str) -> Optional[Dict[str, Any]]:
+    """
+    解析模型输出：先严格按JSON解析，失败时使用宽松解析器
+
+    Returns:
+        {"sql", "explanation", "tables_used", "confidence"}，无法提取SQL时返回 None
+    """
+    try:
+        result = parse_json_response(content)
+        parse_stats.record("json")
+        return result
+    except ValueError:
+        pass
+
+    result = parse_tolerant(content)
+    parse_stats.record("fallback" if result else "failed")
+    return result
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表统计信息模块
+
+从 information_schema.TABLES 和 STATISTICS 收集各表的估算行数、索引定义和索引列的基数，
+缓存后由后台线程定期刷新。统计信息用于：
+  - 提示词中的性能提示（大表的行数和索引），引导模型按索引列过滤
+  - 执行前的检查：估算查询在大表上要扫描的行数，过滤条件没有使用索引时给出警告或拒绝执行
+
+行数和基数都是InnoDB的估算值（MySQL 8 默认缓存 information_schema 统计信息，
+可通过 information_schema_stats_expiry 调整），只用于判断数量级
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from cache import create_cache
+from deadline import Deadline, RequestCancelled
+from fast_json import loads
+from sql_utils import (IDENT, OP, PUNCT, QUOTED, STRING, find_keyword, identifier_name, significant,
+                       split_statements, statement_type, tokenize)
+from sql_validator import KEYWORDS, table_aliases
+
+TABLES_SQL = ("SELECT TABLE_NAME AS table_name, TABLE_ROWS AS table_rows, DATA_LENGTH AS data_length "
+              "FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'")
+
+INDEXES_SQL = ("SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, SEQ_IN_INDEX AS seq, "
+               "COLUMN_NAME AS column_name, NON_UNIQUE AS non_unique, CARDINALITY AS cardinality "
+               "FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() "
+               "ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX")
+
+# 过滤条件所在的子句
+_FILTER_CLAUSES = ("WHERE", "ON")
+
+# 出现在过滤条件所在的括号深度时，表示过滤条件结束
+_CLAUSE_ENDINGS = frozenset(("GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "WINDOW", "FOR", "LOCK", "INTO",
+                             "JOIN", "INNER", "LEFT", "RIGHT", "CROSS", "STRAIGHT_JOIN", "NATURAL", "WHERE",
+                             "ON", "USING", "SELECT", "FROM", "SET"))
+
+# 也是关键字的函数名（后面紧跟括号时是函数调用）
+_KEYWORD_FUNCTIONS = frozenset(("DATE", "YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND", "WEEK", "QUARTER",
+                                "TIME", "TIMESTAMP", "LEFT", "RIGHT", "CHAR", "CONVERT", "REPLACE", "IF",
+                                "MOD", "INSERT", "BINARY"))
+
+
+def _query_rows(pool, sql: str, timeout: Optional[float], deadline: Optional[Deadline]) -> List[Dict[str, Any]]:
+    result_text = pool.call_tool("query", {"sql": sql, "params": []}, timeout=timeout, deadline=deadline)
+    try:
+        rows = loads(result_text or "")
+    except json.JSONDecodeError:
+        raise RuntimeError(result_text or "执行SQL未返回结果")
+    if not isinstance(rows, list):
+        raise RuntimeError(result_text)
+    return rows
+
+
+def _int(value: Any) -> Optional[int]:
+    return int(value) if value is not None else None
+
+
+def collect_table_stats(pool, timeout: Optional[float] = 10,
+                        deadline: Optional[Deadline] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    收集当前数据库中所有表的统计信息
+
+    Args:
+        pool: 会话池
+        timeout: 每次查询的超时时间（秒）
+        deadline: 请求的截止时间
+
+    Returns:
+        表名（小写） -> {"name", "rows", "data_bytes",
+                       "indexes": [{"name", "columns", "unique", "cardinality": 各前缀的基数}],
+                       "cardinality": 索引第一列（小写） -> 基数}
+
+    Raises:
+        RuntimeError: 查询失败
+    """
+    tables: Dict[str, Dict[str, Any]] = {}
+    for row in _query_rows(pool, TABLES_SQL, timeout, deadline):
+        name = row["table_name"]
+        tables[name.lower()] = {
+            "name": name,
+            "rows": _int(row.get("table_rows")) or 0,
+            "data_bytes": _int(row.get("data_length")) or 0,
+            "indexes": [],
+            "cardinality": {}
+        }
+
+    indexes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for row in _query_rows(pool, INDEXES_SQL, timeout, deadline):
+        table = tables.get(row["table_name"].lower())
+        # 函数索引没有列名
+        if table is None or not row.get("column_name"):
+            continue
+        key = (row["table_name"].lower(), row["index_name"])
+        index = indexes.get(key)
+        if index is None:
+            index = {"name": row["index_name"], "columns": [], "unique": not _int(row.get("non_unique")),
+                     "cardinality": []}
+            indexes[key] = index
+            table["indexes"].append(index)
+        column = row["column_name"].lower()
+        cardinality = _int(row.get("cardinality"))
+        index["columns"].append(column)
+        index["cardinality"].append(cardinality)
+        if len(index["columns"]) == 1 and cardinality is not None:
+            table["cardinality"][column] = max(cardinality, table["cardinality"].get(column, 0))
+    return tables
+
+
+def format_count(count: int) -> str:
+    """行数的简短表示（万、亿）"""
+    if count >= 100000000:
+        text, unit = f"{count / 100000000:.1f}", "亿"
+    elif count >= 10000:
+        text, unit = f"{count / 10000:.1f}", "万"
+    else:
+        return str(count)
+    return text.rstrip("0").rstrip(".") + unit
+
+
+def _describe_index(index: Dict[str, Any]) -> str:
+    return f"{index['name']}({','.join(index['columns'])})"
+
+
+def performance_hints(table_info: List[Dict[str, Any]], stats: Dict[str, Dict[str, Any]],
+                      min_rows: int = 10000) -> str:
+    """
+    提示词中的性能提示：每个大表一行，包含估算行数和索引（索引第一列的基数）
+
+    Args:
+        table_info: 放入提示词的表
+        stats: collect_table_stats 返回的统计信息
+        min_rows: 只列出估算行数不少于这么多的表
+
+    Returns:
+        提示文本，没有大表时为空字符串
+    """
+    lines = []
+    for table in table_info:
+        table_stats = stats.get(table["name"].lower())
+        if table_stats is None or table_stats["rows"] < min_rows:
+            continue
+        indexes = []
+        for index in table_stats["indexes"]:
+            text = _describe_index(index)
+            cardinality = index["cardinality"][0]
+            if not index["unique"] and cardinality:
+                text += f"~{format_count(cardinality)}个值"
+            indexes.append(text)
+        lines.append(f"{table['name']} 约{format_count(table_stats['rows'])}行，索引: "
+                     f"{', '.join(indexes) if indexes else '无'}")
+    return "\n".join(lines)
+
+
+def _is_function_call(previous: Optional[Any]) -> bool:
+    """左括号之前的词法单元是否为函数名"""
+    if previous is None or previous.type != IDENT:
+        return False
+    return previous.upper not in KEYWORDS or previous.upper in _KEYWORD_FUNCTIONS
+
+
+def _is_column(tokens, position: int) -> bool:
+    """position 处是否为列引用（标识符，后面不是函数调用的括号）"""
+    if position < 0 or position >= len(tokens):
+        return False
+    token = tokens[position]
+    if token.type not in (IDENT, QUOTED) or (token.type == IDENT and token.upper in KEYWORDS):
+        return False
+    following = tokens[position + 1] if position + 1 < len(tokens) else None
+    return not (following is not None and following.type == PUNCT and following.value == "(")
+
+
+def _predicate_kind(tokens, start: int, end: int) -> str:
+    """
+    列（tokens[start:end + 1]，可以带限定符）在条件中的用法
+
+    Returns:
+        equality（与常量相等、IN、IS NULL）、join（与另一列相等）、range（比较、BETWEEN、前缀 LIKE）或 other
+    """
+    following = tokens[end + 1] if end + 1 < len(tokens) else None
+    previous = tokens[start - 1] if start > 0 else None
+    if following is not None:
+        if following.type == OP and following.value in ("=", "<=>"):
+            return "join" if _is_column(tokens, end + 2) else "equality"
+        if following.type == OP and following.value in ("<", ">", "<=", ">="):
+            return "range"
+        if following.is_keyword("IN"):
+            return "equality"
+        if following.is_keyword("IS"):
+            return "equality" if end + 2 < len(tokens) and tokens[end + 2].is_keyword("NULL") else "other"
+        if following.is_keyword("BETWEEN"):
+            return "range"
+        if following.is_keyword("LIKE"):
+            pattern = tokens[end + 2] if end + 2 < len(tokens) else None
+            if pattern is not None and pattern.type == STRING and pattern.value[1:2] == "%":
+                return "other"
+            return "range"
+        if following.type == OP or following.is_keyword("NOT"):
+            return "other"
+    if previous is not None and previous.type == OP:
+        if previous.value in ("=", "<=>"):
+            # 另一边是 a.x 或 x
+            return "join" if _is_column(tokens, start - 2) else "equality"
+        if previous.value in ("<", ">", "<=", ">="):
+            return "range"
+    return "other"
+
+
+def filter_columns(tokens) -> List[Tuple[Optional[str], str, bool, str]]:
+    """
+    WHERE 和 ON 条件中引用的列
+
+    Args:
+        tokens: 去掉空白和注释的词法单元
+
+    Returns:
+        [(限定符（小写，没有时为 None）, 列名（小写）, 是否可以使用索引, 用法)]，
+        在函数中使用或 LIKE 以通配符开头的列不能使用索引，用法见 _predicate_kind
+    """
+    columns = []
+    index = 0
+    while index < len(tokens):
+        if not tokens[index].is_keyword(*_FILTER_CLAUSES):
+            index += 1
+            continue
+        index += 1
+        depth = 0
+        # 条件中各层括号是否为函数调用
+        functions: List[bool] = []
+        while index < len(tokens):
+            token = tokens[index]
+            previous = tokens[index - 1]
+            if token.type == PUNCT and token.value == "(":
+                functions.append(_is_function_call(previous))
+                depth += 1
+            elif token.type == PUNCT and token.value == ")":
+                if depth == 0:
+                    break
+                functions.pop()
+                depth -= 1
+            elif depth == 0 and token.type == IDENT and token.upper in _CLAUSE_ENDINGS:
+                break
+            elif token.type in (IDENT, QUOTED) and not (token.type == IDENT and
+                                                        (token.upper in KEYWORDS or token.value.startswith("@"))):
+                following = tokens[index + 1] if index + 1 < len(tokens) else None
+                if following is not None and following.type == PUNCT and following.value == "(":
+                    index += 1
+                    continue
+                start = index
+                qualifier = None
+                if following is not None and following.type == PUNCT and following.value == "." and \
+                        index + 2 < len(tokens) and tokens[index + 2].type in (IDENT, QUOTED):
+                    qualifier = identifier_name(token).lower()
+                    index += 2
+                    token = tokens[index]
+                kind = _predicate_kind(tokens, start, index)
+                sargable = not any(functions)
+                if sargable and kind == "other" and index + 1 < len(tokens):
+                    position = index + 1
+                    if tokens[position].is_keyword("NOT") and position + 1 < len(tokens):
+                        position += 1
+                    if tokens[position].is_keyword("LIKE") and position + 1 < len(tokens) and \
+                            tokens[position + 1].type == STRING and tokens[position + 1].value[1:2] == "%":
+                        sargable = False
+                columns.append((qualifier, identifier_name(token).lower(), sargable, kind))
+            index += 1
+    return columns
+
+
+def estimate_scan(table_stats: Dict[str, Any], columns: List[str]) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """
+    估算按这些列过滤时需要扫描的行数
+
+    Args:
+        table_stats: 一个表的统计信息
+        columns: 可以使用索引的过滤列（小写）
+
+    Returns:
+        (估算行数, 使用的索引)，没有可用的索引时为 (表的行数, None)
+    """
+    rows = table_stats["rows"]
+    best: Tuple[int, Optional[Dict[str, Any]]] = (rows, None)
+    for index in table_stats["indexes"]:
+        # 索引可以使用的最左前缀
+        prefix = 0
+        while prefix < len(index["columns"]) and index["columns"][prefix] in columns:
+            prefix += 1
+        if not prefix:
+            continue
+        if index["unique"] and prefix == len(index["columns"]):
+            scan = 1
+        else:
+            cardinality = index["cardinality"][prefix - 1]
+            # 没有基数时按选择性好估算（避免误报）
+            scan = rows // cardinality if cardinality else 1
+        if scan < best[0]:
+            best = (scan, index)
+    return best
+
+
+def check_scan(sql: str, stats: Dict[str, Dict[str, Any]], max_scan_rows: int = 1000000) -> List[str]:
+    """
+    执行前检查：估算SELECT、UPDATE、DELETE在各表上扫描的行数
+
+    Args:
+        sql: SQL文本
+        stats: collect_table_stats 返回的统计信息
+        max_scan_rows: 单个表估算扫描的行数超过这个值时给出警告
+
+    Returns:
+        警告信息列表
+    """
+    warnings = []
+    for statement in split_statements(sql):
+        if statement_type(statement) not in ("SELECT", "UPDATE", "DELETE"):
+            continue
+        tokens = significant(tokenize(statement))
+        aliases = table_aliases(statement)
+        columns = filter_columns(tokens)
+        # 没有过滤条件、只取前几行的查询读到足够的行就停止
+        limited = find_keyword(tokens, "LIMIT") >= 0 and find_keyword(tokens, "ORDER BY") < 0 and \
+            find_keyword(tokens, "GROUP BY") < 0
+        for table in dict.fromkeys(aliases.values()):
+            table_stats = stats.get(table)
+            if table_stats is None or table_stats["rows"] <= max_scan_rows:
+                continue
+            names = {alias for alias, target in aliases.items() if target == table}
+            own = [(name, sargable) for qualifier, name, sargable, _ in columns
+                   if qualifier is None or qualifier in names]
+            if not own and limited:
+                continue
+            usable = [name for name, sargable in own if sargable]
+            scan, index = estimate_scan(table_stats, usable)
+            if scan <= max_scan_rows:
+                continue
+            name = table_stats["name"]
+            if index is not None:
+                warning = (f"{name} 约{format_count(table_stats['rows'])}行，索引 {_describe_index(index)} "
+                           f"的选择性低，预计扫描约{format_count(scan)}行")
+            else:
+                indexes = ", ".join(_describe_index(item) for item in table_stats["indexes"]) or "无"
+                warning = (f"{name} 约{format_count(table_stats['rows'])}行，过滤条件没有使用索引列，"
+                           f"将扫描全表（索引: {indexes}）")
+            indexed = {item["columns"][0] for item in table_stats["indexes"]}
+            wrapped = sorted({column for column, sargable in own if not sargable and column in indexed})
+            if wrapped:
+                warning += f"；{', '.join(wrapped)} 在函数中或以通配符开头的 LIKE 中使用，无法使用索引"
+            if warning not in warnings:
+                warnings.append(warning)
+    return warnings
+
+
+class TableStats:
+    """租户的表统计信息，后台线程定期刷新"""
+
+    def __init__(self, name: str, config: Dict[str, Any], pool, interval: float = 600, timeout: float = 10):
+        """
+        初始化
+
+        Args:
+            name: 租户名称
+            config: 租户配置（决定缓存是否在多进程之间共享）
+            pool: 查询统计信息的会话池
+            interval: 刷新间隔（秒）
+            timeout: 每次查询的超时时间（秒）
+        """
+        self.name = name
+        self.pool = pool
+        self.interval = interval
+        self.timeout = timeout
+        # 多进程共享时只有统计信息过期的进程查询数据库
+        self.cache = create_cache(config, f"{name}:stats", ttl=None, max_entries=2)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._thread_pid = None
+        self._failed_at = 0.0
+        self.refreshes = 0
+        self.failures = 0
+        self.error: Optional[str] = None
+
+    def snapshot(self, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        当前的统计信息，还没有时立即收集（之后由后台线程刷新）
+
+        Returns:
+            表名（小写） -> 表统计信息，收集失败时返回 None
+        """
+        self._ensure_refresher()
+        data = self.cache.get("stats")
+        if data is None and time.time() - self._failed_at >= min(self.interval, 60):
+            data = self.refresh(deadline)
+        return data["tables"] if data else None
+
+    def age(self) -> Optional[float]:
+        """统计信息的时间（秒），还没有时返回 None"""
+        data = self.cache.get("stats")
+        return time.time() - data["collected_at"] if data else None
+
+    def refresh(self, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        重新收集统计信息
+
+        Returns:
+            {"collected_at", "tables"}，失败时返回 None（保留原来的统计信息）
+        """
+        try:
+            tables = collect_table_stats(self.pool, timeout=self.timeout, deadline=deadline)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            print(f"[{self.name}] 收集表统计信息时出错: {str(e)}")
+            self._failed_at = time.time()
+            self.failures += 1
+            self.error = str(e)
+            return None
+        data = {"collected_at": time.time(), "tables": tables}
+        self.cache.set("stats", data)
+        self.refreshes += 1
+        self.error = None
+        return data
+
+    def _ensure_refresher(self):
+        """启动后台刷新线程（fork之后的子进程中重新启动）"""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._closed or (self._thread is not None and self._thread_pid == os.getpid()):
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"table-stats-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            age = self.age()
+            if age is not None and age < self.interval:
+                # 其他进程可能已经刷新，到期后重新检查
+                self._wake.wait(self.interval - age)
+                continue
+            if age is None:
+                # 第一次收集由 snapshot 完成，失败后由这里重试
+                self._wake.wait(self.interval)
+                if self._closed or self.age() is not None:
+                    continue
+            self.refresh()
+            if self.error is not None:
+                # 出错后等一个间隔再重试
+                self._wake.wait(self.interval)
+
+    def close(self):
+        """停止后台线程"""
+        self._closed = True
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        data = self.cache.get("stats")
+        return {
+            "tables": len(data["tables"]) if data else None,
+            "age": round(time.time() - data["collected_at"], 1) if data else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "error": self.error
+        }
+
+
+def create_table_stats(name: str, config: Dict[str, Any], pool) -> Optional[TableStats]:
+    """按租户配置创建表统计信息，table_stats 为 false 时返回 None"""
+    if not config.get("table_stats", True):
+        return None
+    return TableStats(name, config, pool, interval=float(config.get("table_stats_interval", 600)),
+                      timeout=float(config.get("table_stats_timeout", 10)))
@@ -0,0 +1,764 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多租户路由模块
+
+从配置目录加载数据库连接配置（每个租户一个JSON文件），
+并为每个租户提供独立的会话池（MCP或进程内MySQL连接）、表结构缓存、LLM缓存和并发限制
+"""
+
+import json
+import os
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Tuple, Iterator
+
+from bulk_writer import BulkWriter
+from cache import create_cache, make_key
+from deadline import Deadline, RequestCancelled
+from fast_json import loads
+from example_store import get_example_store
+from keyset_pagination import KeysetPlan, iter_keyset_rows, plan_keyset
+from llm_limiter import get_llm_limiter
+from materialize import create_materializer
+from replica_router import create_router, primary_route
+from result_export import iter_json_rows
+from nl_to_sql import DeepSeekNLtoSQL, get_table_info_from_db
+from session_pool import MCPSessionPool, create_session_pool
+from single_flight import SingleFlight
+from sql_utils import add_execution_time_hint, is_select
+from sql_rewriter import plan_rows, rewrite_sql
+from sql_validator import normalize_sql, referenced_tables, validate_sql
+from table_stats import check_scan, create_table_stats, performance_hints
+
+DEFAULT_TENANT = "default"
+
+
+class TenantBusyError(Exception):
+    """租户并发请求数已达上限"""
+
+
+class Tenant:
+    """单个租户（数据库连接配置）及其资源"""
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        """
+        初始化租户
+
+        Args:
+            name: 租户名称
+            config: 该租户的数据库配置
+        """
+        self.name = name
+        self.config = config
+        self.pool = create_session_pool(config, size=config.get("pool_size", 2), name=name)
+        # 配置了只读副本时，SELECT按副本的健康状态和复制延迟路由
+        self.router = create_router(name, config, self.pool)
+        # 表的估算行数和索引（提示词中的性能提示和执行前的扫描检查）
+        self.table_stats = create_table_stats(name, config, self.pool)
+        self.schema_cache = create_cache(config, f"{name}:schema",
+                                         ttl=config.get("schema_cache_ttl", 300), max_entries=4)
+        self.llm_cache = create_cache(config, f"{name}:llm", ttl=config.get("llm_cache_ttl", 3600),
+                                      max_entries=config.get("llm_cache_size", 1024))
+        # 查询结果缓存默认关闭（result_cache_ttl 为 0）
+        self.result_cache = create_cache(config, f"{name}:result", ttl=config.get("result_cache_ttl", 0),
+                                         max_entries=config.get("result_cache_size", 256))
+        # 执行前的SQL改写结果（含改写前后 EXPLAIN 的比较），按SQL缓存
+        self.rewrite_cache = create_cache(config, f"{name}:rewrite", ttl=config.get("sql_rewrite_cache_ttl", 3600),
+                                          max_entries=config.get("llm_cache_size", 1024))
+        # 表的版本号（写入时更新），用于按表失效查询结果缓存
+        self.table_versions = create_cache(config, f"{name}:tables", ttl=None, max_entries=4096)
+        self._table_usage: Counter = Counter()
+        # 合并相同的并发LLM调用、表结构获取和SELECT执行
+        # 执行者的请求被取消时，等待者重新执行而不是共享取消错误
+        self._flights = SingleFlight(retry_on=(RequestCancelled,))
+        # 经过验证的问题和SQL示例，用于few-shot提示（默认关闭，关闭时不创建示例库文件）
+        example_path = config.get("example_store", "examples.db")
+        self.examples = get_example_store(example_path) if config.get("few_shot", False) and example_path else None
+        # 代替HTTP请求调用模型的函数（评测时回放录制的响应），为空时请求DeepSeek API
+        self.llm_transport = None
+        # 热门问题的预计算结果（默认关闭）
+        self.materialized = create_materializer(self)
+        self.max_concurrency = max(1, int(config.get("max_concurrency", 4)))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """
+        占用一个并发名额
+
+        Args:
+            timeout: 等待名额的最长时间（秒）
+
+        Raises:
+            TenantBusyError: 在超时时间内没有空闲名额
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TenantBusyError(f"租户 {self.name} 的并发请求数已达上限 ({self.max_concurrency})")
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    def get_schema(self, refresh: bool = False, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        获取表结构信息（带缓存）
+
+        Args:
+            refresh: 是否忽略缓存重新获取
+            deadline: 请求的截止时间
+
+        Returns:
+            表结构信息列表
+        """
+        if not refresh:
+            table_info = self.schema_cache.get("schema")
+            if table_info is not None:
+                return table_info
+
+        # 并发的表结构请求只访问一次数据库
+        return self._flights.do("schema", lambda: self._fetch_schema(refresh, deadline),
+                                timeout=deadline.timeout() if deadline is not None else None)
+
+    def _fetch_schema(self, refresh: bool, deadline: Optional[Deadline]) -> List[Dict[str, Any]]:
+        # 前一次合并的调用可能刚刚写入缓存
+        if not refresh:
+            table_info = self.schema_cache.get("schema")
+            if table_info is not None:
+                return table_info
+        table_info = get_table_info_from_db(self.config, pool=self.pool, deadline=deadline)
+        # 获取失败时返回空列表，不缓存
+        if table_info:
+            self.schema_cache.set("schema", table_info)
+        return table_info
+
+    def warm(self):
+        """预先创建MCP会话并加载表结构缓存"""
+        self.pool.warm(self.config.get("pool_min_size", 1))
+        self.get_schema()
+
+    def llm_cache_key(self, natural_language: str, table_info: List[Dict[str, Any]]) -> str:
+        """自然语言转SQL缓存键：查询文本 + 表结构"""
+        return make_key(natural_language.strip(), table_info)
+
+    def cached_schema(self) -> Optional[List[Dict[str, Any]]]:
+        """已缓存的表结构，没有缓存时返回 None（不访问数据库）"""
+        return self.schema_cache.get("schema")
+
+    def prompt_schema(self, natural_language: str, table_info: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        选择放入提示词的表
+
+        表数量超过 prompt_max_tables 时，优先保留问题中提到的表（表名或列名出现在问题中），
+        其次是以往转换结果中 tables_used 出现次数多的表
+
+        Args:
+            natural_language: 自然语言查询
+            table_info: 完整的表结构信息
+
+        Returns:
+            裁剪后的表结构信息
+        """
+        max_tables = int(self.config.get("prompt_max_tables", 40))
+        if not max_tables or len(table_info) <= max_tables:
+            return table_info
+
+        text = natural_language.lower()
+        with self._lock:
+            usage = dict(self._table_usage)
+
+        def score(table: Dict[str, Any]) -> Tuple[int, int, int]:
+            name = table["name"].lower()
+            mentioned = int(name in text)
+            columns = sum(1 for column in table["columns"] if len(column["name"]) > 2 and
+                          column["name"].lower() in text)
+            return mentioned, columns, usage.get(name, 0)
+
+        ranked = sorted(table_info, key=score, reverse=True)[:max_tables]
+        # 保持原有顺序，避免同样的表集合生成不同的提示词
+        keep = {id(table) for table in ranked}
+        return [table for table in table_info if id(table) in keep]
+
+    def performance_hints(self, prompt_tables: List[Dict[str, Any]],
+                          deadline: Optional[Deadline] = None) -> Optional[str]:
+        """提示词中的性能提示（放入提示词的表中大表的估算行数和索引），没有统计信息时返回 None"""
+        if self.table_stats is None or not prompt_tables or not self.config.get("prompt_performance_hints", True):
+            return None
+        stats = self.table_stats.snapshot(deadline)
+        if not stats:
+            return None
+        return performance_hints(prompt_tables, stats, min_rows=int(self.config.get("prompt_hint_min_rows", 10000)))
+
+    def check_scan(self, sql: str, deadline: Optional[Deadline] = None) -> List[str]:
+        """
+        执行前检查SQL是否会扫描大表（guardrail 为 off 或没有统计信息时不检查）
+
+        Returns:
+            警告信息列表
+        """
+        if self.table_stats is None or self.config.get("guardrail", "warn") == "off":
+            return []
+        stats = self.table_stats.snapshot(deadline)
+        if not stats:
+            return []
+        return check_scan(sql, stats, max_scan_rows=int(self.config.get("guardrail_max_scan_rows", 1000000)))
+
+    def rewrite_sql(self, sql: str, table_info: Optional[List[Dict[str, Any]]] = None,
+                    deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        执行前对SELECT做等价改写（见 sql_rewriter），结果按SQL缓存
+
+        sql_rewrite_explain 开启时改写前后各执行一次 EXPLAIN，只有估算检查的行数没有变多时才使用改写后的SQL，
+        EXPLAIN 失败时也保留原SQL
+
+        Args:
+            sql: 生成的SQL
+            table_info: 表结构信息，为空时使用缓存的表结构
+            deadline: 请求的截止时间
+
+        Returns:
+            {"sql": 执行的SQL, "original_sql", "rewrites": [{"rule", "before", "after"}], "notes",
+             "plan": {"rows_before", "rows_after"}（没有比较时为 None）, "applied": 是否使用改写后的SQL}
+        """
+        if not self.config.get("sql_rewrite", True) or not is_select(sql):
+            return {"sql": sql, "original_sql": sql, "rewrites": [], "notes": [], "plan": None, "applied": False}
+        cache_key = make_key(sql)
+        cached = self.rewrite_cache.get(cache_key)
+        if isinstance(cached, dict):
+            return dict(cached)
+
+        result = rewrite_sql(sql, table_info or self.cached_schema())
+        result.update(original_sql=sql, plan=None, applied=bool(result["rewrites"]))
+        cacheable = True
+        for rewrite in result["rewrites"]:
+            print(f"SQL改写 [{rewrite['rule']}]: {rewrite['before']} -> {rewrite['after']}")
+        if result["rewrites"] and self.config.get("sql_rewrite_explain", True):
+            try:
+                rows_before = self._plan_rows(sql, deadline)
+                rows_after = self._plan_rows(result["sql"], deadline)
+                result["plan"] = {"rows_before": rows_before, "rows_after": rows_after}
+                result["applied"] = rows_after <= rows_before
+                print(f"SQL改写后估算检查 {rows_after:.0f} 行（改写前 {rows_before:.0f} 行），"
+                      f"{'使用改写后的SQL' if result['applied'] else '保留原SQL'}")
+            except RequestCancelled:
+                raise
+            except Exception as e:
+                print(f"比较改写前后的执行计划时出错，保留原SQL: {str(e)}")
+                result["applied"] = False
+                cacheable = False
+        if not result["applied"]:
+            result["sql"] = sql
+        if cacheable:
+            self.rewrite_cache.set(cache_key, result)
+        return dict(result)
+
+    def _plan_rows(self, sql: str, deadline: Optional[Deadline]) -> float:
+        """执行 EXPLAIN，返回估算检查的行数"""
+        pool = self.read_pool(referenced_tables(sql))
+        limit = self._statement_limit(self.config.get("sql_rewrite_explain_timeout", 5), deadline)
+        result_text = pool.call_tool("query", {"sql": f"EXPLAIN {sql}", "params": []}, timeout=limit,
+                                     deadline=deadline)
+        return plan_rows(result_text)
+
+    def few_shot_examples(self, natural_language: str) -> List[Dict[str, Any]]:
+        """检索与问题相似的已验证示例（在token预算内）"""
+        if self.examples is None:
+            return []
+        try:
+            return self.examples.few_shot(
+                self.name, natural_language,
+                k=int(self.config.get("few_shot_k", 3)),
+                token_budget=int(self.config.get("few_shot_token_budget", 600)),
+                min_score=float(self.config.get("few_shot_min_score", 0.2))
+            )
+        except Exception as e:
+            print(f"检索示例时出错: {str(e)}")
+            return []
+
+    def record_example(self, natural_language: str, sql: str):
+        """记录执行成功的问题和SQL，作为以后的few-shot示例"""
+        if self.examples is None or not self.config.get("few_shot_learn", False):
+            return
+        try:
+            self.examples.add(self.name, natural_language, sql, source="execution")
+        except Exception as e:
+            print(f"记录示例时出错: {str(e)}")
+
+    def translate(self, natural_language: str, table_info: List[Dict[str, Any]],
+                  api_key: str, deadline: Optional[Deadline] = None,
+                  info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        将自然语言转换为SQL（带缓存）
+
+        生成的SQL先在本地校验（语法、多条语句、表和列是否存在），
+        校验失败时把错误发给模型重试，不访问数据库
+
+        Args:
+            natural_language: 自然语言查询
+            table_info: 表结构信息
+            api_key: DeepSeek API密钥
+            deadline: 请求的截止时间
+            info: 可选，累加模型调用信息（llm_calls、prompt_tokens、completion_tokens），命中缓存或合并到其他请求时不写入
+
+        Returns:
+            {"sql", "explanation", "tables_used", "confidence", "validation_errors",
+             "cache": 是否命中缓存（hit/miss）}
+        """
+        cache_key = self.llm_cache_key(natural_language, table_info)
+        cached = self.llm_cache.get(cache_key)
+        if isinstance(cached, dict):
+            return dict(cached, validation_errors=[], cache="hit")
+
+        # 相同问题的并发请求只调用一次模型
+        result = self._flights.do(("llm", cache_key),
+                                  lambda: self._generate(natural_language, table_info, api_key, cache_key, deadline, info),
+                                  timeout=deadline.timeout() if deadline is not None else None)
+        return dict(result)
+
+    def _generate(self, natural_language: str, table_info: List[Dict[str, Any]], api_key: str,
+                  cache_key: str, deadline: Optional[Deadline],
+                  info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """调用模型生成SQL并校验，通过校验的结果写入缓存"""
+        # 前一次合并的调用可能刚刚写入缓存
+        cached = self.llm_cache.get(cache_key)
+        if isinstance(cached, dict):
+            return dict(cached, validation_errors=[], cache="hit")
+
+        converter = DeepSeekNLtoSQL(api_key, json_mode=self.config.get("llm_json_mode", True),
+                                    limiter=get_llm_limiter(self.config),
+                                    timeout=self.config.get("llm_timeout", 60),
+                                    model=self.config.get("llm_model", "deepseek-chat"),
+                                    schema_format=self.config.get("prompt_schema_format", "full"),
+                                    transport=self.llm_transport)
+        prompt_tables = self.prompt_schema(natural_language, table_info) if table_info else table_info
+        examples = self.few_shot_examples(natural_language)
+        hints = self.performance_hints(prompt_tables, deadline)
+        result = converter.generate(natural_language, prompt_tables, examples=examples, deadline=deadline,
+                                    info=info, hints=hints)
+        errors: List[str] = []
+        if result["sql"] and self.config.get("validate_sql", True):
+            schema = table_info or self.cached_schema()
+            validation = validate_sql(result["sql"], schema)
+            retries = int(self.config.get("validation_retries", 1))
+            while not validation.valid and retries > 0:
+                print(f"SQL校验失败，重新生成: {'; '.join(validation.errors)}")
+                retries -= 1
+                result = converter.generate(natural_language, prompt_tables,
+                                            feedback=(validation.sql, validation.errors), examples=examples,
+                                            deadline=deadline, info=info, hints=hints)
+                if not result["sql"]:
+                    break
+                validation = validate_sql(result["sql"], schema)
+            if result["sql"]:
+                result["sql"] = validation.sql
+                errors = validation.errors
+
+        # 只缓存成功且通过校验的转换结果
+        if result["sql"] and not errors:
+            # 模型报告的表可能不完整，与SQL中实际引用的表合并
+            tables_used = [t.lower() for t in result["tables_used"]]
+            for table in referenced_tables(result["sql"]):
+                if table not in tables_used:
+                    tables_used.append(table)
+            result["tables_used"] = tables_used
+            with self._lock:
+                self._table_usage.update(tables_used)
+            self.llm_cache.set(cache_key, result)
+        return dict(result, validation_errors=errors, cache="miss")
+
+    def _statement_limit(self, timeout: Optional[float], deadline: Optional[Deadline]) -> Optional[float]:
+        """单条语句可以执行的时间：timeout（默认 statement_timeout，0表示不限制）与请求剩余时间中较小的一个"""
+        if timeout is None:
+            timeout = self.config.get("statement_timeout", 60)
+        timeout = timeout or None
+        return deadline.timeout(timeout) if deadline is not None else timeout
+
+    def read_pool(self, tables: List[str], primary: bool = False,
+                  info: Optional[Dict[str, Any]] = None) -> MCPSessionPool:
+        """
+        选择执行SELECT的会话池
+
+        Args:
+            tables: 查询引用的表
+            primary: 是否要求使用主库（如需要读到自己刚写入的数据）
+            info: 可选，写入路由信息 routing: {"endpoint", "reason", "lag"}
+        """
+        if self.router is None:
+            return self.pool
+        pool, route = self.router.choose(tables, primary=primary)
+        if info is not None:
+            info["routing"] = route
+        return pool
+
+    def _query(self, sql: str, timeout: Optional[float], cache_key: Optional[str],
+               deadline: Optional[Deadline] = None, info: Optional[Dict[str, Any]] = None,
+               pool: Optional[MCPSessionPool] = None) -> Optional[str]:
+        """执行SELECT并缓存结果"""
+        if cache_key is not None:
+            # 前一次合并的调用可能刚刚写入缓存
+            result_text = self.result_cache.get(cache_key)
+            if result_text is not None:
+                if info is not None:
+                    info["result_cache"] = "hit"
+                return result_text
+        limit = self._statement_limit(timeout, deadline)
+        # MySQL在服务端按同样的时间限制中止查询，即使取消请求时没能执行 KILL QUERY
+        query_sql = add_execution_time_hint(sql, int(limit * 1000)) if limit else sql
+        result_text = (pool or self.pool).call_tool("query", {"sql": query_sql, "params": []}, timeout=limit,
+                                                    deadline=deadline)
+        if result_text and cache_key is not None:
+            self.result_cache.set(cache_key, result_text)
+        return result_text
+
+    def _table_version(self, table: str) -> str:
+        """表的版本号，写入该表时更新，查询结果缓存键包含相关表的版本号"""
+        version = self.table_versions.get(table)
+        if version is None:
+            version = uuid.uuid4().hex[:12]
+            self.table_versions.set(table, version)
+        return version
+
+    def invalidate_tables(self, tables: Optional[List[str]] = None):
+        """
+        使引用了指定表的查询结果缓存失效
+
+        Args:
+            tables: 表名列表，为空时所有查询结果缓存失效
+        """
+        for table in tables or ["*"]:
+            self.table_versions.set(table.lower(), uuid.uuid4().hex[:12])
+        if self.router is not None:
+            self.router.note_write(tables)
+        if self.materialized is not None:
+            self.materialized.invalidate(tables)
+
+    def table_state(self, tables: List[str]) -> List[Tuple[str, str]]:
+        """相关表（包括表示全部表的 *）的版本号，任何一个表被写入后结果不同"""
+        return [(table, self._table_version(table)) for table in sorted(set(tables) | {"*"})]
+
+    def result_cache_key(self, sql: str, tables: List[str]) -> str:
+        """查询结果缓存键：规范化的SQL + 相关表的版本号"""
+        return make_key(normalize_sql(sql), self.table_state(tables))
+
+    def execute_sql(self, sql: str, timeout: Optional[float] = None, tables: Optional[List[str]] = None,
+                    deadline: Optional[Deadline] = None, info: Optional[Dict[str, Any]] = None,
+                    primary: bool = False) -> Optional[str]:
+        """
+        在租户的会话池上执行SQL
+
+        超时或请求被取消时终止正在执行的语句。配置了只读副本时SELECT可能在副本上执行，写操作总是在主库上执行
+
+        Args:
+            sql: SQL语句
+            timeout: 超时时间（秒），默认使用 statement_timeout
+            tables: 额外的相关表（如模型返回的 tables_used），用于查询结果缓存的失效和副本路由
+            deadline: 请求的截止时间
+            info: 可选，写入执行信息（result_cache: hit/miss/off，routing: 执行SELECT的主库或副本）
+            primary: SELECT是否要求在主库上执行
+
+        Returns:
+            MCP工具返回的结果文本
+
+        Raises:
+            TimeoutError: 执行超时
+            RequestCancelled: 请求已被取消
+        """
+        # 根据SQL类型选择工具
+        if is_select(sql):
+            tables = [t.lower() for t in tables or []] + referenced_tables(sql)
+            # 无法确定引用了哪些表的查询不缓存
+            cache_key = self.result_cache_key(sql, tables) if tables and self.result_cache.ttl else None
+            if info is not None:
+                info["result_cache"] = "off" if cache_key is None else "miss"
+            if cache_key is not None:
+                result_text = self.result_cache.get(cache_key)
+                if result_text is not None:
+                    if info is not None:
+                        info["result_cache"] = "hit"
+                    return result_text
+
+            pool = self.read_pool(tables, primary=primary, info=info)
+            # 相同SELECT的并发执行只查询一次（缓存键包含表版本号，写入之后开始的查询不会共享旧结果；
+            # 只合并发往同一个库的查询，要求读主库的查询不会共享副本上的结果）
+            return self._flights.do(("query", id(pool), cache_key or normalize_sql(sql)),
+                                    lambda: self._query(sql, timeout, cache_key, deadline, info, pool),
+                                    timeout=deadline.timeout() if deadline is not None else None)
+
+        if info is not None and self.router is not None:
+            info["routing"] = primary_route("write")
+        result_text = self.pool.call_tool("execute", {"sql": sql, "params": []},
+                                          timeout=self._statement_limit(timeout, deadline), deadline=deadline)
+        # 写操作之后引用了这些表的查询结果可能已过期
+        self.invalidate_tables(referenced_tables(sql))
+        return result_text
+
+    def bulk_writer(self, **options) -> BulkWriter:
+        """创建使用租户会话池的批量写入器，未指定的选项使用租户配置"""
+        return BulkWriter(
+            self.pool,
+            batch_size=options.get("batch_size") or self.config.get("bulk_batch_size", 100),
+            max_rows_per_insert=options.get("max_rows_per_insert") or self.config.get("bulk_max_rows", 500),
+            max_statement_bytes=self.config.get("bulk_max_bytes", 1000000),
+            stop_on_error=bool(options.get("stop_on_error", False)),
+            timeout=self.config.get("bulk_timeout", 600)
+        )
+
+    def bulk_write(self, statements: Optional[List[str]] = None, table: Optional[str] = None,
+                   columns: Optional[List[str]] = None, rows: Optional[List[List[Any]]] = None,
+                   deadline: Optional[Deadline] = None, **options) -> Dict[str, Any]:
+        """
+        批量执行写语句或插入行数据
+
+        Args:
+            statements: SQL语句列表
+            table: 插入行数据时的表名
+            columns: 插入行数据时的列名
+            rows: 行数据
+            deadline: 请求的截止时间（与 bulk_timeout 中较早的一个生效）
+            options: batch_size、max_rows_per_insert、stop_on_error
+
+        Returns:
+            执行报告
+        """
+        writer = self.bulk_writer(**options)
+        try:
+            if statements:
+                return writer.write_statements(statements, deadline=deadline)
+            return writer.write_rows(table, columns, rows, deadline=deadline)
+        finally:
+            # 写操作之后引用了这些表的查询结果可能已过期
+            tables = referenced_tables(";".join(statements)) if statements else [table]
+            self.invalidate_tables(tables)
+
+    def iter_rows(self, sql: str, timeout: Optional[float] = None, paginate: bool = False,
+                  page_size: Optional[int] = None, deadline: Optional[Deadline] = None) -> Iterator[Dict[str, Any]]:
+        """
+        执行SELECT并逐行返回结果
+
+        Args:
+            sql: SELECT语句
+            timeout: 每次工具调用的超时时间（秒）
+            paginate: 是否尝试按主键分页获取
+            page_size: 每页行数
+            deadline: 请求的截止时间（输出中断时取消，终止正在执行的查询）
+
+        Raises:
+            RuntimeError: 执行失败或结果不是行数据
+        """
+        if paginate:
+            plan = self.keyset_plan(sql)
+            if plan is not None:
+                return self.iter_keyset(plan, page_size, timeout=timeout, deadline=deadline)
+        return self._iter_result_rows(sql, timeout, deadline)
+
+    def _iter_result_rows(self, sql: str, timeout: Optional[float] = None,
+                          deadline: Optional[Deadline] = None) -> Iterator[Dict[str, Any]]:
+        result_text = self.execute_sql(sql, timeout=timeout, deadline=deadline)
+        if not result_text:
+            raise RuntimeError("执行SQL未返回结果")
+        try:
+            yield from iter_json_rows(result_text)
+        except ValueError:
+            # 工具返回的是错误信息而不是JSON
+            raise RuntimeError(result_text)
+
+    def keyset_plan(self, sql: str) -> Optional[KeysetPlan]:
+        """为SELECT生成键集分页方案，无法分页时返回 None"""
+        return plan_keyset(sql, self.get_schema())
+
+    def iter_keyset(self, plan: KeysetPlan, page_size: Optional[int] = None,
+                    timeout: Optional[float] = None, deadline: Optional[Deadline] = None,
+                    primary: bool = False, info: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        按分页方案逐页查询并逐行返回结果，每页的执行时间受 statement_timeout 和请求截止时间限制
+
+        所有页在同一个库（主库或同一个副本）上查询，info 中写入路由信息
+        """
+        pool = self.read_pool(referenced_tables(plan.page_sql(1)), primary=primary, info=info)
+
+        def fetch_page(page_sql: str, params: list) -> List[Dict[str, Any]]:
+            limit = self._statement_limit(timeout, deadline)
+            if limit:
+                page_sql = add_execution_time_hint(page_sql, int(limit * 1000))
+            result_text = pool.call_tool("query", {"sql": page_sql, "params": params}, timeout=limit,
+                                         deadline=deadline)
+            try:
+                rows = loads(result_text or "")
+            except json.JSONDecodeError:
+                raise RuntimeError(result_text or "执行SQL未返回结果")
+            if not isinstance(rows, list):
+                raise RuntimeError(result_text)
+            return rows
+
+        page_size = page_size or self.config.get("page_size", 1000)
+        return iter_keyset_rows(fetch_page, plan, page_size,
+                                prefetch=self.config.get("page_prefetch", True))
+
+    def clear_caches(self):
+        """清空租户的所有缓存"""
+        self.schema_cache.clear()
+        self.llm_cache.clear()
+        self.result_cache.clear()
+        self.rewrite_cache.clear()
+        self.table_versions.clear()
+
+    def close(self):
+        """释放租户资源（缓存可能由多个进程共享，不在这里清空）"""
+        if self.table_stats is not None:
+            self.table_stats.close()
+        if self.materialized is not None:
+            self.materialized.close()
+        if self.router is not None:
+            self.router.close()
+        self.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """租户状态"""
+        return {
+            "database": self.config.get("database"),
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "pool": self.pool.stats(),
+            "replicas": self.router.stats() if self.router is not None else None,
+            "table_stats": self.table_stats.stats() if self.table_stats is not None else None,
+            "schema_cache": self.schema_cache.stats(),
+            "llm_cache": self.llm_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "rewrite_cache": self.rewrite_cache.stats(),
+            "single_flight": self._flights.stats(),
+            "examples": self.examples.stats(self.name) if self.examples is not None else None,
+            "materialized": self.materialized.stats() if self.materialized is not None else None
+        }
+
+
+class TenantRegistry:
+    """租户注册表，按名称延迟创建租户资源"""
+
+    def __init__(self, default_config: Dict[str, Any], profiles_dir: Optional[str] = None):
+        """
+        初始化注册表
+
+        Args:
+            default_config: 默认配置（对应 default 租户，同时作为其他租户配置的默认值）
+            profiles_dir: 租户配置目录，目录中每个 <name>.json 为一个租户
+        """
+        self.default_config = default_config
+        self.profiles_dir = profiles_dir
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._tenants: Dict[str, Tenant] = {}
+        self._lock = threading.Lock()
+        self.load_profiles()
+
+    def load_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """从配置目录加载租户配置"""
+        profiles = {DEFAULT_TENANT: dict(self.default_config)}
+
+        if self.profiles_dir and os.path.isdir(self.profiles_dir):
+            for file_name in sorted(os.listdir(self.profiles_dir)):
+                if not file_name.endswith(".json"):
+                    continue
+                name = file_name[:-len(".json")]
+                path = os.path.join(self.profiles_dir, file_name)
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        profile = json.load(f)
+                except Exception as e:
+                    print(f"加载租户配置 {path} 时出错: {str(e)}")
+                    continue
+                # 未指定的项使用默认配置
+                merged = dict(self.default_config)
+                merged.update(profile)
+                profiles[name] = merged
+
+        with self._lock:
+            self._profiles = profiles
+        print(f"已加载 {len(profiles)} 个租户配置")
+        return profiles
+
+    def names(self) -> List[str]:
+        """所有租户名称"""
+        return list(self._profiles)
+
+    def get(self, name: Optional[str] = None) -> Tenant:
+        """
+        获取租户
+
+        Args:
+            name: 租户名称，为空时返回默认租户
+
+        Raises:
+            KeyError: 租户不存在
+        """
+        name = name or DEFAULT_TENANT
+        with self._lock:
+            tenant = self._tenants.get(name)
+            if tenant is None:
+                if name not in self._profiles:
+                    raise KeyError(name)
+                tenant = Tenant(name, self._profiles[name])
+                self._tenants[name] = tenant
+            return tenant
+
+    def reset(self, name: str, config: Optional[Dict[str, Any]] = None):
+        """
+        关闭租户资源，下次访问时按新配置重新创建
+
+        Args:
+            name: 租户名称
+            config: 新配置，为空时保留原配置
+        """
+        with self._lock:
+            tenant = self._tenants.pop(name, None)
+            if config is not None:
+                self._profiles[name] = dict(config)
+                if name == DEFAULT_TENANT:
+                    self.default_config = config
+        if tenant is not None:
+            tenant.close()
+
+    def update_defaults(self, config: Dict[str, Any], clear_caches: bool = False) -> List[str]:
+        """
+        更新默认配置：重新合并所有租户的配置，配置因此变化的已创建租户关闭资源，下次访问时按新配置重新创建
+
+        租户配置文件中指定了的项不受影响
+
+        Args:
+            config: 新的默认配置
+            clear_caches: 是否清空这些租户的缓存（缓存可能由多个进程共享，只需要由修改配置的进程清空）
+
+        Returns:
+            重置的租户名称
+        """
+        with self._lock:
+            self.default_config = config
+        profiles = self.load_profiles()
+        with self._lock:
+            stale = {name: tenant for name, tenant in self._tenants.items() if tenant.config != profiles.get(name)}
+            for name in stale:
+                del self._tenants[name]
+        for tenant in stale.values():
+            if clear_caches:
+                tenant.clear_caches()
+            tenant.close()
+        return list(stale)
+
+    def close(self):
+        """关闭所有租户资源"""
+        with self._lock:
+            tenants, self._tenants = list(self._tenants.values()), {}
+        for tenant in tenants:
+            tenant.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """所有已创建租户的状态"""
+        with self._lock:
+            tenants = dict(self._tenants)
+        return {name: tenant.stats() for name, tenant in tenants.items()}
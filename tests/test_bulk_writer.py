@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""bulk_writer 的单元测试"""
+
+import asyncio
+
+from bulk_writer import BulkWriter, coalesce_inserts, parse_insert
+from deadline import Deadline
+
+
+class FakeResult:
+    def __init__(self, text):
+        self.content = [type("Text", (), {"text": text})()]
+        self.isError = False
+
+
+class FakeSession:
+    def __init__(self):
+        self.sql = []
+
+    async def call_tool(self, name, arguments=None):
+        self.sql.append(arguments["sql"])
+        return FakeResult('{"affectedRows": 1}')
+
+
+class FakePool:
+    def __init__(self):
+        self.session = FakeSession()
+        self.calls = []
+
+    def run(self, fn, timeout=None, deadline=None):
+        self.calls.append((timeout, deadline))
+        return asyncio.run(fn(self.session))
+
+
+def test_parse_insert():
+    prefix, tuples, tail = parse_insert("INSERT INTO t (a, b) VALUES (1, 'x,)'), (2, f(3)) ON DUPLICATE KEY UPDATE b = 1")
+    assert prefix == "INSERT INTO t (a, b)"
+    assert tuples == ["(1, 'x,)')", "(2, f(3))"]
+    assert tail == "ON DUPLICATE KEY UPDATE b = 1"
+    assert parse_insert("UPDATE t SET a = 1") is None
+
+
+def test_coalesce_keeps_order():
+    merged = coalesce_inserts(["INSERT INTO t (a) VALUES (1)", "insert into t (a) values (2)",
+                               "UPDATE t SET a = 3", "INSERT INTO t (a) VALUES (4)"])
+    assert merged == [("INSERT INTO t (a) VALUES (1), (2)", 2), ("UPDATE t SET a = 3", 1),
+                      ("INSERT INTO t (a) VALUES (4)", 1)]
+
+
+def test_write_passes_timeout_and_deadline():
+    pool = FakePool()
+    deadline = Deadline(30)
+    report = BulkWriter(pool, batch_size=2, timeout=600).write_rows("t", ["a"], [[1], [2], [3]], deadline=deadline)
+    assert pool.calls == [(600, deadline)]
+    assert report["success"] and report["rows_in"] == 3
+    assert pool.session.sql[0] == "START TRANSACTION" and pool.session.sql[-1] == "COMMIT"
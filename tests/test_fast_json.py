@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""fast_json 的单元测试"""
+
+import json
+
+from fast_json import RawJSON, dumps, raw_result
+
+
+def count(text):
+    return RawJSON(text).row_count()
+
+
+def test_row_count_compact_and_pretty():
+    rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 3, "name": "c"}]
+    assert count(json.dumps(rows, separators=(",", ":"))) == 3
+    assert count(json.dumps(rows)) == 3
+    assert count(json.dumps(rows, indent=2)) == 3
+
+
+def test_row_count_ignores_separators_in_strings_and_nested_values():
+    rows = [{"note": "},{", "tags": [1, 2, {"a": "]"}]}, {"note": '"},{"', "doc": {"x": {"y": [{}, {}]}}}]
+    assert count(json.dumps(rows, ensure_ascii=False)) == 2
+
+
+def test_row_count_empty_and_non_arrays():
+    assert count("[]") == 0
+    assert count("[ ]") == 0
+    assert count('{"affectedRows": 3}') is None
+    assert count('[{"id": 1}') is None
+    assert count("[1, 2, 3]") == 3
+
+
+def test_raw_result_passthrough():
+    result = raw_result(' [{"id": 1}] ')
+    assert isinstance(result, RawJSON)
+    assert raw_result("Error: table missing") == "Error: table missing"
+    assert json.loads(dumps({"results": result})) == {"results": [{"id": 1}]}
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""job_queue 的单元测试"""
+
+import threading
+import time
+
+from deadline import RequestCancelled
+from job_queue import CANCELLED, RUNNING, SUCCEEDED, JobQueue
+
+
+def wait_status(queue, job_id, status):
+    end = time.time() + 5
+    while queue.get(job_id)["status"] != status and time.time() < end:
+        time.sleep(0.01)
+    return queue.get(job_id)
+
+
+def test_job_runs_with_deadline():
+    queue = JobQueue(lambda job: ({"remaining": job.deadline.remaining()}, 200), workers=1, timeout=60)
+    job = queue.submit({}, "c1")
+    snapshot = wait_status(queue, job.id, SUCCEEDED)
+    assert 0 < snapshot["result"]["remaining"] <= 60
+
+
+def test_cancel_running_job():
+    started = threading.Event()
+
+    def handler(job):
+        started.set()
+        # 模拟执行中的语句：deadline 被取消时中止
+        cancelled = threading.Event()
+        job.deadline.on_cancel(cancelled.set)
+        cancelled.wait(5)
+        raise RequestCancelled(job.deadline.reason)
+
+    queue = JobQueue(handler, workers=1)
+    job = queue.submit({}, "c1")
+    assert started.wait(5)
+    assert queue.get(job.id)["status"] == RUNNING
+    assert queue.cancel(job.id)
+    snapshot = wait_status(queue, job.id, CANCELLED)
+    assert snapshot["status"] == CANCELLED and snapshot["error"] == "任务已取消"
+    assert not queue.cancel(job.id)
+
+
+def test_cancel_queued_job():
+    release = threading.Event()
+
+    def handler(job):
+        release.wait(5)
+        return {}, 200
+
+    queue = JobQueue(handler, workers=1)
+    first = queue.submit({}, "c1")
+    second = queue.submit({}, "c1")
+    wait_status(queue, first.id, RUNNING)
+    assert queue.cancel(second.id)
+    release.set()
+    wait_status(queue, first.id, SUCCEEDED)
+    assert queue.get(second.id)["status"] == CANCELLED
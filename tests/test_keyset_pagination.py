@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""keyset_pagination 的单元测试"""
+
+import pytest
+
+from keyset_pagination import KEYSET_COLUMN, iter_keyset_rows, plan_keyset
+
+TABLE_INFO = [
+    {"name": "orders", "columns": [
+        {"name": "id", "type": "int", "key": "PRI"},
+        {"name": "customer_id", "type": "int", "key": "MUL"},
+        {"name": "amount", "type": "decimal(10,2)", "key": ""},
+    ]},
+    {"name": "order_items", "columns": [
+        {"name": "order_id", "type": "int", "key": "PRI"},
+        {"name": "line", "type": "int", "key": "PRI"},
+    ]},
+]
+
+
+def test_plan_single_table():
+    plan = plan_keyset("SELECT id, amount FROM orders o WHERE amount > 10", TABLE_INFO)
+    assert plan is not None
+    assert plan.key_column == "id"
+    assert plan.page_sql(100) == (f"SELECT id, amount, `o`.`id` AS {KEYSET_COLUMN} FROM orders o "
+                                  f"WHERE (amount > 10) ORDER BY `o`.`id` LIMIT 100")
+    assert plan.page_sql(100, after=True).endswith("WHERE (amount > 10) AND `o`.`id` > ? ORDER BY `o`.`id` LIMIT 100")
+
+
+def test_plan_allows_nested_clauses():
+    sql = "SELECT id FROM orders WHERE customer_id IN (SELECT customer_id FROM orders GROUP BY customer_id LIMIT 5)"
+    assert plan_keyset(sql, TABLE_INFO) is not None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT customer_id, COUNT(*) FROM orders GROUP BY customer_id",
+    "SELECT DISTINCT customer_id FROM orders",
+    "SELECT id FROM orders LIMIT 10",
+    "SELECT id FROM orders ORDER BY amount",
+    "SELECT SUM(amount) FROM orders",
+    "SELECT id, ROW_NUMBER() OVER (ORDER BY amount) AS rn FROM orders",
+    "SELECT id, SUM(amount) OVER (PARTITION BY customer_id) FROM orders",
+    "SELECT id, RANK() OVER w FROM orders WINDOW w AS (ORDER BY amount)",
+    "SELECT id FROM orders UNION SELECT order_id FROM order_items",
+    "SELECT o.id FROM orders o JOIN order_items i ON i.order_id = o.id",
+    "SELECT order_id FROM order_items",
+    "SELECT id FROM missing",
+    "SELECT id FROM orders; SELECT id FROM orders",
+])
+def test_plan_rejects(sql):
+    assert plan_keyset(sql, TABLE_INFO) is None
+
+
+def test_iter_keyset_rows_pages():
+    rows = [{"id": n, KEYSET_COLUMN: n} for n in range(1, 6)]
+    calls = []
+
+    def fetch_page(sql, params):
+        calls.append(params)
+        after = params[0] if params else 0
+        return [dict(row) for row in rows if row["id"] > after][:2]
+
+    plan = plan_keyset("SELECT id FROM orders", TABLE_INFO)
+    result = list(iter_keyset_rows(fetch_page, plan, page_size=2, prefetch=False))
+    assert [row["id"] for row in result] == [1, 2, 3, 4, 5]
+    assert all(KEYSET_COLUMN not in row for row in result)
+    assert calls[0] == [] and calls[1] == [2]
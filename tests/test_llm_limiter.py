@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""llm_limiter 的单元测试"""
+
+import pytest
+
+from llm_limiter import AdaptiveLimiter, LLMBusyError, TokenBucket
+
+
+def limiter(**options):
+    options.setdefault("rate", 0)
+    return AdaptiveLimiter(**options)
+
+
+def test_additive_increase_when_saturated():
+    l = limiter(initial_limit=2, max_limit=3)
+    with l.slot() as first, l.slot() as second:
+        first.succeeded()
+        assert l.limit == 2.5
+        second.succeeded()
+    # 第二个结束时名额已经没有用满
+    assert l.limit == 2.5
+    # 每个窗口约增加1，不超过 max_limit
+    for _ in range(10):
+        with l.slot() as first, l.slot() as second:
+            first.succeeded()
+            second.succeeded()
+    assert l.limit == 3
+
+
+def test_no_increase_when_underused():
+    l = limiter(initial_limit=4)
+    with l.slot() as permit:
+        permit.succeeded()
+    assert l.limit == 4
+
+
+def test_multiplicative_decrease_on_throttle():
+    l = limiter(initial_limit=8, min_limit=2)
+    with l.slot() as permit:
+        permit.throttled()
+    assert l.limit == 4
+    for _ in range(3):
+        with l.slot() as permit:
+            permit.throttled()
+    assert l.limit == 2
+    assert l.metrics()["throttled"] == 4
+
+
+def test_decrease_on_slow_success():
+    l = limiter(initial_limit=10, latency_target=1)
+    with l.slot() as permit:
+        permit.started_at -= 5
+        permit.succeeded()
+    assert l.limit == 9
+    assert l.metrics()["slow"] == 1
+
+
+def test_unreported_slot_counts_as_failure():
+    l = limiter(initial_limit=2)
+    with pytest.raises(RuntimeError):
+        with l.slot():
+            raise RuntimeError("network")
+    metrics = l.metrics()
+    assert metrics["failed"] == 1 and metrics["inflight"] == 0 and l.limit == 2
+
+
+def test_queue_timeout_and_full():
+    l = limiter(initial_limit=1, max_queue=1)
+    with l.slot():
+        with pytest.raises(LLMBusyError):
+            l.acquire(timeout=0.05)
+    assert l.metrics()["timeouts"] == 1
+    with pytest.raises(LLMBusyError):
+        limiter(max_queue=0).acquire()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, burst=2)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0
+    assert 0 < bucket.try_take() <= 1
+    assert TokenBucket(rate=0, burst=1).try_take() == 0
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""nl2sql_eval 的单元测试"""
+
+import json
+
+from nl2sql_eval import Evaluator
+
+
+class FakeFixture:
+    """记录执行过的SQL的测试数据库"""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute_sql(self, sql):
+        self.executed.append(sql)
+        return json.dumps([{"n": 1}])
+
+
+class FakeTransport:
+    latency_ms = 1.0
+
+    def start(self, item):
+        pass
+
+
+class FakeTenant:
+    def __init__(self, sql):
+        self.sql = sql
+
+    def translate(self, question, table_info, api_key, info=None):
+        return {"sql": self.sql, "explanation": "", "validation_errors": []}
+
+
+def evaluator():
+    instance = Evaluator.__new__(Evaluator)
+    instance.fixture = FakeFixture()
+    instance.transport = FakeTransport()
+    instance.api_key = "offline"
+    instance._expected = {}
+    return instance
+
+
+ITEM = {"id": "q1", "question": "订单数", "expected_sql": "SELECT COUNT(*) AS n FROM orders"}
+
+
+def test_write_statements_are_not_executed():
+    for sql in ("DELETE FROM orders", "UPDATE orders SET amount = 0",
+                "SELECT * FROM orders INTO OUTFILE '/tmp/x'", "SELECT id FROM orders FOR UPDATE"):
+        instance = evaluator()
+        detail = instance._evaluate_item(FakeTenant(sql), "s", ITEM, [])
+        assert detail["status"] == "invalid" and detail["error"].endswith("未执行")
+        assert instance.fixture.executed == [ITEM["expected_sql"]]
+
+
+def test_select_is_scored():
+    instance = evaluator()
+    detail = instance._evaluate_item(FakeTenant("SELECT 1 AS n"), "s", ITEM, [])
+    assert detail["status"] == "correct"
+    assert instance.fixture.executed == [ITEM["expected_sql"], "SELECT 1 AS n"]
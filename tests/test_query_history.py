@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""query_history 的单元测试"""
+
+from fast_json import RawJSON
+from query_history import QueryHistory
+
+
+def test_rows_counted_by_writer(tmp_path):
+    history = QueryHistory(str(tmp_path / "history.db"), flush_interval=0.05)
+    history.record({"source": "api", "sql": "SELECT id FROM orders", "status": "ok",
+                    "rows": RawJSON('[{"id": 1, "note": "},{"}, {"id": 2}]')})
+    history.record({"source": "api", "sql": "SELECT id FROM orders WHERE id = 1", "status": "ok", "rows": 1})
+    history.record({"source": "api", "sql": "SELECT broken", "status": "ok", "rows": RawJSON("[{")})
+    history.flush()
+    rows = {item["sql"]: item["rows"] for item in history.recent()}
+    assert rows == {"SELECT id FROM orders": 2, "SELECT id FROM orders WHERE id = 1": 1, "SELECT broken": None}
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""shared_store 的单元测试"""
+
+import shared_store
+from shared_store import SharedStore
+
+
+def accessed_at(store, key):
+    return store.connection().execute("SELECT accessed_at FROM cache WHERE namespace = 'n' AND key = ?",
+                                      (key,)).fetchone()[0]
+
+
+def test_cache_get_does_not_write_on_every_read(tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path / "store.db"))
+    clock = [1000.0]
+    monkeypatch.setattr(shared_store.time, "time", lambda: clock[0])
+    store.cache_set("n", "a", '"1"', ttl=None, max_entries=10)
+
+    changes = store.connection().total_changes
+    clock[0] += 10
+    assert store.cache_get("n", "a") == '"1"'
+    assert store.connection().total_changes == changes
+    assert accessed_at(store, "a") == 1000.0
+
+    clock[0] += shared_store._TOUCH_INTERVAL
+    assert store.cache_get("n", "a") == '"1"'
+    assert accessed_at(store, "a") == clock[0]
+
+
+def test_cache_expiry_and_eviction(tmp_path, monkeypatch):
+    store = SharedStore(str(tmp_path / "store.db"))
+    clock = [1000.0]
+    monkeypatch.setattr(shared_store.time, "time", lambda: clock[0])
+    store.cache_set("n", "old", '"x"', ttl=5, max_entries=2)
+    clock[0] += 100
+    store.cache_set("n", "b", '"b"', ttl=None, max_entries=2)
+    assert store.cache_get("n", "old") is None
+    # 最近读取过（超过访问时间的更新间隔）的条目保留
+    clock[0] += 100
+    store.cache_set("n", "c", '"c"', ttl=None, max_entries=2)
+    clock[0] += 100
+    assert store.cache_get("n", "b") == '"b"'
+    clock[0] += 1
+    store.cache_set("n", "d", '"d"', ttl=None, max_entries=2)
+    assert store.cache_get("n", "b") == '"b"'
+    assert store.cache_get("n", "c") is None
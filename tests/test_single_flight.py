@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""single_flight 的单元测试"""
+
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+class Cancelled(Exception):
+    pass
+
+
+def start_waiters(flight, key, fn, count):
+    """启动 count 个并发调用，等它们都加入同一次执行后返回 (线程列表, 结果列表)"""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(("ok", flight.do(key, fn, timeout=5)))
+        except Exception as e:
+            outcomes.append(("error", e))
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    end = time.monotonic() + 5
+    while flight.stats()["shared"] < count - 1 and time.monotonic() < end:
+        time.sleep(0.001)
+    return threads, outcomes
+
+
+def test_shares_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 42
+
+    threads, outcomes = start_waiters(flight, "k", compute, 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert outcomes == [("ok", 42)] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"executed": 1, "shared": 3, "in_flight": 0}
+
+
+def test_error_propagates_to_all_waiters():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = ValueError("boom")
+
+    def compute():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = start_waiters(flight, "k", compute, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert outcomes == [("error", error)] * 3
+    # 失败的结果不保留，下一次调用重新执行
+    assert flight.do("k", lambda: "again") == "again"
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_retry_on_reexecutes_for_waiters():
+    flight = SingleFlight(retry_on=(Cancelled,))
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            raise Cancelled()
+        return "fresh"
+
+    threads, outcomes = start_waiters(flight, "k", compute, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert sorted(kind for kind, _ in outcomes) == ["error", "ok"]
+    assert ("ok", "fresh") in outcomes
+    assert len(calls) == 2
+
+
+def test_wait_timeout():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("k", lambda: release.wait(5)))
+    leader.start()
+    while flight.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(TimeoutError):
+        flight.do("k", lambda: None, timeout=0.05)
+    release.set()
+    leader.join()
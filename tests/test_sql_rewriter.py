@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""sql_rewriter 的单元测试"""
+
+import json
+
+import pytest
+
+from sql_rewriter import plan_rows, rewrite_sql
+
+TABLE_INFO = [
+    {"name": "orders", "columns": [
+        {"name": "id", "type": "int", "key": "PRI"},
+        {"name": "customer_id", "type": "int", "key": "MUL"},
+        {"name": "created_at", "type": "datetime", "key": ""},
+        {"name": "code", "type": "varchar(20)", "key": ""},
+        {"name": "amount", "type": "decimal(10,2)", "key": ""},
+    ]},
+    {"name": "customers", "columns": [
+        {"name": "id", "type": "int", "key": "PRI"},
+        {"name": "name", "type": "varchar(50)", "key": ""},
+        {"name": "region", "type": "varchar(20)", "key": ""},
+    ]},
+]
+
+RANGE_2024 = "(created_at >= '2024-01-01' AND created_at < '2025-01-01')"
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ("DATE(created_at) = '2024-03-05'", "(created_at >= '2024-03-05' AND created_at < '2024-03-06')"),
+    ("DATE(created_at) BETWEEN '2024-01-01' AND '2024-01-31'",
+     "(created_at >= '2024-01-01' AND created_at < '2024-02-01')"),
+    ("YEAR(created_at) = 2024", RANGE_2024),
+    ("DATE_FORMAT(created_at, '%Y-%m') = '2024-02'", "(created_at >= '2024-02-01' AND created_at < '2024-03-01')"),
+    ("YEAR(created_at) = 2024 OR amount > 5", RANGE_2024 + " OR amount > 5"),
+])
+def test_date_range(condition, expected):
+    result = rewrite_sql(f"SELECT id FROM orders WHERE {condition}", TABLE_INFO)
+    assert result["sql"] == f"SELECT id FROM orders WHERE {expected}"
+    assert [r["rule"] for r in result["rewrites"]] == ["date_range"]
+
+
+def test_exists_to_in():
+    result = rewrite_sql("SELECT name FROM customers c WHERE EXISTS "
+                         "(SELECT 1 FROM orders o WHERE o.customer_id = c.id)", TABLE_INFO)
+    assert result["sql"] == "SELECT name FROM customers c WHERE c.id IN (SELECT o.customer_id FROM orders o)"
+    assert result["rewrites"][0]["rule"] == "exists_to_in"
+
+
+def test_decorrelate_in():
+    result = rewrite_sql("SELECT name FROM customers c WHERE c.region = 'x' AND c.id IN "
+                         "(SELECT o.customer_id FROM orders o WHERE o.code = c.region)", TABLE_INFO)
+    assert result["sql"] == ("SELECT name FROM customers c WHERE c.region = 'x' AND "
+                             "(c.id, c.region) IN (SELECT o.customer_id, o.code FROM orders o)")
+
+
+def test_derived_columns():
+    result = rewrite_sql("SELECT d.id, d.amount FROM (SELECT * FROM orders WHERE amount > 5 LIMIT 10) d "
+                         "WHERE d.code = 'x'", TABLE_INFO)
+    assert result["sql"] == ("SELECT d.id, d.amount FROM (SELECT id, code, amount FROM orders WHERE amount > 5 "
+                             "LIMIT 10) d WHERE d.code = 'x'")
+    assert rewrite_sql("SELECT COUNT(*) FROM (SELECT * FROM orders) d", TABLE_INFO)["sql"] == \
+        "SELECT COUNT(*) FROM (SELECT 1 FROM orders) d"
+
+
+@pytest.mark.parametrize("sql", [
+    # 不是日期列、列上有运算
+    "SELECT id FROM orders WHERE DATE(code) = '2024-03-05'",
+    "SELECT id FROM orders WHERE DATE(created_at + INTERVAL 1 DAY) = '2024-03-05'",
+    # NOT EXISTS 对 NULL 的处理与 NOT IN 不同；聚合子查询总是返回一行
+    "SELECT name FROM customers c WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.customer_id = c.id)",
+    "SELECT name FROM customers c WHERE EXISTS (SELECT COUNT(*) FROM orders o WHERE o.customer_id = c.id)",
+    # 相关条件不是等值条件
+    "SELECT name FROM customers c WHERE c.id IN (SELECT o.customer_id FROM orders o WHERE o.amount > c.id)",
+    # 外层需要派生表的所有列
+    "SELECT d.* FROM (SELECT * FROM orders) d",
+    "UPDATE orders SET amount = 0 WHERE YEAR(created_at) = 2024",
+])
+def test_no_rewrite(sql):
+    result = rewrite_sql(sql, TABLE_INFO)
+    assert result["sql"] == sql
+    assert result["rewrites"] == []
+
+
+def test_date_range_needs_schema():
+    sql = "SELECT id FROM orders WHERE YEAR(created_at) = 2024"
+    assert rewrite_sql(sql)["sql"] == sql
+
+
+def test_notes():
+    notes = rewrite_sql("SELECT * FROM orders ORDER BY RAND()", TABLE_INFO)["notes"]
+    assert len(notes) == 2
+
+
+def test_plan_rows():
+    explain = json.dumps([
+        {"id": 1, "select_type": "PRIMARY", "rows": 100, "filtered": 10},
+        {"id": 1, "select_type": "SIMPLE", "rows": 5, "filtered": 100},
+        {"id": 2, "select_type": "DEPENDENT SUBQUERY", "rows": 3, "filtered": 100},
+    ])
+    # 100 + 10 × 5 + 3 × 50
+    assert plan_rows(explain) == 300
+    with pytest.raises(RuntimeError):
+        plan_rows("Error: Unknown column")
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""sql_validator 的单元测试"""
+
+from sql_validator import clean_sql, read_only_errors, referenced_tables, table_aliases, validate_sql
+
+SCHEMA = [
+    {"name": "orders", "columns": [{"name": "id"}, {"name": "customer_id"}, {"name": "order_date"},
+                                   {"name": "amount"}, {"name": "name"}]},
+    {"name": "customers", "columns": [{"name": "id"}, {"name": "name"}]},
+]
+
+
+def errors(sql):
+    return validate_sql(sql, SCHEMA).errors
+
+
+def test_valid_select():
+    assert errors("SELECT o.id, c.name FROM orders o JOIN customers c ON o.customer_id = c.id") == []
+
+
+def test_unknown_table_and_column():
+    assert errors("SELECT id FROM nope") == ["表不存在: nope"]
+    assert errors("SELECT bogus FROM orders") == ["列不存在: bogus"]
+    assert errors("SELECT o.bogus FROM orders o") == ["列不存在: o.bogus"]
+
+
+def test_from_inside_function_is_not_a_table():
+    assert errors("SELECT EXTRACT(YEAR FROM order_date) FROM orders") == []
+    assert errors("SELECT TRIM(LEADING 'x' FROM name) FROM orders") == []
+    assert errors("SELECT SUBSTRING(name FROM 2 FOR 3) FROM orders") == []
+    assert referenced_tables("SELECT EXTRACT(YEAR FROM order_date) FROM orders") == ["orders"]
+
+
+def test_subquery_tables_are_still_found():
+    sql = "SELECT id FROM orders WHERE customer_id IN (SELECT id FROM customers)"
+    assert errors(sql) == []
+    assert referenced_tables(sql) == ["orders", "customers"]
+    assert referenced_tables("SELECT x FROM (SELECT id AS x FROM orders) d") == ["orders"]
+
+
+def test_collation_and_charset_names_are_not_columns():
+    assert errors("SELECT name FROM orders WHERE name COLLATE utf8mb4_bin = 'a'") == []
+    assert errors("SELECT CONVERT(name USING utf8mb4) FROM orders") == []
+    assert errors("SELECT CAST(name AS CHAR CHARACTER SET utf8mb4) FROM orders") == []
+
+
+def test_upsert_update_is_not_a_table():
+    sql = "INSERT INTO orders (id, amount) VALUES (1, 2) ON DUPLICATE KEY UPDATE amount = VALUES(amount)"
+    assert referenced_tables(sql) == ["orders"]
+    assert errors(sql) == []
+    assert referenced_tables("UPDATE orders SET amount = 0") == ["orders"]
+
+
+def test_into_variables_and_files_are_not_tables():
+    assert referenced_tables("SELECT id INTO @x FROM orders") == ["orders"]
+    assert referenced_tables("SELECT id, name INTO @a, @b FROM orders") == ["orders"]
+    assert referenced_tables("SELECT id INTO OUTFILE '/tmp/x' FROM orders") == ["orders"]
+    assert referenced_tables("SELECT id FROM orders INTO DUMPFILE '/tmp/y'") == ["orders"]
+    assert "表不存在: @x" not in errors("SELECT id INTO @x FROM orders")
+
+
+def test_syntax_errors():
+    assert "括号不匹配，缺少右括号" in errors("SELECT COUNT(id FROM orders")
+    assert "字符串常量没有结束引号" in errors("SELECT id FROM orders WHERE name = 'a")
+    assert any(error.startswith("语句不完整") for error in errors("SELECT id FROM orders WHERE"))
+    assert errors("SELECT 1; SELECT 2") == ["包含 2 条语句，只允许一条"]
+
+
+def test_clean_sql_strips_fences():
+    assert clean_sql("```sql\nSELECT 1;\n```") == "SELECT 1"
+
+
+def test_referenced_tables_skips_ctes():
+    sql = "WITH recent AS (SELECT id FROM orders) SELECT id FROM recent"
+    assert referenced_tables(sql) == ["orders"]
+
+
+def test_table_aliases():
+    assert table_aliases("SELECT 1 FROM orders o JOIN customers AS c ON o.customer_id = c.id") == {
+        "orders": "orders", "o": "orders", "customers": "customers", "c": "customers"}
+
+
+def test_read_only_errors():
+    assert read_only_errors("SELECT id FROM orders WHERE name LIKE 'into%'") == []
+    assert read_only_errors("SELECT SUBSTRING(name FROM 2 FOR 3) FROM orders") == []
+    assert read_only_errors("SELECT * FROM orders INTO OUTFILE '/tmp/x'") == ["不允许 SELECT ... INTO（写入文件或变量）"]
+    assert read_only_errors("SELECT id INTO @x FROM orders") == ["不允许 SELECT ... INTO（写入文件或变量）"]
+    assert read_only_errors("SELECT id FROM orders FOR UPDATE") == ["不允许 FOR UPDATE（锁定行）"]
+    assert read_only_errors("SELECT id FROM orders LOCK IN SHARE MODE") == ["不允许 LOCK IN SHARE MODE（锁定行）"]
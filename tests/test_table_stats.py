@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""table_stats 扫描检查的单元测试"""
+
+import pytest
+
+from table_stats import check_scan, estimate_scan
+
+STATS = {
+    "orders": {"name": "orders", "rows": 5000000, "data_bytes": 0, "cardinality": {}, "indexes": [
+        {"name": "PRIMARY", "columns": ["id"], "unique": True, "cardinality": [5000000]},
+        {"name": "idx_status", "columns": ["status"], "unique": False, "cardinality": [3]},
+        {"name": "idx_customer", "columns": ["customer_id", "created_at"], "unique": False,
+         "cardinality": [100000, 4000000]},
+    ]},
+    "regions": {"name": "regions", "rows": 10, "data_bytes": 0, "cardinality": {}, "indexes": []},
+}
+
+
+def test_estimate_scan():
+    orders = STATS["orders"]
+    assert estimate_scan(orders, ["id"]) == (1, orders["indexes"][0])
+    assert estimate_scan(orders, ["customer_id", "created_at"]) == (1, orders["indexes"][2])
+    assert estimate_scan(orders, ["customer_id"]) == (50, orders["indexes"][2])
+    # 不是最左前缀时不能使用索引
+    assert estimate_scan(orders, ["created_at"]) == (5000000, None)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM orders WHERE id = 5",
+    "SELECT * FROM orders WHERE customer_id = 7",
+    "SELECT * FROM orders LIMIT 10",
+    "SELECT * FROM regions",
+    "SELECT o.id FROM orders o JOIN regions r ON r.id = o.region_id WHERE o.customer_id = 3",
+    "INSERT INTO orders (id) VALUES (1)",
+])
+def test_check_scan_ok(sql):
+    assert check_scan(sql, STATS) == []
+
+
+def test_check_scan_full_scan():
+    for sql in ("SELECT * FROM orders WHERE note = 'x'", "DELETE FROM orders WHERE note = 'x'",
+                "SELECT * FROM orders ORDER BY created_at LIMIT 10"):
+        warnings = check_scan(sql, STATS)
+        assert len(warnings) == 1 and "扫描全表" in warnings[0]
+
+
+def test_check_scan_low_selectivity():
+    warnings = check_scan("SELECT * FROM orders WHERE status = 'paid'", STATS)
+    assert warnings == ["orders 约500万行，索引 idx_status(status) 的选择性低，预计扫描约166.7万行"]
+    assert check_scan("SELECT * FROM orders WHERE status = 'paid'", STATS, max_scan_rows=2000000) == []
+
+
+def test_check_scan_wrapped_column():
+    warnings = check_scan("SELECT * FROM orders WHERE YEAR(customer_id) = 1", STATS)
+    assert len(warnings) == 1 and "customer_id 在函数中" in warnings[0]
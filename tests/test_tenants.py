@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""TenantRegistry 的单元测试"""
+
+import json
+
+import tenants
+from tenants import DEFAULT_TENANT, TenantRegistry
+
+
+class FakeTenant:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.closed = False
+        self.cleared = False
+
+    def clear_caches(self):
+        self.cleared = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_update_defaults_resets_inheriting_tenants(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants, "Tenant", FakeTenant)
+    (tmp_path / "shop_a.json").write_text(json.dumps({"database": "shop_a"}), encoding="utf-8")
+    (tmp_path / "shop_b.json").write_text(json.dumps({"database": "shop_b", "host": "10.0.0.2"}),
+                                          encoding="utf-8")
+    config = {"host": "localhost", "database": "main", "pool_size": 2}
+    registry = TenantRegistry(config, str(tmp_path))
+    default, shop_a, shop_b = (registry.get(name) for name in (DEFAULT_TENANT, "shop_a", "shop_b"))
+
+    reset = registry.update_defaults(dict(config, host="10.0.0.1"), clear_caches=True)
+
+    # shop_b 自己指定了 host，不受影响
+    assert sorted(reset) == [DEFAULT_TENANT, "shop_a"]
+    assert default.closed and default.cleared and shop_a.closed and not shop_b.closed
+    assert registry.get("shop_a").config["host"] == "10.0.0.1"
+    assert registry.get("shop_a").config["database"] == "shop_a"
+    assert registry.get("shop_b") is shop_b
+
+    assert registry.update_defaults(dict(config, host="10.0.0.1")) == []